@@ -4,12 +4,19 @@
 
 import streamlit as st
 import os
+import uuid
 from datetime import datetime
 from modules.document_parser import DocumentParser
-from modules.ai_service import ClaudeService
+from modules.ai_service import ClaudeService, extract_sections_from_outline
 from modules.database import DatabaseManager
 from modules.standards_manager import StandardsManager
 from modules.document_exporter import DocumentExporter
+from modules.metrics import set_record_context
+from modules.model_router import TASKS
+from modules.scheduler import set_request_user, scheduler_statistics
+from modules.proposal_summary import ProposalSummary
+from modules.summary_tree import SummaryTree
+from modules.report_store import AnalysisReport, PROJECT_INFO_CATEGORIES
 
 # 页面配置
 st.set_page_config(
@@ -38,6 +45,9 @@ def init_services():
 # 确保上传目录存在
 os.makedirs("database", exist_ok=True)
 
+# 目录生成和章节生成共用的项目信息长度上限（两者前缀一致才能命中Provider前缀缓存）
+PROJECT_INFO_MAX_CHARS = 5000
+
 # 初始化 Session State
 if 'current_record_id' not in st.session_state:
     st.session_state.current_record_id = None
@@ -51,12 +61,27 @@ if 'uploaded_files_content' not in st.session_state:
     st.session_state.uploaded_files_content = {}
 if 'files_processed' not in st.session_state:
     st.session_state.files_processed = set()  # 记录已处理的文件
+if 'analyzed_contents' not in st.session_state:
+    st.session_state.analyzed_contents = {}  # 生成解析报告时的文件内容（增量解析的比较基准）
+if 'report_index' not in st.session_state:
+    st.session_state.report_index = None  # 解析报告按类别切分后的结构
+if 'summary_tree' not in st.session_state:
+    st.session_state.summary_tree = None  # 招标文件分层摘要
+if 'chat_history' not in st.session_state:
+    st.session_state.chat_history = {'summary': '', 'messages': []}  # 标书问答记录
+if 'session_user' not in st.session_state:
+    st.session_state.session_user = uuid.uuid4().hex[:8]  # 公平调度使用的会话标识
 
 
 def main():
     """主函数"""
     ai_service, db_manager, document_parser, standards_manager = init_services()
 
+    # 本次运行中的模型调用指标关联到当前项目
+    set_record_context(st.session_state.current_record_id)
+    # 本次运行中的模型调用按会话参与公平调度
+    set_request_user(st.session_state.session_user)
+
     # 标题
     st.title("📋 智能标书审查系统")
     st.markdown("---")
@@ -124,8 +149,41 @@ def main():
             reset_session()
             st.rerun()
 
+        # AI响应缓存统计
+        if ai_service.cache:
+            st.markdown("---")
+            cache_stats = ai_service.cache.get_statistics()
+            st.caption(
+                f"♻️ AI缓存: {cache_stats['entries']} 条 | "
+                f"命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}"
+            )
+            if st.button("🧹 清空AI缓存"):
+                ai_service.cache.clear()
+                st.rerun()
+
+        # 前缀缓存（Provider侧）token统计
+        usage_stats = ai_service.get_usage_statistics()
+        if usage_stats['calls']:
+            st.caption(
+                f"🔢 本次运行: 输入 {usage_stats['prompt_tokens']:,} tokens "
+                f"(前缀缓存读取 {usage_stats['cache_read_tokens']:,}，"
+                f"占 {usage_stats['cache_read_ratio']*100:.0f}% / 写入 {usage_stats['cache_write_tokens']:,})，"
+                f"输出 {usage_stats['completion_tokens']:,} tokens"
+            )
+        if usage_stats['coalesced_calls']:
+            st.caption(f"🔗 合并的相同请求: {usage_stats['coalesced_calls']:,} 次")
+
+        # 任务级模型路由
+        if ai_service.router.routes:
+            with st.expander("🧭 模型路由"):
+                for route in ai_service.router.describe():
+                    marker = "" if route['routed'] else "（默认）"
+                    st.caption(f"{route['label']}: {route['provider']} / {route['model']}{marker}")
+
     # 主界面 - 使用 tabs
-    tab1, tab2, tab3, tab4 = st.tabs(["📄 文件上传", "📊 标书分析", "📝 投标文件生成", "📚 国标管理"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(
+        ["📄 文件上传", "📊 标书分析", "💬 标书问答", "📝 投标文件生成", "📚 国标管理", "📈 调用统计"]
+    )
 
     # Tab 1: 文件上传
     with tab1:
@@ -135,14 +193,22 @@ def main():
     with tab2:
         analysis_tab(ai_service, db_manager, document_parser)
 
-    # Tab 3: 投标文件生成
+    # Tab 3: 标书问答
     with tab3:
-        generation_tab(ai_service, db_manager)
+        chat_tab(ai_service, db_manager)
 
-    # Tab 4: 国标管理
+    # Tab 4: 投标文件生成
     with tab4:
+        generation_tab(ai_service, db_manager)
+
+    # Tab 5: 国标管理
+    with tab5:
         standards_management_tab(standards_manager)
 
+    # Tab 6: 调用统计
+    with tab6:
+        metrics_tab(ai_service, db_manager)
+
 
 def file_upload_tab(db_manager, document_parser):
     """文件上传标签页"""
@@ -196,6 +262,12 @@ def file_upload_tab(db_manager, document_parser):
             "types": ["pdf", "docx", "doc", "xlsx", "xls"],
             "help": "其他方案建议相关文件",
             "category": "招标文件附件"
+        },
+        {
+            "name": "补遗/澄清文件",
+            "types": ["pdf", "docx", "doc", "xlsx", "xls"],
+            "help": "招标文件的补遗、澄清或修改通知（已解析的项目可在分析页增量更新解析报告）",
+            "category": "招标文件附件"
         }
     ]
 
@@ -439,6 +511,174 @@ def file_upload_tab(db_manager, document_parser):
                     st.rerun()
 
 
+def current_report():
+    """当前解析报告的类别结构（报告更新后重新切分）"""
+    report_text = st.session_state.get('analysis_report') or ''
+    report = st.session_state.get('report_index')
+    if report is None or not report.matches(report_text):
+        report = AnalysisReport.parse(report_text)
+        st.session_state.report_index = report
+    return report
+
+
+def project_info():
+    """目录/章节生成使用的项目信息（解析报告中的基础信息类别，与批量模式一致）"""
+    report_text = st.session_state.get('analysis_report') or ''
+    context = current_report().context(PROJECT_INFO_CATEGORIES, PROJECT_INFO_MAX_CHARS)
+    return context or report_text[:PROJECT_INFO_MAX_CHARS]
+
+
+def tender_facts_panel(ai_service, uploaded_files_content):
+    """关键信息速览（本地规则提取，无需调用AI）"""
+    facts = ai_service.extract_tender_facts(uploaded_files_content)
+    if not facts:
+        return
+
+    with st.expander("🧾 关键信息速览（规则提取）", expanded=True):
+        st.caption("文件解析后由规则直接提取，结构化解析时会一并交给AI核对；标注\"另见\"的项目原文中有多个不同的值")
+        rows = [
+            {
+                '项目': fact['label'],
+                '提取结果': fact['value'],
+                '另见': '、'.join(fact['alternatives']),
+                '原文依据': fact['evidence'],
+                '来源文件': fact['source'],
+            }
+            for fact in facts.values()
+        ]
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
+
+def amendment_panel(ai_service, db_manager, uploaded_files_content, use_cache):
+    """补遗/澄清增量解析：文件内容与生成解析报告时不同时，只按变化部分更新报告"""
+    analyzed_contents = st.session_state.get('analyzed_contents')
+    if not st.session_state.get('analysis_report') or not analyzed_contents:
+        return
+    if analyzed_contents == uploaded_files_content:
+        return
+
+    diff = ai_service.diff_amendment(analyzed_contents, uploaded_files_content)
+    if not diff['chapters']:
+        return
+
+    with st.expander("📝 文件有变更：补遗/澄清增量解析", expanded=True):
+        st.info(
+            f"与生成解析报告时的文件相比，{len(diff['chapters'])} 章有变化，"
+            f"变化 {diff['changed_chars']:,} 字符（占 {diff['ratio']:.1%}）。"
+            "增量解析只把变化内容交给AI，并替换报告中受影响的章节"
+        )
+        full_ratio = float(os.getenv('AMENDMENT_FULL_REANALYSIS_RATIO', '0.5'))
+        if diff['ratio'] > full_ratio:
+            st.warning(f"⚠️ 变化超过 {full_ratio:.0%}，建议重新进行完整的结构化解析")
+
+        for chapter in diff['chapters']:
+            st.text(f"• {chapter['source']} / {chapter['chapter']}（{chapter['changed_chars']:,} 字符）")
+
+        if st.button("📝 增量更新解析报告", type="primary", key="reanalyze_amendment"):
+            with st.spinner("正在按变更内容更新解析报告..."):
+                try:
+                    result = ai_service.reanalyze_amendment(
+                        st.session_state.analysis_report,
+                        analyzed_contents,
+                        uploaded_files_content,
+                        use_cache=use_cache,
+                        diff=diff
+                    )
+                except Exception as e:
+                    st.error(f"❌ 增量解析失败: {str(e)}")
+                    return
+
+            updated = result['replaced'] + result['added']
+            if not updated:
+                st.warning("⚠️ AI未输出需要更新的章节，解析报告保持不变")
+                return
+
+            st.session_state.analysis_report = result['report']
+            st.session_state.analyzed_contents = dict(uploaded_files_content)
+            updates = {'analysis_report': result['report'], 'analyzed_contents': st.session_state.analyzed_contents}
+
+            # 评审相关章节有变化时重新提取评审标准
+            if any('评' in title for title in updated):
+                try:
+                    evaluation_criteria = ai_service.extract_evaluation_criteria(
+                        result['report'],
+                        use_cache=use_cache,
+                        summary_tree=current_summary_tree(uploaded_files_content)
+                    )
+                    st.session_state.evaluation_criteria = evaluation_criteria
+                    updates['bidding_response'] = evaluation_criteria
+                except Exception as e:
+                    st.warning(f"⚠️ 评审标准重新提取失败，请手动提取: {str(e)}")
+
+            if st.session_state.current_record_id:
+                db_manager.update_record(st.session_state.current_record_id, **updates)
+            st.success(f"✅ 已更新 {len(updated)} 个章节: {'、'.join(updated)}")
+            st.rerun()
+
+
+def current_summary_tree(uploaded_files_content):
+    """与当前文件内容一致的分层摘要（未生成或文件已变化时返回 None）"""
+    tree = st.session_state.get('summary_tree')
+    if tree and tree.is_current(uploaded_files_content):
+        return tree
+    return None
+
+
+def summary_tree_panel(ai_service, db_manager, uploaded_files_content, use_cache):
+    """招标文件分层摘要：生成 / 更新 / 浏览"""
+    tree = st.session_state.get('summary_tree')
+    current = bool(tree and tree.is_current(uploaded_files_content))
+
+    with st.expander("🌲 文档摘要树（片段 → 章 → 全文）", expanded=False):
+        st.caption("按章分层摘要招标文件，随项目保存；评审标准提取会附上评标办法相关章节的摘要，文件未变化时无需重新生成")
+
+        if tree:
+            stats = tree.stats()
+            st.text(f"文件 {stats['document']} 个 · 章 {stats['chapter']} 个 · 片段 {stats['chunk']} 个")
+            if not current:
+                st.warning("⚠️ 文件内容已变化，请更新摘要（未变化的文件沿用已有摘要）")
+
+        label = "🔄 更新摘要树" if tree else "🌲 生成摘要树"
+        if st.button(label, disabled=current, key="build_summary_tree"):
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+
+            def on_progress(completed, total):
+                progress_bar.progress(completed / total if total else 1.0)
+                status_text.text(f"正在生成摘要... {completed}/{total}")
+
+            try:
+                tree = ai_service.build_summary_tree(
+                    uploaded_files_content,
+                    existing=tree,
+                    use_cache=use_cache,
+                    on_progress=on_progress
+                )
+                st.session_state.summary_tree = tree
+                if st.session_state.current_record_id:
+                    db_manager.update_record(
+                        st.session_state.current_record_id,
+                        document_summary=tree.to_dict()
+                    )
+                progress_bar.empty()
+                status_text.empty()
+                st.rerun()
+            except Exception as e:
+                progress_bar.empty()
+                status_text.empty()
+                st.error(f"❌ 摘要生成失败: {str(e)}")
+
+        if tree:
+            level = st.radio(
+                "摘要粒度",
+                options=['document', 'chapter'],
+                format_func=lambda value: {'document': '全文', 'chapter': '按章'}[value],
+                horizontal=True,
+                key="summary_tree_level"
+            )
+            st.markdown(tree.context(level))
+
+
 def analysis_tab(ai_service, db_manager, document_parser):
     """标书分析标签页"""
     st.header("🔍 标书智能分析")
@@ -482,46 +722,80 @@ def analysis_tab(ai_service, db_manager, document_parser):
                 use_container_width=True
             )
 
+    tender_facts_panel(ai_service, uploaded_files_content)
+
     st.markdown("---")
 
-    # 分析按钮
-    if st.button("🚀 开始结构化解析", type="primary", use_container_width=True):
-        # 精确计算token数
-        from modules.text_processor import TextProcessor
-        total_chars = sum(len(content) for content in uploaded_files_content.values())
-        estimated_tokens = sum(TextProcessor.estimate_tokens(content) for content in uploaded_files_content.values())
+    use_cache = st.checkbox(
+        "♻️ 优先使用缓存结果",
+        value=True,
+        help="相同文件和配置的解析结果会被缓存，取消勾选则强制重新调用AI",
+        key="analysis_use_cache"
+    )
 
-        # 读取压缩率配置
-        compression_ratio = float(os.getenv('COMPRESSION_RATIO', '1.0'))
+    # 调用前按模型上下文窗口规划输入策略，显示规划结果和预计耗时
+    total_chars = sum(len(content) for content in uploaded_files_content.values())
+    plan = ai_service.plan_analysis_input(uploaded_files_content)
+    st.info(f"📊 文档规模: {total_chars:,} 字符 ≈ {plan['input_tokens']:,} tokens")
+    plan_text = (
+        f"🔧 输入策略: **{plan['label']}**（{plan['reason']}）  \n"
+        f"模型 {plan['model']} · 上下文窗口 {plan['context_window']:,} · 可用于文件内容 {plan['budget_tokens']:,} tokens · "
+        f"实际发送约 {plan['final_tokens']:,} tokens（{plan['ratio']:.0%}）· 预计耗时约 {plan['predicted_seconds']:.0f} 秒"
+    )
+    if plan['strategy'] in ('as_is', 'dedupe'):
+        st.info(plan_text)
+    else:
+        st.warning(plan_text)
 
-        st.info(f"📊 文档规模: {total_chars:,} 字符 ≈ {estimated_tokens:,} tokens")
+    summary_tree_panel(ai_service, db_manager, uploaded_files_content, use_cache)
 
-        # 显示压缩设置
-        if compression_ratio < 1.0:
-            target_tokens = int(estimated_tokens * compression_ratio)
-            st.info(f"🔧 压缩设置: {compression_ratio*100:.0f}%（将压缩至约 {target_tokens:,} tokens）")
-        else:
-            st.info(f"🔧 压缩设置: 不压缩（COMPRESSION_RATIO=1.0）")
+    amendment_panel(ai_service, db_manager, uploaded_files_content, use_cache)
 
+    # 分析按钮
+    if st.button("🚀 开始结构化解析", type="primary", use_container_width=True):
         progress_bar = st.progress(0)
         status_text = st.empty()
 
         try:
-            status_text.text("正在调用 Claude AI 进行结构化解析...")
+            if plan['strategy'] == 'map_reduce':
+                status_text.text(f"正在分 {len(plan['parts'])} 块摘录招标文件，完成后汇总解析...")
+            else:
+                status_text.text("正在调用 Claude AI 进行结构化解析...")
             progress_bar.progress(10)
 
-            # 调用结构化解析
-            analysis_report = ai_service.parse_bidding_document_structured(uploaded_files_content)
+            # 调用结构化解析（流式输出，边生成边显示）
+            stream_placeholder = st.empty()
+
+            def persist_partial_report(partial_text):
+                """解析过程中定期保存已生成部分，中断后不至于全部丢失"""
+                if st.session_state.current_record_id:
+                    db_manager.update_record(
+                        st.session_state.current_record_id,
+                        analysis_report=partial_text
+                    )
+
+            analysis_report = render_stream(
+                ai_service.parse_bidding_document_structured_stream(
+                    uploaded_files_content,
+                    use_cache=use_cache,
+                    plan=plan
+                ),
+                stream_placeholder,
+                on_partial=persist_partial_report
+            )
+            stream_placeholder.empty()
             progress_bar.progress(60)
 
-            # 保存到 session 和数据库
+            # 保存到 session 和数据库（同时保存本次解析的文件内容，作为补遗/澄清增量解析的比较基准）
             st.session_state.analysis_report = analysis_report
+            st.session_state.analyzed_contents = dict(uploaded_files_content)
             progress_bar.progress(70)
 
             if st.session_state.current_record_id:
                 db_manager.update_record(
                     st.session_state.current_record_id,
                     analysis_report=analysis_report,
+                    analyzed_contents=st.session_state.analyzed_contents,
                     status='analyzed'
                 )
             progress_bar.progress(80)
@@ -529,7 +803,11 @@ def analysis_tab(ai_service, db_manager, document_parser):
             status_text.text("正在自动提取评审标准...")
             # 自动提取评审标准
             try:
-                evaluation_criteria = ai_service.extract_evaluation_criteria(analysis_report)
+                evaluation_criteria = ai_service.extract_evaluation_criteria(
+                    analysis_report,
+                    use_cache=use_cache,
+                    summary_tree=current_summary_tree(uploaded_files_content)
+                )
                 st.session_state.evaluation_criteria = evaluation_criteria
                 progress_bar.progress(100)
 
@@ -609,7 +887,8 @@ def analysis_tab(ai_service, db_manager, document_parser):
                     with st.spinner("正在提取评审标准..."):
                         try:
                             evaluation_criteria = ai_service.extract_evaluation_criteria(
-                                st.session_state.analysis_report
+                                st.session_state.analysis_report,
+                                summary_tree=current_summary_tree(uploaded_files_content)
                             )
                             st.session_state.evaluation_criteria = evaluation_criteria
 
@@ -638,27 +917,11 @@ def analysis_tab(ai_service, db_manager, document_parser):
         with col_left:
             st.markdown("### 📊 结构化解析结果")
 
-            # 将解析报告按照 ## 标题分割成各个大类
-            sections = st.session_state.analysis_report.split('\n## ')
-
-            for i, section in enumerate(sections):
-                if not section.strip():
-                    continue
-
-                # 第一个section前面没有 ##，需要特殊处理
-                if i == 0:
-                    lines = section.split('\n')
-                    # 跳过顶部的说明文字，找到第一个 ## 开头的内容
-                    continue
-
-                # 提取标题和内容
-                lines = section.split('\n', 1)
-                title = lines[0].strip()
-                content = lines[1] if len(lines) > 1 else ""
-
-                # 使用 expander 显示每个大类
-                with st.expander(f"📁 {title}", expanded=(i == 1)):
-                    st.markdown(content)
+            # 按切分后的类别结构显示（报告未变化时不重复切分）
+            report = current_report()
+            for i, section in enumerate(report.sections):
+                with st.expander(f"📁 {section['title']}", expanded=(i == 0)):
+                    st.markdown(section['content'])
 
         with col_right:
             st.markdown("### 📄 招标文件原文")
@@ -692,6 +955,71 @@ def analysis_tab(ai_service, db_manager, document_parser):
                 st.warning("暂无文件内容")
 
 
+def chat_tab(ai_service, db_manager):
+    """标书问答标签页（多轮对话，按问题检索招标文件原文，结合解析报告回答）"""
+    st.header("💬 标书问答")
+
+    analysis_report = st.session_state.get('analysis_report')
+    uploaded_files_content = st.session_state.get('uploaded_files_content') or {}
+    if not analysis_report and not uploaded_files_content:
+        st.warning("⚠️ 请先上传招标文件或从历史记录中加载项目")
+        return
+
+    st.caption("每个问题从招标文件中检索相关原文，结合解析报告回答；解析报告作为共享前缀，追问时可命中前缀缓存。"
+               "对话较长时较早的轮次自动压缩为摘要")
+
+    chat = st.session_state.chat_history
+    if chat['summary']:
+        with st.expander("🗜️ 较早对话的摘要", expanded=False):
+            st.markdown(chat['summary'])
+    for message in chat['messages']:
+        with st.chat_message(message['role']):
+            st.markdown(message['content'])
+
+    with st.form("chat_form", clear_on_submit=True):
+        question = st.text_area("提问", placeholder="例如：违约金和罚款条款有哪些？", height=80)
+        ask = st.form_submit_button("📨 发送", type="primary", use_container_width=True)
+
+    if chat['messages'] and st.button("🧹 清空对话", key="clear_chat"):
+        st.session_state.chat_history = {'summary': '', 'messages': []}
+        if st.session_state.current_record_id:
+            db_manager.update_record(st.session_state.current_record_id, chat_history=None)
+        st.rerun()
+
+    if not (ask and question.strip()):
+        return
+
+    question = question.strip()
+    with st.chat_message('user'):
+        st.markdown(question)
+    try:
+        summary, messages = ai_service.compact_chat_history(chat['messages'], chat['summary'])
+        with st.chat_message('assistant'):
+            answer = render_stream(
+                ai_service.chat_stream(
+                    question,
+                    conversation_history=messages,
+                    history_summary=summary,
+                    analysis_report=analysis_report,
+                    document_contents=uploaded_files_content,
+                    use_cache=False
+                ),
+                st.empty()
+            )
+    except Exception as e:
+        st.error(f"❌ 回答失败: {str(e)}")
+        return
+
+    chat = {
+        'summary': summary,
+        'messages': messages + [{'role': 'user', 'content': question}, {'role': 'assistant', 'content': answer}]
+    }
+    st.session_state.chat_history = chat
+    if st.session_state.current_record_id:
+        db_manager.update_record(st.session_state.current_record_id, chat_history=chat)
+    st.rerun()
+
+
 def generation_tab(ai_service, db_manager):
     """投标文件生成标签页"""
     st.header("📝 技术标文件生成")
@@ -707,10 +1035,24 @@ def generation_tab(ai_service, db_manager):
     if 'generated_sections' not in st.session_state:
         st.session_state.generated_sections = {}
 
+    # 历史项目章节库（记录未变化时不重建）
+    ai_service.refresh_section_library(db_manager, limit=int(os.getenv('SECTION_LIBRARY_MAX_RECORDS', '500')))
+
     # 步骤1: 生成技术标目录
     st.markdown("### 步骤1: 生成技术标目录结构")
 
-    if st.button("🏗️ 生成技术标目录", type="primary", use_container_width=True):
+    pipeline = st.checkbox(
+        "⚡ 目录生成过程中同步生成章节（流水线）",
+        value=False,
+        help="目录每输出一个章节就立即开始生成该章节，目录与章节生成重叠执行"
+    )
+
+    run_outline = st.button("🏗️ 生成技术标目录", type="primary", use_container_width=True)
+
+    if run_outline and pipeline:
+        generate_outline_pipeline(ai_service, db_manager)
+
+    if run_outline and not pipeline:
         progress_bar = st.progress(0)
         status_text = st.empty()
 
@@ -718,8 +1060,8 @@ def generation_tab(ai_service, db_manager):
             status_text.text("正在生成技术标目录结构...")
             progress_bar.progress(20)
 
-            # 从解析报告中提取项目需求（取前5000字符）
-            project_requirements = st.session_state.get('analysis_report', '')[:5000]
+            # 从解析报告中提取项目需求（与章节生成使用相同长度，保证前缀一致）
+            project_requirements = project_info()
 
             # 检查是否有评审标准
             if not st.session_state.get('evaluation_criteria'):
@@ -738,6 +1080,12 @@ def generation_tab(ai_service, db_manager):
             progress_bar.progress(90)
 
             st.session_state.technical_outline = outline
+
+            if st.session_state.current_record_id:
+                db_manager.update_record(
+                    st.session_state.current_record_id,
+                    technical_outline=outline
+                )
             progress_bar.progress(100)
 
             progress_bar.empty()
@@ -754,7 +1102,7 @@ def generation_tab(ai_service, db_manager):
 
             # 显示调试信息
             with st.expander("调试信息"):
-                st.write("project_requirements length:", len(st.session_state.get('analysis_report', '')))
+                st.write("project_requirements length:", len(project_info()))
                 st.write("evaluation_criteria available:", bool(st.session_state.get('evaluation_criteria')))
                 if st.session_state.get('evaluation_criteria'):
                     st.write("evaluation_criteria length:", len(st.session_state.evaluation_criteria))
@@ -782,6 +1130,9 @@ def generation_tab(ai_service, db_manager):
         sections_list = extract_sections_from_outline(outline_data)
 
         if sections_list:
+            generate_all_sections_panel(ai_service, db_manager, sections_list)
+
+            st.markdown("#### 单独生成章节")
             selected_section = st.selectbox(
                 "选择要生成的章节",
                 options=range(len(sections_list)),
@@ -791,27 +1142,31 @@ def generation_tab(ai_service, db_manager):
 
             section_info = sections_list[selected_section]
 
-            col_gen, col_view = st.columns([1, 3])
+            use_cache = st.checkbox(
+                "♻️ 优先使用缓存结果",
+                value=True,
+                help="取消勾选则重新生成此章节（不复用之前的生成结果）",
+                key="section_use_cache"
+            )
 
-            with col_gen:
-                if st.button("✍️ 生成此章节", type="primary", use_container_width=True):
-                    with st.spinner(f"正在生成 {section_info['title']}..."):
-                        try:
-                            section_content = ai_service.generate_technical_proposal_section(
-                                section_title=section_info['title'],
-                                word_count=section_info.get('word_count', 1000),
-                                section_requirements=section_info.get('description', ''),
-                                project_info=st.session_state.get('analysis_report', '')[:3000],
-                                evaluation_criteria=st.session_state.evaluation_criteria
-                            )
+            reusable = ai_service.find_reusable_section(section_info, st.session_state.evaluation_criteria)
+            if reusable:
+                st.info(
+                    f"♻️ 历史项目《{reusable['project']}》中的章节「{reusable['title']}」"
+                    f"与本章节高度相似（标题相似度 {reusable['title_score']:.2f}，项目相似度 "
+                    f"{reusable['project_score']:.2f}），可直接采用，无需调用模型"
+                )
+                with st.expander("查看历史章节", expanded=False):
+                    st.markdown(reusable['content'])
+                if st.button("♻️ 直接采用此历史章节", key="reuse_section"):
+                    store_generated_section(db_manager, section_info['title'], reusable['content'])
+                    st.success("✅ 已采用历史章节，可在下方查看并按需修改")
+                    st.rerun()
 
-                            # 保存到 session
-                            st.session_state.generated_sections[section_info['title']] = section_content
-                            st.success("✅ 章节生成完成！")
-                            st.rerun()
+            col_gen, col_view = st.columns([1, 3])
 
-                        except Exception as e:
-                            st.error(f"❌ 生成失败: {str(e)}")
+            # 流式输出区域（整行宽度，位于按钮下方）
+            section_stream_placeholder = st.empty()
 
             with col_view:
                 # 显示已生成的章节数量
@@ -819,6 +1174,34 @@ def generation_tab(ai_service, db_manager):
                 generated_count = len(st.session_state.generated_sections)
                 st.info(f"📊 进度: {generated_count}/{total_sections} 个章节已生成")
 
+            with col_gen:
+                if st.button("✍️ 生成此章节", type="primary", use_container_width=True):
+                    try:
+                        section_content = render_stream(
+                            ai_service.generate_technical_proposal_section_stream(
+                                section_title=section_info['title'],
+                                word_count=section_info.get('word_count', 1000),
+                                section_requirements=section_info.get('description', ''),
+                                project_info=project_info(),
+                                evaluation_criteria=st.session_state.evaluation_criteria,
+                                use_cache=use_cache,
+                                retriever=get_section_retriever(ai_service),
+                                summary=(
+                                    build_proposal_summary(ai_service, exclude=section_info['title']).render() or None
+                                    if st.session_state.get('section_consistency') else None
+                                )
+                            ),
+                            section_stream_placeholder
+                        )
+
+                        # 保存到 session 和数据库
+                        store_generated_section(db_manager, section_info['title'], section_content)
+                        st.success("✅ 章节生成完成！")
+                        st.rerun()
+
+                    except Exception as e:
+                        st.error(f"❌ 生成失败: {str(e)}")
+
         # 显示已生成的章节
         if st.session_state.generated_sections:
             st.markdown("---")
@@ -887,6 +1270,256 @@ def generation_tab(ai_service, db_manager):
                             st.error(f"Word导出失败: {str(e)}")
 
 
+def generate_all_sections_panel(ai_service, db_manager, sections_list):
+    """一键并发生成全部章节（每完成一个立即保存，失败章节可单独重试）"""
+    if 'failed_sections' not in st.session_state:
+        st.session_state.failed_sections = []
+
+    pending = [s for s in sections_list if s['title'] not in st.session_state.generated_sections]
+    failed_titles = set(st.session_state.failed_sections)
+
+    col_all, col_retry, col_workers = st.columns([2, 2, 1])
+    with col_workers:
+        max_workers = st.number_input(
+            "并发数",
+            min_value=1,
+            max_value=16,
+            value=int(os.getenv('SECTION_CONCURRENCY', '4')),
+            key="section_concurrency"
+        )
+    with col_all:
+        run_all = st.button(
+            f"⚡ 一键生成剩余全部章节（{len(pending)} 个）",
+            type="primary",
+            use_container_width=True,
+            disabled=not pending
+        )
+    with col_retry:
+        run_retry = st.button(
+            f"🔁 重试失败章节（{len(failed_titles)} 个）",
+            use_container_width=True,
+            disabled=not failed_titles
+        )
+
+    col_consistency, col_pack, col_reuse = st.columns(3)
+    with col_consistency:
+        consistency = st.checkbox(
+            "🔗 一致性模式",
+            value=False,
+            help="按目录顺序分批生成，后续章节参考已完成章节的关键承诺、人员、设备和进度数据（摘要长度固定），"
+                 "减少章节间的重复和数字不一致；单独生成章节时同样生效",
+            key="section_consistency"
+        )
+    with col_pack:
+        pack = st.checkbox(
+            "📦 合并小章节",
+            value=os.getenv('SECTION_PACK_ENABLED', 'true').lower() in ('true', '1', 'yes'),
+            help=f"相邻的小章节（建议字数≤{ai_service.packer.small_words}）合并为一次调用生成，"
+                 "减少调用次数和重复发送的评审标准；合并输出解析失败的章节自动单独生成",
+            key="section_pack"
+        )
+    with col_reuse:
+        reuse = st.checkbox(
+            "♻️ 复用历史章节",
+            value=False,
+            help="同类历史项目中标题基本相同、篇幅足够的章节直接采用，不调用模型；"
+                 "其余章节生成时仍会参考相似的历史章节",
+            key="section_reuse"
+        )
+
+    if not (run_all or run_retry):
+        if failed_titles:
+            st.warning(f"⚠️ 以下章节生成失败: {'、'.join(st.session_state.failed_sections)}")
+        return
+
+    targets = pending if run_all else [s for s in sections_list if s['title'] in failed_titles]
+
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    log_area = st.container()
+
+    total = len(targets)
+    done = 0
+    if reuse:
+        remaining = []
+        for section in targets:
+            match = ai_service.find_reusable_section(section, st.session_state.evaluation_criteria)
+            if not match:
+                remaining.append(section)
+                continue
+            store_generated_section(db_manager, section['title'], match['content'])
+            done += 1
+            log_area.caption(f"♻️ {section['title']}（复用《{match['project']}》「{match['title']}」）")
+        targets = remaining
+        progress_bar.progress(int(done / total * 100))
+
+    generation_args = dict(
+        project_info=project_info(),
+        evaluation_criteria=st.session_state.evaluation_criteria,
+        max_workers=int(max_workers),
+        retriever=get_section_retriever(ai_service),
+        pack=pack
+    )
+    if not targets:
+        results = []
+    elif consistency:
+        results = ai_service.generate_sections_consistently(
+            targets, summary=build_proposal_summary(ai_service), **generation_args
+        )
+    else:
+        results = ai_service.generate_sections_concurrently(targets, **generation_args)
+
+    failed = []
+    for result in results:
+        done += 1
+        progress_bar.progress(int(done / total * 100))
+        status_text.text(f"已完成 {done}/{total} 个章节")
+
+        if result['content']:
+            store_generated_section(db_manager, result['title'], result['content'])
+            packed = f"（合并生成 {result['packed']} 个章节）" if result.get('packed', 1) > 1 else ""
+            log_area.caption(f"✅ {result['title']}{packed}")
+        else:
+            failed.append(result['title'])
+            log_area.caption(f"❌ {result['title']}: {result['error']}")
+
+    st.session_state.failed_sections = failed
+    progress_bar.empty()
+    status_text.empty()
+
+    if failed:
+        st.warning(f"⚠️ {len(failed)} 个章节生成失败，可点击重试")
+    else:
+        st.success(f"✅ 全部 {total} 个章节生成完成！")
+    st.rerun()
+
+
+def store_generated_section(db_manager, section_title, content):
+    """保存已生成章节到 session（按目录顺序排列）和数据库"""
+    sections = dict(st.session_state.generated_sections)
+    sections[section_title] = content
+    st.session_state.generated_sections = order_sections_by_outline(sections)
+
+    if st.session_state.current_record_id:
+        db_manager.save_generated_section(st.session_state.current_record_id, section_title, content)
+
+
+def get_section_retriever(ai_service):
+    """已上传招标文件时返回检索索引（按文件内容缓存），用于为每个章节检索相关原文条款"""
+    return ai_service.get_retriever(st.session_state.get('uploaded_files_content') or {})
+
+
+def build_proposal_summary(ai_service, exclude=None):
+    """由已生成章节（按目录顺序）构建一致性模式的滚动摘要，exclude 为正在重新生成的章节"""
+    sections = {
+        title: content for title, content in st.session_state.generated_sections.items() if title != exclude
+    }
+    return ProposalSummary.from_sections(sections, ai_service.router.provider_for('section').model)
+
+
+def order_sections_by_outline(sections):
+    """并发生成时完成顺序不定，按目录顺序重新排列，保证导出顺序正确"""
+    outline_order = [s['title'] for s in extract_sections_from_outline(st.session_state.technical_outline or {})]
+    ordered = {title: sections[title] for title in outline_order if title in sections}
+    ordered.update({title: text for title, text in sections.items() if title not in ordered})
+    return ordered
+
+
+def generate_outline_pipeline(ai_service, db_manager):
+    """流水线生成：目录流式输出的同时，已解析出的章节立即并发生成并保存"""
+    status_text = st.empty()
+    progress_bar = st.progress(0)
+    log_area = st.container()
+
+    found = 0
+    done = 0
+    failed = []
+    try:
+        for event in ai_service.generate_outline_and_sections(
+            project_requirements=project_info(),
+            evaluation_criteria=st.session_state.evaluation_criteria,
+            max_workers=int(st.session_state.get('section_concurrency', os.getenv('SECTION_CONCURRENCY', '4'))),
+            skip_titles=set(st.session_state.generated_sections),
+            retriever=get_section_retriever(ai_service)
+        ):
+            if event['type'] == 'section_found':
+                found += 1
+                log_area.caption(f"📑 目录解析出章节: {event['section']['title']}")
+            elif event['type'] == 'outline':
+                st.session_state.technical_outline = event['outline']
+                if st.session_state.current_record_id:
+                    db_manager.update_record(
+                        st.session_state.current_record_id,
+                        technical_outline=event['outline']
+                    )
+                log_area.caption(f"✅ 目录生成完成，共 {found} 个章节")
+            elif event['type'] == 'section':
+                done += 1
+                if event['content']:
+                    store_generated_section(db_manager, event['title'], event['content'])
+                    log_area.caption(f"✅ {event['title']}")
+                else:
+                    failed.append(event['title'])
+                    log_area.caption(f"❌ {event['title']}: {event['error']}")
+
+            status_text.text(f"目录已解析 {found} 个章节，已完成 {done} 个")
+            if found:
+                progress_bar.progress(min(100, int(done / found * 100)))
+    except Exception as e:
+        status_text.empty()
+        progress_bar.empty()
+        st.error(f"❌ 生成失败: {str(e)}")
+        return
+
+    # 目录完成前结束的章节在此按最终目录顺序重排
+    st.session_state.generated_sections = order_sections_by_outline(st.session_state.generated_sections)
+    st.session_state.failed_sections = failed
+    status_text.empty()
+    progress_bar.empty()
+    if failed:
+        st.warning(f"⚠️ {len(failed)} 个章节生成失败，可点击重试")
+    else:
+        st.success(f"✅ 目录及全部 {done} 个章节生成完成！")
+    st.rerun()
+
+
+def render_stream(stream, placeholder, on_partial=None, persist_interval=5.0):
+    """
+    将AI流式输出逐步渲染到页面占位符
+
+    Args:
+        stream: 增量文本迭代器
+        placeholder: st.empty() 占位符
+        on_partial: 可选回调，定期以当前已生成的全文调用（用于中途保存）
+        persist_interval: 调用 on_partial 的最小间隔（秒）
+
+    Returns:
+        完整的生成文本
+    """
+    import time
+
+    chunks = []
+    last_render = 0.0
+    last_persist = time.time()
+
+    for delta in stream:
+        chunks.append(delta)
+        now = time.time()
+
+        # 控制刷新频率，避免每个token都重绘页面
+        if now - last_render >= 0.2:
+            placeholder.markdown("".join(chunks) + " ▌")
+            last_render = now
+
+        if on_partial and now - last_persist >= persist_interval:
+            on_partial("".join(chunks))
+            last_persist = now
+
+    full_text = "".join(chunks)
+    placeholder.markdown(full_text)
+    return full_text
+
+
 def display_outline_tree(outline_data):
     """显示目录树结构"""
     if 'outline' in outline_data and isinstance(outline_data['outline'], list):
@@ -917,40 +1550,6 @@ def display_outline_item(item, level=0):
             display_outline_item(child, level + 1)
 
 
-def extract_sections_from_outline(outline_data):
-    """从目录结构中提取所有章节"""
-    sections = []
-
-    if outline_data.get('raw'):
-        # 原始文本格式，无法提取
-        return []
-
-    if 'outline' in outline_data and isinstance(outline_data['outline'], list):
-        for item in outline_data['outline']:
-            extract_sections_recursive(item, sections)
-
-    return sections
-
-
-def extract_sections_recursive(item, sections, parent_title=''):
-    """递归提取章节"""
-    title = item.get('title', '')
-    full_title = f"{parent_title} {title}".strip() if parent_title else title
-
-    # 如果有 word_count，说明是可生成的章节
-    if 'word_count' in item:
-        sections.append({
-            'title': full_title,
-            'word_count': item['word_count'],
-            'description': item.get('description', '')
-        })
-
-    # 递归处理子项
-    if 'children' in item and item['children']:
-        for child in item['children']:
-            extract_sections_recursive(child, sections, full_title)
-
-
 def merge_all_sections(outline, generated_sections):
     """合并所有已生成的章节为完整文档"""
     content_parts = [
@@ -975,13 +1574,25 @@ def merge_all_sections(outline, generated_sections):
 
 def load_record(record):
     """加载历史记录"""
+    import json
+
     st.session_state.current_record_id = record.id
     st.session_state.project_name = record.project_name
     st.session_state.analysis_report = record.analysis_report
+    st.session_state.report_index = (
+        AnalysisReport.from_json(record.report_sections, record.analysis_report) if record.analysis_report else None
+    )
     st.session_state.bidding_response = record.bidding_response
+    st.session_state.technical_outline = json.loads(record.technical_outline) if record.technical_outline else None
+    st.session_state.generated_sections = json.loads(record.generated_sections) if record.generated_sections else {}
+    st.session_state.failed_sections = []
+    st.session_state.summary_tree = SummaryTree.from_json(record.document_summary)
+    st.session_state.analyzed_contents = json.loads(record.analyzed_contents) if record.analyzed_contents else {}
+    st.session_state.chat_history = (
+        json.loads(record.chat_history) if record.chat_history else {'summary': '', 'messages': []}
+    )
 
     # 加载文件信息
-    import json
     if record.uploaded_files:
         uploaded_files_info = json.loads(record.uploaded_files)
         st.session_state.uploaded_files_info = uploaded_files_info
@@ -1005,7 +1616,14 @@ def reset_session():
     st.session_state.current_record_id = None
     st.session_state.project_name = ''
     st.session_state.analysis_report = None
+    st.session_state.report_index = None
     st.session_state.bidding_response = None
+    st.session_state.technical_outline = None
+    st.session_state.generated_sections = {}
+    st.session_state.failed_sections = []
+    st.session_state.summary_tree = None
+    st.session_state.analyzed_contents = {}
+    st.session_state.chat_history = {'summary': '', 'messages': []}
     st.session_state.uploaded_files_content = {}
     st.session_state.uploaded_files_info = {}
     st.session_state.files_processed = set()
@@ -1208,5 +1826,117 @@ def standards_management_tab(standards_manager):
         st.info("📭 暂无标准文件，请上传")
 
 
+def metrics_tab(ai_service, db_manager):
+    """调用统计标签页（按任务 / 项目的延迟、token用量和成本）"""
+    st.header("📈 模型调用统计")
+
+    schedulers = scheduler_statistics()
+    if schedulers:
+        with st.expander("🚦 请求调度（排队情况）"):
+            st.caption("所有模型调用按优先级排队获取并发名额：交互 > 流水线（并发章节） > 批量；"
+                       "同一优先级内进行中调用较少的会话优先")
+            for provider_name, stats in schedulers.items():
+                st.markdown(f"**{provider_name}**：并发上限 {stats['max_concurrency']}，进行中 {stats['running']}")
+                rows = [
+                    {
+                        '优先级': row['label'],
+                        '排队中': row['queued'],
+                        '进行中': row['running'],
+                        '已调度': row['served'],
+                        '等待p50(ms)': round(row['wait_p50_ms']),
+                        '等待p95(ms)': round(row['wait_p95_ms']),
+                        '最长等待(ms)': round(row['wait_max_ms']),
+                    }
+                    for row in stats['classes'].values()
+                ]
+                st.dataframe(rows, use_container_width=True, hide_index=True)
+
+    if not ai_service.metrics:
+        st.info("调用指标记录已关闭（METRICS_ENABLED=false）")
+        return
+
+    import pandas as pd
+
+    col_task, col_record = st.columns(2)
+    with col_task:
+        task_filter = st.selectbox(
+            "任务", ["全部"] + list(TASKS),
+            format_func=lambda task: task if task == "全部" else f"{task} - {TASKS[task]}"
+        )
+    with col_record:
+        records = {r.id: r.project_name for r in db_manager.get_all_records()}
+        record_filter = st.selectbox(
+            "项目",
+            ["全部"] + list(records.keys()),
+            format_func=lambda rid: rid if rid == "全部" else f"{rid} - {records[rid]}"
+        )
+
+    calls = ai_service.metrics.get_calls(
+        task=None if task_filter == "全部" else task_filter,
+        record_id=None if record_filter == "全部" else record_filter
+    )
+    if not calls:
+        st.info("暂无调用记录")
+        return
+
+    live_calls = [c for c in calls if not c['cache_hit']]
+    costs = [c['cost'] for c in live_calls if c['cost'] is not None]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("调用次数", f"{len(calls)}", help="含本地缓存命中")
+    with col2:
+        st.metric("输入 tokens", f"{sum(c['prompt_tokens'] or 0 for c in calls):,}")
+    with col3:
+        st.metric("输出 tokens", f"{sum(c['completion_tokens'] or 0 for c in calls):,}")
+    with col4:
+        st.metric("估算成本", f"${sum(costs):.2f}" if costs else "-")
+
+    st.markdown("### 按任务汇总")
+    by_task = ai_service.metrics.summarize(calls, group_by='task')
+    st.dataframe(pd.DataFrame(by_task), use_container_width=True, hide_index=True)
+
+    st.markdown("### 按项目汇总")
+    by_record = ai_service.metrics.summarize(calls, group_by='record_id')
+    for row in by_record:
+        row['project_name'] = records.get(row['record_id'], '-')
+    st.dataframe(pd.DataFrame(by_record), use_container_width=True, hide_index=True)
+
+    if ai_service.calibrator:
+        calibrations = ai_service.calibrator.get_all()
+        with st.expander(f"🎯 token估算校准（{len(calibrations)} 个模型）"):
+            st.caption("按各模型实际计费的输入token拟合的系数（每中文字符 / 每英文单词 / 每其他字符），"
+                       "用于上下文窗口规划、输出预算和限流估算；未校准的模型使用默认系数 1.5 / 1.3 / 0.5")
+            if calibrations:
+                st.dataframe(pd.DataFrame(calibrations), use_container_width=True, hide_index=True)
+            else:
+                st.info("暂无校准数据（每个模型累计足够调用后自动拟合）")
+
+    with st.expander(f"调用明细（{len(calls)} 条）"):
+        st.dataframe(pd.DataFrame(calls), use_container_width=True, hide_index=True)
+
+    col_export1, col_export2, col_clear = st.columns(3)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    with col_export1:
+        st.download_button(
+            "📥 导出汇总CSV",
+            data=ai_service.metrics.to_csv(by_task + by_record).encode('utf-8-sig'),
+            file_name=f"llm_metrics_summary_{timestamp}.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+    with col_export2:
+        st.download_button(
+            "📥 导出明细CSV",
+            data=ai_service.metrics.to_csv(calls).encode('utf-8-sig'),
+            file_name=f"llm_calls_{timestamp}.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+    with col_clear:
+        if st.button("🧹 清空调用记录", use_container_width=True):
+            ai_service.metrics.clear()
+            st.rerun()
+
+
 if __name__ == "__main__":
     main()
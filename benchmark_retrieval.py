@@ -0,0 +1,116 @@
+"""
+检索索引基准测试
+解析示例招标文件，测量索引构建（冷启动）、索引加载（磁盘缓存）和查询延迟，
+并对比按章节检索的参考条款与原先截取文件开头方式的提示词长度
+
+用法:
+    python benchmark_retrieval.py                      # 使用 database/ 下的示例招标文件
+    python benchmark_retrieval.py 文件1.pdf 文件2.xls   # 指定文件（也支持 .txt/.md）
+"""
+
+import os
+import sys
+import glob
+import time
+import tempfile
+
+from modules.retrieval import RetrievalIndexCache, chunk_documents, BM25Index
+from modules.metrics import percentile
+from modules.text_processor import TextProcessor
+
+# 典型的技术标章节（标题 + 章节要求），作为检索查询
+SECTION_QUERIES = [
+    "项目总体认识与建设意义 阐述项目背景、建设必要性和意义",
+    "施工组织总体设想与管理目标 质量目标 安全目标 工期目标",
+    "工程概况 工程规模 建设地点 结构形式",
+    "主要施工方法 土方开挖 基础施工 主体结构",
+    "确保工程质量的技术组织措施 质量保证体系 检验批验收",
+    "确保安全生产的技术组织措施 安全文明施工 扬尘治理",
+    "确保工期的技术组织措施 施工进度计划 关键线路",
+    "重点、难点分析及应对措施",
+    "劳动力计划及主要施工机械设备投入计划",
+    "项目管理机构 项目经理 技术负责人 人员配备",
+    "工程量清单 主要材料 综合单价",
+    "投标保证金 履约担保 付款方式 质保期",
+]
+
+
+def load_documents(paths):
+    """解析文件，返回 {文件名: 文本}"""
+    contents = {}
+    parser = None
+    for path in paths:
+        name = os.path.basename(path)
+        if path.lower().endswith(('.txt', '.md')):
+            with open(path, 'r', encoding='utf-8') as f:
+                contents[name] = f.read()
+            continue
+        if parser is None:
+            from modules.document_parser import DocumentParser
+            parser = DocumentParser(enable_ocr=False, extract_tables=False)
+        started = time.perf_counter()
+        contents[name] = parser.parse(path)['content']
+        print(f"解析 {name}: {len(contents[name]):,} 字符，{time.perf_counter() - started:.2f}s")
+    return contents
+
+
+def main():
+    paths = sys.argv[1:] or sorted(
+        glob.glob(os.path.join('database', '*.pdf')) + glob.glob(os.path.join('database', '*.xls*'))
+    )
+    if not paths:
+        print("未找到示例文件，请指定要测试的招标文件")
+        return 1
+
+    contents = load_documents(paths)
+    total_chars = sum(len(text) for text in contents.values())
+    print(f"\n文件数: {len(contents)}，总字符: {total_chars:,}，估算token: "
+          f"{sum(TextProcessor.estimate_tokens(t) for t in contents.values()):,}")
+
+    # 冷启动：切块 + 建索引
+    started = time.perf_counter()
+    chunks = chunk_documents(contents)
+    chunk_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    index = BM25Index(chunks)
+    build_seconds = time.perf_counter() - started
+    print(f"切块: {len(chunks)} 个片段，{chunk_seconds * 1000:.1f}ms")
+    print(f"建索引: {len(index.postings):,} 个词项，{build_seconds * 1000:.1f}ms")
+
+    # 磁盘缓存：首次写入，新进程（新缓存实例）读取
+    with tempfile.TemporaryDirectory() as cache_dir:
+        started = time.perf_counter()
+        RetrievalIndexCache(cache_dir=cache_dir).get(contents)
+        cold_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        RetrievalIndexCache(cache_dir=cache_dir).get(contents)
+        warm_seconds = time.perf_counter() - started
+    print(f"索引缓存: 构建并写入 {cold_seconds * 1000:.1f}ms，从磁盘加载 {warm_seconds * 1000:.1f}ms")
+
+    # 查询延迟
+    latencies = []
+    for _ in range(20):
+        for query in SECTION_QUERIES:
+            started = time.perf_counter()
+            index.search(query, top_k=4)
+            latencies.append((time.perf_counter() - started) * 1000)
+    print(f"查询: {len(latencies)} 次，p50 {percentile(latencies, 50):.2f}ms，"
+          f"p95 {percentile(latencies, 95):.2f}ms，最大 {max(latencies):.2f}ms")
+
+    # 提示词长度：检索参考条款 vs 每个文件截取前2000字符
+    truncated = sum(min(len(text), 2000) for text in contents.values())
+    retrieved = [len(index.context_for(query, top_k=4, max_chars=2000)) for query in SECTION_QUERIES]
+    print(f"\n原文要点长度: 截取开头 {truncated:,} 字符/次，按章节检索平均 "
+          f"{sum(retrieved) / len(retrieved):,.0f} 字符/次")
+
+    print("\n示例检索结果:")
+    for query in SECTION_QUERIES[:3]:
+        print(f"\n> {query}")
+        for hit in index.search(query, top_k=2):
+            preview = hit['text'].replace('\n', ' ')[:80]
+            print(f"  [{hit['score']:.2f}] {hit['source']} @{hit['offset']}: {preview}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
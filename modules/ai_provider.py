@@ -4,24 +4,93 @@ AI Provider 抽象层
 """
 
 import os
-from typing import Optional
+from typing import Optional, Iterator, Dict, List, Callable
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+def empty_usage() -> Dict[str, int]:
+    """空的token用量字典（各Provider统一口径）"""
+    return {
+        'prompt_tokens': 0,  # 输入token总数（含缓存读取/写入部分）
+        'completion_tokens': 0,  # 输出token数
+        'cache_read_tokens': 0,  # 命中前缀缓存的输入token数
+        'cache_write_tokens': 0  # 写入前缀缓存的输入token数（仅Anthropic计费）
+    }
+
+
 class AIProvider:
-    """AI Provider基类"""
+    """
+    AI Provider基类
+
+    子类至少实现 complete 或 generate 之一；
+    prefix 为稳定的长上下文（招标文件、评审标准等），作为可缓存前缀放在请求最前面发送；
+    json_mode=True 时要求模型直接输出JSON对象（不带代码块），由各Provider以原生方式约束
+    """
 
-    def generate(self, prompt: str, max_tokens: int = 8000, temperature: float = 0.3) -> str:
+    name = 'base'  # provider标识（用于缓存键、日志等）
+    model = ''
+
+    def complete(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        json_mode: bool = False
+    ) -> Dict:
+        """
+        生成文本并返回完整结果
+
+        Returns:
+            {'text': 输出文本, 'usage': token用量, 'stop_reason': 结束原因, 'model': 实际模型}
+        """
+        text = self.generate(prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, json_mode=json_mode)
+        return {'text': text, 'usage': empty_usage(), 'stop_reason': None, 'model': self.model}
+
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        json_mode: bool = False
+    ) -> str:
         """生成文本"""
-        raise NotImplementedError
+        return self.complete(
+            prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, json_mode=json_mode
+        )['text']
+
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        on_finish: Optional[Callable[[Dict], None]] = None,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        """
+        流式生成文本，逐段返回增量内容
+
+        默认实现退化为一次性生成，子类可覆盖以提供真正的流式输出
+
+        Args:
+            on_finish: 可选回调，结束时以 {'usage', 'stop_reason', 'model'} 调用
+        """
+        result = self.complete(prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, json_mode=json_mode)
+        yield result['text']
+        if on_finish:
+            on_finish(result)
 
 
 class OpenAIProvider(AIProvider):
     """OpenAI GPT-4 Provider（支持OpenRouter等第三方平台）"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    name = 'openai'
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
         try:
             from openai import OpenAI
         except ImportError:
@@ -31,38 +100,141 @@ class OpenAIProvider(AIProvider):
         if not self.api_key:
             raise ValueError("未找到 OPENAI_API_KEY，请在 .env 文件中配置")
 
+        # 超时由环境变量控制；SDK自带重试关闭，统一由 provider_middleware 处理
+        client_options = {
+            'timeout': float(os.getenv('LLM_REQUEST_TIMEOUT', '600')),
+            'max_retries': 0
+        }
+
         # 支持自定义base_url（如OpenRouter、国内镜像等）
         base_url = os.getenv('OPENAI_BASE_URL')
         if base_url:
-            self.client = OpenAI(api_key=self.api_key, base_url=base_url)
+            self.client = OpenAI(api_key=self.api_key, base_url=base_url, **client_options)
         else:
-            self.client = OpenAI(api_key=self.api_key)
+            self.client = OpenAI(api_key=self.api_key, **client_options)
 
         # 从环境变量读取模型
         # 注意：OpenRouter的模型格式是 "openai/gpt-4o-mini"
-        self.model = os.getenv('OPENAI_MODEL', 'gpt-4o')
+        self.model = model or default_model('openai')
 
         print(f"[AI Provider] 使用OpenAI - 模型: {self.model}")
         if base_url:
             print(f"[AI Provider] API端点: {base_url}")
 
-    def generate(self, prompt: str, max_tokens: int = 8000, temperature: float = 0.3) -> str:
+    def _build_messages(self, prompt: str, prefix: Optional[str]) -> List[Dict]:
+        """构建消息列表（前缀作为system消息放在最前，保证跨调用前缀一致）"""
+        messages = []
+        if prefix:
+            if self.model.startswith('anthropic/'):
+                # OpenRouter转发到Claude模型时，需要显式标记缓存断点
+                messages.append({
+                    "role": "system",
+                    "content": [
+                        {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}
+                    ]
+                })
+            else:
+                # OpenAI系模型对 ≥1024 tokens 的公共前缀自动缓存
+                messages.append({"role": "system", "content": prefix})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    @staticmethod
+    def _response_format(json_mode: bool) -> Dict:
+        """JSON模式：约束输出为合法JSON对象"""
+        return {'response_format': {"type": "json_object"}} if json_mode else {}
+
+    @staticmethod
+    def _parse_usage(usage) -> Dict[str, int]:
+        """解析OpenAI格式的usage（cached_tokens位于prompt_tokens_details中）"""
+        result = empty_usage()
+        if usage is None:
+            return result
+
+        result['prompt_tokens'] = getattr(usage, 'prompt_tokens', 0) or 0
+        result['completion_tokens'] = getattr(usage, 'completion_tokens', 0) or 0
+
+        details = getattr(usage, 'prompt_tokens_details', None)
+        if isinstance(details, dict):
+            result['cache_read_tokens'] = details.get('cached_tokens') or 0
+            result['cache_write_tokens'] = details.get('cache_write_tokens') or 0
+        elif details is not None:
+            result['cache_read_tokens'] = getattr(details, 'cached_tokens', 0) or 0
+            result['cache_write_tokens'] = getattr(details, 'cache_write_tokens', 0) or 0
+        return result
+
+    def complete(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        json_mode: bool = False
+    ) -> Dict:
         """调用OpenAI API生成文本"""
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
+            messages=self._build_messages(prompt, prefix),
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **self._response_format(json_mode)
+        )
+        choice = response.choices[0]
+        return {
+            'text': choice.message.content or '',
+            'usage': self._parse_usage(response.usage),
+            'stop_reason': choice.finish_reason,
+            'model': response.model or self.model
+        }
+
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        on_finish: Optional[Callable[[Dict], None]] = None,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        """调用OpenAI流式API，逐段返回增量文本"""
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._build_messages(prompt, prefix),
             max_tokens=max_tokens,
-            temperature=temperature
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._response_format(json_mode)
         )
-        return response.choices[0].message.content
+        usage = None
+        stop_reason = None
+        for chunk in stream:
+            # 最后一个统计块只含usage、不含choices
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            # OpenRouter等平台可能发送不含choices的心跳/统计块
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason:
+                stop_reason = chunk.choices[0].finish_reason
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+        if on_finish:
+            on_finish({
+                'usage': self._parse_usage(usage),
+                'stop_reason': stop_reason,
+                'model': self.model
+            })
 
 
 class ClaudeProvider(AIProvider):
     """Claude (Anthropic) Provider"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    name = 'claude'
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
         try:
             import anthropic
         except ImportError:
@@ -72,33 +244,178 @@ class ClaudeProvider(AIProvider):
         if not self.api_key:
             raise ValueError("未找到 ANTHROPIC_API_KEY，请在 .env 文件中配置")
 
+        # 超时由环境变量控制；SDK自带重试关闭，统一由 provider_middleware 处理
+        client_options = {
+            'timeout': float(os.getenv('LLM_REQUEST_TIMEOUT', '600')),
+            'max_retries': 0
+        }
+
         # 支持OpenRouter或其他代理
         base_url = os.getenv('ANTHROPIC_BASE_URL')
         if base_url:
             self.client = anthropic.Anthropic(
                 api_key=self.api_key,
-                base_url=base_url
+                base_url=base_url,
+                **client_options
             )
-            self.model = os.getenv('ANTHROPIC_MODEL', 'anthropic/claude-sonnet-4')
         else:
-            self.client = anthropic.Anthropic(api_key=self.api_key)
-            self.model = os.getenv('ANTHROPIC_MODEL', 'claude-sonnet-4-20250514')
+            self.client = anthropic.Anthropic(api_key=self.api_key, **client_options)
+        self.model = model or default_model('claude')
 
         print(f"[AI Provider] 使用Claude - 模型: {self.model}")
         if base_url:
             print(f"[AI Provider] API端点: {base_url}")
 
-    def generate(self, prompt: str, max_tokens: int = 8000, temperature: float = 0.3) -> str:
-        """调用Claude API生成文本"""
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            messages=[
+    def _build_request(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        prefix: Optional[str],
+        json_mode: bool = False
+    ) -> Dict:
+        """
+        构建请求参数（前缀放入system并设置cache_control缓存断点）
+
+        JSON模式下以 "{" 预填充assistant回复，模型从对象内部继续输出（返回时需补回 "{"）
+        """
+        request = {
+            'model': self.model,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'messages': [
                 {"role": "user", "content": prompt}
             ]
+        }
+        if json_mode:
+            request['messages'].append({"role": "assistant", "content": "{"})
+        if prefix:
+            request['system'] = [
+                {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}
+            ]
+        return request
+
+    @staticmethod
+    def _parse_usage(usage) -> Dict[str, int]:
+        """解析Anthropic格式的usage（input_tokens不含缓存部分，需要加回）"""
+        result = empty_usage()
+        if usage is None:
+            return result
+
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        result['prompt_tokens'] = (getattr(usage, 'input_tokens', 0) or 0) + cache_read + cache_write
+        result['completion_tokens'] = getattr(usage, 'output_tokens', 0) or 0
+        result['cache_read_tokens'] = cache_read
+        result['cache_write_tokens'] = cache_write
+        return result
+
+    def complete(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        json_mode: bool = False
+    ) -> Dict:
+        """调用Claude API生成文本"""
+        response = self.client.messages.create(
+            **self._build_request(prompt, max_tokens, temperature, prefix, json_mode)
+        )
+        text = "".join(
+            block.text for block in response.content if getattr(block, 'type', '') == 'text'
+        )
+        if json_mode:
+            text = "{" + text
+        return {
+            'text': text,
+            'usage': self._parse_usage(response.usage),
+            'stop_reason': response.stop_reason,
+            'model': response.model or self.model
+        }
+
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        on_finish: Optional[Callable[[Dict], None]] = None,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        """调用Claude流式API，逐段返回增量文本"""
+        # JSON模式的预填充 "{" 随第一个片段一起返回（收到模型输出前不产生任何片段，便于中间件重试）
+        pending = "{" if json_mode else ""
+        with self.client.messages.stream(
+            **self._build_request(prompt, max_tokens, temperature, prefix, json_mode)
+        ) as stream:
+            for text in stream.text_stream:
+                yield pending + text
+                pending = ""
+            final_message = stream.get_final_message()
+        if pending:
+            yield pending
+
+        if on_finish:
+            on_finish({
+                'usage': self._parse_usage(final_message.usage),
+                'stop_reason': final_message.stop_reason,
+                'model': final_message.model or self.model
+            })
+
+
+def default_model(provider_type: str) -> str:
+    """Provider的默认模型（读取 OPENAI_MODEL / ANTHROPIC_MODEL / MOCK_MODEL）"""
+    if provider_type == 'openai':
+        return os.getenv('OPENAI_MODEL', 'gpt-4o')
+    if provider_type == 'claude':
+        # OpenRouter等代理使用 "anthropic/..." 格式的模型名
+        fallback = 'anthropic/claude-sonnet-4' if os.getenv('ANTHROPIC_BASE_URL') else 'claude-sonnet-4-20250514'
+        return os.getenv('ANTHROPIC_MODEL', fallback)
+    return os.getenv('MOCK_MODEL', 'mock-model')
+
+
+def create_provider(provider_type: str, model: Optional[str] = None) -> AIProvider:
+    """
+    按类型创建单个Provider（已包装限流、重试和熔断）
+
+    设置 LLM_RECORD_MODE=record|replay|auto 时额外包装录制/回放（目录 LLM_RECORD_DIR），
+    replay 模式不创建真实Provider，无需API密钥和网络
+
+    Args:
+        provider_type: openai | claude | mock
+        model: 模型名称，不提供则读取 OPENAI_MODEL / ANTHROPIC_MODEL
+    """
+    from .provider_middleware import ResilientProvider
+
+    provider_type = provider_type.strip().lower()
+    record_mode = os.getenv('LLM_RECORD_MODE', '').strip().lower()
+
+    if record_mode == 'replay':
+        provider = None
+    elif provider_type == 'openai':
+        provider = OpenAIProvider(model=model)
+    elif provider_type == 'claude':
+        provider = ClaudeProvider(model=model)
+    elif provider_type == 'mock':
+        from .mock_provider import MockProvider
+        provider = MockProvider.from_env(model=model)
+    else:
+        raise ValueError(f"不支持的AI Provider: {provider_type}，请设置为 'openai'、'claude' 或 'mock'")
+
+    if record_mode and record_mode != 'off':
+        from .record_replay import RecordReplayProvider
+        provider = RecordReplayProvider(
+            provider,
+            record_dir=os.getenv('LLM_RECORD_DIR', 'data/recordings'),
+            mode=record_mode,
+            name=provider_type,
+            model=model or default_model(provider_type),
+            replay_timing=os.getenv('LLM_REPLAY_TIMING', 'false').lower() in ('true', '1', 'yes')
         )
-        return response.content[0].text
+
+    # 外层包装限流、重试与熔断
+    return ResilientProvider.from_env(provider)
 
 
 def get_ai_provider() -> AIProvider:
@@ -108,12 +425,19 @@ def get_ai_provider() -> AIProvider:
     环境变量配置：
     AI_PROVIDER=openai    → 使用OpenAI GPT-4o
     AI_PROVIDER=claude    → 使用Claude（默认）
+    AI_PROVIDER=mock      → 本地模拟（离线测试/压测，见 mock_provider）
+    AI_PROVIDER=composite → 组合多个后端（COMPOSITE_BACKENDS=openai,claude），支持对冲请求和故障转移
+
+    返回的Provider已包装限流、重试和熔断（见 provider_middleware）
     """
     provider_type = os.getenv('AI_PROVIDER', 'claude').lower()
 
-    if provider_type == 'openai':
-        return OpenAIProvider()
-    elif provider_type == 'claude':
-        return ClaudeProvider()
-    else:
-        raise ValueError(f"不支持的AI Provider: {provider_type}，请设置为 'openai' 或 'claude'")
+    if provider_type == 'composite':
+        from .composite_provider import CompositeProvider
+
+        backend_types = [t for t in os.getenv('COMPOSITE_BACKENDS', 'openai,claude').split(',') if t.strip()]
+        backends = [create_provider(t) for t in backend_types]
+        print(f"[AI Provider] 组合模式 - 后端: {', '.join(backend_types)}")
+        return CompositeProvider.from_env(backends)
+
+    return create_provider(provider_type)
@@ -4,21 +4,115 @@ AI 服务模块
 """
 
 import os
+import re
 import json
-from typing import List, Dict, Optional
+import time
+import threading
+import contextvars
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Iterator, Tuple
 from dotenv import load_dotenv
-from .ai_provider import get_ai_provider, AIProvider
-from .text_processor import TextProcessor, ContentCompressor
+from .ai_provider import get_ai_provider, AIProvider, empty_usage
+from .llm_cache import LLMCache
+from .model_router import ModelRouter
+from .metrics import MetricsStore, get_record_context
+from .outline_stream import IncrementalOutlineParser
+from .retrieval import BM25Index, RetrievalIndexCache
+from .context_planner import ContextPlanner, split_by_tokens
+from .output_budget import is_truncated, section_output_tokens, continuation_delta, ContinuationStitcher
+from .token_calibration import TokenCalibrator, get_calibrator
+from .proposal_summary import ProposalSummary
+from .section_packer import SectionPacker, parse_packed_output
+from .summary_tree import SummaryTree, split_chapters, content_hash
+from .fact_extractor import FactExtractor, render_fact_sheet
+from .amendment_diff import diff_documents, render_diff, patch_report
+from .report_store import split_report_sections, report_context, CRITERIA_CATEGORIES
+from .section_library import SectionLibrary
+from .single_flight import SingleFlight, get_single_flight
+from .scheduler import get_scheduler, scheduling_enabled, context_with_priority
+from .text_processor import TextProcessor
 from .prompts import (
-    BIDDING_DOCUMENT_ANALYSIS_PROMPT,
-    EVALUATION_CRITERIA_EXTRACTION_PROMPT,
-    TECHNICAL_PROPOSAL_OUTLINE_PROMPT,
-    TECHNICAL_PROPOSAL_SECTION_PROMPT
+    BIDDING_DOCUMENT_ANALYSIS_PREFIX,
+    BIDDING_DOCUMENT_ANALYSIS_SUFFIX,
+    BIDDING_DOCUMENT_MAP_PREFIX,
+    BIDDING_DOCUMENT_MAP_SUFFIX,
+    EVALUATION_CRITERIA_EXTRACTION_PREFIX,
+    EVALUATION_CRITERIA_EXTRACTION_SUFFIX,
+    TECHNICAL_PROPOSAL_CONTEXT_PREFIX,
+    TECHNICAL_PROPOSAL_OUTLINE_SUFFIX,
+    TECHNICAL_PROPOSAL_SECTION_SUFFIX,
+    TECHNICAL_PROPOSAL_SECTION_REFERENCES,
+    TECHNICAL_PROPOSAL_SECTION_CONSISTENCY,
+    TECHNICAL_PROPOSAL_SECTION_DRAFTS,
+    TECHNICAL_PROPOSAL_PACKED_SECTIONS_SUFFIX,
+    TECHNICAL_PROPOSAL_PACKED_SECTION_ITEM,
+    BIDDING_RESPONSE_RETRIEVAL_QUERY,
+    SUMMARY_TREE_CHUNK_PREFIX,
+    SUMMARY_TREE_CHUNK_SUFFIX,
+    SUMMARY_TREE_CHAPTER_PREFIX,
+    SUMMARY_TREE_CHAPTER_SUFFIX,
+    SUMMARY_TREE_DOCUMENT_PREFIX,
+    SUMMARY_TREE_DOCUMENT_SUFFIX,
+    SUMMARY_TREE_CRITERIA_QUERY,
+    TENDER_FACTS_SECTION,
+    AMENDMENT_REANALYSIS_PREFIX,
+    AMENDMENT_REANALYSIS_SUFFIX,
+    TENDER_CHAT_PREFIX,
+    TENDER_CHAT_SUFFIX,
+    CHAT_HISTORY_SECTION,
+    CHAT_RECENT_SECTION,
+    CHAT_HISTORY_SUMMARY_PREFIX,
+    CHAT_HISTORY_SUMMARY_SUFFIX,
+    OUTPUT_CONTINUATION_SUFFIX
 )
 
 # 加载环境变量
 load_dotenv()
 
+# 各任务的生成参数 (max_tokens, temperature)，交互调用与批量模式共用
+TASK_PARAMS = {
+    'analysis': (16000, 0.2),
+    'criteria': (8000, 0.3),
+    'outline': (8000, 0.4),
+    'section': (8000, 0.5),
+    'chat': (2000, 0.3),
+}
+
+
+def extract_sections_from_outline(outline_data: Dict) -> List[Dict]:
+    """从目录结构中提取所有可生成的章节（带 word_count 的节点，标题带上级标题）"""
+    sections = []
+
+    if outline_data.get('raw'):
+        # 原始文本格式，无法提取
+        return []
+
+    if 'outline' in outline_data and isinstance(outline_data['outline'], list):
+        for item in outline_data['outline']:
+            _extract_sections_recursive(item, sections)
+
+    return sections
+
+
+def _extract_sections_recursive(item: Dict, sections: List[Dict], parent_title: str = ''):
+    """递归提取章节"""
+    title = item.get('title', '')
+    full_title = f"{parent_title} {title}".strip() if parent_title else title
+
+    # 如果有 word_count，说明是可生成的章节
+    if 'word_count' in item:
+        sections.append({
+            'title': full_title,
+            'word_count': item['word_count'],
+            'description': item.get('description', '')
+        })
+
+    # 递归处理子项
+    if 'children' in item and item['children']:
+        for child in item['children']:
+            _extract_sections_recursive(child, sections, full_title)
+
 
 class ClaudeService:
     """
@@ -28,25 +122,425 @@ class ClaudeService:
     为了保持向后兼容，类名不变
     """
 
-    def __init__(self, provider: Optional[AIProvider] = None):
+    def __init__(
+        self,
+        provider: Optional[AIProvider] = None,
+        cache: Optional[LLMCache] = None,
+        router: Optional[ModelRouter] = None,
+        metrics: Optional[MetricsStore] = None,
+        retrieval: Optional[RetrievalIndexCache] = None,
+        calibrator: Optional[TokenCalibrator] = None,
+        single_flight: Optional[SingleFlight] = None,
+        section_library: Optional[SectionLibrary] = None
+    ):
         """
         初始化 AI 服务
 
         Args:
             provider: AI Provider实例，如果不提供则从环境变量自动选择
+            cache: 响应缓存，如果不提供则按环境变量创建（LLM_CACHE_ENABLED=false 关闭）
+            router: 任务级模型路由，如果不提供：传入了provider则所有任务都使用该provider，
+                    否则按环境变量（MODEL_ROUTE_<任务>、MODEL_ROUTES_FILE）创建
+            metrics: 调用指标存储，如果不提供则按环境变量创建（METRICS_ENABLED=false 关闭）
+            retrieval: 招标文件检索索引缓存，如果不提供则按环境变量创建（RETRIEVAL_ENABLED=false 关闭）
+            calibrator: token估算校准器，如果不提供则使用进程内共享的校准器（TOKEN_CALIBRATION_ENABLED=false 关闭）
+            single_flight: 相同请求合并器，如果不提供则使用进程内共享的合并器（SINGLE_FLIGHT_ENABLED=false 关闭）
+            section_library: 历史章节库，如果不提供则按环境变量创建（SECTION_LIBRARY_ENABLED=false 关闭）
         """
         if provider:
             self.provider = provider
+            self.router = router or ModelRouter(provider)
         else:
             # 从环境变量自动选择provider
             self.provider = get_ai_provider()
+            self.router = router or ModelRouter.from_env(self.provider)
+
+        self.cache = cache if cache is not None else LLMCache.from_env()
+        self.metrics = metrics if metrics is not None else MetricsStore.from_env()
+        self.retrieval = retrieval if retrieval is not None else RetrievalIndexCache.from_env()
+        self.planner = ContextPlanner.from_env(self.metrics)
+        self.packer = SectionPacker.from_env()
+        self.fact_extractor = FactExtractor.from_env()
+        self.section_library = section_library if section_library is not None else SectionLibrary.from_env()
+        self.calibrator = calibrator if calibrator is not None else get_calibrator()
+        self.single_flight = single_flight if single_flight is not None else get_single_flight()
+        # 所有模型调用按优先级排队获取并发名额（LLM_SCHEDULER_ENABLED=false 关闭）
+        self.scheduling = scheduling_enabled()
+
+        # 输出被 max_tokens 截断时的最大续写次数（0 表示不续写）
+        self.max_continuations = int(os.getenv('OUTPUT_MAX_CONTINUATIONS', '3'))
+
+        # 检索参数：每个章节的片段数 / 章节参考条款字符上限 / 投标文件生成的原文要点字符上限
+        self.retrieval_top_k = int(os.getenv('RETRIEVAL_TOP_K', '4'))
+        self.retrieval_section_chars = int(os.getenv('RETRIEVAL_SECTION_CHARS', '2000'))
+        self.retrieval_generation_chars = int(os.getenv('RETRIEVAL_GENERATION_CHARS', '4000'))
+
+        # 分层摘要参数：片段大小 / 各级摘要的最大输出token数 / 评审标准提取时附带的章节摘要字符上限
+        self.summary_chunk_tokens = int(os.getenv('SUMMARY_TREE_CHUNK_TOKENS', '3000'))
+        self.summary_output_tokens = {
+            'chunk': int(os.getenv('SUMMARY_TREE_CHUNK_OUTPUT_TOKENS', '600')),
+            'chapter': int(os.getenv('SUMMARY_TREE_CHAPTER_OUTPUT_TOKENS', '800')),
+            'document': int(os.getenv('SUMMARY_TREE_DOCUMENT_OUTPUT_TOKENS', '1500')),
+        }
+        self.summary_criteria_chars = int(os.getenv('SUMMARY_TREE_CRITERIA_CHARS', '3000'))
+
+        # 增量解析参数：变更前后保留的上下文段落数 / 提示词中变更内容的字符上限
+        self.amendment_context = int(os.getenv('AMENDMENT_CONTEXT_PARAGRAPHS', '1'))
+        self.amendment_max_diff_chars = int(os.getenv('AMENDMENT_MAX_DIFF_CHARS', '30000'))
+
+        # 历史章节复用参数：参考稿数量 / 参考稿最低相似度 / 每篇参考稿字符上限 /
+        # 直接采用所需的标题相似度和项目评审标准相似度
+        self.section_library_top_k = int(os.getenv('SECTION_LIBRARY_TOP_K', '2'))
+        self.section_library_min_score = float(os.getenv('SECTION_LIBRARY_MIN_SCORE', '0.3'))
+        self.section_library_draft_chars = int(os.getenv('SECTION_LIBRARY_DRAFT_CHARS', '1500'))
+        self.section_reuse_threshold = float(os.getenv('SECTION_REUSE_THRESHOLD', '0.9'))
+        self.section_reuse_project_threshold = float(os.getenv('SECTION_REUSE_PROJECT_THRESHOLD', '0.5'))
+
+        # 标书问答参数：对话历史token上限（超出时压缩较早的轮次）/ 保留原文的最近消息数 /
+        # 历史摘要的最大输出token数 / 前缀中解析报告的字符上限 / 每个问题检索的片段数和字符上限
+        self.chat_history_tokens = int(os.getenv('CHAT_HISTORY_TOKENS', '3000'))
+        self.chat_keep_messages = int(os.getenv('CHAT_KEEP_MESSAGES', '4'))
+        self.chat_summary_tokens = int(os.getenv('CHAT_SUMMARY_TOKENS', '800'))
+        self.chat_report_chars = int(os.getenv('CHAT_REPORT_CHARS', '30000'))
+        self.chat_top_k = int(os.getenv('CHAT_TOP_K', '6'))
+        self.chat_reference_chars = int(os.getenv('CHAT_REFERENCE_CHARS', '4000'))
+
+        # 累计token用量（含前缀缓存读取/写入）
+        self.usage_totals = empty_usage()
+        self.usage_totals['calls'] = 0
+        self._usage_lock = threading.Lock()
+
+    def _scheduled(self, provider: AIProvider, task: str):
+        """占用provider调度器的一个并发名额（优先级和用户取自当前上下文）"""
+        if not self.scheduling:
+            return nullcontext()
+        return get_scheduler(provider.name).slot(label=task)
+
+    def _record_usage(self, result: Dict, task: str = 'default'):
+        """累计一次调用的token用量并打印任务、模型和缓存情况"""
+        usage = result.get('usage') or empty_usage()
+        with self._usage_lock:
+            for key in ('prompt_tokens', 'completion_tokens', 'cache_read_tokens', 'cache_write_tokens'):
+                self.usage_totals[key] += usage.get(key, 0)
+            self.usage_totals['calls'] += 1
+
+        print(
+            f"[AI Service] [{task}] {result.get('model') or ''} "
+            f"tokens: 输入 {usage.get('prompt_tokens', 0):,} "
+            f"(缓存读取 {usage.get('cache_read_tokens', 0):,} / 写入 {usage.get('cache_write_tokens', 0):,})，"
+            f"输出 {usage.get('completion_tokens', 0):,}"
+        )
+
+    def _record_metrics(
+        self,
+        task: str,
+        provider: AIProvider,
+        started: float,
+        result: Optional[Dict] = None,
+        ttft: Optional[float] = None,
+        stream: bool = False,
+        cache_hit: bool = False,
+        error: Optional[Exception] = None
+    ):
+        """写入一次调用的指标（started/ttft 为 time.monotonic() 时间点）"""
+        if not self.metrics:
+            return
+        result = result or {}
+        self.metrics.record(
+            task=task,
+            provider=provider.name,
+            model=result.get('model') or provider.model,
+            usage=result.get('usage'),
+            latency_ms=(time.monotonic() - started) * 1000,
+            ttft_ms=(ttft - started) * 1000 if ttft is not None else None,
+            stop_reason=result.get('stop_reason'),
+            stream=stream,
+            cache_hit=cache_hit,
+            error=f"{error.__class__.__name__}: {error}" if error is not None else None
+        )
+
+    def _record_calibration(self, provider: AIProvider, prompt: str, prefix: Optional[str], result: Dict):
+        """记录token估算校准样本（实际发送的提示词全文 + 服务端计费的 prompt_tokens）"""
+        usage = result.get('usage') or {}
+        if self.calibrator and usage.get('prompt_tokens'):
+            self.calibrator.record(provider.model, (prefix or '') + prompt, usage['prompt_tokens'])
+
+    def get_usage_statistics(self) -> Dict:
+        """获取累计token用量及前缀缓存命中率"""
+        with self._usage_lock:
+            stats = dict(self.usage_totals)
+        prompt_tokens = stats['prompt_tokens']
+        stats['cache_read_ratio'] = stats['cache_read_tokens'] / prompt_tokens if prompt_tokens else 0.0
+        stats['coalesced_calls'] = self.single_flight.stats()['coalesced'] if self.single_flight else 0
+        return stats
+
+    def _generate(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        prefix: Optional[str] = None,
+        use_cache: bool = True,
+        task: str = 'default',
+        json_mode: bool = False
+    ) -> str:
+        """
+        统一的生成入口（按任务路由Provider，先查缓存，未命中再调用，输出被截断时自动续写；
+        与进行中的相同请求合并为一次调用）
+
+        Args:
+            prompt: 提示词（随任务变化的部分）
+            max_tokens: 最大输出token数
+            temperature: 温度
+            prefix: 稳定的长上下文前缀（可被Provider前缀缓存命中）
+            use_cache: 是否使用响应缓存（False 时强制重新生成，但仍会写入缓存）
+            task: 任务类型（见 model_router.TASKS），决定使用的provider和模型
+            json_mode: 是否约束输出为JSON对象
+
+        Returns:
+            模型输出文本
+        """
+        provider = self.router.provider_for(task)
+        started = time.monotonic()
+
+        cache_key = LLMCache.make_key(
+            provider.name, provider.model, prompt, temperature, max_tokens, prefix=prefix, json_mode=json_mode
+        )
+        if self.cache and use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"[AI Service] [{task}] 命中缓存 ({cache_key[:8]})")
+                self._record_metrics(task, provider, started, cache_hit=True)
+                return cached
+
+        def call() -> str:
+            return self._complete_upstream(provider, cache_key, prompt, max_tokens, temperature, prefix, task, json_mode)
+
+        if not self.single_flight:
+            return call()
+        response, shared = self.single_flight.do(cache_key, call)
+        if shared:
+            self._record_metrics(task, provider, started, cache_hit=True)
+        return response
+
+    def _complete_upstream(
+        self,
+        provider: AIProvider,
+        cache_key: str,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        prefix: Optional[str],
+        task: str,
+        json_mode: bool
+    ) -> str:
+        """实际调用Provider（含自动续写），完成后写入响应缓存（调度排队时间不计入调用耗时）"""
+        started = time.monotonic()
+        try:
+            with self._scheduled(provider, task):
+                started = time.monotonic()
+                result = provider.complete(
+                    prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, json_mode=json_mode
+                )
+        except Exception as e:
+            self._record_metrics(task, provider, started, error=e)
+            raise
+        self._record_usage(result, task)
+        self._record_metrics(task, provider, started, result=result)
+        self._record_calibration(provider, prompt, prefix, result)
+        response = result['text']
+
+        if is_truncated(result.get('stop_reason')):
+            response = self.continue_output(task, prompt, response, max_tokens, temperature, prefix)
+
+        if self.cache:
+            self.cache.set(cache_key, response, provider.name, provider.model)
+        return response
+
+    def _generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        prefix: Optional[str] = None,
+        use_cache: bool = True,
+        task: str = 'default',
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        """
+        统一的流式生成入口（命中缓存时一次性返回缓存内容，输出被截断时自动续写并接在后面输出；
+        与进行中的相同流式请求合并，后加入的调用方先回放已输出的内容）
+
+        参数同 _generate
+        """
+        provider = self.router.provider_for(task)
+        started = time.monotonic()
+
+        cache_key = LLMCache.make_key(
+            provider.name, provider.model, prompt, temperature, max_tokens, prefix=prefix, json_mode=json_mode
+        )
+        if self.cache and use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"[AI Service] [{task}] 命中缓存 ({cache_key[:8]})")
+                self._record_metrics(task, provider, started, stream=True, cache_hit=True)
+                yield cached
+                return
+
+        def upstream() -> Iterator[str]:
+            return self._stream_upstream(provider, cache_key, prompt, max_tokens, temperature, prefix, task, json_mode)
+
+        if not self.single_flight:
+            yield from upstream()
+            return
+        yield from self.single_flight.stream(cache_key, upstream)
+
+    def _stream_upstream(
+        self,
+        provider: AIProvider,
+        cache_key: str,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        prefix: Optional[str],
+        task: str,
+        json_mode: bool
+    ) -> Iterator[str]:
+        """实际流式调用Provider（含自动续写），完整结束后写入响应缓存"""
+        started = time.monotonic()
+        chunks = []
+        call_prompt = prompt
+        continuations = 0
+        while True:
+            finish_info = {}
+
+            def on_finish(info: Dict):
+                finish_info.update(info)
+                self._record_usage(info, task)
+
+            # 续写时缓冲开头，去除与已输出结尾重复的部分后再输出
+            stitcher = ContinuationStitcher("".join(chunks)) if continuations else None
+            ttft = None
+            try:
+                with self._scheduled(provider, task):
+                    started = time.monotonic()
+                    for delta in provider.generate_stream(
+                        call_prompt,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        prefix=prefix,
+                        on_finish=on_finish,
+                        json_mode=json_mode and not continuations
+                    ):
+                        if ttft is None:
+                            ttft = time.monotonic()
+                        if stitcher:
+                            delta = stitcher.feed(delta)
+                            if not delta:
+                                continue
+                        chunks.append(delta)
+                        yield delta
+                if stitcher:
+                    delta = stitcher.flush()
+                    if delta:
+                        chunks.append(delta)
+                        yield delta
+            except GeneratorExit:
+                # 调用方提前停止读取（如页面刷新），按取消记录
+                self._record_metrics(
+                    task, provider, started, result=finish_info, ttft=ttft, stream=True,
+                    error=RuntimeError('调用方取消')
+                )
+                raise
+            except Exception as e:
+                self._record_metrics(task, provider, started, result=finish_info, ttft=ttft, stream=True, error=e)
+                raise
+            self._record_metrics(task, provider, started, result=finish_info, ttft=ttft, stream=True)
+            self._record_calibration(provider, call_prompt, prefix, finish_info)
+
+            if not is_truncated(finish_info.get('stop_reason')) or continuations >= self.max_continuations:
+                break
+            continuations += 1
+            print(f"[AI Service] [{task}] 输出达到 max_tokens（{max_tokens}），第{continuations}次续写")
+            call_prompt = OUTPUT_CONTINUATION_SUFFIX.format(prompt=prompt, partial="".join(chunks))
+
+        # 只有完整结束的输出才写入缓存
+        if self.cache:
+            self.cache.set(cache_key, "".join(chunks), provider.name, provider.model)
+
+    def continue_output(
+        self,
+        task: str,
+        prompt: str,
+        partial: str,
+        max_tokens: int,
+        temperature: float,
+        prefix: Optional[str] = None
+    ) -> str:
+        """
+        续写被 max_tokens 截断的输出，直到正常结束或达到最大续写次数
+
+        续写请求沿用原前缀（命中前缀缓存），指令部分附上已输出内容；
+        拼接时去除续写开头与已输出结尾重复的部分
 
-    def analyze_bidding_document(self, document_contents: Dict[str, str]) -> str:
+        Args:
+            task: 任务类型
+            prompt: 原指令（随任务变化的部分）
+            partial: 已输出（被截断）的内容
+            max_tokens: 每次续写的最大输出token数
+            temperature: 温度
+            prefix: 原前缀
+
+        Returns:
+            拼接后的完整输出
+        """
+        provider = self.router.provider_for(task)
+        text = partial
+        for attempt in range(1, self.max_continuations + 1):
+            print(f"[AI Service] [{task}] 输出达到 max_tokens（{max_tokens}），第{attempt}次续写")
+            started = time.monotonic()
+            continuation_prompt = OUTPUT_CONTINUATION_SUFFIX.format(prompt=prompt, partial=text)
+            try:
+                with self._scheduled(provider, task):
+                    started = time.monotonic()
+                    result = provider.complete(
+                        continuation_prompt,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        prefix=prefix
+                    )
+            except Exception as e:
+                self._record_metrics(task, provider, started, error=e)
+                raise
+            self._record_usage(result, task)
+            self._record_metrics(task, provider, started, result=result)
+            self._record_calibration(provider, continuation_prompt, prefix, result)
+            text += continuation_delta(text, result['text'])
+            if not is_truncated(result.get('stop_reason')):
+                break
+        return text
+
+    def get_retriever(self, document_contents: Dict[str, str]) -> Optional[BM25Index]:
+        """
+        获取招标文件的检索索引（按内容缓存，同一项目只构建一次）
+
+        Args:
+            document_contents: {文件类别: 解析后的文本}
+
+        Returns:
+            BM25Index，检索关闭或文件为空时返回 None
+        """
+        if not self.retrieval or not document_contents:
+            return None
+        return self.retrieval.get(document_contents)
+
+    def analyze_bidding_document(self, document_contents: Dict[str, str], use_cache: bool = True) -> str:
         """
         分析标书文件
 
         Args:
             document_contents: 字典，键为文件类型（如"PDF规范"），值为文件内容
+            use_cache: 是否使用响应缓存
 
         Returns:
             分析报告文本
@@ -55,13 +549,15 @@ class ClaudeService:
         prompt = self._build_analysis_prompt(document_contents)
 
         # 调用 AI Provider
-        return self.provider.generate(prompt, max_tokens=8000, temperature=0.3)
+        return self._generate(prompt, max_tokens=8000, temperature=0.3, use_cache=use_cache, task='analysis')
 
     def generate_bidding_response(
         self,
         analysis_report: str,
         document_contents: Dict[str, str],
-        requirements: Optional[str] = None
+        requirements: Optional[str] = None,
+        use_cache: bool = True,
+        summary_tree: Optional[SummaryTree] = None
     ) -> str:
         """
         生成投标文件
@@ -70,6 +566,8 @@ class ClaudeService:
             analysis_report: 之前生成的分析报告
             document_contents: 原始标书内容
             requirements: 额外的生成要求
+            use_cache: 是否使用响应缓存
+            summary_tree: 招标文件分层摘要（提供时附上各文件的全文概要）
 
         Returns:
             生成的投标文件内容
@@ -77,11 +575,12 @@ class ClaudeService:
         prompt = self._build_generation_prompt(
             analysis_report,
             document_contents,
-            requirements
+            requirements,
+            summary_tree
         )
 
         # 调用 AI Provider
-        return self.provider.generate(prompt, max_tokens=8000, temperature=0.5)
+        return self._generate(prompt, max_tokens=8000, temperature=0.5, use_cache=use_cache, task='generation')
 
     def _build_analysis_prompt(self, document_contents: Dict[str, str]) -> str:
         """构建标书分析提示词"""
@@ -146,22 +645,32 @@ class ClaudeService:
         self,
         analysis_report: str,
         document_contents: Dict[str, str],
-        requirements: Optional[str]
+        requirements: Optional[str],
+        summary_tree: Optional[SummaryTree] = None
     ) -> str:
         """构建投标文件生成提示词"""
         prompt_parts = [
             "你是一位经验丰富的投标文件编写专家。基于以下标书分析报告和原始标书文件，请生成一份专业的投标响应文件。\n",
             "=== 标书分析报告 ===\n",
             analysis_report,
-            "\n\n=== 原始标书要点 ===\n"
         ]
-
-        # 添加简要的标书内容
-        for file_type, content in document_contents.items():
-            if content and content.strip():
-                # 只添加前2000字符，避免太长
-                truncated = content[:2000] + "..." if len(content) > 2000 else content
-                prompt_parts.append(f"\n【{file_type}】\n{truncated}\n")
+        if summary_tree:
+            prompt_parts.append(f"\n\n=== 招标文件概要 ===\n{summary_tree.context('document')}")
+        prompt_parts.append("\n\n=== 原始标书要点 ===\n")
+
+        # 检索与生成要求最相关的原文条款；未启用检索时退回到截取各文件开头
+        retriever = self.get_retriever(document_contents)
+        if retriever:
+            query = f"{BIDDING_RESPONSE_RETRIEVAL_QUERY} {requirements or ''}"
+            prompt_parts.append(retriever.context_for(
+                query, top_k=self.retrieval_top_k * 3, max_chars=self.retrieval_generation_chars
+            ) + "\n")
+        else:
+            for file_type, content in document_contents.items():
+                if content and content.strip():
+                    # 只添加前2000字符，避免太长
+                    truncated = content[:2000] + "..." if len(content) > 2000 else content
+                    prompt_parts.append(f"\n【{file_type}】\n{truncated}\n")
 
         if requirements:
             prompt_parts.append(f"\n=== 特殊要求 ===\n{requirements}\n")
@@ -203,82 +712,394 @@ class ClaudeService:
 
         return "".join(prompt_parts)
 
-    def parse_bidding_document_structured(self, document_contents: Dict[str, str]) -> str:
+    def parse_bidding_document_structured(
+        self,
+        document_contents: Dict[str, str],
+        use_cache: bool = True,
+        plan: Optional[Dict] = None
+    ) -> str:
         """
-        结构化解析招标文件（7类分析）- 支持大文档自动压缩
+        结构化解析招标文件（7类分析）- 按上下文窗口自动选择输入策略
 
         Args:
             document_contents: 文件内容字典
+            use_cache: 是否使用响应缓存
+            plan: plan_analysis_input 返回的输入规划，不提供时自动规划
 
         Returns:
             结构化解析报告
         """
-        # 合并所有文件内容
+        prefix, prompt = self._build_structured_analysis_prompt(document_contents, plan, use_cache)
+
+        # 调用 AI Provider
+        max_tokens, temperature = TASK_PARAMS['analysis']
+        return self._generate(
+            prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, use_cache=use_cache, task='analysis'
+        )
+
+    def parse_bidding_document_structured_stream(
+        self,
+        document_contents: Dict[str, str],
+        use_cache: bool = True,
+        plan: Optional[Dict] = None
+    ) -> Iterator[str]:
+        """
+        结构化解析招标文件（流式版本，map_reduce 策略的分块摘录在开始输出前完成）
+
+        Args:
+            document_contents: 文件内容字典
+            use_cache: 是否使用响应缓存
+            plan: plan_analysis_input 返回的输入规划，不提供时自动规划
+
+        Yields:
+            解析报告的增量文本片段
+        """
+        prefix, prompt = self._build_structured_analysis_prompt(document_contents, plan, use_cache)
+        max_tokens, temperature = TASK_PARAMS['analysis']
+        return self._generate_stream(
+            prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, use_cache=use_cache, task='analysis'
+        )
+
+    def extract_tender_facts(self, document_contents: Dict[str, str]) -> Dict[str, Dict]:
+        """
+        本地规则提取关键信息（投标截止时间、开标时间、投标保证金、项目编号、工期、资质等级）
+
+        Args:
+            document_contents: 文件内容字典
+
+        Returns:
+            关键信息（见 FactExtractor.extract），未启用时返回空字典
+        """
+        if not self.fact_extractor:
+            return {}
+        return self.fact_extractor.extract(document_contents)
+
+    def _tender_facts_section(self, document_contents: Dict[str, str]) -> str:
+        """解析提示词中的预提取关键信息（没有找到任何信息时为空）"""
+        facts = render_fact_sheet(self.extract_tender_facts(document_contents))
+        return TENDER_FACTS_SECTION.format(facts=facts) if facts else ''
+
+    @staticmethod
+    def _combine_documents(document_contents: Dict[str, str]) -> str:
+        """合并所有文件内容（每个文件前标注文件类别）"""
         combined_content = []
         for file_type, content in document_contents.items():
             if content and content.strip():
                 combined_content.append(f"\n【{file_type}】\n{content}\n")
+        return "\n".join(combined_content)
 
-        document_text = "\n".join(combined_content)
+    def plan_analysis_input(self, document_contents: Dict[str, str]) -> Dict:
+        """
+        规划结构化解析的输入策略（直接发送 / 去重 / 压缩 / 分块摘录后汇总）
 
-        # 估算token数
-        total_tokens = TextProcessor.estimate_tokens(document_text)
-        print(f"[AI Service] 文档总token数: {total_tokens:,}")
+        按解析任务所用模型的上下文窗口、指令长度和输出预留计算；
+        COMPRESSION_RATIO 设置为小于1时作为手动压缩率优先使用
 
-        # 从环境变量读取配置
-        compression_ratio = float(os.getenv('COMPRESSION_RATIO', '1.0'))
+        Args:
+            document_contents: 文件内容字典
 
-        print(f"[AI Service] 压缩率设置: {compression_ratio}")
+        Returns:
+            输入规划（见 ContextPlanner.plan），可直接显示或传给解析方法
+        """
+        provider = self.router.provider_for('analysis')
+        max_tokens, _ = TASK_PARAMS['analysis']
+        instruction_tokens = TextProcessor.estimate_tokens(
+            BIDDING_DOCUMENT_ANALYSIS_PREFIX.format(document_content='') + BIDDING_DOCUMENT_ANALYSIS_SUFFIX
+            + self._tender_facts_section(document_contents),
+            provider.model
+        )
+        compression_ratio = float(os.getenv('COMPRESSION_RATIO', '1.0'))
+        return self.planner.plan(
+            self._combine_documents(document_contents),
+            provider.model,
+            instruction_tokens,
+            max_tokens,
+            task='analysis',
+            forced_ratio=compression_ratio if compression_ratio < 1.0 else None
+        )
 
-        # 仅按照用户设置的压缩率处理，不自动判断
-        if compression_ratio < 1.0:
-            # 计算目标token数
-            target_tokens = int(total_tokens * compression_ratio)
+    def _map_document_parts(self, parts: List[str], use_cache: bool = True) -> str:
+        """
+        map 阶段：并发对各分块做信息摘录，按分块顺序合并
 
-            print(f"[AI Service] 开始智能压缩 ({total_tokens:,} → {target_tokens:,} tokens)")
+        Args:
+            parts: 分块文本
+            use_cache: 是否使用响应缓存
 
-            # 压缩策略：保留关键信息（标题、要求、数值等）
-            compressed_text = ContentCompressor.compress_for_analysis(
-                document_text,
-                target_ratio=compression_ratio
+        Returns:
+            合并后的摘录（作为汇总解析的文档内容）
+        """
+        max_workers = max(1, min(self.planner.map_concurrency, len(parts)))
+        print(f"[AI Service] 分块摘录: {len(parts)} 块（并发数: {max_workers}）")
+
+        def extract(index: int, part: str) -> str:
+            prefix = BIDDING_DOCUMENT_MAP_PREFIX.format(part=index + 1, total=len(parts), document_content=part)
+            return self._generate(
+                BIDDING_DOCUMENT_MAP_SUFFIX,
+                max_tokens=self.planner.map_output_tokens,
+                temperature=0.2,
+                prefix=prefix,
+                use_cache=use_cache,
+                task='map'
             )
 
-            document_text = compressed_text
-            final_tokens = TextProcessor.estimate_tokens(document_text)
-            actual_ratio = final_tokens / total_tokens
-            print(f"[AI Service] 压缩完成: {final_tokens:,} tokens，实际压缩率: {actual_ratio*100:.1f}%")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, extract, index, part)
+                for index, part in enumerate(parts)
+            ]
+            extracts = [future.result() for future in futures]
+
+        return "\n".join(
+            f"\n【第{index}部分摘录】\n{extract}\n" for index, extract in enumerate(extracts, 1)
+        )
+
+    def _build_structured_analysis_prompt(
+        self,
+        document_contents: Dict[str, str],
+        plan: Optional[Dict] = None,
+        use_cache: bool = True
+    ) -> Tuple[str, str]:
+        """
+        构建结构化解析提示词（按输入规划处理文件内容）
+
+        Returns:
+            (缓存前缀, 指令部分)
+        """
+        plan = plan or self.plan_analysis_input(document_contents)
+
+        if plan['strategy'] == 'map_reduce':
+            document_text = self._map_document_parts(plan['parts'], use_cache)
+            # 摘录合并后仍超出时截断（保留标题结构）
+            if TextProcessor.estimate_tokens(document_text, plan['model']) > plan['budget_tokens']:
+                document_text = TextProcessor.smart_truncate(document_text, plan['budget_tokens'])
         else:
-            print(f"[AI Service] 不压缩（COMPRESSION_RATIO=1.0）")
+            document_text = plan['document_text']
+
+        # 使用新的解析提示词（招标文件原文作为缓存前缀）；
+        # 预提取的关键信息取自完整原文（分块摘录或压缩后也不会丢失），随原文一起缓存
+        prefix = BIDDING_DOCUMENT_ANALYSIS_PREFIX.format(document_content=document_text)
+        prefix += self._tender_facts_section(document_contents)
+        return prefix, BIDDING_DOCUMENT_ANALYSIS_SUFFIX
+
+    def diff_amendment(self, old_contents: Dict[str, str], new_contents: Dict[str, str]) -> Dict:
+        """
+        按段落比较上次解析时的文件内容与当前文件内容（本地计算，不调用模型）
+
+        Returns:
+            变更（见 diff_documents）
+        """
+        return diff_documents(old_contents, new_contents, context=self.amendment_context)
+
+    def reanalyze_amendment(
+        self,
+        analysis_report: str,
+        old_contents: Dict[str, str],
+        new_contents: Dict[str, str],
+        use_cache: bool = True,
+        diff: Optional[Dict] = None
+    ) -> Dict:
+        """
+        补遗/澄清增量解析：只把变化的内容交给模型，更新受影响的报告章节
+
+        Args:
+            analysis_report: 原解析报告
+            old_contents: 生成原报告时的文件内容
+            new_contents: 当前文件内容
+            use_cache: 是否使用响应缓存
+            diff: 已计算的变更（不提供时重新比较）
 
-        # 使用新的解析提示词
-        prompt = BIDDING_DOCUMENT_ANALYSIS_PROMPT.format(
-            document_content=document_text
+        Returns:
+            {'report': 更新后的报告, 'replaced': 被替换的章节标题, 'added': 新增的章节标题, 'diff': 变更}
+        """
+        diff = diff or self.diff_amendment(old_contents, new_contents)
+        if not diff['chapters']:
+            return {'report': analysis_report, 'replaced': [], 'added': [], 'diff': diff}
+
+        headings = "\n".join(title for title, _ in split_report_sections(analysis_report) if title)
+        prefix = AMENDMENT_REANALYSIS_PREFIX.format(analysis_report=analysis_report)
+        prompt = AMENDMENT_REANALYSIS_SUFFIX.format(
+            changes=render_diff(diff, self.amendment_max_diff_chars),
+            headings=headings or "（无）"
         )
+        print(f"[AI Service] 增量解析: {len(diff['chapters'])} 章有变化，"
+              f"变化 {diff['changed_chars']:,}/{diff['total_chars']:,} 字符 ({diff['ratio']:.1%})")
 
-        # 调用 AI Provider
-        return self.provider.generate(prompt, max_tokens=16000, temperature=0.2)
+        max_tokens, temperature = TASK_PARAMS['analysis']
+        updates = self._generate(
+            prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, use_cache=use_cache, task='analysis'
+        )
+        report, replaced, added = patch_report(analysis_report, updates)
+        return {'report': report, 'replaced': replaced, 'added': added, 'diff': diff}
 
-    def extract_evaluation_criteria(self, analysis_report: str) -> str:
+    def build_summary_tree(
+        self,
+        document_contents: Dict[str, str],
+        existing: Optional[SummaryTree] = None,
+        use_cache: bool = True,
+        on_progress=None
+    ) -> SummaryTree:
+        """
+        生成招标文件分层摘要（片段 → 章 → 全文）
+
+        片段摘要并发生成；只有一个片段的章直接使用片段摘要，不再合并。
+        内容未变化的文件沿用 existing 中的摘要
+
+        Args:
+            document_contents: 文件内容字典
+            existing: 已保存的摘要树
+            use_cache: 是否使用响应缓存
+            on_progress: 进度回调 on_progress(已完成调用数, 总调用数)
+
+        Returns:
+            摘要树
+        """
+        previous = existing.files if existing else {}
+        stale = (existing or SummaryTree()).stale_sources(document_contents)
+        model = self.router.provider_for('map').model
+
+        # 待生成文件的章和片段
+        files = {}
+        chunks = []  # (文件类别, 章序号, 片段偏移, 片段内容)
+        for source in stale:
+            chapters = []
+            for chapter in split_chapters(document_contents[source]):
+                chapters.append({'title': chapter['title'], 'offset': chapter['offset'], 'summary': '', 'chunks': []})
+                offset = chapter['offset']
+                for part in split_by_tokens(chapter['text'], self.summary_chunk_tokens, model):
+                    if part.strip():
+                        chunks.append((source, len(chapters) - 1, offset, part))
+                    offset += len(part) + 1
+            files[source] = {'hash': content_hash(document_contents[source]), 'summary': '', 'chapters': chapters}
+
+        chapter_counts = {}
+        for source, index, _, _ in chunks:
+            chapter_counts[(source, index)] = chapter_counts.get((source, index), 0) + 1
+        reduce_count = sum(1 for count in chapter_counts.values() if count > 1)
+        total = len(chunks) + reduce_count + len(files)
+        completed = 0
+        if files:
+            print(f"[AI Service] 分层摘要: {len(files)} 个文件, {len(chapter_counts)} 章, {len(chunks)} 个片段")
+
+        def summarize(level: str, task: str, source: str, chapter: str, content: str) -> str:
+            prefix_template, suffix = {
+                'chunk': (SUMMARY_TREE_CHUNK_PREFIX, SUMMARY_TREE_CHUNK_SUFFIX),
+                'chapter': (SUMMARY_TREE_CHAPTER_PREFIX, SUMMARY_TREE_CHAPTER_SUFFIX),
+                'document': (SUMMARY_TREE_DOCUMENT_PREFIX, SUMMARY_TREE_DOCUMENT_SUFFIX),
+            }[level]
+            return self._generate(
+                suffix,
+                max_tokens=self.summary_output_tokens[level],
+                temperature=0.2,
+                prefix=prefix_template.format(source=source, chapter=chapter, content=content),
+                use_cache=use_cache,
+                task=task
+            ).strip()
+
+        def run_all(jobs: List[Tuple]) -> List[str]:
+            """并发执行一级摘要调用，按提交顺序返回"""
+            nonlocal completed
+            if not jobs:
+                return []
+            max_workers = max(1, min(self.planner.map_concurrency, len(jobs)))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, summarize, *job) for job in jobs]
+                for future in as_completed(futures):
+                    future.result()
+                    completed += 1
+                    if on_progress:
+                        on_progress(completed, total)
+                return [future.result() for future in futures]
+
+        # 片段摘要（map）
+        chunk_summaries = run_all([
+            ('chunk', 'map', source, files[source]['chapters'][index]['title'], part)
+            for source, index, _, part in chunks
+        ])
+        for (source, index, offset, _), summary in zip(chunks, chunk_summaries):
+            files[source]['chapters'][index]['chunks'].append({'offset': offset, 'summary': summary})
+
+        # 章摘要（多个片段时合并）
+        reduce_jobs = []
+        for source, node in files.items():
+            for chapter in node['chapters']:
+                if len(chapter['chunks']) == 1:
+                    chapter['summary'] = chapter['chunks'][0]['summary']
+                elif len(chapter['chunks']) > 1:
+                    content = "\n\n".join(
+                        f"【片段{index}】\n{chunk['summary']}" for index, chunk in enumerate(chapter['chunks'], 1)
+                    )
+                    reduce_jobs.append((chapter, ('chapter', 'reduce', source, chapter['title'], content)))
+        for (chapter, _), summary in zip(reduce_jobs, run_all([job for _, job in reduce_jobs])):
+            chapter['summary'] = summary
+        for node in files.values():
+            node['chapters'] = [chapter for chapter in node['chapters'] if chapter['chunks']]
+
+        # 全文摘要
+        sources = list(files)
+        document_summaries = run_all([
+            ('document', 'reduce', source, '', "\n\n".join(
+                f"【{chapter['title']}】\n{chapter['summary']}" for chapter in files[source]['chapters']
+            ))
+            for source in sources
+        ])
+        for source, summary in zip(sources, document_summaries):
+            files[source]['summary'] = summary
+
+        # 按文件顺序组装（沿用未变化文件的摘要，丢弃已不存在的文件）
+        tree = SummaryTree()
+        for source, content in document_contents.items():
+            if source in files:
+                tree.files[source] = files[source]
+            elif content and content.strip() and source in previous:
+                tree.files[source] = previous[source]
+        return tree
+
+    def extract_evaluation_criteria(
+        self,
+        analysis_report: str,
+        use_cache: bool = True,
+        summary_tree: Optional[SummaryTree] = None
+    ) -> str:
         """
         从解析报告中提取评审标准
 
         Args:
             analysis_report: 招标文件解析报告
+            use_cache: 是否使用响应缓存
+            summary_tree: 招标文件分层摘要（提供时附上与评标办法最相关的章节摘要，补充报告中省略的细节）
 
         Returns:
             评审标准总结
         """
-        prompt = EVALUATION_CRITERIA_EXTRACTION_PROMPT.format(
-            analysis_report=analysis_report
+        # 只发送项目需求和评审要求两类（报告未按类别组织时发送全文）
+        prefix = EVALUATION_CRITERIA_EXTRACTION_PREFIX.format(
+            analysis_report=report_context(analysis_report, CRITERIA_CATEGORIES)
         )
 
+        suffix = EVALUATION_CRITERIA_EXTRACTION_SUFFIX
+        if summary_tree:
+            chapters = summary_tree.context(
+                'chapter', query=SUMMARY_TREE_CRITERIA_QUERY, max_chars=self.summary_criteria_chars
+            )
+            suffix = f"\n=== 招标文件相关章节摘要 ===\n{chapters}\n" + suffix
+
         # 调用 AI Provider
-        return self.provider.generate(prompt, max_tokens=8000, temperature=0.3)
+        max_tokens, temperature = TASK_PARAMS['criteria']
+        return self._generate(
+            suffix,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            prefix=prefix,
+            use_cache=use_cache,
+            task='criteria'
+        )
 
     def generate_technical_proposal_outline(
         self,
         project_requirements: str,
-        evaluation_criteria: str
+        evaluation_criteria: str,
+        use_cache: bool = True
     ) -> Dict:
         """
         生成技术标目录结构
@@ -286,31 +1107,144 @@ class ClaudeService:
         Args:
             project_requirements: 项目需求
             evaluation_criteria: 评审标准
+            use_cache: 是否使用响应缓存
 
         Returns:
             目录结构（JSON格式）
         """
-        prompt = TECHNICAL_PROPOSAL_OUTLINE_PROMPT.format(
-            project_requirements=project_requirements,
+        # 与章节生成共用同一前缀，后续逐章生成可直接命中前缀缓存
+        prefix = TECHNICAL_PROPOSAL_CONTEXT_PREFIX.format(
+            project_info=project_requirements,
             evaluation_criteria=evaluation_criteria
         )
 
-        # 调用 AI Provider
-        response_text = self.provider.generate(prompt, max_tokens=8000, temperature=0.4)
+        # 调用 AI Provider（JSON模式约束输出格式）
+        max_tokens, temperature = TASK_PARAMS['outline']
+        response_text = self._generate(
+            TECHNICAL_PROPOSAL_OUTLINE_SUFFIX,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            prefix=prefix,
+            use_cache=use_cache,
+            task='outline',
+            json_mode=True
+        )
+        return self.parse_outline_response(response_text)
 
-        # 尝试从响应中提取JSON
-        try:
-            # 尝试解析JSON
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                json_text = response_text[json_start:json_end].strip()
-                return json.loads(json_text)
-            else:
-                # 如果没有代码块，尝试直接解析
-                return {"outline": response_text, "raw": True}
-        except:
-            return {"outline": response_text, "raw": True}
+    @staticmethod
+    def parse_outline_response(response_text: str) -> Dict:
+        """
+        从目录生成的输出中提取JSON
+
+        依次尝试：整体解析 → ```json 代码块 → 第一个 { 到最后一个 } 之间的内容
+        全部失败时返回 {'outline': 原文, 'raw': True}（无法拆分章节）
+        """
+        candidates = [response_text.strip()]
+        fenced = re.search(r'```(?:json)?\s*(.*?)```', response_text, re.DOTALL)
+        if fenced:
+            candidates.append(fenced.group(1).strip())
+        start, end = response_text.find('{'), response_text.rfind('}')
+        if 0 <= start < end:
+            candidates.append(response_text[start:end + 1])
+
+        for candidate in candidates:
+            try:
+                data = json.loads(candidate)
+            except ValueError:
+                continue
+            if isinstance(data, list):
+                data = {'outline': data}
+            if isinstance(data, dict) and isinstance(data.get('outline'), list):
+                return data
+
+        print("[AI Service] 目录JSON解析失败，按原始文本保存（无法拆分章节）")
+        return {"outline": response_text, "raw": True}
+
+    def generate_outline_and_sections(
+        self,
+        project_requirements: str,
+        evaluation_criteria: str,
+        max_workers: Optional[int] = None,
+        use_cache: bool = True,
+        skip_titles: Optional[set] = None,
+        retriever: Optional[BM25Index] = None
+    ) -> Iterator[Dict]:
+        """
+        流水线生成：流式生成目录的同时，每解析出一个章节就立即提交章节生成
+
+        目录与章节共用同一前缀（project_requirements 同时作为章节的项目信息）
+
+        Args:
+            project_requirements: 项目需求
+            evaluation_criteria: 评审标准
+            max_workers: 章节生成最大并发数，默认读取 SECTION_CONCURRENCY（默认4）
+            use_cache: 是否使用响应缓存
+            skip_titles: 已生成、无需再生成的章节标题
+            retriever: 招标文件检索索引（为每个章节附加相关原文条款）
+
+        Yields:
+            {'type': 'section_found', 'section': 章节信息}  目录中解析出新章节
+            {'type': 'outline', 'outline': 目录}            目录生成完毕
+            {'type': 'section', 'title', 'content', 'error'}  章节生成完成
+        """
+        if max_workers is None:
+            max_workers = int(os.getenv('SECTION_CONCURRENCY', '4'))
+        skip_titles = skip_titles or set()
+
+        prefix = TECHNICAL_PROPOSAL_CONTEXT_PREFIX.format(
+            project_info=project_requirements,
+            evaluation_criteria=evaluation_criteria
+        )
+        max_tokens, temperature = TASK_PARAMS['outline']
+        parser = IncrementalOutlineParser()
+        chunks = []
+        futures = set()
+
+        def finished() -> List:
+            done = [f for f in futures if f.done()]
+            futures.difference_update(done)
+            return done
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for delta in self._generate_stream(
+                TECHNICAL_PROPOSAL_OUTLINE_SUFFIX,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                prefix=prefix,
+                use_cache=use_cache,
+                task='outline',
+                json_mode=True
+            ):
+                chunks.append(delta)
+                for section in parser.feed(delta):
+                    yield {'type': 'section_found', 'section': section}
+                    if section['title'] in skip_titles:
+                        continue
+                    futures.add(executor.submit(
+                        context_with_priority('pipeline').run,
+                        self._generate_section_result,
+                        section, project_requirements, evaluation_criteria, use_cache, retriever
+                    ))
+                # 目录仍在输出时，已完成的章节也及时返回
+                for future in finished():
+                    yield dict(future.result(), type='section')
+
+            outline = parser.result() or self.parse_outline_response("".join(chunks))
+            print(f"[AI Service] 目录生成完毕，流水线已提交 {len(parser.sections)} 个章节")
+            yield {'type': 'outline', 'outline': outline}
+
+            # 流式解析未能识别章节（如输出格式异常）时，按完整目录补交
+            if not parser.sections:
+                for section in extract_sections_from_outline(outline):
+                    if section['title'] not in skip_titles:
+                        futures.add(executor.submit(
+                            context_with_priority('pipeline').run,
+                            self._generate_section_result,
+                            section, project_requirements, evaluation_criteria, use_cache, retriever
+                        ))
+
+            for future in as_completed(list(futures)):
+                yield dict(future.result(), type='section')
 
     def generate_technical_proposal_section(
         self,
@@ -318,7 +1252,10 @@ class ClaudeService:
         word_count: int,
         section_requirements: str,
         project_info: str,
-        evaluation_criteria: str
+        evaluation_criteria: str,
+        use_cache: bool = True,
+        retriever: Optional[BM25Index] = None,
+        summary: Optional[str] = None
     ) -> str:
         """
         生成技术标的单个章节
@@ -329,32 +1266,629 @@ class ClaudeService:
             section_requirements: 章节要求
             project_info: 项目基本信息
             evaluation_criteria: 评审标准
+            use_cache: 是否使用响应缓存
+            retriever: 招标文件检索索引，提供时在章节指令前附加检索到的相关原文条款
+            summary: 已完成章节的滚动摘要（一致性模式，见 ProposalSummary.render）
 
         Returns:
             章节内容
         """
-        prompt = TECHNICAL_PROPOSAL_SECTION_PROMPT.format(
-            section_title=section_title,
-            word_count=word_count,
-            section_requirements=section_requirements,
+        prefix, prompt = self._build_section_prompt(
+            section_title, word_count, section_requirements, project_info, evaluation_criteria, retriever, summary
+        )
+
+        # 调用 AI Provider（输出预算按建议字数计算，超出时自动续写）
+        max_tokens, temperature = TASK_PARAMS['section']
+        return self._generate(
+            prompt,
+            max_tokens=section_output_tokens(word_count, max_tokens, self.router.provider_for('section').model),
+            temperature=temperature,
+            prefix=prefix,
+            use_cache=use_cache,
+            task='section'
+        )
+
+    def generate_technical_proposal_section_stream(
+        self,
+        section_title: str,
+        word_count: int,
+        section_requirements: str,
+        project_info: str,
+        evaluation_criteria: str,
+        use_cache: bool = True,
+        retriever: Optional[BM25Index] = None,
+        summary: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        生成技术标的单个章节（流式版本）
+
+        参数同 generate_technical_proposal_section
+
+        Yields:
+            章节内容的增量文本片段
+        """
+        prefix, prompt = self._build_section_prompt(
+            section_title, word_count, section_requirements, project_info, evaluation_criteria, retriever, summary
+        )
+
+        max_tokens, temperature = TASK_PARAMS['section']
+        return self._generate_stream(
+            prompt,
+            max_tokens=section_output_tokens(word_count, max_tokens, self.router.provider_for('section').model),
+            temperature=temperature,
+            prefix=prefix,
+            use_cache=use_cache,
+            task='section'
+        )
+
+    def generate_sections_concurrently(
+        self,
+        sections: List[Dict],
+        project_info: str,
+        evaluation_criteria: str,
+        max_workers: Optional[int] = None,
+        use_cache: bool = True,
+        retriever: Optional[BM25Index] = None,
+        pack: bool = False
+    ) -> Iterator[Dict]:
+        """
+        并发生成多个章节（有界并发，按完成先后逐个返回结果）
+
+        单个章节失败不影响其他章节（重试由 provider_middleware 统一处理）；pack=True 时相邻的小章节合并为一次调用
+
+        Args:
+            sections: 章节列表 [{'title': ..., 'word_count': ..., 'description': ...}]
+            project_info: 项目基本信息
+            evaluation_criteria: 评审标准
+            max_workers: 最大并发数，默认读取环境变量 SECTION_CONCURRENCY（默认4）
+            use_cache: 是否使用响应缓存
+            retriever: 招标文件检索索引（为每个章节附加相关原文条款）
+            pack: 是否合并相邻的小章节（见 SectionPacker）
+
+        Yields:
+            {'title': 章节标题, 'content': 章节内容（失败为None）, 'error': 错误信息,
+             'packed': 合并生成的章节数（单独生成为1）}
+        """
+        groups = self.packer.pack(sections) if pack else [[section] for section in sections]
+        if max_workers is None:
+            max_workers = int(os.getenv('SECTION_CONCURRENCY', '4'))
+        max_workers = max(1, min(max_workers, len(groups) or 1))
+
+        print(f"[AI Service] 并发生成 {len(sections)} 个章节，{len(groups)} 次调用（并发数: {max_workers}）")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 复制上下文，使工作线程中的调用指标仍关联到当前项目记录（章节调用按流水线优先级调度）
+            futures = [
+                executor.submit(
+                    context_with_priority('pipeline').run,
+                    self._generate_section_group,
+                    group, project_info, evaluation_criteria, use_cache, retriever
+                )
+                for group in groups
+            ]
+            for future in as_completed(futures):
+                yield from future.result()
+
+    def generate_sections_consistently(
+        self,
+        sections: List[Dict],
+        project_info: str,
+        evaluation_criteria: str,
+        max_workers: Optional[int] = None,
+        use_cache: bool = True,
+        retriever: Optional[BM25Index] = None,
+        summary: Optional[ProposalSummary] = None,
+        pack: bool = False
+    ) -> Iterator[Dict]:
+        """
+        一致性模式生成多个章节：按目录顺序分批并发生成，每批章节的提示词附带此前已完成章节的滚动摘要
+        （关键承诺、人员、设备、进度），每批完成后按目录顺序把新章节并入摘要
+
+        同一批内的章节使用相同的摘要，分批方式只取决于章节顺序和并发数，结果可命中响应缓存；
+        不提供已有摘要时第一批只含第一个调用，先由它确定关键信息，其后各批都带有前文摘要
+
+        Args:
+            sections: 章节列表（按目录顺序）
+            project_info: 项目基本信息
+            evaluation_criteria: 评审标准
+            max_workers: 每批的调用数（即并发数），默认读取环境变量 SECTION_CONCURRENCY（默认4）
+            use_cache: 是否使用响应缓存
+            retriever: 招标文件检索索引
+            summary: 已有章节构建的摘要（见 ProposalSummary.from_sections），不提供则从空摘要开始
+            pack: 是否合并相邻的小章节（见 SectionPacker）
+
+        Yields:
+            同 generate_sections_concurrently
+        """
+        groups = self.packer.pack(sections) if pack else [[section] for section in sections]
+        if max_workers is None:
+            max_workers = int(os.getenv('SECTION_CONCURRENCY', '4'))
+        max_workers = max(1, min(max_workers, len(groups) or 1))
+        if summary is None:
+            summary = ProposalSummary.from_env(self.router.provider_for('section').model)
+
+        # 摘要为空时第一批只生成第一个调用：否则首批其余章节都看不到任何前文，首批越大不一致越多
+        first = max_workers if summary.render() else 1
+        batches = [groups[:first]] + [groups[start:start + max_workers] for start in range(first, len(groups), max_workers)]
+
+        print(f"[AI Service] 一致性模式生成 {len(sections)} 个章节，{len(groups)} 次调用（每批 {max_workers} 次）")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch in batches:
+                if not batch:
+                    continue
+                rendered = summary.render() or None
+                futures = {
+                    executor.submit(
+                        context_with_priority('pipeline').run,
+                        self._generate_section_group,
+                        group, project_info, evaluation_criteria, use_cache, retriever, rendered
+                    ): position
+                    for position, group in enumerate(batch)
+                }
+                # 按批内位置保存结果（目录中可能有同名章节，不能按标题区分）
+                results = {}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    yield from results[futures[future]]
+
+                for position, group in enumerate(batch):
+                    for section, result in zip(group, results[position]):
+                        if result['content']:
+                            summary.update(section['title'], result['content'])
+                print(f"[AI Service] 滚动摘要: {len(summary)} 条关键信息，"
+                      f"约 {TextProcessor.estimate_tokens(summary.render(), summary.model)} tokens")
+
+    def _generate_section_group(
+        self,
+        group: List[Dict],
+        project_info: str,
+        evaluation_criteria: str,
+        use_cache: bool,
+        retriever: Optional[BM25Index] = None,
+        summary: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        生成一组相邻章节：单个章节直接生成；多个章节合并为一次调用并按分隔标记拆分，
+        调用失败或某个章节解析失败（缺失、过短）时该章节单独生成
+
+        Returns:
+            各章节的结果（按组内顺序），格式同 _generate_section_result，另含 'packed'
+        """
+        if len(group) == 1:
+            result = self._generate_section_result(
+                group[0], project_info, evaluation_criteria, use_cache, retriever, summary
+            )
+            return [dict(result, packed=1)]
+
+        parsed = {}
+        titles = '、'.join(section['title'] for section in group)
+        try:
+            prefix, prompt, max_tokens = self._build_packed_section_prompt(
+                group, project_info, evaluation_criteria, retriever, summary
+            )
+            _, temperature = TASK_PARAMS['section']
+            text = self._generate(
+                prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                prefix=prefix,
+                use_cache=use_cache,
+                task='section'
+            )
+            parsed = parse_packed_output(text, [section['title'] for section in group])
+        except Exception as e:
+            print(f"[AI Service] 合并生成失败，改为逐个生成: {titles} - {e}")
+
+        results = []
+        for index, section in enumerate(group):
+            if index in parsed:
+                results.append({
+                    'title': section['title'], 'content': parsed[index], 'error': None, 'packed': len(group)
+                })
+                continue
+            if parsed:
+                print(f"[AI Service] 合并输出中未解析到章节，单独生成: {section['title']}")
+            result = self._generate_section_result(
+                section, project_info, evaluation_criteria, use_cache, retriever, summary
+            )
+            results.append(dict(result, packed=1))
+        return results
+
+    def _build_packed_section_prompt(
+        self,
+        group: List[Dict],
+        project_info: str,
+        evaluation_criteria: str,
+        retriever: Optional[BM25Index] = None,
+        summary: Optional[str] = None
+    ) -> Tuple[str, str, int]:
+        """
+        构建合并生成多个章节的提示词（前缀与单章节生成相同，可共享前缀缓存）
+
+        Returns:
+            (缓存前缀, 指令, 输出预算)，输出预算为各章节预算之和（不超过章节任务上限，超出时自动续写）
+        """
+        prefix = TECHNICAL_PROPOSAL_CONTEXT_PREFIX.format(
             project_info=project_info,
             evaluation_criteria=evaluation_criteria
         )
+        sections_list = "\n".join(
+            TECHNICAL_PROPOSAL_PACKED_SECTION_ITEM.format(
+                index=index,
+                section_title=section['title'],
+                word_count=section.get('word_count', 1000),
+                section_requirements=section.get('description', '')
+            )
+            for index, section in enumerate(group, 1)
+        )
+        context = self._section_context(group, evaluation_criteria, retriever, summary)
+        prompt = context + TECHNICAL_PROPOSAL_PACKED_SECTIONS_SUFFIX.format(count=len(group), sections_list=sections_list)
 
-        # 调用 AI Provider
-        return self.provider.generate(prompt, max_tokens=8000, temperature=0.5)
+        maximum, _ = TASK_PARAMS['section']
+        model = self.router.provider_for('section').model
+        max_tokens = min(maximum, sum(
+            section_output_tokens(section.get('word_count', 1000), maximum, model) for section in group
+        ))
+        return prefix, prompt, max_tokens
+
+    def _generate_section_result(
+        self,
+        section: Dict,
+        project_info: str,
+        evaluation_criteria: str,
+        use_cache: bool,
+        retriever: Optional[BM25Index] = None,
+        summary: Optional[str] = None
+    ) -> Dict:
+        """
+        生成单个章节，失败时返回错误信息而不抛出（重试由 provider_middleware 统一处理）
+
+        Returns:
+            {'title', 'content', 'error'}
+        """
+        try:
+            content = self.generate_technical_proposal_section(
+                section_title=section['title'],
+                word_count=section.get('word_count', 1000),
+                section_requirements=section.get('description', ''),
+                project_info=project_info,
+                evaluation_criteria=evaluation_criteria,
+                use_cache=use_cache,
+                retriever=retriever,
+                summary=summary
+            )
+            return {'title': section['title'], 'content': content, 'error': None}
+        except Exception as e:
+            print(f"[AI Service] 章节生成失败: {section['title']} - {e}")
+            return {'title': section['title'], 'content': None, 'error': str(e)}
+
+    def run_bulk(
+        self,
+        db_manager,
+        record_ids: Optional[List[int]] = None,
+        stages: Optional[List[str]] = None,
+        poll_interval: Optional[float] = None
+    ) -> Dict:
+        """
+        批量模式：通过Provider批量接口处理多个项目记录（解析 → 评审标准 → 目录 → 章节），结果写回记录
+
+        Args:
+            db_manager: DatabaseManager 实例
+            record_ids: 要处理的记录ID，默认全部记录
+            stages: 要执行的阶段（analysis / criteria / outline / sections），默认全部
+            poll_interval: 轮询间隔（秒），默认读取 BATCH_POLL_INTERVAL（默认30）
+
+        Returns:
+            {阶段: {'submitted', 'cached', 'succeeded', 'failed'}}
+        """
+        from .batch_runner import BatchRunner
+
+        if poll_interval is None:
+            poll_interval = float(os.getenv('BATCH_POLL_INTERVAL', '30'))
+        runner = BatchRunner(self, db_manager, poll_interval=poll_interval)
+        return runner.run(record_ids=record_ids, stages=stages)
+
+    def _build_section_prompt(
+        self,
+        section_title: str,
+        word_count: int,
+        section_requirements: str,
+        project_info: str,
+        evaluation_criteria: str,
+        retriever: Optional[BM25Index] = None,
+        summary: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """
+        构建章节生成提示词
+
+        按章节检索到的原文条款和前文摘要放在章节指令中（而不是前缀），保证各章节共享的前缀不变
+
+        Returns:
+            (缓存前缀, 章节指令)，同一项目所有章节的前缀完全一致
+        """
+        prefix = TECHNICAL_PROPOSAL_CONTEXT_PREFIX.format(
+            project_info=project_info,
+            evaluation_criteria=evaluation_criteria
+        )
+        context = self._section_context(
+            [{'title': section_title, 'description': section_requirements}], evaluation_criteria, retriever, summary
+        )
+        prompt = context + TECHNICAL_PROPOSAL_SECTION_SUFFIX.format(
+            section_title=section_title,
+            word_count=word_count,
+            section_requirements=section_requirements
+        )
+        return prefix, prompt
+
+    def _section_context(
+        self,
+        sections: List[Dict],
+        evaluation_criteria: str,
+        retriever: Optional[BM25Index] = None,
+        summary: Optional[str] = None
+    ) -> str:
+        """
+        章节指令之前的上下文（单章节与合并生成共用）：前文摘要、历史项目同类章节、招标文件相关条款
+
+        合并生成时按组内章节数放宽检索条数和字数，参考稿每个章节取最相似的一篇（去重）
+
+        Args:
+            sections: 本次生成的章节（单章节生成时只有一个）
+            evaluation_criteria: 评审标准（用于参考稿排序）
+            retriever: 招标文件检索索引
+            summary: 已完成章节的滚动摘要
+
+        Returns:
+            上下文文本（无可用上下文时为空字符串）
+        """
+        packed = len(sections) > 1
+        context = ""
+        if summary:
+            context += TECHNICAL_PROPOSAL_SECTION_CONSISTENCY.format(summary=summary)
+
+        drafts, seen = [], set()
+        for section in sections:
+            for draft in self.similar_sections(
+                section['title'], section.get('description', ''), evaluation_criteria,
+                top_k=1 if packed else self.section_library_top_k, min_score=self.section_library_min_score
+            ):
+                key = (draft['record_id'], draft['title'])
+                if key not in seen:
+                    seen.add(key)
+                    drafts.append(draft)
+        if drafts:
+            context += TECHNICAL_PROPOSAL_SECTION_DRAFTS.format(drafts="\n\n".join(
+                f"【{draft['project']} / {draft['title']}】\n{draft['content'][:self.section_library_draft_chars]}"
+                for draft in drafts
+            ))
+
+        if retriever:
+            references = retriever.context_for(
+                " ".join(f"{section['title']} {section.get('description', '')}" for section in sections),
+                top_k=self.retrieval_top_k + (len(sections) if packed else 0),
+                max_chars=self.retrieval_section_chars * (2 if packed else 1)
+            )
+            if references:
+                context += TECHNICAL_PROPOSAL_SECTION_REFERENCES.format(references=references)
+        return context
+
+    def refresh_section_library(self, db_manager, limit: int = 500) -> int:
+        """
+        由数据库中的历史记录刷新章节库（记录未变化时不重建）
 
-    def chat(self, message: str, conversation_history: Optional[List[Dict]] = None) -> str:
+        Args:
+            db_manager: 数据库管理器
+            limit: 最多索引的记录数（按更新时间取最近的记录）
+
+        Returns:
+            章节库中的章节数，章节库关闭时返回 0
+        """
+        if self.section_library is None:
+            return 0
+        signature = tuple(db_manager.get_update_times(limit))
+        if signature == self.section_library.signature:
+            return len(self.section_library)
+        return self.section_library.refresh(db_manager.get_all_records(limit=limit), signature)
+
+    def similar_sections(
+        self,
+        section_title: str,
+        section_requirements: str = "",
+        evaluation_criteria: str = "",
+        top_k: int = 3,
+        min_score: float = 0.0
+    ) -> List[Dict]:
         """
-        通用对话接口
+        检索历史项目中与本章节最相似的已生成章节（排除当前项目）
+
+        Args:
+            section_title: 章节标题
+            section_requirements: 章节要求
+            evaluation_criteria: 当前项目的评审标准（同类项目的章节排序靠前）
+            top_k: 返回数量
+            min_score: 最低相似度
+
+        Returns:
+            [{'record_id', 'project', 'title', 'content', 'score', 'title_score', 'section_score', 'project_score'}]，
+            章节库关闭时为空
+        """
+        if self.section_library is None or not len(self.section_library):
+            return []
+        return self.section_library.search(
+            f"{section_title} {section_requirements}",
+            project=evaluation_criteria,
+            top_k=top_k,
+            min_score=min_score,
+            exclude_record=get_record_context()
+        )
+
+    def find_reusable_section(self, section: Dict, evaluation_criteria: str = "") -> Optional[Dict]:
+        """
+        查找可直接采用的历史章节
+
+        标题相似度不低于 SECTION_REUSE_THRESHOLD（基本是同一章节）、项目评审标准相似度不低于
+        SECTION_REUSE_PROJECT_THRESHOLD（同类项目），且篇幅接近要求字数
+
+        Args:
+            section: 目录中的章节 {'title', 'description', 'word_count'}
+            evaluation_criteria: 当前项目的评审标准
+
+        Returns:
+            最相似的历史章节，没有达到阈值的章节时返回 None
+        """
+        for match in self.similar_sections(
+            section['title'], section.get('description', ''), evaluation_criteria, top_k=5
+        ):
+            if (match['title_score'] >= self.section_reuse_threshold
+                    and match['project_score'] >= self.section_reuse_project_threshold
+                    and len(match['content']) >= section.get('word_count', 1000) * 0.6):
+                return match
+        return None
+
+    @staticmethod
+    def _render_messages(messages: List[Dict]) -> str:
+        """格式化对话消息"""
+        roles = {'user': '用户', 'assistant': '助手'}
+        return "\n\n".join(
+            f"{roles.get(message['role'], message['role'])}：{message['content']}" for message in messages
+        )
+
+    def compact_chat_history(
+        self,
+        conversation_history: Optional[List[Dict]],
+        history_summary: str = "",
+        use_cache: bool = True
+    ) -> Tuple[str, List[Dict]]:
+        """
+        控制对话历史的长度：超出 CHAT_HISTORY_TOKENS 时把较早的轮次压缩进摘要，只保留最近几条消息原文
+
+        Args:
+            conversation_history: 对话历史 [{"role": "user/assistant", "content": "..."}]
+            history_summary: 之前压缩得到的摘要
+            use_cache: 是否使用缓存
+
+        Returns:
+            (摘要, 保留原文的最近消息)，未超出上限时原样返回
+        """
+        history = list(conversation_history or [])
+        model = self.router.provider_for('chat').model
+        tokens = TextProcessor.estimate_tokens(history_summary + self._render_messages(history), model)
+        if tokens <= self.chat_history_tokens or len(history) <= self.chat_keep_messages:
+            return history_summary, history
+
+        older = history[:-self.chat_keep_messages] if self.chat_keep_messages else history
+        recent = history[len(older):]
+        summary = self._generate(
+            CHAT_HISTORY_SUMMARY_SUFFIX.format(
+                summary=history_summary or "（无）",
+                messages=self._render_messages(older)
+            ),
+            max_tokens=self.chat_summary_tokens,
+            temperature=0.2,
+            prefix=CHAT_HISTORY_SUMMARY_PREFIX,
+            use_cache=use_cache,
+            task='chat'
+        ).strip()
+        print(f"[AI Service] 对话历史约 {tokens:,} tokens，{len(older)} 条消息压缩为摘要（{len(summary)} 字）")
+        return summary, recent
+
+    def _build_chat_prompt(
+        self,
+        message: str,
+        history: List[Dict],
+        history_summary: str = "",
+        analysis_report: Optional[str] = None,
+        document_contents: Optional[Dict[str, str]] = None
+    ) -> Tuple[Optional[str], str]:
+        """
+        构建问答提示词
+
+        前缀只包含解析报告和关键信息（同一项目不变），检索片段和对话历史随问题变化，放在指令中
+
+        Returns:
+            (缓存前缀, 指令)，没有项目资料时前缀为 None（普通对话）
+        """
+        history_text = ""
+        if history_summary:
+            history_text += CHAT_HISTORY_SECTION.format(summary=history_summary)
+        if history:
+            history_text += CHAT_RECENT_SECTION.format(messages=self._render_messages(history))
+
+        document_contents = document_contents or {}
+        if not analysis_report and not any((text or '').strip() for text in document_contents.values()):
+            return None, f"{history_text}\n{message}".strip() if history_text else message
+
+        prefix = TENDER_CHAT_PREFIX.format(
+            report=(analysis_report or "（尚未生成解析报告）")[:self.chat_report_chars],
+            facts=render_fact_sheet(self.extract_tender_facts(document_contents)) or "（无）"
+        )
+        references = ""
+        retriever = self.get_retriever(document_contents)
+        if retriever:
+            # 追问常省略主语（如"那违约金呢"），检索时带上上一个问题
+            previous = next((item['content'] for item in reversed(history) if item['role'] == 'user'), "")
+            references = retriever.context_for(
+                f"{previous} {message}", top_k=self.chat_top_k, max_chars=self.chat_reference_chars
+            )
+        prompt = TENDER_CHAT_SUFFIX.format(
+            history=history_text,
+            references=references or "（未检索到相关原文）",
+            message=message
+        )
+        return prefix, prompt
+
+    def chat(
+        self,
+        message: str,
+        conversation_history: Optional[List[Dict]] = None,
+        history_summary: str = "",
+        analysis_report: Optional[str] = None,
+        document_contents: Optional[Dict[str, str]] = None,
+        use_cache: bool = False
+    ) -> str:
+        """
+        通用对话接口（提供解析报告或文件内容时按标书问答回答）
 
         Args:
             message: 用户消息
             conversation_history: 对话历史，格式为 [{"role": "user/assistant", "content": "..."}]
+            history_summary: 之前压缩得到的对话摘要（见 compact_chat_history）
+            analysis_report: 项目的解析报告
+            document_contents: 招标文件内容字典（用于检索相关原文和提取关键信息）
+            use_cache: 是否使用响应缓存（默认不使用：重复提问时应重新回答）
 
         Returns:
             AI 回复
         """
-        # chat方法暂不支持provider（需要conversation_history）
-        # 如果需要使用，请直接调用Claude或OpenAI的原生接口
-        raise NotImplementedError("chat方法暂不支持多provider，请使用parse或generate方法")
+        history_summary, history = self.compact_chat_history(conversation_history, history_summary, use_cache)
+        prefix, prompt = self._build_chat_prompt(
+            message, history, history_summary, analysis_report, document_contents
+        )
+        max_tokens, temperature = TASK_PARAMS['chat']
+        return self._generate(
+            prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, use_cache=use_cache, task='chat'
+        )
+
+    def chat_stream(
+        self,
+        message: str,
+        conversation_history: Optional[List[Dict]] = None,
+        history_summary: str = "",
+        analysis_report: Optional[str] = None,
+        document_contents: Optional[Dict[str, str]] = None,
+        use_cache: bool = False
+    ) -> Iterator[str]:
+        """
+        对话接口（流式版本）
+
+        参数同 chat；不压缩对话历史，调用方需先调用 compact_chat_history 并保存其结果后传入
+
+        Yields:
+            回复的增量文本片段
+        """
+        prefix, prompt = self._build_chat_prompt(
+            message, list(conversation_history or []), history_summary, analysis_report, document_contents
+        )
+        max_tokens, temperature = TASK_PARAMS['chat']
+        return self._generate_stream(
+            prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, use_cache=use_cache, task='chat'
+        )
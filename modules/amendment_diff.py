@@ -0,0 +1,189 @@
+"""
+补遗/澄清增量解析
+招标文件发布补遗、澄清或修订版后，将新版本与上次解析时保存的文件内容按段落对齐比较，
+找出发生变化的章，只把变化部分（带少量上下文）交给模型，输出受影响的报告章节并替换回原报告；
+增量解析的耗时随变更规模而不是文件规模增长
+
+- 段落对齐：difflib 按段落（非空行，空白归一化）比较，整段改动、插入、删除都能定位
+- 新增的文件类别（如"补遗/澄清文件"）整体视为新增内容，删除的类别整体视为删除
+- 变化定位到章（与分层摘要使用同样的分章规则），提示词按章分组列出变更
+"""
+
+import re
+import difflib
+from typing import Dict, List, Optional, Tuple
+from .summary_tree import split_chapters
+from .report_store import split_report_sections
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def split_paragraphs(text: str) -> List[Tuple[int, str]]:
+    """
+    按行切分段落（跳过空行，空白归一化后用于比较）
+
+    Returns:
+        [(起始位置, 归一化后的段落)]
+    """
+    paragraphs = []
+    position = 0
+    for line in (text or '').split('\n'):
+        normalized = _WHITESPACE.sub(' ', line).strip()
+        if normalized:
+            paragraphs.append((position, normalized))
+        position += len(line) + 1
+    return paragraphs
+
+
+def _chapter_at(chapters: List[Dict], offset: int) -> str:
+    """位置所在章的标题"""
+    title = chapters[0]['title'] if chapters else ''
+    for chapter in chapters:
+        if chapter['offset'] > offset:
+            break
+        title = chapter['title']
+    return title
+
+
+def diff_documents(
+    old_contents: Dict[str, str],
+    new_contents: Dict[str, str],
+    context: int = 1
+) -> Dict:
+    """
+    按段落比较两个版本的文件内容
+
+    Args:
+        old_contents: 上次解析时的文件内容 {文件类别: 文本}
+        new_contents: 当前文件内容
+        context: 每处变更前后保留的未变化段落数
+
+    Returns:
+        {
+            'chapters': [{'source', 'chapter', 'offset', 'hunks': [[(标记, 段落)]], 'changed_chars'}],
+            'changed_chars': 变化的字符数（删除 + 新增）,
+            'total_chars': 新版本总字符数,
+            'ratio': 变化比例
+        }
+        标记为 ' '（上下文）、'-'（删除）、'+'（新增）；chapters 按文件和原文顺序排列
+    """
+    chapters: Dict[Tuple[str, str], Dict] = {}
+    changed_chars = 0
+
+    sources = list(new_contents) + [source for source in old_contents if source not in new_contents]
+    for source in sources:
+        old_text = old_contents.get(source) or ''
+        new_text = new_contents.get(source) or ''
+        if old_text == new_text:
+            continue
+
+        old_paragraphs = split_paragraphs(old_text)
+        new_paragraphs = split_paragraphs(new_text)
+        # 文件被删除时按旧版本分章定位
+        located_text, located = (new_text, new_paragraphs) if new_text.strip() else (old_text, old_paragraphs)
+        file_chapters = split_chapters(located_text) if located_text.strip() else []
+
+        matcher = difflib.SequenceMatcher(
+            None, [text for _, text in old_paragraphs], [text for _, text in new_paragraphs], autojunk=False
+        )
+        for group in matcher.get_grouped_opcodes(context):
+            hunk = []
+            anchor = None
+            for tag, i1, i2, j1, j2 in group:
+                if tag == 'equal':
+                    hunk.extend((' ', text) for _, text in new_paragraphs[j1:j2])
+                    continue
+                if anchor is None:
+                    index = j1 if located is new_paragraphs else i1
+                    anchor = located[min(index, len(located) - 1)][0] if located else 0
+                removed = [text for _, text in old_paragraphs[i1:i2]]
+                added = [text for _, text in new_paragraphs[j1:j2]]
+                hunk.extend(('-', text) for text in removed)
+                hunk.extend(('+', text) for text in added)
+                changed_chars += sum(len(text) for text in removed + added)
+            if anchor is None:
+                continue
+
+            title = _chapter_at(file_chapters, anchor)
+            chapter = chapters.setdefault((source, title), {
+                'source': source, 'chapter': title, 'offset': anchor, 'hunks': [], 'changed_chars': 0
+            })
+            chapter['hunks'].append(hunk)
+            chapter['changed_chars'] += sum(len(text) for mark, text in hunk if mark != ' ')
+
+    total_chars = sum(len(text or '') for text in new_contents.values())
+    source_order = {source: index for index, source in enumerate(sources)}
+    return {
+        'chapters': sorted(chapters.values(), key=lambda item: (source_order[item['source']], item['offset'])),
+        'changed_chars': changed_chars,
+        'total_chars': total_chars,
+        'ratio': changed_chars / total_chars if total_chars else 1.0,
+    }
+
+
+def render_diff(diff: Dict, max_chars: Optional[int] = None) -> str:
+    """
+    格式化变更（按章分组，"- "删除 / "+ "新增 / "  "上下文）
+
+    Args:
+        diff: diff_documents 的结果
+        max_chars: 字符上限（超出部分省略并注明）
+
+    Returns:
+        变更文本
+    """
+    blocks = []
+    used = 0
+    for index, chapter in enumerate(diff['chapters']):
+        lines = [f"【{chapter['source']} / {chapter['chapter']}】"]
+        for hunk in chapter['hunks']:
+            lines.extend(f"{mark} {text}" for mark, text in hunk)
+            lines.append('')
+        block = "\n".join(lines)
+        if max_chars and blocks and used + len(block) > max_chars:
+            blocks.append(f"（另有 {len(diff['chapters']) - index} 章的变更因篇幅省略）")
+            break
+        blocks.append(block)
+        used += len(block)
+    return "\n".join(blocks)
+
+
+def _section_key(title: str) -> str:
+    """报告章节标题的比较键（去掉序号和空白）"""
+    title = re.sub(r'^\s*#+\s*', '', title)
+    title = re.sub(r'^[\d.、\s]+|^[一二三四五六七八九十]+[、.]\s*', '', title)
+    return _WHITESPACE.sub('', title)
+
+
+def patch_report(report: str, updates: str) -> Tuple[str, List[str], List[str]]:
+    """
+    用模型输出的更新章节替换原报告中的同名章节
+
+    Args:
+        report: 原报告
+        updates: 模型输出（若干以"## "开头的完整章节）
+
+    Returns:
+        (更新后的报告, 被替换的章节标题, 新增的章节标题)
+    """
+    new_sections = {
+        _section_key(title): (title, text.rstrip())
+        for title, text in split_report_sections(updates) if title
+    }
+    replaced = []
+    parts = []
+    for title, text in split_report_sections(report):
+        key = _section_key(title) if title else None
+        if key in new_sections:
+            new_title, new_text = new_sections.pop(key)
+            parts.append(new_text + "\n")
+            replaced.append(new_title)
+        else:
+            parts.append(text)
+    added = []
+    for new_title, new_text in new_sections.values():
+        if parts and parts[-1].strip():
+            parts[-1] = parts[-1].rstrip('\n') + "\n"
+        parts.append(new_text + "\n")
+        added.append(new_title)
+    return "\n".join(parts), replaced, added
@@ -0,0 +1,561 @@
+"""
+批量模式（离线处理）
+将多个项目记录的解析、评审标准提取、目录生成、章节生成请求汇总后，
+通过 OpenAI Batch / Anthropic Message Batches 接口提交，轮询完成后写回对应的 BiddingRecord
+- 不占用每分钟请求/token限额，价格约为同步调用的一半，适合夜间批量处理历史标书
+- 各阶段依次执行（后一阶段依赖前一阶段的结果），同一阶段内所有记录的请求合并提交
+- 已命中响应缓存的请求直接使用缓存结果；批量结果也写入响应缓存，之后交互使用时可直接命中
+- 其他 Provider（如 mock）使用本地线程池模拟批量执行
+
+用法：
+    python -m modules.batch_runner --records 1 2 3 --stages analysis criteria
+"""
+
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from .ai_provider import AIProvider, OpenAIProvider, ClaudeProvider, empty_usage
+from .llm_cache import LLMCache
+from .provider_middleware import ResilientProvider
+from .metrics import record_context
+from .scheduler import get_scheduler, scheduling_enabled, request_priority
+from .output_budget import is_truncated, section_output_tokens
+from .report_store import report_context, PROJECT_INFO_CATEGORIES, CRITERIA_CATEGORIES
+from .prompts import (
+    EVALUATION_CRITERIA_EXTRACTION_PREFIX,
+    EVALUATION_CRITERIA_EXTRACTION_SUFFIX,
+    TECHNICAL_PROPOSAL_CONTEXT_PREFIX,
+    TECHNICAL_PROPOSAL_OUTLINE_SUFFIX
+)
+
+# 执行阶段（按顺序）及对应的任务类型
+STAGES = ('analysis', 'criteria', 'outline', 'sections')
+STAGE_TASKS = {'analysis': 'analysis', 'criteria': 'criteria', 'outline': 'outline', 'sections': 'section'}
+
+
+class BatchBackend:
+    """批量接口基类"""
+
+    name = 'base'
+    max_requests = 10000  # 单个批次的请求数上限
+
+    def __init__(self, provider: AIProvider):
+        self.provider = provider
+
+    def submit(self, requests: List[Dict]) -> str:
+        """
+        提交批次
+
+        Args:
+            requests: [{'custom_id', 'prompt', 'prefix', 'max_tokens', 'temperature', 'json_mode'}]
+
+        Returns:
+            批次ID
+        """
+        raise NotImplementedError
+
+    def poll(self, batch_id: str) -> Dict:
+        """查询批次进度，返回 {'done': bool, 'completed': n, 'failed': n, 'total': n}"""
+        raise NotImplementedError
+
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        """
+        获取批次结果
+
+        Returns:
+            {custom_id: {'text', 'usage', 'stop_reason', 'model'} 或 {'error': 错误信息}}
+        """
+        raise NotImplementedError
+
+
+class AnthropicBatchBackend(BatchBackend):
+    """Anthropic Message Batches"""
+
+    name = 'anthropic'
+    max_requests = 100000
+
+    def __init__(self, provider: AIProvider):
+        super().__init__(provider)
+        # JSON模式请求以 "{" 预填充，结果中需要补回
+        self._json_ids = set()
+
+    def submit(self, requests: List[Dict]) -> str:
+        self._json_ids.update(req['custom_id'] for req in requests if req.get('json_mode'))
+        batch = self.provider.client.messages.batches.create(requests=[
+            {
+                'custom_id': req['custom_id'],
+                'params': self.provider._build_request(
+                    req['prompt'], req['max_tokens'], req['temperature'], req['prefix'], req.get('json_mode', False)
+                )
+            }
+            for req in requests
+        ])
+        return batch.id
+
+    def poll(self, batch_id: str) -> Dict:
+        batch = self.provider.client.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        failed = counts.errored + counts.canceled + counts.expired
+        return {
+            'done': batch.processing_status == 'ended',
+            'completed': counts.succeeded,
+            'failed': failed,
+            'total': counts.processing + counts.succeeded + failed
+        }
+
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        results = {}
+        for entry in self.provider.client.messages.batches.results(batch_id):
+            if entry.result.type != 'succeeded':
+                error = getattr(entry.result, 'error', None)
+                results[entry.custom_id] = {'error': f"{entry.result.type}: {error}" if error else entry.result.type}
+                continue
+            message = entry.result.message
+            text = "".join(block.text for block in message.content if getattr(block, 'type', '') == 'text')
+            results[entry.custom_id] = {
+                'text': "{" + text if entry.custom_id in self._json_ids else text,
+                'usage': self.provider._parse_usage(message.usage),
+                'stop_reason': message.stop_reason,
+                'model': message.model or self.provider.model
+            }
+        return results
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """OpenAI Batch API（上传JSONL文件 → 创建批次 → 下载结果文件）"""
+
+    name = 'openai'
+    max_requests = 50000
+
+    def submit(self, requests: List[Dict]) -> str:
+        lines = [
+            json.dumps({
+                'custom_id': req['custom_id'],
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': self.provider.model,
+                    'messages': self.provider._build_messages(req['prompt'], req['prefix']),
+                    'max_tokens': req['max_tokens'],
+                    'temperature': req['temperature'],
+                    **self.provider._response_format(req.get('json_mode', False))
+                }
+            }, ensure_ascii=False)
+            for req in requests
+        ]
+        input_file = self.provider.client.files.create(
+            file=(f"batch_{uuid.uuid4().hex[:8]}.jsonl", "\n".join(lines).encode('utf-8')),
+            purpose='batch'
+        )
+        batch = self.provider.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h'
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> Dict:
+        batch = self.provider.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            'done': batch.status in ('completed', 'failed', 'expired', 'cancelled'),
+            'completed': counts.completed if counts else 0,
+            'failed': counts.failed if counts else 0,
+            'total': counts.total if counts else 0
+        }
+
+    def _read_lines(self, file_id: Optional[str]) -> List[Dict]:
+        if not file_id:
+            return []
+        content = self.provider.client.files.content(file_id).text
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        batch = self.provider.client.batches.retrieve(batch_id)
+        results = {}
+        for line in self._read_lines(batch.output_file_id) + self._read_lines(batch.error_file_id):
+            response = line.get('response') or {}
+            if line.get('error') or response.get('status_code') != 200:
+                results[line['custom_id']] = {'error': str(line.get('error') or response.get('body'))}
+                continue
+            body = response['body']
+            choice = body['choices'][0]
+            results[line['custom_id']] = {
+                'text': choice['message'].get('content') or '',
+                'usage': self.provider._parse_usage(SimpleNamespace(**body['usage'])) if body.get('usage') else empty_usage(),
+                'stop_reason': choice.get('finish_reason'),
+                'model': body.get('model') or self.provider.model
+            }
+        return results
+
+
+class LocalBatchBackend(BatchBackend):
+    """本地模拟批量执行（线程池逐条调用 Provider，用于 mock 等不支持批量接口的 Provider）"""
+
+    name = 'local'
+
+    def __init__(self, provider: AIProvider, max_workers: int = 4):
+        super().__init__(provider)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='local-batch')
+        self._batches: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, requests: List[Dict]) -> str:
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        futures = {req['custom_id']: self._executor.submit(self._complete, req) for req in requests}
+        with self._lock:
+            self._batches[batch_id] = futures
+        return batch_id
+
+    def _complete(self, req: Dict) -> Dict:
+        """逐条调用（与交互调用共用调度器，按批量优先级排队）"""
+        def call():
+            return self.provider.complete(
+                req['prompt'],
+                max_tokens=req['max_tokens'],
+                temperature=req['temperature'],
+                prefix=req['prefix'],
+                json_mode=req.get('json_mode', False)
+            )
+
+        if not scheduling_enabled():
+            return call()
+        with get_scheduler(self.provider.name).slot(priority='bulk', label='batch'):
+            return call()
+
+    def poll(self, batch_id: str) -> Dict:
+        with self._lock:
+            futures = self._batches[batch_id]
+        done = [f for f in futures.values() if f.done()]
+        failed = sum(1 for f in done if f.exception() is not None)
+        return {
+            'done': len(done) == len(futures),
+            'completed': len(done) - failed,
+            'failed': failed,
+            'total': len(futures)
+        }
+
+    def results(self, batch_id: str) -> Dict[str, Dict]:
+        with self._lock:
+            futures = self._batches.pop(batch_id)
+        results = {}
+        for custom_id, future in futures.items():
+            error = future.exception()
+            results[custom_id] = {'error': str(error)} if error else future.result()
+        return results
+
+
+def get_batch_backend(provider: AIProvider) -> BatchBackend:
+    """
+    按 Provider 类型选择批量接口
+
+    只解开限流/重试包装（批量接口不占用每分钟限额）；录制/回放等改变响应来源的包装不能绕过，
+    这类 Provider 使用本地模拟批量执行
+    """
+    inner = provider
+    while isinstance(inner, ResilientProvider):
+        inner = inner.inner
+
+    if isinstance(inner, ClaudeProvider):
+        return AnthropicBatchBackend(inner)
+    if isinstance(inner, OpenAIProvider):
+        return OpenAIBatchBackend(inner)
+    return LocalBatchBackend(provider)
+
+
+class BatchRunner:
+    """按阶段收集请求、提交批次并将结果写回项目记录"""
+
+    def __init__(
+        self,
+        ai_service,
+        db_manager,
+        poll_interval: float = 30.0,
+        project_info_chars: int = 5000,
+        upload_dir: str = 'database'
+    ):
+        """
+        Args:
+            ai_service: ClaudeService 实例（提供路由、提示词构建、缓存和指标）
+            db_manager: DatabaseManager 实例
+            poll_interval: 轮询间隔（秒）
+            project_info_chars: 目录/章节生成时使用的项目信息长度上限（与界面保持一致以命中缓存）
+            upload_dir: 上传文件所在目录
+        """
+        self.ai_service = ai_service
+        self.db_manager = db_manager
+        self.poll_interval = poll_interval
+        self.project_info_chars = project_info_chars
+        self.upload_dir = upload_dir
+        self._backends: Dict[str, BatchBackend] = {}
+
+    def _backend(self, task: str) -> BatchBackend:
+        if task not in self._backends:
+            self._backends[task] = get_batch_backend(self.ai_service.router.provider_for(task))
+        return self._backends[task]
+
+    def _load_documents(self, record) -> Dict[str, str]:
+        """重新解析记录关联的上传文件"""
+        from .document_parser import DocumentParser
+
+        files = json.loads(record.uploaded_files) if record.uploaded_files else {}
+        parser = DocumentParser()
+        contents = {}
+        for category, filename in files.items():
+            file_path = os.path.join(self.upload_dir, filename)
+            if not os.path.exists(file_path):
+                continue
+            try:
+                contents[category] = parser.parse(file_path)['content']
+            except Exception as e:
+                print(f"[Batch Runner] 记录 {record.id} 文件解析失败 {filename}: {e}")
+        return contents
+
+    # ---------- 各阶段请求构建 ----------
+
+    def _requests_for(self, stage: str, record) -> List[Tuple[Dict, Dict]]:
+        """
+        构建某条记录在指定阶段的请求
+
+        Returns:
+            [(请求, 写回信息)]，已完成的阶段返回空列表
+        """
+        from .ai_service import TASK_PARAMS, extract_sections_from_outline
+
+        task = STAGE_TASKS[stage]
+        max_tokens, temperature = TASK_PARAMS[task]
+        items = []
+
+        if stage == 'analysis' and not record.analysis_report:
+            contents = self._load_documents(record)
+            if contents:
+                # 超出上下文窗口需分块摘录时，摘录调用在此同步完成，汇总解析进入批次
+                prefix, prompt = self.ai_service._build_structured_analysis_prompt(contents)
+                # 与交互模式一致保存解析时的文件内容，作为补遗/澄清增量解析的比较基准
+                items.append((prefix, prompt, {'contents': contents}))
+
+        elif stage == 'criteria' and record.analysis_report and not record.bidding_response:
+            prefix = EVALUATION_CRITERIA_EXTRACTION_PREFIX.format(
+                analysis_report=report_context(record.analysis_report, CRITERIA_CATEGORIES)
+            )
+            items.append((prefix, EVALUATION_CRITERIA_EXTRACTION_SUFFIX, {}))
+
+        elif stage == 'outline' and record.bidding_response and not record.technical_outline:
+            prefix = TECHNICAL_PROPOSAL_CONTEXT_PREFIX.format(
+                project_info=report_context(record.analysis_report, PROJECT_INFO_CATEGORIES, self.project_info_chars),
+                evaluation_criteria=record.bidding_response
+            )
+            items.append((prefix, TECHNICAL_PROPOSAL_OUTLINE_SUFFIX, {}))
+
+        elif stage == 'sections' and record.technical_outline:
+            outline = json.loads(record.technical_outline)
+            generated = json.loads(record.generated_sections) if record.generated_sections else {}
+            pending = [s for s in extract_sections_from_outline(outline) if s['title'] not in generated]
+            # 与交互模式一致附加检索到的原文条款（索引按文件内容缓存）
+            retriever = None
+            if pending and self.ai_service.retrieval:
+                retriever = self.ai_service.get_retriever(self._load_documents(record))
+            for section in pending:
+                prefix, prompt = self.ai_service._build_section_prompt(
+                    section['title'],
+                    section.get('word_count', 1000),
+                    section.get('description', ''),
+                    report_context(record.analysis_report, PROJECT_INFO_CATEGORIES, self.project_info_chars),
+                    record.bidding_response or '',
+                    retriever
+                )
+                # 输出预算与交互模式一致按建议字数计算（缓存键相同）
+                items.append((prefix, prompt, {
+                    'title': section['title'],
+                    'max_tokens': section_output_tokens(
+                        section.get('word_count', 1000), max_tokens, self.ai_service.router.provider_for(task).model
+                    )
+                }))
+
+        return [
+            (
+                {
+                    # Anthropic 要求 custom_id 只含字母数字、下划线和短横线
+                    'custom_id': f"r{record.id}-{stage}-{index}",
+                    'prompt': prompt,
+                    'prefix': prefix,
+                    'max_tokens': meta.get('max_tokens', max_tokens),
+                    'temperature': temperature,
+                    # 目录与交互模式一致使用JSON模式（缓存键相同）
+                    'json_mode': stage == 'outline'
+                },
+                dict(meta, record_id=record.id)
+            )
+            for index, (prefix, prompt, meta) in enumerate(items)
+        ]
+
+    def _write_back(self, stage: str, meta: Dict, text: str):
+        """将单个结果写回项目记录"""
+        from .ai_service import ClaudeService
+
+        record_id = meta['record_id']
+        if stage == 'analysis':
+            self.db_manager.update_record(
+                record_id, analysis_report=text, analyzed_contents=meta.get('contents') or {}, status='analyzed'
+            )
+        elif stage == 'criteria':
+            # 评审标准与界面一致，保存在 bidding_response 字段
+            self.db_manager.update_record(record_id, bidding_response=text)
+        elif stage == 'outline':
+            self.db_manager.update_record(record_id, technical_outline=ClaudeService.parse_outline_response(text))
+        elif stage == 'sections':
+            self.db_manager.save_generated_section(record_id, meta['title'], text)
+
+    # ---------- 执行 ----------
+
+    def _wait(self, backend: BatchBackend, batch_id: str):
+        """轮询直到批次结束"""
+        while True:
+            status = backend.poll(batch_id)
+            print(f"[Batch Runner] 批次 {batch_id}: 完成 {status['completed']} / 失败 {status['failed']} "
+                  f"/ 共 {status['total']}")
+            if status['done']:
+                return
+            time.sleep(self.poll_interval)
+
+    def run_stage(self, stage: str, record_ids: List[int]) -> Dict:
+        """
+        执行单个阶段
+
+        Returns:
+            {'submitted': 提交数, 'cached': 缓存命中数, 'succeeded': 成功数, 'failed': 失败数}
+        """
+        task = STAGE_TASKS[stage]
+        provider = self.ai_service.router.provider_for(task)
+        cache = self.ai_service.cache
+        summary = {'submitted': 0, 'cached': 0, 'succeeded': 0, 'failed': 0}
+
+        pending = []  # [(请求, 写回信息, 缓存键)]
+        for record_id in record_ids:
+            record = self.db_manager.get_record(record_id)
+            if not record:
+                continue
+            # 与交互模式一致在记录上下文中构建提示词（分块摘录调用计入该记录，历史章节检索排除该记录自身的章节）
+            with record_context(record.id):
+                requests = self._requests_for(stage, record)
+            for request, meta in requests:
+                cache_key = None
+                if cache:
+                    cache_key = LLMCache.make_key(
+                        provider.name, provider.model, request['prompt'],
+                        request['temperature'], request['max_tokens'],
+                        prefix=request['prefix'], json_mode=request['json_mode']
+                    )
+                    cached = cache.get(cache_key)
+                    if cached is not None:
+                        self._write_back(stage, meta, cached)
+                        summary['cached'] += 1
+                        continue
+                pending.append((request, meta, cache_key))
+
+        if not pending:
+            print(f"[Batch Runner] 阶段 {stage}: 无待处理请求（缓存命中 {summary['cached']}）")
+            return summary
+
+        backend = self._backend(task)
+        print(f"[Batch Runner] 阶段 {stage}: 提交 {len(pending)} 个请求（{backend.name}）")
+
+        for start in range(0, len(pending), backend.max_requests):
+            chunk = pending[start:start + backend.max_requests]
+            batch_id = backend.submit([request for request, _, _ in chunk])
+            summary['submitted'] += len(chunk)
+            self._wait(backend, batch_id)
+            results = backend.results(batch_id)
+
+            for request, meta, cache_key in chunk:
+                result = results.get(request['custom_id']) or {'error': '结果缺失'}
+                with record_context(meta['record_id']):
+                    if 'error' in result:
+                        summary['failed'] += 1
+                        print(f"[Batch Runner] {request['custom_id']} 失败: {result['error']}")
+                        if self.ai_service.metrics:
+                            self.ai_service.metrics.record(
+                                task, provider.name, provider.model, error=result['error']
+                            )
+                        continue
+
+                    summary['succeeded'] += 1
+                    self.ai_service._record_usage(result, task)
+                    self.ai_service._record_calibration(provider, request['prompt'], request['prefix'], result)
+                    if self.ai_service.metrics:
+                        self.ai_service.metrics.record(
+                            task, provider.name, result.get('model') or provider.model,
+                            usage=result.get('usage'), stop_reason=result.get('stop_reason')
+                        )
+                    if is_truncated(result.get('stop_reason')):
+                        # 批次结果被截断时以交互调用续写（与交互模式一致，缓存中保存完整输出）
+                        print(f"[Batch Runner] {request['custom_id']} 输出被截断（达到 max_tokens），续写")
+                        try:
+                            result['text'] = self.ai_service.continue_output(
+                                task, request['prompt'], result['text'], request['max_tokens'],
+                                request['temperature'], request['prefix']
+                            )
+                        except Exception as e:
+                            print(f"[Batch Runner] {request['custom_id']} 续写失败，保留截断结果: {e}")
+                if cache and cache_key:
+                    cache.set(cache_key, result['text'], provider.name, provider.model)
+                self._write_back(stage, meta, result['text'])
+
+        print(f"[Batch Runner] 阶段 {stage} 完成: {summary}")
+        return summary
+
+    def run(self, record_ids: Optional[List[int]] = None, stages: Optional[List[str]] = None) -> Dict:
+        """
+        依次执行各阶段
+
+        Args:
+            record_ids: 要处理的记录ID，默认全部记录
+            stages: 要执行的阶段，默认全部（analysis → criteria → outline → sections）
+
+        Returns:
+            {阶段: 统计}
+        """
+        if record_ids is None:
+            record_ids = [record.id for record in self.db_manager.get_all_records(limit=10000)]
+        stages = [stage for stage in STAGES if stage in (stages or STAGES)]
+
+        report = {}
+        # 批量任务中的交互式调用（分块摘录、续写）按批量优先级调度，不影响页面上的用户
+        with request_priority('bulk'):
+            for stage in stages:
+                report[stage] = self.run_stage(stage, record_ids)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量处理历史标书（使用Provider批量接口）")
+    parser.add_argument('--records', type=int, nargs='*', help="记录ID，默认全部")
+    parser.add_argument('--stages', nargs='*', choices=STAGES, help="执行阶段，默认全部")
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv('BATCH_POLL_INTERVAL', '30')))
+    args = parser.parse_args()
+
+    from .ai_service import ClaudeService
+    from .database import DatabaseManager
+
+    ai_service = ClaudeService()
+    db_manager = DatabaseManager()
+    try:
+        report = ai_service.run_bulk(
+            db_manager,
+            record_ids=args.records,
+            stages=args.stages,
+            poll_interval=args.poll_interval
+        )
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    finally:
+        db_manager.close()
+
+
+if __name__ == '__main__':
+    main()
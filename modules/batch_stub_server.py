@@ -0,0 +1,331 @@
+"""
+批量接口本地替身服务器（测试用）
+实现 OpenAI Batch 与 Anthropic Message Batches 接口的最小子集，请求由 MockProvider 处理，不访问网络：
+    OpenAI:    POST /v1/files, GET /v1/files/{id}/content, POST /v1/batches, GET /v1/batches/{id}
+    Anthropic: POST /v1/messages/batches, GET /v1/messages/batches/{id}, GET /v1/messages/batches/{id}/results
+
+用法：
+    python -m modules.batch_stub_server --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 或 ANTHROPIC_BASE_URL=http://127.0.0.1:8765
+    python -m modules.batch_runner
+"""
+
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Tuple
+from .ai_provider import AIProvider
+
+
+def _text_of(content) -> str:
+    """消息内容可能是字符串或内容块列表"""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get('text', '') for block in content or [])
+
+
+class BatchStubState:
+    """替身服务器的内存状态"""
+
+    def __init__(self, provider: AIProvider):
+        self.provider = provider
+        self.files: Dict[str, bytes] = {}
+        self.openai_batches: Dict[str, Dict] = {}
+        self.anthropic_batches: Dict[str, Dict] = {}
+        self.anthropic_results: Dict[str, list] = {}
+        self.lock = threading.Lock()
+
+    def _complete(self, prefix: Optional[str], prompt: str, max_tokens: int, temperature: float, json_mode: bool = False):
+        return self.provider.complete(
+            prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix or None, json_mode=json_mode
+        )
+
+    # ---------- OpenAI ----------
+
+    def process_openai(self, batch_id: str):
+        batch = self.openai_batches[batch_id]
+        lines = [json.loads(line) for line in self.files[batch['input_file_id']].decode('utf-8').splitlines() if line.strip()]
+        batch['status'] = 'in_progress'
+        batch['request_counts']['total'] = len(lines)
+
+        output, errors = [], []
+        for line in lines:
+            body = line['body']
+            prefix = "".join(_text_of(m['content']) for m in body['messages'] if m['role'] == 'system')
+            prompt = "".join(_text_of(m['content']) for m in body['messages'] if m['role'] == 'user')
+            try:
+                json_mode = (body.get('response_format') or {}).get('type') == 'json_object'
+                result = self._complete(
+                    prefix, prompt, body.get('max_tokens', 8000), body.get('temperature', 0.3), json_mode
+                )
+            except Exception as e:
+                errors.append({'id': f"batch_req_{uuid.uuid4().hex[:8]}", 'custom_id': line['custom_id'],
+                               'response': None, 'error': {'code': 'server_error', 'message': str(e)}})
+                batch['request_counts']['failed'] += 1
+                continue
+
+            usage = result['usage']
+            output.append({
+                'id': f"batch_req_{uuid.uuid4().hex[:8]}",
+                'custom_id': line['custom_id'],
+                'response': {
+                    'status_code': 200,
+                    'request_id': uuid.uuid4().hex,
+                    'body': {
+                        'id': f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                        'object': 'chat.completion',
+                        'created': int(time.time()),
+                        'model': body['model'],
+                        'choices': [{
+                            'index': 0,
+                            'message': {'role': 'assistant', 'content': result['text']},
+                            'finish_reason': result['stop_reason']
+                        }],
+                        'usage': {
+                            'prompt_tokens': usage['prompt_tokens'],
+                            'completion_tokens': usage['completion_tokens'],
+                            'total_tokens': usage['prompt_tokens'] + usage['completion_tokens'],
+                            'prompt_tokens_details': {'cached_tokens': usage['cache_read_tokens']}
+                        }
+                    }
+                },
+                'error': None
+            })
+            batch['request_counts']['completed'] += 1
+
+        with self.lock:
+            batch['output_file_id'] = self._store_file(output)
+            batch['error_file_id'] = self._store_file(errors) if errors else None
+            batch['status'] = 'completed'
+            batch['completed_at'] = int(time.time())
+
+    def _store_file(self, rows) -> str:
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.files[file_id] = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows).encode('utf-8')
+        return file_id
+
+    # ---------- Anthropic ----------
+
+    def process_anthropic(self, batch_id: str, requests: list):
+        batch = self.anthropic_batches[batch_id]
+        counts = batch['request_counts']
+        results = []
+        for request in requests:
+            params = request['params']
+            prefix = _text_of(params.get('system'))
+            prompt = "".join(_text_of(m['content']) for m in params['messages'] if m['role'] == 'user')
+            # 以 "{" 预填充assistant回复即JSON模式，返回内容不含预填充部分
+            prefill = params['messages'][-1]['content'] if params['messages'][-1]['role'] == 'assistant' else ''
+            try:
+                result = self._complete(
+                    prefix, prompt, params.get('max_tokens', 8000), params.get('temperature', 0.3), prefill == '{'
+                )
+                if prefill and result['text'].startswith(prefill):
+                    result['text'] = result['text'][len(prefill):]
+            except Exception as e:
+                results.append({'custom_id': request['custom_id'], 'result': {
+                    'type': 'errored',
+                    'error': {'type': 'error', 'error': {'type': 'api_error', 'message': str(e)}}
+                }})
+                counts['processing'] -= 1
+                counts['errored'] += 1
+                continue
+
+            usage = result['usage']
+            results.append({'custom_id': request['custom_id'], 'result': {
+                'type': 'succeeded',
+                'message': {
+                    'id': f"msg_{uuid.uuid4().hex[:12]}",
+                    'type': 'message',
+                    'role': 'assistant',
+                    'model': params['model'],
+                    'content': [{'type': 'text', 'text': result['text']}],
+                    'stop_reason': 'max_tokens' if result['stop_reason'] == 'length' else 'end_turn',
+                    'stop_sequence': None,
+                    'usage': {
+                        'input_tokens': usage['prompt_tokens'] - usage['cache_read_tokens'] - usage['cache_write_tokens'],
+                        'output_tokens': usage['completion_tokens'],
+                        'cache_read_input_tokens': usage['cache_read_tokens'],
+                        'cache_creation_input_tokens': usage['cache_write_tokens']
+                    }
+                }
+            }})
+            counts['processing'] -= 1
+            counts['succeeded'] += 1
+
+        with self.lock:
+            self.anthropic_results[batch_id] = results
+            batch['processing_status'] = 'ended'
+            batch['ended_at'] = _iso_now()
+
+
+def _iso_now() -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def make_handler(state: BatchStubState):
+    """创建绑定到指定状态的请求处理类"""
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload: Dict, status: int = 200):
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_bytes(self, data: bytes, content_type: str = 'application/octet-stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> bytes:
+            length = int(self.headers.get('Content-Length', '0'))
+            return self.rfile.read(length) if length else b''
+
+        def _multipart(self) -> Tuple[Dict[str, bytes], Dict[str, str]]:
+            """解析 multipart/form-data，返回 (字段值, 文件名)"""
+            raw = b"Content-Type: " + self.headers['Content-Type'].encode() + b"\r\n\r\n" + self._body()
+            message = BytesParser(policy=default_policy).parsebytes(raw)
+            fields, filenames = {}, {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                fields[name] = part.get_payload(decode=True)
+                if part.get_filename():
+                    filenames[name] = part.get_filename()
+            return fields, filenames
+
+        def _not_found(self):
+            self._send_json({'error': {'type': 'not_found_error', 'message': self.path}}, status=404)
+
+        def do_POST(self):
+            path = self.path.split('?')[0]
+
+            if path == '/v1/files':
+                fields, filenames = self._multipart()
+                file_id = f"file-{uuid.uuid4().hex[:12]}"
+                with state.lock:
+                    state.files[file_id] = fields['file']
+                self._send_json({
+                    'id': file_id, 'object': 'file', 'bytes': len(fields['file']), 'created_at': int(time.time()),
+                    'filename': filenames.get('file', 'batch.jsonl'), 'purpose': (fields.get('purpose') or b'batch').decode()
+                })
+
+            elif path == '/v1/batches':
+                payload = json.loads(self._body())
+                batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+                batch = {
+                    'id': batch_id, 'object': 'batch', 'endpoint': payload['endpoint'], 'errors': None,
+                    'input_file_id': payload['input_file_id'], 'completion_window': payload['completion_window'],
+                    'status': 'validating', 'output_file_id': None, 'error_file_id': None,
+                    'created_at': int(time.time()), 'completed_at': None, 'metadata': payload.get('metadata'),
+                    'request_counts': {'total': 0, 'completed': 0, 'failed': 0}
+                }
+                with state.lock:
+                    state.openai_batches[batch_id] = batch
+                threading.Thread(target=state.process_openai, args=(batch_id,), daemon=True).start()
+                self._send_json(batch)
+
+            elif path == '/v1/messages/batches':
+                payload = json.loads(self._body())
+                batch_id = f"msgbatch_{uuid.uuid4().hex[:12]}"
+                host = self.headers.get('Host')
+                batch = {
+                    'id': batch_id, 'type': 'message_batch', 'processing_status': 'in_progress',
+                    'request_counts': {'processing': len(payload['requests']), 'succeeded': 0,
+                                       'errored': 0, 'canceled': 0, 'expired': 0},
+                    'created_at': _iso_now(), 'expires_at': _iso_now(), 'ended_at': None,
+                    'cancel_initiated_at': None, 'archived_at': None,
+                    'results_url': f"http://{host}/v1/messages/batches/{batch_id}/results"
+                }
+                with state.lock:
+                    state.anthropic_batches[batch_id] = batch
+                threading.Thread(
+                    target=state.process_anthropic, args=(batch_id, payload['requests']), daemon=True
+                ).start()
+                self._send_json(batch)
+
+            else:
+                self._not_found()
+
+        def do_GET(self):
+            path = self.path.split('?')[0]
+
+            match = re.fullmatch(r'/v1/files/([\w-]+)/content', path)
+            if match and match.group(1) in state.files:
+                self._send_bytes(state.files[match.group(1)])
+                return
+
+            match = re.fullmatch(r'/v1/batches/([\w-]+)', path)
+            if match and match.group(1) in state.openai_batches:
+                with state.lock:
+                    self._send_json(state.openai_batches[match.group(1)])
+                return
+
+            match = re.fullmatch(r'/v1/messages/batches/([\w-]+)/results', path)
+            if match and match.group(1) in state.anthropic_results:
+                lines = "\n".join(json.dumps(r, ensure_ascii=False) for r in state.anthropic_results[match.group(1)])
+                self._send_bytes(lines.encode('utf-8'), 'application/binary')
+                return
+
+            match = re.fullmatch(r'/v1/messages/batches/([\w-]+)', path)
+            if match and match.group(1) in state.anthropic_batches:
+                with state.lock:
+                    self._send_json(state.anthropic_batches[match.group(1)])
+                return
+
+            self._not_found()
+
+    return Handler
+
+
+def start_stub_server(port: int = 0, provider: Optional[AIProvider] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    在后台线程启动替身服务器
+
+    Args:
+        port: 监听端口，0 表示自动分配
+        provider: 处理请求的 Provider，默认按环境变量创建 MockProvider
+
+    Returns:
+        (服务器实例, 根地址 http://127.0.0.1:端口)
+    """
+    if provider is None:
+        from .mock_provider import MockProvider
+        provider = MockProvider.from_env()
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(BatchStubState(provider)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量接口本地替身服务器")
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port)
+    print(f"[Batch Stub] 已启动: {base_url}")
+    print(f"[Batch Stub] OPENAI_BASE_URL={base_url}/v1  ANTHROPIC_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
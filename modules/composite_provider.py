@@ -0,0 +1,304 @@
+"""
+组合 Provider：多后端对冲请求与故障转移
+- 按配置顺序选择主后端，其余作为备用
+- 主后端耗时超过其历史延迟的指定分位数时，向下一个后端发送对冲请求，取先完成者
+- 后端报错时自动切换到下一个后端
+- 每个后端维护延迟直方图，自动计算对冲阈值
+"""
+
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional, Iterator, Dict, Callable
+from .ai_provider import AIProvider
+
+
+class LatencyHistogram:
+    """最近N次延迟样本（秒），用于计算分位数"""
+
+    def __init__(self, max_samples: int = 200):
+        self.samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    @property
+    def count(self) -> int:
+        return len(self.samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """第p百分位延迟，无样本时返回 None"""
+        with self._lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+        return ordered[index]
+
+
+class CompositeProvider(AIProvider):
+    """多后端组合 Provider（对冲请求 + 故障转移）"""
+
+    name = 'composite'
+
+    def __init__(
+        self,
+        backends: List[AIProvider],
+        hedge_percentile: float = 95,
+        min_samples: int = 5,
+        default_hedge_delay: float = 120.0,
+        default_ttft_hedge_delay: float = 20.0
+    ):
+        """
+        Args:
+            backends: 后端列表，按优先级排列（第一个为主后端）
+            hedge_percentile: 对冲阈值使用的延迟分位数
+            min_samples: 样本数不足时使用默认阈值
+            default_hedge_delay: 非流式调用的默认对冲阈值（秒）
+            default_ttft_hedge_delay: 流式调用首个token的默认对冲阈值（秒）
+        """
+        if not backends:
+            raise ValueError("CompositeProvider 至少需要一个后端")
+
+        self.backends = backends
+        self.model = '+'.join(f"{b.name}:{b.model}" for b in backends)
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.default_hedge_delay = default_hedge_delay
+        self.default_ttft_hedge_delay = default_ttft_hedge_delay
+
+        # 延迟直方图：键为 (后端序号, 类型, max_tokens量级)，不同输出规模的耗时差异很大
+        self._histograms: Dict[tuple, LatencyHistogram] = {}
+        self._hist_lock = threading.Lock()
+
+        self.stats = {i: {'calls': 0, 'wins': 0, 'errors': 0, 'hedges': 0} for i in range(len(backends))}
+        self._stats_lock = threading.Lock()
+
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='composite')
+
+    @classmethod
+    def from_env(cls, backends: List[AIProvider]) -> 'CompositeProvider':
+        """根据环境变量创建（HEDGE_PERCENTILE、HEDGE_MIN_SAMPLES、HEDGE_DEFAULT_DELAY、HEDGE_DEFAULT_TTFT_DELAY）"""
+        return cls(
+            backends,
+            hedge_percentile=float(os.getenv('HEDGE_PERCENTILE', '95')),
+            min_samples=int(os.getenv('HEDGE_MIN_SAMPLES', '5')),
+            default_hedge_delay=float(os.getenv('HEDGE_DEFAULT_DELAY', '120')),
+            default_ttft_hedge_delay=float(os.getenv('HEDGE_DEFAULT_TTFT_DELAY', '20'))
+        )
+
+    def _histogram(self, index: int, kind: str, max_tokens: int) -> LatencyHistogram:
+        size_class = max(1, max_tokens).bit_length()
+        key = (index, kind, size_class)
+        with self._hist_lock:
+            if key not in self._histograms:
+                self._histograms[key] = LatencyHistogram()
+            return self._histograms[key]
+
+    def _hedge_delay(self, index: int, kind: str, max_tokens: int) -> float:
+        """后端的对冲阈值：样本足够时取历史分位数，否则取默认值"""
+        histogram = self._histogram(index, kind, max_tokens)
+        if histogram.count < self.min_samples:
+            return self.default_ttft_hedge_delay if kind == 'ttft' else self.default_hedge_delay
+        return histogram.percentile(self.hedge_percentile)
+
+    def _bump(self, index: int, field: str):
+        with self._stats_lock:
+            self.stats[index][field] += 1
+
+    def complete(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        json_mode: bool = False
+    ) -> Dict:
+        """
+        非流式调用：主后端超时则对冲，报错则故障转移，返回最先成功的结果
+
+        落后的请求无法真正中断（SDK调用不可取消），其结果会被丢弃
+        """
+        pending_backends = list(range(len(self.backends)))
+        running = {}  # future -> (后端序号, 开始时间)
+        last_error = None
+
+        def launch(index: int):
+            self._bump(index, 'calls')
+            started = time.monotonic()
+            future = self._executor.submit(
+                self.backends[index].complete,
+                prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, json_mode=json_mode
+            )
+            running[future] = (index, started)
+
+            def record_latency(f, index=index, started=started):
+                if not f.cancelled() and f.exception() is None:
+                    self._histogram(index, 'total', max_tokens).add(time.monotonic() - started)
+            future.add_done_callback(record_latency)
+
+        launch(pending_backends.pop(0))
+
+        while running:
+            # 只有还有备用后端时才设置对冲超时
+            timeout = None
+            if pending_backends:
+                primary_index, primary_started = min(running.values(), key=lambda item: item[1])
+                delay = self._hedge_delay(primary_index, 'total', max_tokens)
+                timeout = max(0.0, delay - (time.monotonic() - primary_started))
+
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # 超过阈值仍未完成，发送对冲请求
+                hedge_index = pending_backends.pop(0)
+                print(f"[Composite Provider] 主请求超过对冲阈值，向 {self.backends[hedge_index].name} 发送对冲请求")
+                self._bump(hedge_index, 'hedges')
+                launch(hedge_index)
+                continue
+
+            for future in done:
+                index, _ = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    self._bump(index, 'wins')
+                    for other in running:
+                        other.cancel()
+                    return future.result()
+
+                last_error = error
+                self._bump(index, 'errors')
+                print(f"[Composite Provider] {self.backends[index].name} 调用失败: {error}")
+                if pending_backends:
+                    launch(pending_backends.pop(0))
+
+        raise last_error
+
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        on_finish: Optional[Callable[[Dict], None]] = None,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        """
+        流式调用：首个token超过阈值未到达则对冲，先输出者胜出，其余流被关闭
+
+        输出开始后不再切换后端（避免内容拼接错乱）
+        """
+        events = queue.Queue()
+        cancel_flags = {}
+        pending_backends = list(range(len(self.backends)))
+        active = set()
+        started_at = {}
+        winner = None
+        finish_info = None
+        last_error = None
+
+        def worker(index: int, cancel: threading.Event):
+            stream = self.backends[index].generate_stream(
+                prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                prefix=prefix,
+                on_finish=lambda info: events.put((index, 'finish', info)),
+                json_mode=json_mode
+            )
+            try:
+                for delta in stream:
+                    if cancel.is_set():
+                        stream.close()
+                        return
+                    events.put((index, 'delta', delta))
+                events.put((index, 'done', None))
+            except Exception as e:
+                events.put((index, 'error', e))
+
+        def launch(index: int):
+            self._bump(index, 'calls')
+            cancel_flags[index] = threading.Event()
+            started_at[index] = time.monotonic()
+            active.add(index)
+            threading.Thread(target=worker, args=(index, cancel_flags[index]), daemon=True).start()
+
+        launch(pending_backends.pop(0))
+
+        try:
+            while True:
+                timeout = None
+                if winner is None and pending_backends and active:
+                    primary_index = min(active, key=lambda i: started_at[i])
+                    delay = self._hedge_delay(primary_index, 'ttft', max_tokens)
+                    timeout = max(0.0, delay - (time.monotonic() - started_at[primary_index]))
+
+                try:
+                    index, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge_index = pending_backends.pop(0)
+                    print(f"[Composite Provider] 首个token超过对冲阈值，向 {self.backends[hedge_index].name} 发送对冲请求")
+                    self._bump(hedge_index, 'hedges')
+                    launch(hedge_index)
+                    continue
+
+                # 已有胜出者时忽略其他后端的事件
+                if winner is not None and index != winner:
+                    continue
+
+                if kind == 'error':
+                    active.discard(index)
+                    self._bump(index, 'errors')
+                    if winner == index:
+                        raise payload
+                    last_error = payload
+                    print(f"[Composite Provider] {self.backends[index].name} 流式调用失败: {payload}")
+                    if pending_backends:
+                        launch(pending_backends.pop(0))
+                    elif not active:
+                        raise last_error
+                    continue
+
+                if winner is None:
+                    winner = index
+                    self._bump(index, 'wins')
+                    self._histogram(index, 'ttft', max_tokens).add(time.monotonic() - started_at[index])
+                    for other, flag in cancel_flags.items():
+                        if other != index:
+                            flag.set()
+
+                if kind == 'delta':
+                    yield payload
+                elif kind == 'finish':
+                    finish_info = payload
+                elif kind == 'done':
+                    self._histogram(index, 'total', max_tokens).add(time.monotonic() - started_at[index])
+                    if on_finish and finish_info is not None:
+                        on_finish(finish_info)
+                    return
+        finally:
+            # 调用方提前停止迭代时，通知所有后端线程退出
+            for flag in cancel_flags.values():
+                flag.set()
+
+    def get_statistics(self) -> List[Dict]:
+        """各后端的调用统计及延迟分位数"""
+        result = []
+        for index, backend in enumerate(self.backends):
+            with self._stats_lock:
+                stats = dict(self.stats[index])
+            with self._hist_lock:
+                totals = [h for (i, kind, _), h in self._histograms.items() if i == index and kind == 'total']
+            samples = sorted(s for h in totals for s in list(h.samples))
+            stats.update({
+                'backend': f"{backend.name}:{backend.model}",
+                'p50': samples[len(samples) // 2] if samples else None,
+                'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else None
+            })
+            result.append(stats)
+        return result
@@ -0,0 +1,379 @@
+"""
+上下文窗口规划
+根据模型上下文窗口和各部分的估算token数，为招标文件解析选择代价最低、且能放入窗口的输入策略：
+    as_is      直接发送原文
+    dedupe     去除重复行（页眉页脚、重复表头等）后发送
+    compress   按计算出的压缩率压缩（保留标题、数值和强制性条款）
+    map_reduce 分块摘录后再汇总解析（额外调用次数最多，仅在压缩率过低时使用）
+
+所有策略都为输出预留 max_tokens 的空间，并保留一定安全余量（token数按模型的校准系数估算）
+预计耗时按调用指标中的历史首token延迟和输出速度估算，无历史数据时使用默认值
+"""
+
+import os
+import re
+import math
+import hashlib
+import threading
+from typing import Dict, List, Optional
+from .text_processor import TextProcessor, ContentCompressor
+from .metrics import MetricsStore, percentile
+
+# 模型上下文窗口（tokens），按模型名包含的关键字匹配，先匹配先生效
+MODEL_CONTEXT_WINDOWS = [
+    ('gpt-4o', 128000),
+    ('gpt-4.1', 1047576),
+    ('gpt-4-turbo', 128000),
+    ('gpt-3.5', 16385),
+    ('o1', 200000),
+    ('o3', 200000),
+    ('claude', 200000),
+    ('gemini', 1048576),
+    ('deepseek', 64000),
+    ('qwen', 131072),
+    ('mock', 200000),
+]
+
+DEFAULT_CONTEXT_WINDOW = 128000
+
+STRATEGIES = {
+    'as_is': '直接发送',
+    'dedupe': '去重后发送',
+    'compress': '压缩后发送',
+    'map_reduce': '分块摘录后汇总',
+}
+
+# 无历史数据时的默认速度：输入处理（token/秒）、输出生成（token/秒）、固定开销（秒）
+DEFAULT_PREFILL_TPS = 5000.0
+DEFAULT_DECODE_TPS = 50.0
+DEFAULT_BASE_SECONDS = 1.0
+
+
+def context_window(model: Optional[str]) -> int:
+    """
+    获取模型的上下文窗口大小
+
+    MODEL_CONTEXT_WINDOW 环境变量可强制指定（用于未登记的模型或代理限制）
+
+    Args:
+        model: 模型名称
+
+    Returns:
+        上下文窗口（tokens）
+    """
+    override = os.getenv('MODEL_CONTEXT_WINDOW')
+    if override:
+        return int(override)
+    name = (model or '').lower()
+    for keyword, window in MODEL_CONTEXT_WINDOWS:
+        if keyword in name:
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def dedupe_text(text: str, min_chars: int = 8) -> str:
+    """
+    去除重复行（PDF每页重复的页眉页脚、重复的表头和声明等）
+
+    短行（如表格中的"是"、序号）可能合理重复，长度小于 min_chars 的行不去重
+
+    Args:
+        text: 原文
+        min_chars: 参与去重的最小行长度
+
+    Returns:
+        去重后的文本
+    """
+    seen = set()
+    lines = []
+    blank = False
+    for line in text.split('\n'):
+        normalized = re.sub(r'\s+', '', line)
+        if not normalized:
+            # 连续空行只保留一个
+            if not blank:
+                lines.append('')
+            blank = True
+            continue
+        blank = False
+        if len(normalized) >= min_chars:
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def split_by_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> List[str]:
+    """
+    按行把文本切分为不超过 max_tokens 的分块（单行超长时按字符切分）
+
+    Args:
+        text: 原文
+        max_tokens: 每块最大token数
+        model: 模型名称（已校准时按该模型的系数估算）
+
+    Returns:
+        分块列表
+    """
+    parts = []
+    current = []
+    current_tokens = 0
+    for line in text.split('\n'):
+        line_tokens = TextProcessor.estimate_tokens(line, model) + 1
+        if line_tokens > max_tokens:
+            if current:
+                parts.append('\n'.join(current))
+                current, current_tokens = [], 0
+            pieces = math.ceil(line_tokens / max_tokens)
+            size = math.ceil(len(line) / pieces)
+            parts.extend(line[i:i + size] for i in range(0, len(line), size))
+            continue
+        if current and current_tokens + line_tokens > max_tokens:
+            parts.append('\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        parts.append('\n'.join(current))
+    return parts
+
+
+class ContextPlanner:
+    """输入策略规划器"""
+
+    def __init__(
+        self,
+        metrics: Optional[MetricsStore] = None,
+        safety_margin: float = 0.05,
+        min_compression_ratio: float = 0.4,
+        map_output_tokens: int = 4000,
+        map_concurrency: int = 4
+    ):
+        """
+        Args:
+            metrics: 调用指标存储（用于估算耗时），为空时使用默认速度
+            safety_margin: 上下文窗口的安全余量比例（token数为估算值）
+            min_compression_ratio: 可接受的最低压缩率，更低时改用 map_reduce
+            map_output_tokens: map 阶段每块的最大输出token数
+            map_concurrency: map 阶段并发数
+        """
+        self.metrics = metrics
+        self.safety_margin = safety_margin
+        self.min_compression_ratio = min_compression_ratio
+        self.map_output_tokens = map_output_tokens
+        self.map_concurrency = map_concurrency
+
+        self._cache: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, metrics: Optional[MetricsStore] = None) -> 'ContextPlanner':
+        """根据环境变量创建（CONTEXT_SAFETY_MARGIN、CONTEXT_MIN_COMPRESSION_RATIO、CONTEXT_MAP_*）"""
+        return cls(
+            metrics=metrics,
+            safety_margin=float(os.getenv('CONTEXT_SAFETY_MARGIN', '0.05')),
+            min_compression_ratio=float(os.getenv('CONTEXT_MIN_COMPRESSION_RATIO', '0.4')),
+            map_output_tokens=int(os.getenv('CONTEXT_MAP_OUTPUT_TOKENS', '4000')),
+            map_concurrency=int(os.getenv('CONTEXT_MAP_CONCURRENCY', '4'))
+        )
+
+    def input_budget(self, model: Optional[str], instruction_tokens: int, max_output_tokens: int) -> int:
+        """可用于文档内容的token数 = 窗口 × (1 - 安全余量) - 指令 - 输出预留"""
+        window = context_window(model)
+        return int(window * (1 - self.safety_margin)) - instruction_tokens - max_output_tokens
+
+    def plan(
+        self,
+        document_text: str,
+        model: Optional[str],
+        instruction_tokens: int,
+        max_output_tokens: int,
+        task: str = 'analysis',
+        forced_ratio: Optional[float] = None
+    ) -> Dict:
+        """
+        选择输入策略
+
+        Args:
+            document_text: 合并后的文档内容
+            model: 调用使用的模型
+            instruction_tokens: 提示词中除文档内容外的token数
+            max_output_tokens: 输出预留的token数
+            task: 任务类型（用于按历史指标估算耗时）
+            forced_ratio: 手动指定的压缩率（COMPRESSION_RATIO），<1.0 时强制压缩
+
+        Returns:
+            {'strategy', 'label', 'model', 'context_window', 'budget_tokens', 'input_tokens',
+             'final_tokens', 'ratio', 'parts', 'predicted_seconds', 'reason', 'document_text'}
+            map_reduce 时 'parts' 为分块文本列表，其余策略为空列表
+        """
+        key = hashlib.sha256(
+            f"{model}|{context_window(model)}|{instruction_tokens}|{max_output_tokens}|{task}|{forced_ratio}|"
+            .encode('utf-8') + document_text.encode('utf-8')
+        ).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+
+        plan = self._plan(document_text, model, instruction_tokens, max_output_tokens, task, forced_ratio)
+        print(f"[Context Planner] {plan['label']}：{plan['input_tokens']:,} → {plan['final_tokens']:,} tokens "
+              f"（可用 {plan['budget_tokens']:,} / 窗口 {plan['context_window']:,}），{plan['reason']}")
+
+        with self._lock:
+            # 只保留最近的少量规划（界面每次刷新都会重新规划）
+            if len(self._cache) >= 8:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = plan
+        return plan
+
+    def _plan(
+        self,
+        document_text: str,
+        model: Optional[str],
+        instruction_tokens: int,
+        max_output_tokens: int,
+        task: str,
+        forced_ratio: Optional[float]
+    ) -> Dict:
+        window = context_window(model)
+        budget = self.input_budget(model, instruction_tokens, max_output_tokens)
+        input_tokens = TextProcessor.estimate_tokens(document_text, model)
+        if budget <= 0:
+            raise ValueError(
+                f"模型 {model} 的上下文窗口（{window:,} tokens）不足以容纳指令和输出预留"
+                f"（{instruction_tokens + max_output_tokens:,} tokens）"
+            )
+
+        def result(strategy: str, text: str, reason: str, parts: Optional[List[str]] = None) -> Dict:
+            final_tokens = TextProcessor.estimate_tokens(text, model) if text else 0
+            if parts:
+                final_tokens = min(budget, len(parts) * self.map_output_tokens)
+            return {
+                'strategy': strategy,
+                'label': STRATEGIES[strategy],
+                'model': model,
+                'context_window': window,
+                'budget_tokens': budget,
+                'input_tokens': input_tokens,
+                'final_tokens': final_tokens,
+                'ratio': final_tokens / input_tokens if input_tokens else 1.0,
+                'parts': parts or [],
+                'predicted_seconds': self._predict_plan_seconds(
+                    model, task, instruction_tokens + final_tokens, max_output_tokens, parts
+                ),
+                'reason': reason,
+                'document_text': text,
+            }
+
+        # 手动指定压缩率：沿用原有行为，但仍需放入窗口
+        if forced_ratio is not None and forced_ratio < 1.0:
+            compressed = ContentCompressor.compress_for_analysis(document_text, target_ratio=forced_ratio)
+            if TextProcessor.estimate_tokens(compressed, model) <= budget:
+                return result('compress', compressed, f"按 COMPRESSION_RATIO={forced_ratio} 压缩")
+
+        if input_tokens <= budget:
+            return result('as_is', document_text, "原文可完整放入上下文窗口")
+
+        deduped = dedupe_text(document_text)
+        deduped_tokens = TextProcessor.estimate_tokens(deduped, model)
+        if deduped_tokens <= budget:
+            return result('dedupe', deduped, f"去除重复行后可放入（减少 {input_tokens - deduped_tokens:,} tokens）")
+
+        ratio = budget / deduped_tokens if deduped_tokens else 1.0
+        if ratio >= self.min_compression_ratio:
+            compressed = ContentCompressor.compress_for_analysis(deduped, target_ratio=ratio)
+            if TextProcessor.estimate_tokens(compressed, model) > budget:
+                compressed = TextProcessor.smart_truncate(compressed, budget)
+            # 结构化截断总是保留标题行，条款大多以"第X条"开头时仍会超出，改为头尾截断
+            if TextProcessor.estimate_tokens(compressed, model) > budget:
+                compressed = TextProcessor.smart_truncate(compressed, budget, keep_structure=False)
+            return result('compress', compressed, f"压缩率 {ratio:.0%} 可放入")
+
+        # 压缩过多会丢失信息：分块摘录，每块留出指令和摘录输出的空间
+        part_budget = self.input_budget(model, instruction_tokens, self.map_output_tokens)
+        parts = split_by_tokens(deduped, part_budget, model)
+        return result(
+            'map_reduce', '',
+            f"需压缩至 {ratio:.0%}（低于 {self.min_compression_ratio:.0%}），分 {len(parts)} 块摘录后汇总",
+            parts
+        )
+
+    # ---------- 耗时估算 ----------
+
+    def _speeds(self, model: Optional[str], task: str) -> Dict:
+        """从历史调用估算输入处理速度、输出速度、固定开销和典型输出长度"""
+        speeds = {
+            'prefill_tps': DEFAULT_PREFILL_TPS,
+            'decode_tps': DEFAULT_DECODE_TPS,
+            'base_seconds': DEFAULT_BASE_SECONDS,
+            'output_tokens': None,
+        }
+        if not self.metrics:
+            return speeds
+
+        calls = [
+            c for c in self.metrics.get_calls(task=task, limit=200)
+            if c.get('success') and not c.get('cache_hit') and (not model or c.get('model') == model)
+        ]
+        prefill = [
+            c['prompt_tokens'] / (c['ttft_ms'] / 1000)
+            for c in calls if c.get('ttft_ms') and c.get('prompt_tokens')
+        ]
+        decode = [
+            c['completion_tokens'] / ((c['latency_ms'] - c['ttft_ms']) / 1000)
+            for c in calls
+            if c.get('ttft_ms') and c.get('latency_ms') and c['latency_ms'] > c['ttft_ms'] and c.get('completion_tokens')
+        ]
+        outputs = [c['completion_tokens'] for c in calls if c.get('completion_tokens')]
+        if prefill:
+            speeds['prefill_tps'] = percentile(prefill, 50)
+            speeds['base_seconds'] = 0.0
+        if decode:
+            speeds['decode_tps'] = percentile(decode, 50)
+        if outputs:
+            speeds['output_tokens'] = percentile(outputs, 50)
+        return speeds
+
+    def predict_seconds(
+        self,
+        model: Optional[str],
+        task: str,
+        input_tokens: int,
+        max_output_tokens: int
+    ) -> float:
+        """
+        估算单次调用耗时
+
+        Args:
+            model: 模型名称
+            task: 任务类型
+            input_tokens: 输入token数
+            max_output_tokens: 最大输出token数（无历史数据时按一半估算输出长度）
+
+        Returns:
+            预计耗时（秒）
+        """
+        speeds = self._speeds(model, task)
+        output_tokens = min(max_output_tokens, speeds['output_tokens'] or max_output_tokens // 2)
+        return (
+            speeds['base_seconds']
+            + input_tokens / speeds['prefill_tps']
+            + output_tokens / speeds['decode_tps']
+        )
+
+    def _predict_plan_seconds(
+        self,
+        model: Optional[str],
+        task: str,
+        input_tokens: int,
+        max_output_tokens: int,
+        parts: Optional[List[str]]
+    ) -> float:
+        seconds = self.predict_seconds(model, task, input_tokens, max_output_tokens)
+        if parts:
+            # map 阶段按并发数分轮执行，每轮耗时按最长分块估算
+            longest = max(TextProcessor.estimate_tokens(part, model) for part in parts)
+            rounds = math.ceil(len(parts) / max(1, self.map_concurrency))
+            seconds += rounds * self.predict_seconds(model, 'map', longest, self.map_output_tokens)
+        return seconds
@@ -3,12 +3,13 @@
 管理标书审查历史记录
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
 import json
+from .report_store import AnalysisReport
 
 Base = declarative_base()
 
@@ -28,9 +29,27 @@ class BiddingRecord(Base):
     # 分析报告
     analysis_report = Column(Text)
 
+    # 分析报告按类别切分后的结构（JSON 格式存储，随 analysis_report 自动更新）
+    report_sections = Column(Text)
+
     # 投标文件
     bidding_response = Column(Text)
 
+    # 技术标目录（JSON 格式存储）
+    technical_outline = Column(Text)
+
+    # 已生成的技术标章节（JSON 格式存储）{"章节标题": "章节内容"}
+    generated_sections = Column(Text)
+
+    # 招标文件分层摘要（JSON 格式存储）{"version": 1, "files": {...}}
+    document_summary = Column(Text)
+
+    # 生成解析报告时的文件内容（JSON 格式存储）{"文件类别": "文本"}，补遗/澄清增量解析时作为比较基准
+    analyzed_contents = Column(Text)
+
+    # 标书问答记录（JSON 格式存储）{"summary": 较早对话的摘要, "messages": [{"role", "content"}]}
+    chat_history = Column(Text)
+
     # 状态：draft(草稿), analyzed(已分析), completed(已完成)
     status = Column(String(20), default='draft')
 
@@ -43,7 +62,13 @@ class BiddingRecord(Base):
             'update_time': self.update_time.strftime('%Y-%m-%d %H:%M:%S') if self.update_time else None,
             'uploaded_files': json.loads(self.uploaded_files) if self.uploaded_files else {},
             'analysis_report': self.analysis_report,
+            'report_sections': json.loads(self.report_sections) if self.report_sections else None,
             'bidding_response': self.bidding_response,
+            'technical_outline': json.loads(self.technical_outline) if self.technical_outline else None,
+            'generated_sections': json.loads(self.generated_sections) if self.generated_sections else {},
+            'document_summary': json.loads(self.document_summary) if self.document_summary else None,
+            'analyzed_contents': json.loads(self.analyzed_contents) if self.analyzed_contents else {},
+            'chat_history': json.loads(self.chat_history) if self.chat_history else None,
             'status': self.status
         }
 
@@ -51,6 +76,10 @@ class BiddingRecord(Base):
 class DatabaseManager:
     """数据库管理器"""
 
+    # 以JSON字符串存储的字段（传入dict/list时自动序列化）
+    JSON_FIELDS = ('uploaded_files', 'technical_outline', 'generated_sections', 'document_summary', 'analyzed_contents', 'report_sections',
+                   'chat_history')
+
     def __init__(self, db_path: str = 'data/bidding_system.db'):
         """
         初始化数据库
@@ -67,10 +96,25 @@ class DatabaseManager:
         # 创建所有表
         Base.metadata.create_all(self.engine)
 
+        # 旧版数据库补充新增字段
+        self._migrate_columns()
+
         # 创建会话
         Session = sessionmaker(bind=self.engine)
         self.session = Session()
 
+    def _migrate_columns(self):
+        """为旧版数据库补充模型中新增的字段（SQLite只支持 ADD COLUMN）"""
+        table_name = BiddingRecord.__tablename__
+        existing = {col['name'] for col in inspect(self.engine).get_columns(table_name)}
+
+        with self.engine.begin() as conn:
+            for column in BiddingRecord.__table__.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=self.engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}'))
+                    print(f"[Database] 新增字段: {table_name}.{column.name}")
+
     def create_record(
         self,
         project_name: str,
@@ -113,9 +157,15 @@ class DatabaseManager:
         if not record:
             raise ValueError(f"记录不存在: {record_id}")
 
-        # 特殊处理 uploaded_files
-        if 'uploaded_files' in kwargs and isinstance(kwargs['uploaded_files'], dict):
-            kwargs['uploaded_files'] = json.dumps(kwargs['uploaded_files'], ensure_ascii=False)
+        # 报告更新时同步保存切分后的结构
+        if 'analysis_report' in kwargs and 'report_sections' not in kwargs:
+            report = kwargs['analysis_report']
+            kwargs['report_sections'] = AnalysisReport.parse(report).to_dict() if report else None
+
+        # 特殊处理 JSON 字段
+        for field in self.JSON_FIELDS:
+            if field in kwargs and isinstance(kwargs[field], (dict, list)):
+                kwargs[field] = json.dumps(kwargs[field], ensure_ascii=False)
 
         for key, value in kwargs.items():
             if hasattr(record, key):
@@ -125,6 +175,35 @@ class DatabaseManager:
         self.session.commit()
         return record
 
+    def save_generated_section(
+        self,
+        record_id: int,
+        section_title: str,
+        content: str
+    ) -> BiddingRecord:
+        """
+        保存单个已生成章节（合并到 generated_sections 中）
+
+        Args:
+            record_id: 记录ID
+            section_title: 章节标题
+            content: 章节内容
+
+        Returns:
+            更新后的记录
+        """
+        record = self.get_record(record_id)
+        if not record:
+            raise ValueError(f"记录不存在: {record_id}")
+
+        sections = json.loads(record.generated_sections) if record.generated_sections else {}
+        sections[section_title] = content
+        record.generated_sections = json.dumps(sections, ensure_ascii=False)
+
+        record.update_time = datetime.now()
+        self.session.commit()
+        return record
+
     def get_record(self, record_id: int) -> BiddingRecord:
         """获取单条记录"""
         return self.session.query(BiddingRecord).filter_by(id=record_id).first()
@@ -144,6 +223,24 @@ class DatabaseManager:
             .limit(limit)\
             .all()
 
+    def get_update_times(self, limit: int = 50) -> list:
+        """
+        获取最近记录的ID和更新时间（只查两列，用于判断记录是否有变化）
+
+        Args:
+            limit: 最多返回的记录数
+
+        Returns:
+            [(记录ID, 更新时间)]，与 get_all_records 顺序一致
+        """
+        return [
+            (record_id, update_time)
+            for record_id, update_time in self.session.query(BiddingRecord.id, BiddingRecord.update_time)
+            .order_by(BiddingRecord.update_time.desc())
+            .limit(limit)
+            .all()
+        ]
+
     def delete_record(self, record_id: int):
         """删除记录"""
         record = self.get_record(record_id)
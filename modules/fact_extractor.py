@@ -0,0 +1,298 @@
+"""
+招标文件关键信息预提取（本地规则）
+投标截止时间、开标时间、投标保证金、项目编号、工期、资质等级等信息格式高度固定，
+文件解析完成后立即用编译好的规则提取，毫秒级给出关键信息表：页面上直接显示，
+并注入解析提示词，模型只需核对和判断，不必再从全文中查找
+
+- 日期时间：2025年11月12日9时30分 / 2025-11-12 09:30 / 上午、下午
+- 金额：20万元 / 200,000.00元 / 人民币贰拾万元整（中文大小写数字）
+- 工期：180日历天 / 一百八十天 / 6个月
+- 同一信息出现多个不同值时按出现次数取值，其余值作为"另见"一并给出，由模型和用户核对
+"""
+
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+_CN_DIGITS = {
+    '零': 0, '〇': 0, '一': 1, '壹': 1, '二': 2, '贰': 2, '两': 2, '三': 3, '叁': 3,
+    '四': 4, '肆': 4, '五': 5, '伍': 5, '六': 6, '陆': 6, '七': 7, '柒': 7,
+    '八': 8, '捌': 8, '九': 9, '玖': 9,
+}
+_CN_UNITS = {'十': 10, '拾': 10, '百': 100, '佰': 100, '千': 1000, '仟': 1000}
+_CN_NUMERAL = '零〇一壹二贰两三叁四肆五伍六陆七柒八捌九玖十拾百佰千仟万萬亿'
+
+_DATETIME = re.compile(
+    r'(\d{4})\s*[年\-/.]\s*(\d{1,2})\s*[月\-/.]\s*(\d{1,2})\s*日?'
+    r'(?:\s*[（(]?\s*(?:星期|周)[一二三四五六日天]\s*[)）]?)?'
+    r'(?:\s*(上午|下午|晚上)?\s*(\d{1,2})\s*(?:[:：]|时|点)\s*(\d{1,2})?\s*分?)?'
+)
+_AMOUNT = re.compile(
+    rf'(?:人民币|[¥￥])?\s*(?:大写[:：]?\s*)?'
+    rf'(\d[\d,，]*(?:\.\d+)?|[{_CN_NUMERAL}]+)\s*(万元|万|元)'
+)
+_DURATION = re.compile(rf'(\d+|[{_CN_NUMERAL}]+)\s*(个?日历天|个?日历日|天|日|个月|月|年)')
+_CODE = re.compile(r'[:：为是]?\s*([^\s，。；;,:：、]{4,40})')
+
+# 资质类别 + 等级（先匹配固定词再向前取专业名称，避免在每个汉字位置回溯）
+_QUALIFICATION = re.compile(
+    r'(施工总承包|专业承包|工程设计|工程监理|工程勘察|设计|监理|勘察)'
+    r'(?:资质)?\s*(特级|甲级|乙级|丙级|壹级|贰级|叁级|一级|二级|三级)'
+    r'(及以上|以上)?'
+)
+_QUALIFICATION_FIELD = re.compile(r'[一-龥]{2,16}$')
+# 资质类别前常见的引导词（截掉后只保留专业名称）
+_QUALIFICATION_LEAD = re.compile(r'.*(?:具备|具有|持有|取得|须|应|要求|并|及|或|和|、)')
+
+
+def chinese_to_number(text: str) -> Optional[float]:
+    """
+    中文数字（含大写）转数值，如 贰拾万 → 200000、一百八十 → 180
+
+    Args:
+        text: 中文数字串
+
+    Returns:
+        数值，包含无法识别的字符时返回 None
+    """
+    total = section = number = 0
+    for char in text:
+        if char in _CN_DIGITS:
+            number = _CN_DIGITS[char]
+        elif char in _CN_UNITS:
+            section += (number or 1) * _CN_UNITS[char]
+            number = 0
+        elif char in ('万', '萬'):
+            total += (section + number) * 10000
+            section = number = 0
+        elif char == '亿':
+            total = (total + section + number) * 100000000
+            section = number = 0
+        else:
+            return None
+    return total + section + number
+
+
+def _to_number(text: str) -> Optional[float]:
+    """阿拉伯数字（可带千分位）或中文数字转数值"""
+    if text[0].isdigit():
+        try:
+            return float(text.replace(',', '').replace('，', ''))
+        except ValueError:
+            return None
+    return chinese_to_number(text)
+
+
+def parse_datetime(text: str) -> Optional[Tuple[str, int, int]]:
+    """
+    提取文本中的第一个日期时间
+
+    Returns:
+        (规范化值 YYYY-MM-DD HH:MM, 起始位置, 结束位置)，未找到时返回 None
+    """
+    for match in _DATETIME.finditer(text):
+        year, month, day, period, hour, minute = match.groups()
+        month, day = int(month), int(day)
+        if not (1 <= month <= 12 and 1 <= day <= 31):
+            continue
+        value = f"{year}-{month:02d}-{day:02d}"
+        if hour is not None:
+            hour = int(hour)
+            if period in ('下午', '晚上') and hour < 12:
+                hour += 12
+            if hour <= 24:
+                value += f" {hour:02d}:{int(minute or 0):02d}"
+        return value, match.start(), match.end()
+    return None
+
+
+def parse_amount(text: str) -> Optional[Tuple[str, int, int]]:
+    """
+    提取文本中的第一个金额（统一换算为元）
+
+    Returns:
+        (规范化值 如"200,000元", 起始位置, 结束位置)，未找到时返回 None
+    """
+    for match in _AMOUNT.finditer(text):
+        number = _to_number(match.group(1))
+        if not number:
+            continue
+        if match.group(2).startswith('万'):
+            number *= 10000
+        value = f"{number:,.2f}".rstrip('0').rstrip('.') + '元'
+        return value, match.start(), match.end()
+    return None
+
+
+def parse_duration(text: str) -> Optional[Tuple[str, int, int]]:
+    """
+    提取文本中的第一个期限
+
+    Returns:
+        (规范化值 如"180日历天"/"6个月", 起始位置, 结束位置)，未找到时返回 None
+    """
+    # 日期中的"年/月/日"不是期限
+    text = _DATETIME.sub(lambda match: ' ' * len(match.group(0)), text)
+    for match in _DURATION.finditer(text):
+        number = _to_number(match.group(1))
+        if not number:
+            continue
+        unit = match.group(2).lstrip('个')
+        if unit == '年' and number > 10:
+            continue
+        unit = {'日历日': '日历天', '日': '天', '月': '个月', '个月': '个月'}.get(unit, unit)
+        return f"{number:g}{unit}", match.start(), match.end()
+    return None
+
+
+def parse_code(text: str) -> Optional[Tuple[str, int, int]]:
+    """
+    提取关键词后紧跟的编号（须包含数字）
+
+    Returns:
+        (编号, 起始位置, 结束位置)，未找到时返回 None
+    """
+    match = _CODE.match(text)
+    if not match:
+        return None
+    code = match.group(1)
+    # 截掉未配对的括号（如"XX-001（一标段）"中的标段说明）
+    for left, right in (('（', '）'), ('(', ')'), ('【', '】'), ('[', ']')):
+        if code.count(left) > code.count(right):
+            code = code[:code.rfind(left)]
+        elif code.endswith(right) and code.count(right) > code.count(left):
+            code = code[:-1]
+    # 末尾不含数字的括号说明（如"（一标段）"）不属于编号
+    code = re.sub(r'[（(][^（）()\d]*[）)]$', '', code)
+    if len(code) < 4 or not re.search(r'\d', code):
+        return None
+    return code, match.start(1), match.start(1) + len(code)
+
+
+# (键, 名称, 关键词规则, 值解析函数)；值在关键词后 window 个字符内查找
+FACT_RULES: List[Tuple[str, str, re.Pattern, Callable[[str], Optional[Tuple[str, int, int]]]]] = [
+    ('bid_deadline', '投标截止时间', re.compile(
+        r'投标(?:文件)?(?:递交|提交)?的?截止(?:时间|日期)|递交投标文件的?截止(?:时间|日期)'
+    ), parse_datetime),
+    ('bid_opening', '开标时间', re.compile(r'开标(?:时间|日期)'), parse_datetime),
+    ('bid_bond', '投标保证金', re.compile(r'投标保证金'), parse_amount),
+    ('project_code', '项目编号', re.compile(r'项目编号|招标编号|标段编号|项目代码'), parse_code),
+    ('duration', '工期', re.compile(r'工期(?!目标|间|内)'), parse_duration),
+]
+QUALIFICATION_LABEL = '资质等级'
+
+
+class FactExtractor:
+    """招标文件关键信息本地提取"""
+
+    def __init__(self, window: int = 80):
+        """
+        Args:
+            window: 关键词后查找值的字符范围
+        """
+        self.window = window
+
+    @classmethod
+    def from_env(cls) -> Optional['FactExtractor']:
+        """根据环境变量创建，TENDER_FACTS_ENABLED=false 时返回 None"""
+        if os.getenv('TENDER_FACTS_ENABLED', 'true').lower() in ('false', '0', 'no'):
+            return None
+        return cls(window=int(os.getenv('TENDER_FACTS_WINDOW', '80')))
+
+    @staticmethod
+    def _evidence(text: str, start: int, end: int) -> str:
+        """关键词到值的原文片段（单行显示）"""
+        return re.sub(r'\s+', ' ', text[start:end]).strip()
+
+    def _candidates(self, source: str, text: str) -> Dict[str, List[Dict]]:
+        """单个文件中各信息的所有候选值"""
+        candidates: Dict[str, List[Dict]] = {}
+        for key, _, anchor, parse in FACT_RULES:
+            for match in anchor.finditer(text):
+                window = text[match.end():match.end() + self.window]
+                parsed = parse(window)
+                if not parsed:
+                    continue
+                value, start, end = parsed
+                candidates.setdefault(key, []).append({
+                    'value': value,
+                    'source': source,
+                    'offset': match.start(),
+                    'evidence': self._evidence(text, match.start(), match.end() + end),
+                })
+
+        for match in _QUALIFICATION.finditer(text):
+            field = _QUALIFICATION_FIELD.search(text, max(0, match.start() - 16), match.start())
+            if not field:
+                continue
+            name = _QUALIFICATION_LEAD.sub('', field.group(0))
+            if len(name) < 2:
+                continue
+            start = match.start() - len(name)
+            candidates.setdefault('qualification', []).append({
+                'value': f"{name}{match.group(1)}{match.group(2)}{match.group(3) or ''}",
+                'source': source,
+                'offset': start,
+                'evidence': self._evidence(text, start, match.end()),
+            })
+        return candidates
+
+    def extract(self, document_contents: Dict[str, str]) -> Dict[str, Dict]:
+        """
+        提取关键信息
+
+        Args:
+            document_contents: {文件类别: 文本内容}
+
+        Returns:
+            {键: {'label', 'value', 'source', 'offset', 'evidence', 'alternatives': [其他值]}}（按 FACT_RULES 顺序，只包含找到的信息）；
+            资质等级可能有多项，value 为全部资质（按出现顺序、以"；"分隔）
+        """
+        candidates: Dict[str, List[Dict]] = {}
+        for source, text in document_contents.items():
+            if text and text.strip():
+                for key, found in self._candidates(source, text).items():
+                    candidates.setdefault(key, []).extend(found)
+
+        facts = {}
+        for key, label, _, _ in FACT_RULES:
+            found = candidates.get(key)
+            if not found:
+                continue
+            counts: Dict[str, int] = {}
+            for candidate in found:
+                counts[candidate['value']] = counts.get(candidate['value'], 0) + 1
+            # 出现次数最多的值（次数相同时取最先出现的）
+            best = max(counts, key=lambda value: counts[value])
+            first = next(candidate for candidate in found if candidate['value'] == best)
+            facts[key] = dict(first, label=label, alternatives=[value for value in counts if value != best])
+
+        qualifications = candidates.get('qualification')
+        if qualifications:
+            values = list(dict.fromkeys(candidate['value'] for candidate in qualifications))
+            facts['qualification'] = dict(
+                qualifications[0], label=QUALIFICATION_LABEL, value='；'.join(values), alternatives=[]
+            )
+        return facts
+
+
+def render_fact_sheet(facts: Dict[str, Dict], with_evidence: bool = False) -> str:
+    """
+    格式化关键信息表
+
+    Args:
+        facts: FactExtractor.extract 的结果
+        with_evidence: 是否附上原文依据
+
+    Returns:
+        每项一行的文本，没有任何信息时返回空字符串
+    """
+    lines = []
+    for fact in facts.values():
+        line = f"- {fact['label']}：{fact['value']}"
+        if fact['alternatives']:
+            line += f"（另见：{'、'.join(fact['alternatives'])}）"
+        if with_evidence:
+            line += f"\n  原文：{fact['evidence']}（{fact['source']}）"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,208 @@
+"""
+LLM 响应缓存模块
+相同请求（provider、模型、提示词、温度、max_tokens 均相同）直接返回本地缓存结果
+- SQLite持久化，进程重启后仍然有效
+- 支持过期时间（TTL）
+- 超出容量时按最近访问时间淘汰（LRU）
+"""
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+Base = declarative_base()
+
+
+class CacheEntry(Base):
+    """缓存条目表"""
+    __tablename__ = 'llm_cache'
+
+    key = Column(String(64), primary_key=True)  # 请求哈希
+    provider = Column(String(50))  # openai / claude
+    model = Column(String(200))  # 模型名称
+    response = Column(Text)  # 模型输出
+    create_time = Column(DateTime, default=datetime.now)
+    last_access = Column(DateTime, default=datetime.now, index=True)  # LRU淘汰依据
+    hit_count = Column(Integer, default=0)
+
+
+class LLMCache:
+    """LLM 响应缓存（SQLite + TTL + LRU）"""
+
+    def __init__(
+        self,
+        db_path: str = 'data/llm_cache.db',
+        ttl_hours: float = 168,
+        max_entries: int = 500
+    ):
+        """
+        Args:
+            db_path: 缓存数据库路径
+            ttl_hours: 缓存有效期（小时），<=0 表示永不过期
+            max_entries: 最多保留的条目数，超出时淘汰最久未访问的条目
+        """
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+
+        self.ttl = timedelta(hours=ttl_hours) if ttl_hours > 0 else None
+        self.max_entries = max_entries
+
+        # 命中统计（进程内）
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['LLMCache']:
+        """根据环境变量创建缓存，LLM_CACHE_ENABLED=false 时返回 None"""
+        if os.getenv('LLM_CACHE_ENABLED', 'true').lower() in ('false', '0', 'no'):
+            return None
+        return cls(
+            db_path=os.getenv('LLM_CACHE_PATH', 'data/llm_cache.db'),
+            ttl_hours=float(os.getenv('LLM_CACHE_TTL_HOURS', '168')),
+            max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '500'))
+        )
+
+    @staticmethod
+    def make_key(
+        provider: str,
+        model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        prefix: Optional[str] = None,
+        json_mode: bool = False
+    ) -> str:
+        """计算请求哈希（SHA256），prefix 为缓存前缀（可选），json_mode 仅在开启时参与计算（兼容旧键）"""
+        fields = [provider, model, prefix or '', prompt, temperature, max_tokens]
+        if json_mode:
+            fields.append('json')
+        payload = json.dumps(fields, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存
+
+        Args:
+            key: 请求哈希
+
+        Returns:
+            缓存的模型输出，未命中或已过期返回 None
+        """
+        with self._lock:
+            session = self.Session()
+            try:
+                entry = session.query(CacheEntry).filter_by(key=key).first()
+
+                if entry and self.ttl and datetime.now() - entry.create_time > self.ttl:
+                    # 已过期，删除
+                    session.delete(entry)
+                    session.commit()
+                    entry = None
+
+                if not entry:
+                    self.misses += 1
+                    return None
+
+                entry.last_access = datetime.now()
+                entry.hit_count = (entry.hit_count or 0) + 1
+                session.commit()
+                self.hits += 1
+                return entry.response
+            finally:
+                session.close()
+
+    def set(self, key: str, response: str, provider: str = '', model: str = ''):
+        """
+        写入缓存（超出容量时按LRU淘汰）
+
+        Args:
+            key: 请求哈希
+            response: 模型输出
+            provider: provider名称
+            model: 模型名称
+        """
+        if not response:
+            return
+
+        with self._lock:
+            session = self.Session()
+            try:
+                now = datetime.now()
+                entry = session.query(CacheEntry).filter_by(key=key).first()
+                if entry:
+                    entry.response = response
+                    entry.create_time = now
+                    entry.last_access = now
+                else:
+                    session.add(CacheEntry(
+                        key=key,
+                        provider=provider,
+                        model=model,
+                        response=response,
+                        create_time=now,
+                        last_access=now
+                    ))
+                session.commit()
+                self._evict(session)
+            finally:
+                session.close()
+
+    def _evict(self, session):
+        """淘汰过期条目和超出容量的最久未访问条目"""
+        if self.ttl:
+            expire_before = datetime.now() - self.ttl
+            session.query(CacheEntry)\
+                .filter(CacheEntry.create_time < expire_before)\
+                .delete(synchronize_session=False)
+
+        total = session.query(CacheEntry).count()
+        overflow = total - self.max_entries
+        if overflow > 0:
+            stale_keys = [
+                row.key for row in session.query(CacheEntry.key)
+                .order_by(CacheEntry.last_access.asc())
+                .limit(overflow)
+                .all()
+            ]
+            session.query(CacheEntry)\
+                .filter(CacheEntry.key.in_(stale_keys))\
+                .delete(synchronize_session=False)
+
+        session.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            session = self.Session()
+            try:
+                session.query(CacheEntry).delete()
+                session.commit()
+            finally:
+                session.close()
+
+    def get_statistics(self) -> Dict:
+        """获取缓存统计信息"""
+        session = self.Session()
+        try:
+            entries = session.query(CacheEntry).count()
+        finally:
+            session.close()
+
+        total = self.hits + self.misses
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
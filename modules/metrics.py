@@ -0,0 +1,317 @@
+"""
+LLM 调用指标模块
+记录每次模型调用的 token 用量、首token延迟、总耗时、停止原因、模型、任务和项目记录
+- SQLite持久化（data/metrics.db）
+- 按任务 / 项目记录汇总 p50/p95 延迟和 token 用量
+- 估算调用成本，支持导出CSV
+"""
+
+import os
+import io
+import csv
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, List
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, Boolean
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+Base = declarative_base()
+
+# 当前调用所属的项目记录ID（线程池中需通过 contextvars.copy_context() 传递）
+_current_record_id: contextvars.ContextVar = contextvars.ContextVar('current_record_id', default=None)
+
+# 模型价格（美元 / 百万token）：输入、输出、缓存读取、缓存写入
+# 按模型名包含的关键字匹配，越具体的关键字越靠前
+MODEL_PRICES = [
+    ('gpt-4o-mini', (0.15, 0.60, 0.075, 0.15)),
+    ('gpt-4o', (2.50, 10.00, 1.25, 2.50)),
+    ('claude-3-5-haiku', (0.80, 4.00, 0.08, 1.00)),
+    ('claude-haiku', (1.00, 5.00, 0.10, 1.25)),
+    ('claude-sonnet', (3.00, 15.00, 0.30, 3.75)),
+    ('claude-3-5-sonnet', (3.00, 15.00, 0.30, 3.75)),
+    ('claude-opus', (15.00, 75.00, 1.50, 18.75)),
+]
+
+
+def set_record_context(record_id: Optional[int]):
+    """设置当前上下文的项目记录ID，后续调用指标会关联到该记录"""
+    _current_record_id.set(record_id)
+
+
+def get_record_context() -> Optional[int]:
+    """获取当前上下文的项目记录ID"""
+    return _current_record_id.get()
+
+
+@contextmanager
+def record_context(record_id: Optional[int]):
+    """在 with 块内将调用指标关联到指定项目记录"""
+    token = _current_record_id.set(record_id)
+    try:
+        yield
+    finally:
+        _current_record_id.reset(token)
+
+
+def estimate_cost(model: Optional[str], usage: Dict) -> Optional[float]:
+    """
+    估算一次调用的成本
+
+    Args:
+        model: 模型名称（如 openai/gpt-4o、claude-sonnet-4-20250514）
+        usage: token用量（见 ai_provider.empty_usage）
+
+    Returns:
+        成本（美元），未知模型返回 None
+    """
+    name = (model or '').lower()
+    for keyword, (input_price, output_price, cache_read_price, cache_write_price) in MODEL_PRICES:
+        if keyword in name:
+            cache_read = usage.get('cache_read_tokens', 0)
+            cache_write = usage.get('cache_write_tokens', 0)
+            uncached = max(0, usage.get('prompt_tokens', 0) - cache_read - cache_write)
+            return (
+                uncached * input_price
+                + usage.get('completion_tokens', 0) * output_price
+                + cache_read * cache_read_price
+                + cache_write * cache_write_price
+            ) / 1_000_000
+    return None
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """第p百分位（最近秩法），空列表返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class CallMetric(Base):
+    """调用指标表"""
+    __tablename__ = 'llm_calls'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    create_time = Column(DateTime, default=datetime.now, index=True)
+    task = Column(String(50), index=True)  # analysis / criteria / outline / section ...
+    provider = Column(String(50))
+    model = Column(String(200))
+    record_id = Column(Integer, index=True)  # 关联的项目记录
+    stream = Column(Boolean, default=False)
+    cache_hit = Column(Boolean, default=False)  # 是否命中本地响应缓存
+    success = Column(Boolean, default=True)
+    error = Column(Text)
+    stop_reason = Column(String(50))
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cache_read_tokens = Column(Integer, default=0)
+    cache_write_tokens = Column(Integer, default=0)
+    ttft_ms = Column(Float)  # 首个token延迟（仅流式）
+    latency_ms = Column(Float)  # 总耗时
+    cost = Column(Float)  # 估算成本（美元）
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'create_time': self.create_time.strftime('%Y-%m-%d %H:%M:%S') if self.create_time else None,
+            'task': self.task,
+            'provider': self.provider,
+            'model': self.model,
+            'record_id': self.record_id,
+            'stream': self.stream,
+            'cache_hit': self.cache_hit,
+            'success': self.success,
+            'error': self.error,
+            'stop_reason': self.stop_reason,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cache_read_tokens': self.cache_read_tokens,
+            'cache_write_tokens': self.cache_write_tokens,
+            'ttft_ms': self.ttft_ms,
+            'latency_ms': self.latency_ms,
+            'cost': self.cost
+        }
+
+
+class MetricsStore:
+    """调用指标存储与汇总"""
+
+    def __init__(self, db_path: str = 'data/metrics.db'):
+        """
+        Args:
+            db_path: 指标数据库路径
+        """
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['MetricsStore']:
+        """根据环境变量创建，METRICS_ENABLED=false 时返回 None"""
+        if os.getenv('METRICS_ENABLED', 'true').lower() in ('false', '0', 'no'):
+            return None
+        return cls(db_path=os.getenv('METRICS_PATH', 'data/metrics.db'))
+
+    def record(
+        self,
+        task: str,
+        provider: str,
+        model: str,
+        usage: Optional[Dict] = None,
+        latency_ms: Optional[float] = None,
+        ttft_ms: Optional[float] = None,
+        stop_reason: Optional[str] = None,
+        stream: bool = False,
+        cache_hit: bool = False,
+        error: Optional[str] = None,
+        record_id: Optional[int] = None
+    ):
+        """
+        记录一次调用（写入失败只打印日志，不影响业务流程）
+
+        Args:
+            task: 任务类型
+            provider: provider名称
+            model: 模型名称
+            usage: token用量，缓存命中或失败时可为空
+            latency_ms: 总耗时（毫秒）
+            ttft_ms: 首个token延迟（毫秒）
+            stop_reason: 停止原因
+            stream: 是否流式调用
+            cache_hit: 是否命中本地响应缓存
+            error: 错误信息（为空表示成功）
+            record_id: 项目记录ID，默认取当前上下文
+        """
+        usage = usage or {}
+        if record_id is None:
+            record_id = get_record_context()
+
+        metric = CallMetric(
+            task=task,
+            provider=provider,
+            model=model,
+            record_id=record_id,
+            stream=stream,
+            cache_hit=cache_hit,
+            success=error is None,
+            error=error,
+            stop_reason=stop_reason,
+            prompt_tokens=usage.get('prompt_tokens', 0),
+            completion_tokens=usage.get('completion_tokens', 0),
+            cache_read_tokens=usage.get('cache_read_tokens', 0),
+            cache_write_tokens=usage.get('cache_write_tokens', 0),
+            ttft_ms=ttft_ms,
+            latency_ms=latency_ms,
+            cost=None if cache_hit else estimate_cost(model, usage)
+        )
+
+        with self._lock:
+            session = self.Session()
+            try:
+                session.add(metric)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                print(f"[Metrics] 写入调用指标失败: {e}")
+            finally:
+                session.close()
+
+    def get_calls(
+        self,
+        task: Optional[str] = None,
+        record_id: Optional[int] = None,
+        limit: int = 5000
+    ) -> List[Dict]:
+        """
+        查询调用明细（按时间倒序）
+
+        Args:
+            task: 只看指定任务
+            record_id: 只看指定项目记录
+            limit: 返回条数上限
+
+        Returns:
+            调用记录列表
+        """
+        session = self.Session()
+        try:
+            query = session.query(CallMetric)
+            if task:
+                query = query.filter_by(task=task)
+            if record_id is not None:
+                query = query.filter_by(record_id=record_id)
+            rows = query.order_by(CallMetric.create_time.desc()).limit(limit).all()
+            return [row.to_dict() for row in rows]
+        finally:
+            session.close()
+
+    @staticmethod
+    def summarize(calls: List[Dict], group_by: str = 'task') -> List[Dict]:
+        """
+        按字段分组汇总
+
+        Args:
+            calls: get_calls 返回的调用记录
+            group_by: 分组字段（task / record_id / model）
+
+        Returns:
+            每组的调用数、缓存命中数、失败数、p50/p95 延迟、p50 首token延迟、token合计和成本
+        """
+        groups: Dict = {}
+        for call in calls:
+            groups.setdefault(call.get(group_by), []).append(call)
+
+        summary = []
+        for key, items in groups.items():
+            # 延迟分位数只统计真实的模型调用（排除缓存命中和失败）
+            live = [c for c in items if c['success'] and not c['cache_hit']]
+            latencies = [c['latency_ms'] for c in live if c['latency_ms'] is not None]
+            ttfts = [c['ttft_ms'] for c in live if c['ttft_ms'] is not None]
+            costs = [c['cost'] for c in live if c['cost'] is not None]
+            summary.append({
+                group_by: key,
+                'calls': len(items),
+                'cache_hits': sum(1 for c in items if c['cache_hit']),
+                'errors': sum(1 for c in items if not c['success']),
+                'latency_p50_ms': percentile(latencies, 50),
+                'latency_p95_ms': percentile(latencies, 95),
+                'ttft_p50_ms': percentile(ttfts, 50),
+                'ttft_p95_ms': percentile(ttfts, 95),
+                'prompt_tokens': sum(c['prompt_tokens'] or 0 for c in items),
+                'completion_tokens': sum(c['completion_tokens'] or 0 for c in items),
+                'cache_read_tokens': sum(c['cache_read_tokens'] or 0 for c in items),
+                'truncated': sum(1 for c in items if c['stop_reason'] in ('length', 'max_tokens')),
+                'cost': sum(costs) if costs else None
+            })
+        summary.sort(key=lambda row: row['calls'], reverse=True)
+        return summary
+
+    @staticmethod
+    def to_csv(rows: List[Dict]) -> str:
+        """将调用记录或汇总结果导出为CSV文本"""
+        if not rows:
+            return ''
+        # 各行字段可能不同（如按项目汇总的行多出 record_id/project_name），表头取所有字段的并集
+        fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=fieldnames, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+
+    def clear(self):
+        """清空调用指标"""
+        with self._lock:
+            session = self.Session()
+            try:
+                session.query(CallMetric).delete()
+                session.commit()
+            finally:
+                session.close()
@@ -0,0 +1,383 @@
+"""
+本地模拟 Provider（AI_PROVIDER=mock）
+不访问网络，按提示词类型返回结构与真实输出一致的内容，用于离线测试、压测和基准测试
+- 解析报告：按解析提示词中的 ##/### 标题逐项填充
+- 评审标准、技术标目录（JSON）、技术标章节（按建议字数）、合并生成的章节（带分隔标记）
+- 分块摘录、分层摘要（片段/章/全文）、补遗增量解析（输出受影响的报告章节 + 变更说明）
+- 标书问答（引用检索到的原文片段）、对话历史压缩
+- 可配置延迟模型：首token延迟、每秒token数、随机抖动
+- 可按比例注入错误（429），用于验证重试、熔断和故障转移
+- 输出只由提示词决定（相同请求输出相同），便于结果对比
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from typing import Optional, Iterator, Dict, Callable, List
+from .ai_provider import AIProvider, empty_usage
+from .text_processor import TextProcessor
+
+# 章节正文使用的句子素材（按提示词哈希确定性地组合）
+SENTENCES = [
+    "本项目严格按照招标文件及相关规范要求组织实施，确保各项技术指标满足设计要求。",
+    "我方将组建经验丰富的项目管理团队，实行项目经理负责制，明确各岗位职责。",
+    "施工前编制专项施工方案并组织专家论证，经监理单位审批后方可实施。",
+    "建立健全质量保证体系，落实三检制度，关键工序实行旁站监督。",
+    "针对本工程重点难点，制定专项技术措施和应急预案，确保施工安全可控。",
+    "合理安排施工顺序，采用流水作业方式，保证关键线路工期目标实现。",
+    "现场设置封闭围挡和扬尘监测设备，落实绿色施工和文明施工各项要求。",
+    "主要材料进场前进行见证取样复检，不合格材料严禁用于工程实体。",
+    "采用BIM技术进行施工模拟和碰撞检查，提前发现并解决设计冲突问题。",
+    "定期召开工程例会，及时协调解决施工中出现的问题，确保信息传递畅通。",
+    "劳动力按施工阶段动态调配，高峰期投入各工种人员满足进度需要。",
+    "机械设备进场前完成检查验收，建立设备台账并落实日常维护保养。",
+]
+
+
+class MockAPIError(Exception):
+    """模拟的API错误（带 status_code，可被 provider_middleware 识别为可重试）"""
+
+    def __init__(self, message: str, status_code: int = 429):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = None
+
+
+class MockProvider(AIProvider):
+    """模拟 Provider"""
+
+    name = 'mock'
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        ttft_ms: float = 500,
+        tokens_per_sec: float = 100,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        seed: int = 42
+    ):
+        """
+        Args:
+            model: 模型名称（仅用于标识）
+            ttft_ms: 首个token延迟（毫秒）
+            tokens_per_sec: 输出速度（token/秒），<=0 表示不模拟输出耗时
+            jitter: 延迟随机抖动比例（0.2 表示 ±20%）
+            error_rate: 错误注入比例（0~1），注入的错误为 429
+            seed: 随机种子（抖动和错误注入可复现）
+        """
+        self.model = model or 'mock-model'
+        self.ttft_ms = ttft_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+        # 模拟前缀缓存：同一前缀第二次出现时计为缓存读取
+        self._seen_prefixes = set()
+        self._prefix_lock = threading.Lock()
+
+        print(f"[AI Provider] 使用模拟Provider - 首token {ttft_ms:.0f}ms，{tokens_per_sec:.0f} tokens/s，"
+              f"错误率 {error_rate:.0%}")
+
+    @classmethod
+    def from_env(cls, model: Optional[str] = None) -> 'MockProvider':
+        """根据环境变量创建（MOCK_TTFT_MS、MOCK_TOKENS_PER_SEC、MOCK_JITTER、MOCK_ERROR_RATE、MOCK_SEED）"""
+        return cls(
+            model=model or os.getenv('MOCK_MODEL', 'mock-model'),
+            ttft_ms=float(os.getenv('MOCK_TTFT_MS', '500')),
+            tokens_per_sec=float(os.getenv('MOCK_TOKENS_PER_SEC', '100')),
+            jitter=float(os.getenv('MOCK_JITTER', '0.2')),
+            error_rate=float(os.getenv('MOCK_ERROR_RATE', '0')),
+            seed=int(os.getenv('MOCK_SEED', '42'))
+        )
+
+    # ---------- 延迟与错误模型 ----------
+
+    def _random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    def _scaled(self, seconds: float) -> float:
+        """加入随机抖动"""
+        if self.jitter <= 0:
+            return seconds
+        return max(0.0, seconds * (1 + self.jitter * (2 * self._random() - 1)))
+
+    def _maybe_fail(self):
+        if self.error_rate > 0 and self._random() < self.error_rate:
+            raise MockAPIError("模拟错误: rate limit exceeded", status_code=429)
+
+    def _output_seconds(self, tokens: int) -> float:
+        if self.tokens_per_sec <= 0:
+            return 0.0
+        return self._scaled(tokens / self.tokens_per_sec)
+
+    # ---------- 输出内容 ----------
+
+    def _render(self, prompt: str, prefix: Optional[str], json_mode: bool = False) -> str:
+        """按提示词类型生成模拟输出"""
+        if '=== 续写要求 ===' in prompt:
+            return self._render_continuation(prompt, prefix)
+
+        full_prompt = (prefix or '') + prompt
+        rng = random.Random(hashlib.sha256(full_prompt.encode('utf-8')).hexdigest())
+
+        # 问答类提示词中含有用户输入，先于其他类型判断
+        if '=== 需要合并进摘要的对话 ===' in prompt:
+            return self._render_chat_summary(prompt)
+        if '=== 当前问题 ===' in prompt:
+            return self._render_chat_answer(prompt)
+        if '=== 招标文件变更内容 ===' in prompt:
+            return self._render_amendment(prompt, prefix or '', rng)
+        if '=== 摘录要求 ===' in prompt:
+            return self._render_map(rng)
+        if '=== 摘要要求 ===' in prompt:
+            return self._render_summary(prefix or '', rng)
+        if '=== 解析要求 ===' in prompt:
+            return self._render_analysis(prompt, rng)
+        if '=== 提取要求 ===' in prompt:
+            return self._render_criteria(rng)
+        if '目录生成要求' in prompt:
+            return self._render_outline(rng, json_mode)
+        if '当前章节信息' in prompt:
+            return self._render_section(prompt, rng)
+        if '=== 章节列表 ===' in prompt:
+            return self._render_packed_sections(prompt, rng)
+        return f"模拟回复：{prompt.strip()[:100]}"
+
+    def _render_continuation(self, prompt: str, prefix: Optional[str]) -> str:
+        """续写请求：按原指令重新生成完整输出，返回已输出部分之后的内容（并模拟重复中断处的最后几个字）"""
+        original, _, rest = prompt.partition('\n\n=== 已输出内容（因长度限制中断） ===\n')
+        partial = rest.rsplit('\n\n=== 续写要求 ===', 1)[0]
+        full = self._render(original, prefix, json_mode=partial.startswith('{'))
+        if not full.startswith(partial):
+            return full
+        return full[max(0, len(partial) - 10):]
+
+    @staticmethod
+    def _paragraph(rng: random.Random, sentences: int) -> str:
+        return "".join(rng.choice(SENTENCES) for _ in range(sentences))
+
+    def _render_analysis(self, prompt: str, rng: random.Random) -> str:
+        """按解析要求中的 ##/### 标题输出结构化报告"""
+        lines = ["# 招标文件解析报告", ""]
+        for line in prompt.splitlines():
+            stripped = line.strip()
+            if stripped.startswith('### '):
+                lines.append(stripped)
+                lines.append(f"- **内容**：{self._paragraph(rng, 1)}")
+                lines.append(f"- **来源**：招标文件第{rng.randint(1, 8)}章第{rng.randint(1, 20)}条")
+                lines.append("")
+            elif stripped.startswith('## '):
+                lines.append(stripped)
+                lines.append("")
+        return "\n".join(lines)
+
+    def _render_map(self, rng: random.Random) -> str:
+        """分块摘录：按原文顺序的要点列表"""
+        return "\n".join(
+            f"- {self._paragraph(rng, 1)}（第{rng.randint(1, 8)}章{rng.randint(1, 20)}节）"
+            for _ in range(rng.randint(3, 6))
+        )
+
+    def _render_summary(self, prefix: str, rng: random.Random) -> str:
+        """分层摘要：片段 / 章 / 全文概要（按前缀中的层级说明区分）"""
+        if '各章的摘要' in prefix:
+            return "\n".join(
+                ["本文件包含投标须知、评标办法、合同条款和技术要求等章节。"]
+                + [f"- {self._paragraph(rng, 2)}" for _ in range(4)]
+            )
+        count = 3 if '各片段的摘要' in prefix else 2
+        return "\n".join(f"- {self._paragraph(rng, 1)}" for _ in range(count))
+
+    def _render_amendment(self, prompt: str, report: str, rng: random.Random) -> str:
+        """补遗增量解析：输出受变更影响的报告章节（原文 + 变更内容）和变更说明"""
+        changes = prompt.split('=== 招标文件变更内容 ===', 1)[1].split('=== 更新要求 ===', 1)[0]
+        removed = [line[2:].strip() for line in changes.splitlines() if line.startswith('- ')]
+        added = [line[2:].strip() for line in changes.splitlines() if line.startswith('+ ')]
+
+        # 原报告按 "## " 切分，优先选择包含被删除原文的章节
+        sections = re.split(r'\n(?=## )', '\n' + report)
+        sections = [section.strip() for section in sections if section.strip().startswith('## ')]
+        parts = []
+        if sections:
+            target = next(
+                (section for section in sections if any(text and text in section for text in removed)),
+                rng.choice(sections)
+            )
+            # 删除的原文依次替换为新增的原文，多出的新增内容附在章节末尾
+            for index, text in enumerate(removed):
+                target = target.replace(text, added[index] if index < len(added) else '（已删除）')
+            parts.append(target.rstrip())
+            parts.extend(f"- **变更**：{text}" for text in added[len(removed):])
+            parts.append("")
+        parts.append("## 变更说明")
+        parts.extend(f"- 新增/修改：{text}" for text in added)
+        parts.extend(f"- 删除：{text}" for text in removed)
+        if not added and not removed:
+            parts.append("- 无实质性变更")
+        return "\n".join(parts)
+
+    @staticmethod
+    def _render_chat_answer(prompt: str) -> str:
+        """标书问答：引用检索到的第一个原文片段回答"""
+        references = prompt.split('=== 招标文件相关原文 ===', 1)[-1].split('=== 当前问题 ===', 1)[0].strip()
+        question = prompt.rsplit('=== 当前问题 ===', 1)[1].strip()
+        lines = [line.strip() for line in references.splitlines() if line.strip()]
+        if not lines or lines[0].startswith('（未检索到'):
+            return f"关于「{question}」，招标文件中未找到相关规定。"
+        source = lines[0] if lines[0].startswith('【') else ''
+        # 与问题重合字数最多的原文行
+        excerpt = max(
+            (line for line in lines if not line.startswith('【')),
+            key=lambda line: sum(char in line for char in set(question)),
+            default=''
+        )
+        return f"关于「{question}」，根据招标文件{source}：\n\n> {excerpt[:200]}"
+
+    @staticmethod
+    def _render_chat_summary(prompt: str) -> str:
+        """对话历史压缩：列出已有摘要和对话中用户问过的问题"""
+        existing = prompt.split('=== 已有摘要 ===', 1)[1].split('=== 需要合并进摘要的对话 ===', 1)[0].strip()
+        lines = [line for line in existing.splitlines() if line.startswith('- ')]
+        lines += [f"- 用户问过：{line[3:].strip()[:60]}" for line in prompt.splitlines() if line.startswith('用户：')]
+        return "\n".join(lines) or "- （无）"
+
+    def _render_criteria(self, rng: random.Random) -> str:
+        factors = ["项目经理视频陈述及答辩", "施工组织设计", "质量保证措施", "安全文明施工措施"]
+        lines = [
+            "### 【招标文件项目需求】",
+            self._paragraph(rng, 3),
+            "",
+            "### 【评审标准】",
+            "",
+            "#### 技术评分",
+            f"- **总分**：{rng.choice([40, 50, 60])}分",
+        ]
+        for i, factor in enumerate(factors, 1):
+            lines.append(f"- **评审因素{i}**：{factor}")
+            lines.append(f"  - 评分：{rng.randint(5, 20)}分")
+            lines.append(f"  - 要求：{self._paragraph(rng, 1)}")
+        lines += ["", "#### 备注", self._paragraph(rng, 1)]
+        return "\n".join(lines)
+
+    def _render_outline(self, rng: random.Random, json_mode: bool = False) -> str:
+        chapters = [
+            ("一、技术文件", ["评分点", "项目总体认识与建设意义", "施工组织总体设想与管理目标"]),
+            ("二、项目经理视频陈述及答辩", ["项目经理基本情况与业绩介绍", "对本项目的理解与实施构想"]),
+            ("三、施工组织设计", ["工程概况", "主要施工方法", "确保工程质量的技术组织措施", "重点、难点"]),
+        ]
+        outline = []
+        for chapter_title, children in chapters:
+            outline.append({
+                "level": 1,
+                "title": chapter_title,
+                "children": [
+                    {
+                        "level": 2,
+                        "title": f"{i}. {child}",
+                        "word_count": rng.choice([300, 500, 800, 1000]),
+                        "description": f"阐述{child}相关内容"
+                    }
+                    for i, child in enumerate(children, 1)
+                ]
+            })
+        text = json.dumps({"outline": outline}, ensure_ascii=False, indent=2)
+        return text if json_mode else "```json\n" + text + "\n```"
+
+    def _render_section(self, prompt: str, rng: random.Random) -> str:
+        """按章节标题和建议字数输出正文"""
+        title_match = re.search(r'\*\*章节标题\*\*：(.+)', prompt)
+        count_match = re.search(r'\*\*建议字数\*\*：(\d+)', prompt)
+        title = title_match.group(1).strip() if title_match else "章节"
+        word_count = int(count_match.group(1)) if count_match else 800
+        return self._section_body(title, word_count, rng)
+
+    def _render_packed_sections(self, prompt: str, rng: random.Random) -> str:
+        """合并生成：按章节列表依次输出带分隔标记的章节"""
+        parts = []
+        for index, title, word_count in re.findall(r'^(\d+)\. \*\*(.+?)\*\*（建议(\d+)字）', prompt, re.MULTILINE):
+            parts.append(f"@@@SECTION {index}@@@")
+            parts.append(self._section_body(title, int(word_count), rng))
+        return "\n".join(parts)
+
+    def _section_body(self, title: str, word_count: int, rng: random.Random) -> str:
+        parts: List[str] = [f"# {title}", ""]
+        length = 0
+        subsection = 1
+        while length < word_count:
+            parts.append(f"## {subsection}. 实施要点")
+            paragraph = self._paragraph(rng, 4)
+            parts.append(paragraph)
+            parts.append("")
+            length += len(paragraph)
+            subsection += 1
+        return "\n".join(parts)
+
+    # ---------- Provider 接口 ----------
+
+    def _usage(self, prompt: str, prefix: Optional[str], text: str) -> Dict:
+        usage = empty_usage()
+        prefix_tokens = TextProcessor.estimate_tokens(prefix or '')
+        usage['prompt_tokens'] = prefix_tokens + TextProcessor.estimate_tokens(prompt)
+        usage['completion_tokens'] = TextProcessor.estimate_tokens(text)
+        if prefix:
+            key = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+            with self._prefix_lock:
+                if key in self._seen_prefixes:
+                    usage['cache_read_tokens'] = prefix_tokens
+                else:
+                    usage['cache_write_tokens'] = prefix_tokens
+                    self._seen_prefixes.add(key)
+        return usage
+
+    def _truncate(self, text: str, max_tokens: int):
+        """超过 max_tokens 时截断，返回 (文本, 停止原因)"""
+        tokens = TextProcessor.estimate_tokens(text)
+        if tokens <= max_tokens:
+            return text, 'stop'
+        return text[:int(len(text) * max_tokens / tokens)], 'length'
+
+    def complete(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        json_mode: bool = False
+    ) -> Dict:
+        time.sleep(self._scaled(self.ttft_ms / 1000))
+        self._maybe_fail()
+
+        text, stop_reason = self._truncate(self._render(prompt, prefix, json_mode), max_tokens)
+        usage = self._usage(prompt, prefix, text)
+        time.sleep(self._output_seconds(usage['completion_tokens']))
+        return {'text': text, 'usage': usage, 'stop_reason': stop_reason, 'model': self.model}
+
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        on_finish: Optional[Callable[[Dict], None]] = None,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        time.sleep(self._scaled(self.ttft_ms / 1000))
+        self._maybe_fail()
+
+        text, stop_reason = self._truncate(self._render(prompt, prefix, json_mode), max_tokens)
+        chunk_size = 20
+        for start in range(0, len(text), chunk_size):
+            chunk = text[start:start + chunk_size]
+            yield chunk
+            time.sleep(self._output_seconds(TextProcessor.estimate_tokens(chunk)))
+
+        if on_finish:
+            on_finish({'usage': self._usage(prompt, prefix, text), 'stop_reason': stop_reason, 'model': self.model})
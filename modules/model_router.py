@@ -0,0 +1,127 @@
+"""
+任务级模型路由
+按任务类型（解析、评审标准提取、目录、章节、分块摘要等）选择 provider + 模型
+- 轻量任务（如评审标准提取只是对已有报告做整理）可以路由到更快更便宜的小模型
+- 每个任务可配置多个候选，按顺序故障转移
+- 未配置的任务使用默认 Provider
+
+配置方式（环境变量优先于配置文件）：
+    MODEL_ROUTE_CRITERIA=openai:openai/gpt-4o-mini,claude:claude-3-5-haiku-latest
+    MODEL_ROUTES_FILE=data/model_routes.json
+        {"criteria": ["openai:openai/gpt-4o-mini"], "section": ["claude:claude-sonnet-4-20250514"]}
+"""
+
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+from .ai_provider import AIProvider, create_provider
+
+# 任务类型及说明
+TASKS = {
+    'analysis': '招标文件结构化解析',
+    'criteria': '评审标准提取',
+    'outline': '技术标目录生成',
+    'section': '技术标章节生成',
+    'map': '分块摘要（map）',
+    'reduce': '摘要合并（reduce）',
+    'generation': '投标文件生成',
+    'chat': '标书问答',
+}
+
+
+def parse_route(spec: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    解析路由配置字符串
+
+    Args:
+        spec: 如 "openai:openai/gpt-4o-mini,claude"（provider后的模型名可省略）
+
+    Returns:
+        [(provider类型, 模型名或None), ...]
+    """
+    route = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        provider_type, _, model = item.partition(':')
+        route.append((provider_type.strip().lower(), model.strip() or None))
+    return route
+
+
+class ModelRouter:
+    """任务 → Provider 路由表"""
+
+    def __init__(
+        self,
+        default_provider: AIProvider,
+        routes: Optional[Dict[str, List[Tuple[str, Optional[str]]]]] = None
+    ):
+        """
+        Args:
+            default_provider: 未配置路由的任务使用的Provider
+            routes: {任务: [(provider类型, 模型), ...]}，多个候选按顺序故障转移
+        """
+        self.default_provider = default_provider
+        self.routes = routes or {}
+        self._providers: Dict[str, AIProvider] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_provider: AIProvider) -> 'ModelRouter':
+        """从 MODEL_ROUTES_FILE 和 MODEL_ROUTE_<任务> 环境变量读取路由表"""
+        routes = {}
+
+        routes_file = os.getenv('MODEL_ROUTES_FILE')
+        if routes_file and os.path.exists(routes_file):
+            with open(routes_file, 'r', encoding='utf-8') as f:
+                for task, candidates in json.load(f).items():
+                    if isinstance(candidates, str):
+                        candidates = [candidates]
+                    routes[task] = parse_route(','.join(candidates))
+
+        for task in TASKS:
+            spec = os.getenv(f'MODEL_ROUTE_{task.upper()}')
+            if spec:
+                routes[task] = parse_route(spec)
+
+        for task, route in routes.items():
+            candidates = ', '.join(f"{provider_type}:{model or '默认模型'}" for provider_type, model in route)
+            print(f"[Model Router] {task} → {candidates}")
+
+        return cls(default_provider, routes)
+
+    def provider_for(self, task: str) -> AIProvider:
+        """获取任务对应的Provider（按需创建并复用）"""
+        route = self.routes.get(task)
+        if not route:
+            return self.default_provider
+
+        with self._lock:
+            if task not in self._providers:
+                self._providers[task] = self._build(route)
+            return self._providers[task]
+
+    def _build(self, route: List[Tuple[str, Optional[str]]]) -> AIProvider:
+        """单个候选直接返回，多个候选组合为可故障转移的Provider"""
+        backends = [create_provider(provider_type, model) for provider_type, model in route]
+        if len(backends) == 1:
+            return backends[0]
+
+        from .composite_provider import CompositeProvider
+        return CompositeProvider.from_env(backends)
+
+    def describe(self) -> List[Dict]:
+        """当前路由表（用于界面展示）"""
+        result = []
+        for task, label in TASKS.items():
+            provider = self.provider_for(task)
+            result.append({
+                'task': task,
+                'label': label,
+                'provider': provider.name,
+                'model': provider.model,
+                'routed': task in self.routes
+            })
+        return result
@@ -0,0 +1,164 @@
+"""
+技术标目录的增量JSON解析
+在目录生成的流式输出过程中逐字符扫描JSON，每当一个带 word_count 的章节对象闭合时立即返回该章节，
+使章节生成可以在目录尚未输出完毕时就开始（目录生成与章节生成重叠执行）
+
+章节标题规则与 ai_service.extract_sections_from_outline 一致：上级标题 + 空格 + 本级标题；
+上级对象的 title 出现在 children 之后、或上级对象本身也是章节（带 word_count）时，
+其下章节暂存到该对象闭合后再按目录顺序（上级章节在前）返回
+"""
+
+import json
+from typing import List, Dict, Optional
+
+
+class IncrementalOutlineParser:
+    """流式目录JSON解析器"""
+
+    def __init__(self):
+        self.buffer = ''
+        self._pos = 0  # 已扫描到的位置
+        self._stack: List[Dict] = []  # 未闭合的对象/数组 {'type', 'start', 'key', 'title', 'expect_key', 'section', 'pending'}
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._root_start: Optional[int] = None
+        self._root_end: Optional[int] = None
+        self.sections: List[Dict] = []
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        输入一段流式输出
+
+        Args:
+            chunk: 新增文本
+
+        Returns:
+            本次新闭合的章节 [{'title', 'word_count', 'description'}]
+        """
+        self.buffer += chunk
+        found = []
+        text = self.buffer
+
+        while self._pos < len(text):
+            i = self._pos
+            ch = text[i]
+            self._pos += 1
+
+            # 根对象闭合后忽略后续内容（如代码块结束标记）
+            if self._root_end is not None:
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string(text[self._string_start:i + 1])
+                continue
+
+            # 根对象开始前的内容（如 ```json）直接跳过
+            if self._root_start is None:
+                if ch == '{':
+                    self._root_start = i
+                    self._push('object', i)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == '{':
+                self._push('object', i)
+            elif ch == '[':
+                self._push('array', i)
+            elif ch in '}]':
+                frame = self._stack.pop()
+                if frame['type'] == 'object':
+                    found.extend(self._on_object_closed(text[frame['start']:i + 1], frame))
+                if not self._stack:
+                    self._root_end = i + 1
+            elif ch == ',' and self._stack and self._stack[-1]['type'] == 'object':
+                self._stack[-1]['expect_key'] = True
+                self._stack[-1]['key'] = None
+
+        self.sections.extend(found)
+        return found
+
+    def _push(self, kind: str, start: int):
+        self._stack.append({
+            'type': kind, 'start': start, 'key': None, 'title': None, 'expect_key': kind == 'object',
+            'section': False, 'pending': []
+        })
+
+    def _on_string(self, literal: str):
+        """字符串闭合：对象中作为键或 title 的值记录下来（用于拼接上级标题）"""
+        if not self._stack or self._stack[-1]['type'] != 'object':
+            return
+        frame = self._stack[-1]
+        try:
+            value = json.loads(literal)
+        except ValueError:
+            return
+        if frame['expect_key']:
+            frame['key'] = value
+            frame['expect_key'] = False
+            if value == 'word_count':
+                frame['section'] = True
+        elif frame['key'] == 'title':
+            frame['title'] = value
+
+    def _on_object_closed(self, literal: str, frame: Dict) -> List[Dict]:
+        """
+        对象闭合：带 word_count 的对象即为可生成的章节
+
+        本对象的章节排在暂存的下级章节之前（与 extract_sections_from_outline 的顺序一致），
+        所有上级标题都已确定且上级都不是章节时返回，否则继续暂存到最内层需要等待的上级对象
+
+        Returns:
+            可以返回的章节（标题已完整）
+        """
+        try:
+            item = json.loads(literal)
+        except ValueError:
+            item = None
+        if not isinstance(item, dict):
+            return []
+
+        title = str(item.get('title', '') or '')
+        sections = [
+            dict(section, title=" ".join(part for part in (title, section['title']) if part))
+            for section in frame['pending']
+        ]
+        if 'word_count' in item:
+            sections.insert(0, {
+                'title': title,
+                'word_count': item['word_count'],
+                'description': item.get('description', '')
+            })
+        if not sections:
+            return []
+
+        # 根对象（{"outline": [...]}）不参与标题拼接
+        ancestors = [f for f in self._stack[1:] if f['type'] == 'object']
+        unresolved = next((index for index in range(len(ancestors) - 1, -1, -1)
+                           if ancestors[index]['title'] is None or ancestors[index]['section']), None)
+        if unresolved is None:
+            prefix = [f['title'] for f in ancestors if f['title']]
+            return [dict(section, title=" ".join(prefix + [section['title']]).strip()) for section in sections]
+
+        prefix = [f['title'] for f in ancestors[unresolved + 1:] if f['title']]
+        ancestors[unresolved]['pending'].extend(
+            dict(section, title=" ".join(prefix + [section['title']]).strip()) for section in sections
+        )
+        return []
+
+    def result(self) -> Optional[Dict]:
+        """根对象完整时返回解析后的目录，否则返回 None"""
+        if self._root_start is None or self._root_end is None:
+            return None
+        try:
+            return json.loads(self.buffer[self._root_start:self._root_end])
+        except ValueError:
+            return None
@@ -0,0 +1,109 @@
+"""
+输出预算与自动续写
+- 按任务计算输出预算：章节按建议字数换算token并留出余量，避免小章节也预留8000 tokens占用限流额度
+- 识别因达到 max_tokens 而截断的输出（OpenAI: length / Claude: max_tokens）
+- 续写拼接：去除续写开头与已输出结尾重复的部分，使截断处无缝衔接
+"""
+
+import os
+import math
+from typing import Optional
+from .text_processor import TextProcessor
+
+# 表示输出因达到 max_tokens 被截断的停止原因
+TRUNCATED_STOP_REASONS = ('length', 'max_tokens')
+
+
+def is_truncated(stop_reason: Optional[str]) -> bool:
+    """输出是否因达到 max_tokens 被截断"""
+    return stop_reason in TRUNCATED_STOP_REASONS
+
+
+def section_output_tokens(word_count, maximum: int = 8000, model: Optional[str] = None) -> int:
+    """
+    按章节建议字数计算输出预算
+
+    预算 = 字数 × 每字token数 × 余量 + 标题/格式开销，限制在 [SECTION_MIN_OUTPUT_TOKENS, maximum]
+    余量覆盖提示词中允许的 ±20% 字数浮动以及Markdown格式符号
+
+    Args:
+        word_count: 建议字数（非数字时按1000字计算）
+        maximum: 预算上限
+        model: 生成章节的模型（已校准时按该模型的系数换算）
+
+    Returns:
+        max_tokens
+    """
+    try:
+        words = int(word_count)
+    except (TypeError, ValueError):
+        words = 1000
+
+    margin = float(os.getenv('SECTION_OUTPUT_MARGIN', '1.5'))
+    minimum = int(os.getenv('SECTION_MIN_OUTPUT_TOKENS', '1024'))
+    # 按中文正文估算每字token数（与 TextProcessor.estimate_tokens 一致）
+    per_char = TextProcessor.estimate_tokens('字' * 100, model) / 100
+    budget = int(words * per_char * margin) + 300
+    # 向上取整到256的倍数：校准系数小幅变化时预算（及响应缓存键）保持不变
+    budget = math.ceil(budget / 256) * 256
+    return max(minimum, min(maximum, budget))
+
+
+def continuation_delta(previous: str, continuation: str, max_overlap: int = 300, min_overlap: int = 8) -> str:
+    """
+    计算续写内容中需要追加的部分（去除与已输出结尾重复的开头）
+
+    模型续写时常会重复中断处的最后几个字或整行，按以下顺序处理：
+    1. 续写开头与已输出结尾的最长重叠（不少于 min_overlap 个字符）
+    2. 续写从中断的那一行行首重新开始（忽略首尾空白）
+
+    Args:
+        previous: 已输出内容
+        continuation: 续写内容
+        max_overlap: 检查重叠的最大长度
+        min_overlap: 认定为重复的最小重叠长度（避免误删正常的短重复）
+
+    Returns:
+        应追加到 previous 之后的文本
+    """
+    tail = previous[-max_overlap:]
+    for size in range(min(len(tail), len(continuation)), min_overlap - 1, -1):
+        if tail.endswith(continuation[:size]):
+            return continuation[size:]
+
+    partial_line = previous[previous.rfind('\n') + 1:].strip()
+    stripped = continuation.lstrip()
+    if len(partial_line) >= min_overlap and stripped.startswith(partial_line):
+        return stripped[len(partial_line):]
+    return continuation
+
+
+class ContinuationStitcher:
+    """流式续写拼接：缓冲续写开头，确认重叠部分后再输出"""
+
+    def __init__(self, previous: str, max_overlap: int = 300):
+        """
+        Args:
+            previous: 已输出内容
+            max_overlap: 检查重叠的最大长度（缓冲到该长度后开始输出）
+        """
+        self.previous = previous
+        self.max_overlap = max_overlap
+        self._buffer = ''
+        self._resolved = False
+
+    def feed(self, delta: str) -> str:
+        """输入续写片段，返回可以输出的文本（开头部分缓冲期间返回空字符串）"""
+        if self._resolved:
+            return delta
+        self._buffer += delta
+        if len(self._buffer) < self.max_overlap:
+            return ''
+        return self.flush()
+
+    def flush(self) -> str:
+        """续写结束（或缓冲已满）时输出去重后的缓冲内容"""
+        if self._resolved:
+            return ''
+        self._resolved = True
+        return continuation_delta(self.previous, self._buffer, self.max_overlap)
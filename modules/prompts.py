@@ -4,13 +4,21 @@
 定义招标文件解析和技术标生成的提示词模板
 """
 
-# 招标文件解析提示词模板
-BIDDING_DOCUMENT_ANALYSIS_PROMPT = """
+# 提示词均拆分为两部分：
+# - *_PREFIX：稳定的长上下文（招标文件、解析报告、评审标准），作为可缓存前缀发送
+# - *_SUFFIX：随任务变化的指令部分
+# 同一份文件的多次调用前缀完全一致，可命中 Anthropic cache_control / OpenAI 自动前缀缓存
+# 完整提示词 = PREFIX + SUFFIX（保留 *_PROMPT 常量以兼容旧代码）
+
+# 招标文件解析提示词模板（前缀：招标文件原文）
+BIDDING_DOCUMENT_ANALYSIS_PREFIX = """
 你是一位资深的招标文件解析专家。请仔细分析以下招标文件，并按照指定的结构化格式提取关键信息。
 
 === 招标文件内容 ===
 {document_content}
+"""
 
+BIDDING_DOCUMENT_ANALYSIS_SUFFIX = """
 === 解析要求 ===
 
 请严格按照以下7大类别进行信息提取，每个类别下包含多个子类别。对于每个具体要求，必须从文件中检索并找到准确答案。如果文件中没有相关信息，请标注"未提及"。
@@ -160,14 +168,125 @@ BIDDING_DOCUMENT_ANALYSIS_PROMPT = """
 4. 风险审查要具体说明风险所在，不仅仅是列举条款
 """
 
+BIDDING_DOCUMENT_ANALYSIS_PROMPT = BIDDING_DOCUMENT_ANALYSIS_PREFIX + BIDDING_DOCUMENT_ANALYSIS_SUFFIX
+
+
+# 超长招标文件分块摘录提示词（map阶段，摘录结果合并后再按上面的解析提示词汇总）
+BIDDING_DOCUMENT_MAP_PREFIX = """
+你是一位资深的招标文件解析专家。以下是一份较长招标文件的第{part}/{total}部分。
+
+=== 招标文件片段 ===
+{document_content}
+"""
+
+BIDDING_DOCUMENT_MAP_SUFFIX = """
+=== 摘录要求 ===
+
+请从以上片段中摘录后续结构化解析所需的全部信息，包括：
+基础信息（招标人、代理、项目名称/编号/规模/预算/地点/工期/质量要求）、资格要求、招投标时间节点与流程、
+投标文件要求、无效标与废标情形、评标办法与评分标准、合同主要条款、技术要求以及风险相关条款。
+
+1. 保留原文中的数值、日期、金额、比例、条款编号和标准编号，不要改写或换算
+2. 按原文顺序输出简洁的要点列表，并注明所在章节（如"第X章X节"）
+3. 片段中没有的信息不要编造，也不要输出"未提及"
+"""
+
+
+# 分层摘要提示词（片段 → 章 → 全文，前缀为待摘要内容）
+SUMMARY_TREE_CHUNK_PREFIX = """
+你是一位资深的招标文件解析专家。以下是《{source}》「{chapter}」中的一个片段。
+
+=== 文件片段 ===
+{content}
+"""
+
+SUMMARY_TREE_CHUNK_SUFFIX = """
+=== 摘要要求 ===
+
+请概括以上片段的主要内容（不超过300字）：
+1. 保留原文中的数值、日期、金额、比例、条款编号和标准编号，不要改写或换算
+2. 只输出要点，不要开场白
+3. 片段中没有的信息不要编造
+"""
+
+SUMMARY_TREE_CHAPTER_PREFIX = """
+你是一位资深的招标文件解析专家。以下是《{source}》「{chapter}」各片段的摘要（按原文顺序）。
+
+=== 片段摘要 ===
+{content}
+"""
+
+SUMMARY_TREE_CHAPTER_SUFFIX = """
+=== 摘要要求 ===
+
+请将以上片段摘要合并为本章的摘要（不超过500字）：
+1. 去除重复内容，保留全部关键数值、日期、金额和条款编号
+2. 按原文顺序组织要点，不要开场白
+"""
+
+SUMMARY_TREE_DOCUMENT_PREFIX = """
+你是一位资深的招标文件解析专家。以下是《{source}》各章的摘要（按原文顺序）。
+
+=== 各章摘要 ===
+{content}
+"""
+
+SUMMARY_TREE_DOCUMENT_SUFFIX = """
+=== 摘要要求 ===
+
+请写出该文件的全文概要（不超过800字）：
+1. 说明文件结构（包含哪些章）和每章的核心内容
+2. 突出项目概况、资格要求、时间节点、评标办法、合同关键条款和主要技术要求
+3. 保留关键数值、日期和金额，不要开场白
+"""
 
-# 评审标准提取提示词
-EVALUATION_CRITERIA_EXTRACTION_PROMPT = """
+# 从摘要树中选取评审标准相关章节的查询语句
+SUMMARY_TREE_CRITERIA_QUERY = "评标办法 评分标准 评审因素 分值 技术标 施工组织设计 资格审查"
+
+
+# 补遗/澄清增量解析提示词（前缀：原解析报告）
+AMENDMENT_REANALYSIS_PREFIX = """
+你是一位资深的招标文件解析专家。以下是根据招标文件原版本生成的结构化解析报告。
+
+=== 原解析报告 ===
+{analysis_report}
+"""
+
+AMENDMENT_REANALYSIS_SUFFIX = """
+=== 招标文件变更内容 ===
+招标文件发布了补遗/澄清或修订版本，以下是与原版本相比发生变化的内容（按章分组；"- "为删除的原文，"+ "为新增的原文，"  "为未变化的上下文）：
+
+{changes}
+
+=== 更新要求 ===
+
+原报告的二级章节为：
+{headings}
+
+1. 只输出受上述变更影响的二级章节，每个章节以原报告中完全相同的"## "标题行开头，并完整输出该章节更新后的全部内容（未受影响的部分保持原文）
+2. 未受影响的章节不要输出
+3. 最后输出"## 变更说明"章节，逐条列出本次变更内容、对投标的影响及需要调整的准备工作
+4. 以变更后的原文为准，保留原文中的数值、日期、金额和条款编号，不要编造
+"""
+
+
+# 规则预提取的关键信息（附在解析提示词的文件内容之后）
+TENDER_FACTS_SECTION = """
+=== 规则预提取的关键信息 ===
+以下信息由规则从原文中自动提取，请与原文核对后直接采用；标注"另见"的项目原文中有多个不同的值，请判断以哪个为准并在报告中说明：
+{facts}
+"""
+
+
+# 评审标准提取提示词（前缀：解析报告）
+EVALUATION_CRITERIA_EXTRACTION_PREFIX = """
 你是一位资深的招标评审专家。请从以下招标文件解析报告中，提取并总结评审标准。
 
 === 招标文件解析报告 ===
 {analysis_report}
+"""
 
+EVALUATION_CRITERIA_EXTRACTION_SUFFIX = """
 === 提取要求 ===
 
 请重点关注以下内容：
@@ -216,16 +335,25 @@ EVALUATION_CRITERIA_EXTRACTION_PROMPT = """
 **注意**：请确保提取的评审标准完整、准确，这将作为技术标文档生成的重要依据。
 """
 
+EVALUATION_CRITERIA_EXTRACTION_PROMPT = EVALUATION_CRITERIA_EXTRACTION_PREFIX + EVALUATION_CRITERIA_EXTRACTION_SUFFIX
 
-# 技术标目录生成提示词
-TECHNICAL_PROPOSAL_OUTLINE_PROMPT = """
-你是一位资深的投标文件编写专家。请基于以下信息，生成技术标文档的详细目录结构。
 
-=== 招标文件项目需求 ===
-{project_requirements}
+# 技术标公共前缀（目录生成与所有章节生成共用，保证逐章生成时前缀缓存持续命中）
+TECHNICAL_PROPOSAL_CONTEXT_PREFIX = """
+你是一位资深的投标文件编写专家。以下是本项目的背景资料，后续任务均基于这些资料完成。
+
+=== 项目基本信息 ===
+{project_info}
 
 === 评审标准 ===
 {evaluation_criteria}
+"""
+
+
+# 技术标目录生成提示词
+TECHNICAL_PROPOSAL_OUTLINE_SUFFIX = """
+=== 当前任务 ===
+请基于以上信息，生成技术标文档的详细目录结构。
 
 === 目录生成要求 ===
 
@@ -327,35 +455,33 @@ TECHNICAL_PROPOSAL_OUTLINE_PROMPT = """
 **输出格式**：请以JSON格式输出目录结构，便于程序处理：
 
 ```json
-{{
+{
   "outline": [
-    {{
+    {
       "level": 1,
       "title": "一、技术文件",
       "children": [
-        {{
+        {
           "level": 2,
           "title": "1. 评分点",
           "word_count": 500,
           "description": "总结评审标准中的关键评分点"
-        }}
+        }
       ]
-    }}
+    }
   ]
-}}
+}
 ```
 """
 
+# 完整模板需要 .format()：后缀不含占位符、直接发送，拼接时转义其中JSON示例的花括号
+TECHNICAL_PROPOSAL_OUTLINE_PROMPT = TECHNICAL_PROPOSAL_CONTEXT_PREFIX + TECHNICAL_PROPOSAL_OUTLINE_SUFFIX.replace('{', '{{').replace('}', '}}')
 
-# 技术标章节生成提示词模板
-TECHNICAL_PROPOSAL_SECTION_PROMPT = """
-你是一位资深的投标文件编写专家。请基于以下信息，撰写技术标文档的指定章节。
 
-=== 项目基本信息 ===
-{project_info}
-
-=== 评审标准 ===
-{evaluation_criteria}
+# 技术标章节生成提示词模板
+TECHNICAL_PROPOSAL_SECTION_SUFFIX = """
+=== 当前任务 ===
+请基于以上信息，撰写技术标文档的指定章节。
 
 === 当前章节信息 ===
 - **章节标题**：{section_title}
@@ -402,3 +528,148 @@ TECHNICAL_PROPOSAL_SECTION_PROMPT = """
 - 如提及图纸，请注明"[见附图X]"
 - 引用规范标准时请注明具体编号
 """
+
+TECHNICAL_PROPOSAL_SECTION_PROMPT = TECHNICAL_PROPOSAL_CONTEXT_PREFIX + TECHNICAL_PROPOSAL_SECTION_SUFFIX
+
+
+# 合并生成多个相邻小章节（与单章节共用前缀，按分隔标记依次输出）
+TECHNICAL_PROPOSAL_PACKED_SECTIONS_SUFFIX = """
+=== 当前任务 ===
+请基于以上信息，依次撰写技术标文档的以下 {count} 个相邻章节。
+
+=== 章节列表 ===
+{sections_list}
+
+=== 撰写要求 ===
+
+1. **内容要求**：
+   - 紧密结合项目实际情况，充分响应评审标准要求
+   - 各章节内容各有侧重，不要相互重复
+   - 语言专业、精练、有针对性，数据准确、措施具体
+
+2. **格式要求**：
+   - 使用清晰的Markdown格式，适当使用列表和表格
+   - 每个章节以章节标题（# 标题）开头
+
+3. **字数控制**：
+   - 各章节按建议字数撰写（允许±20%浮动）
+
+4. **输出格式（必须严格遵守）**：
+   - 每个章节之前单独一行输出分隔标记 @@@SECTION 序号@@@（序号即章节列表中的序号）
+   - 按序号顺序输出全部 {count} 个章节，不要遗漏，不要输出分隔标记以外的说明文字
+
+示例：
+@@@SECTION 1@@@
+# 第一个章节标题
+（第一个章节内容）
+@@@SECTION 2@@@
+# 第二个章节标题
+（第二个章节内容）
+
+请开始撰写：
+"""
+
+# 合并生成时章节列表中的单个章节
+TECHNICAL_PROPOSAL_PACKED_SECTION_ITEM = """{index}. **{section_title}**（建议{word_count}字）
+   章节要求：{section_requirements}"""
+
+# 章节相关的招标文件条款（按章节检索，放在章节指令之前，不影响共享前缀的缓存）
+TECHNICAL_PROPOSAL_SECTION_REFERENCES = """
+=== 招标文件相关条款 ===
+以下是从招标文件中检索到的与本章节最相关的原文片段，撰写时请据实响应：
+
+{references}
+"""
+
+# 一致性模式：已完成章节的滚动摘要（放在章节指令之前，不影响共享前缀的缓存）
+TECHNICAL_PROPOSAL_SECTION_CONSISTENCY = """
+=== 前文已确定的关键信息 ===
+以下是本技术标已完成章节中的关键承诺、人员、设备和进度数据。本章节涉及相同内容时必须与之保持一致
+（数字、人员、设备型号和时间节点不得改动）；前文已详细展开的内容简要引用即可，不要重复论述：
+
+{summary}
+"""
+
+# 历史章节复用：相似项目已生成的同类章节（放在章节指令之前，不影响共享前缀的缓存）
+TECHNICAL_PROPOSAL_SECTION_DRAFTS = """
+=== 历史项目同类章节（参考稿） ===
+以下是以往相似项目中已完成的同类章节，可沿用其结构、组织方式和成熟表述，
+但必须按本项目的项目信息、评审标准和章节要求改写：项目名称、工程量、工期、人员、设备等数据一律以本项目为准，
+不得照抄参考稿中其他项目的具体信息：
+
+{drafts}
+"""
+
+# 投标文件生成时检索原始标书要点使用的查询
+BIDDING_RESPONSE_RETRIEVAL_QUERY = (
+    "技术要求 技术规范 技术指标 工期 进度 商务条款 投标保证金 付款方式 履约保证金 质保期 "
+    "资质要求 人员资格 业绩要求 质量标准 售后服务 响应时间 评分标准"
+)
+
+
+# 标书问答（前缀：解析报告 + 规则提取的关键信息，同一项目的所有问题共享，可命中Provider前缀缓存）
+TENDER_CHAT_PREFIX = """你是一位资深的招投标专家，正在就一个招标项目回答投标人的提问。
+以下是该项目招标文件的结构化解析报告和规则提取的关键信息，每个问题还会附上从招标文件原文中检索到的相关片段。
+
+=== 招标文件解析报告 ===
+{report}
+
+=== 关键信息 ===
+{facts}
+
+=== 回答要求 ===
+1. 以招标文件原文片段为准，其次参考解析报告；两者不一致时以原文为准并指出差异
+2. 引用具体条款时注明出处（文件类别、章节或条款号），涉及金额、日期、比例等数字时原样给出
+3. 资料中找不到依据时明确说明"招标文件中未找到相关规定"，不要推测或编造
+4. 回答简明扼要、直接给出结论，必要时用列表分点说明
+"""
+
+# 标书问答的单轮指令（历史摘要 + 最近对话 + 检索片段 + 当前问题）
+TENDER_CHAT_SUFFIX = """{history}
+=== 招标文件相关原文 ===
+{references}
+
+=== 当前问题 ===
+{message}
+"""
+
+# 对话历史（放在当前问题之前）
+CHAT_HISTORY_SECTION = """
+=== 之前对话的摘要 ===
+{summary}
+"""
+
+CHAT_RECENT_SECTION = """
+=== 最近的对话 ===
+{messages}
+"""
+
+# 对话历史压缩（较早的轮次合并进摘要，控制每轮发送的token数）
+CHAT_HISTORY_SUMMARY_PREFIX = """你负责压缩一段关于招标项目的问答对话，压缩结果将代替原对话作为后续问答的上下文。
+
+压缩要求：
+1. 保留用户问过的问题和得到的结论，特别是金额、日期、比例、资质等级、条款出处等具体信息
+2. 保留用户的关注点和尚未解决的问题
+3. 删除寒暄、重复内容和论述过程
+4. 使用简洁的条目列出，不超过500字
+"""
+
+CHAT_HISTORY_SUMMARY_SUFFIX = """=== 已有摘要 ===
+{summary}
+
+=== 需要合并进摘要的对话 ===
+{messages}
+
+请输出合并后的完整摘要："""
+
+# 输出达到 max_tokens 被截断时的续写提示词（原指令 + 已输出内容，前缀保持不变以命中前缀缓存）
+OUTPUT_CONTINUATION_SUFFIX = """{prompt}
+
+=== 已输出内容（因长度限制中断） ===
+{partial}
+
+=== 续写要求 ===
+以上内容因输出长度限制在中途中断。请从中断处直接继续输出剩余内容：
+- 不要重复已输出的内容，不要添加任何说明或开场白
+- 保持原有的格式、层级和编号（如中断在表格中，直接续写表格行）
+"""
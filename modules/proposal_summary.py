@@ -0,0 +1,147 @@
+"""
+技术标滚动摘要（一致性模式）
+从已完成章节中本地提取关键承诺、人员、设备和进度数据，压缩为固定token预算内的摘要，
+注入后续章节的提示词，使各章节的数字、人员和设备保持一致，且不重复前文已展开的内容
+
+- 本地规则提取，不额外调用模型
+- 相同信息只保留最先出现的表述（后续章节应与之保持一致）
+- 超出预算时从占用最多的类别末尾删除，提示词长度不随技术标篇幅线性增长
+"""
+
+import os
+import re
+from typing import Dict, List, Optional
+from .text_processor import TextProcessor
+
+# (类别, 标题, 匹配规则)
+SUMMARY_CATEGORIES = [
+    ('commitments', '关键承诺与目标', re.compile(
+        r'承诺|确保|保证|目标|合格率|优良|不低于|不少于|不超过|零事故|达到.{0,10}(标准|等级|要求)'
+    )),
+    ('personnel', '人员配置', re.compile(
+        r'项目经理|技术负责人|总工|安全员|质检员|质量员|施工员|资料员|材料员|造价员|专职|劳动力|\d+\s*(人|名)'
+    )),
+    ('equipment', '主要设备', re.compile(
+        r'\d+\s*(台|套|辆|部|组)|挖掘机|装载机|起重机|塔吊|吊车|压路机|搅拌|发电机|泵车|全站仪|水准仪|检测仪'
+    )),
+    ('schedule', '进度安排', re.compile(
+        r'工期|日历天|\d+\s*(天|日|周|个月)|\d{4}\s*年|开工|竣工|完工|节点|里程碑'
+    )),
+]
+
+_SENTENCE_SPLIT = re.compile(r'[。；;！!？?\n]')
+_MARKDOWN = re.compile(r'^[#>\-*+\s]+|\*\*|__|`')
+_NORMALIZE = re.compile(r'[\s，,、：:（）()“”"\'|*#\-]+')
+
+
+def _fact_sentences(content: str, max_chars: int) -> List[str]:
+    """将章节内容拆为短句（表格行合并为一句，去除Markdown符号）"""
+    sentences = []
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line or re.fullmatch(r'\|?[\s:\-|]+\|?', line):
+            continue  # 空行 / 表格分隔行
+        if line.startswith('|'):
+            cells = [cell.strip() for cell in line.strip('|').split('|') if cell.strip()]
+            parts = ['，'.join(cells)]
+        else:
+            parts = _SENTENCE_SPLIT.split(line)
+        for part in parts:
+            part = _MARKDOWN.sub('', part.strip()).strip(' ，,：:')
+            if 6 <= len(part) <= max_chars:
+                sentences.append(part)
+    return sentences
+
+
+class ProposalSummary:
+    """已完成章节的滚动摘要"""
+
+    MAX_TITLES = 20
+
+    def __init__(self, max_tokens: int = 800, max_fact_chars: int = 60, model: Optional[str] = None):
+        """
+        Args:
+            max_tokens: 摘要（含已完成章节列表）的token上限
+            max_fact_chars: 单条信息的最大字符数（更长的句子多为论述，不作为关键信息）
+            model: 估算token使用的模型（已校准时按该模型的系数估算）
+        """
+        self.max_tokens = max_tokens
+        self.max_fact_chars = max_fact_chars
+        self.model = model
+        self.facts: Dict[str, List[str]] = {key: [] for key, _, _ in SUMMARY_CATEGORIES}
+        self.sections: List[str] = []  # 摘要中列出的已完成章节
+        self._covered = set()
+        self._seen = set()
+
+    @classmethod
+    def from_env(cls, model: Optional[str] = None) -> 'ProposalSummary':
+        """根据环境变量创建（PROPOSAL_SUMMARY_MAX_TOKENS）"""
+        return cls(max_tokens=int(os.getenv('PROPOSAL_SUMMARY_MAX_TOKENS', '800')), model=model)
+
+    @classmethod
+    def from_sections(cls, sections: Dict[str, str], model: Optional[str] = None) -> 'ProposalSummary':
+        """
+        按目录顺序由已生成章节构建摘要
+
+        Args:
+            sections: {章节标题: 章节内容}（按目录顺序）
+            model: 估算token使用的模型
+        """
+        summary = cls.from_env(model)
+        for title, content in sections.items():
+            summary.update(title, content)
+        return summary
+
+    def update(self, section_title: str, content: str):
+        """
+        加入一个已完成章节的关键信息
+
+        Args:
+            section_title: 章节标题
+            content: 章节内容
+        """
+        if not content or section_title in self._covered:
+            return
+        self._covered.add(section_title)
+        self.sections.append(section_title)
+
+        for sentence in _fact_sentences(content, self.max_fact_chars):
+            key = _NORMALIZE.sub('', sentence)
+            if key in self._seen:
+                continue
+            for category, _, pattern in SUMMARY_CATEGORIES:
+                if pattern.search(sentence):
+                    self.facts[category].append(sentence)
+                    self._seen.add(key)
+                    break
+        self._trim()
+
+    def _trim(self):
+        """超出token预算时从条目最多的类别末尾删除（保留最先确定的信息）"""
+        while self.facts and TextProcessor.estimate_tokens(self.render(), self.model) > self.max_tokens:
+            category = max(self.facts, key=lambda key: len(self.facts[key]))
+            if not self.facts[category]:
+                # 只剩章节列表仍超出预算：只保留最近的章节标题
+                if len(self.sections) <= 1:
+                    return
+                self.sections = self.sections[len(self.sections) // 2:]
+                continue
+            self.facts[category].pop()
+
+    def render(self) -> str:
+        """格式化为提示词中的摘要文本，尚无内容时返回空字符串"""
+        if not self.sections:
+            return ''
+        # 章节列表只列出最近的章节，避免章节标题挤占关键信息的预算
+        titles = '、'.join(self.sections[-self.MAX_TITLES:])
+        if len(self.sections) > self.MAX_TITLES:
+            titles = f"（共{len(self.sections)}个，列出最近{self.MAX_TITLES}个）{titles}"
+        lines = [f"已完成章节：{titles}"]
+        for category, label, _ in SUMMARY_CATEGORIES:
+            if self.facts[category]:
+                lines.append(f"\n【{label}】")
+                lines.extend(f"- {fact}" for fact in self.facts[category])
+        return "\n".join(lines)
+
+    def __len__(self) -> int:
+        return sum(len(facts) for facts in self.facts.values())
@@ -0,0 +1,341 @@
+"""
+Provider 中间件
+在 AI Provider 外层统一处理：
+- 令牌桶限流（每分钟请求数 / 每分钟token数，按provider共享）
+- 指数退避重试（带随机抖动，遵循 Retry-After）
+- 熔断器（连续失败后快速失败，冷却后半开试探）
+"""
+
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Optional, Iterator, Dict, Callable
+from .ai_provider import AIProvider
+from .text_processor import TextProcessor
+
+# 可重试的HTTP状态码（529为Anthropic过载）
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器打开时抛出（调用被快速拒绝）"""
+
+
+class TokenBucket:
+    """令牌桶（线程安全），按分钟速率匀速补充"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: 每分钟补充的令牌数
+            capacity: 桶容量，默认等于每分钟速率（允许一分钟的突发量）
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        获取令牌，不足时阻塞等待
+
+        Args:
+            amount: 需要的令牌数（超过容量时按容量计）
+
+        Returns:
+            实际等待的秒数
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """熔断器：closed → (连续失败) → open → (冷却) → half_open（只放行一个试探请求）→ closed/open"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后打开熔断
+            reset_timeout: 打开后多少秒进入半开状态（放行一次试探请求）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self._probe_owner: Optional[int] = None  # 半开状态下正在试探的线程
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """当前是否允许发出请求（半开状态下同一时间只允许一个试探请求）"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self._probe_owner is not None:
+                    return False
+                self._probe_owner = threading.get_ident()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = 'closed'
+            self._probe_owner = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+            self._probe_owner = None
+
+    def release_probe(self):
+        """试探请求没有得出结果（如调用被中断）：归还试探名额，下一个请求重新试探"""
+        with self._lock:
+            if self._probe_owner == threading.get_ident():
+                self._probe_owner = None
+
+
+# 同一provider的所有实例共享限流器和熔断器（限额是按API账号计算的）
+_shared_lock = threading.Lock()
+_request_buckets: Dict[str, TokenBucket] = {}
+_token_buckets: Dict[str, TokenBucket] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def _env_prefix(provider_name: str) -> str:
+    return 'ANTHROPIC' if provider_name == 'claude' else provider_name.upper()
+
+
+def get_shared_limits(provider_name: str):
+    """
+    获取provider共享的 (请求数令牌桶, token令牌桶, 熔断器)
+
+    环境变量（以openai为例，claude使用 ANTHROPIC_ 前缀）：
+        OPENAI_RPM: 每分钟请求数上限（0 表示不限制）
+        OPENAI_TPM: 每分钟token数上限（0 表示不限制）
+        LLM_CIRCUIT_FAILURES: 连续失败多少次熔断
+        LLM_CIRCUIT_RESET_SECONDS: 熔断冷却时间
+    """
+    with _shared_lock:
+        if provider_name not in _breakers:
+            prefix = _env_prefix(provider_name)
+            rpm = float(os.getenv(f'{prefix}_RPM', '0'))
+            tpm = float(os.getenv(f'{prefix}_TPM', '0'))
+            _request_buckets[provider_name] = TokenBucket(rpm) if rpm > 0 else None
+            _token_buckets[provider_name] = TokenBucket(tpm) if tpm > 0 else None
+            _breakers[provider_name] = CircuitBreaker(
+                failure_threshold=int(os.getenv('LLM_CIRCUIT_FAILURES', '5')),
+                reset_timeout=float(os.getenv('LLM_CIRCUIT_RESET_SECONDS', '60'))
+            )
+        return _request_buckets[provider_name], _token_buckets[provider_name], _breakers[provider_name]
+
+
+def is_retryable(error: Exception) -> bool:
+    """判断异常是否值得重试（限流、过载、超时、网络错误）"""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    name = type(error).__name__
+    return 'Timeout' in name or 'Connection' in name
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """从错误响应头中读取 Retry-After（秒数或HTTP日期）"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class ResilientProvider(AIProvider):
+    """带限流、重试和熔断的 Provider 包装器"""
+
+    def __init__(
+        self,
+        inner: AIProvider,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0
+    ):
+        """
+        Args:
+            inner: 被包装的实际 Provider
+            max_retries: 最大重试次数
+            base_delay: 退避基础等待时间（秒）
+            max_delay: 单次等待上限（秒）
+        """
+        self.inner = inner
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_bucket, self.token_bucket, self.breaker = get_shared_limits(inner.name)
+
+    @classmethod
+    def from_env(cls, inner: AIProvider) -> 'ResilientProvider':
+        """根据环境变量创建（LLM_MAX_RETRIES）"""
+        return cls(inner, max_retries=int(os.getenv('LLM_MAX_RETRIES', '4')))
+
+    @property
+    def name(self) -> str:
+        return self.inner.name
+
+    @property
+    def model(self) -> str:
+        return self.inner.model
+
+    def _acquire(self, prompt: str, prefix: Optional[str], max_tokens: int):
+        """发送前获取限流令牌（token数按 输入估算 + max_tokens 计）"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} 连续调用失败，已熔断，请稍后再试")
+
+        waited = 0.0
+        try:
+            if self.request_bucket:
+                waited += self.request_bucket.acquire(1)
+            if self.token_bucket:
+                estimated = (
+                    TextProcessor.estimate_tokens(prompt, self.model)
+                    + TextProcessor.estimate_tokens(prefix or '', self.model)
+                )
+                waited += self.token_bucket.acquire(estimated + max_tokens)
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        if waited > 0.5:
+            print(f"[Provider Middleware] {self.name} 限流等待 {waited:.1f}s")
+
+    def _record_error(self, error: BaseException) -> bool:
+        """
+        按异常类型记录熔断结果
+
+        Returns:
+            是否可以重试
+        """
+        if isinstance(error, Exception) and is_retryable(error):
+            self.breaker.record_failure()
+            return True
+        if getattr(error, 'status_code', None) is not None:
+            # 上游正常返回了错误响应（如参数错误），服务本身可用
+            self.breaker.record_success()
+        else:
+            # 本地异常或调用被中断，不能说明上游状态
+            self.breaker.release_probe()
+        return False
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """计算退避时间：优先 Retry-After，否则指数退避 + 全抖动"""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _call_with_retry(self, call: Callable, prompt: str, prefix: Optional[str], max_tokens: int):
+        """执行调用，可重试错误按退避策略重试"""
+        attempt = 0
+        while True:
+            self._acquire(prompt, prefix, max_tokens)
+            try:
+                result = call()
+            except BaseException as e:
+                if not self._record_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                print(f"[Provider Middleware] {self.name} 调用失败({e.__class__.__name__})，"
+                      f"{delay:.1f}s 后第{attempt}次重试")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def complete(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        json_mode: bool = False
+    ) -> Dict:
+        return self._call_with_retry(
+            lambda: self.inner.complete(
+                prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, json_mode=json_mode
+            ),
+            prompt, prefix, max_tokens
+        )
+
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        on_finish: Optional[Callable[[Dict], None]] = None,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        """流式生成：仅在收到第一个片段之前的失败会重试，之后的失败直接抛出"""
+        attempt = 0
+        while True:
+            self._acquire(prompt, prefix, max_tokens)
+            started = False
+            try:
+                for delta in self.inner.generate_stream(
+                    prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    prefix=prefix,
+                    on_finish=on_finish,
+                    json_mode=json_mode
+                ):
+                    started = True
+                    yield delta
+            except BaseException as e:
+                if not self._record_error(e) or started or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                print(f"[Provider Middleware] {self.name} 流式调用失败({e.__class__.__name__})，"
+                      f"{delay:.1f}s 后第{attempt}次重试")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return
@@ -0,0 +1,193 @@
+"""
+录制 / 回放 Provider
+- record：调用真实 Provider，并把请求和响应（含token用量、耗时）保存到磁盘
+- replay：只从磁盘读取已录制的响应，不访问网络（未录制的请求直接报错）
+- auto：已录制则回放，否则调用真实 Provider 并录制
+
+录制文件按请求哈希命名（与响应缓存相同的键），每个请求一个JSON文件，便于纳入版本管理
+"""
+
+import os
+import json
+import time
+from datetime import datetime
+from typing import Optional, Iterator, Dict, Callable
+from .ai_provider import AIProvider, empty_usage
+from .llm_cache import LLMCache
+
+RECORD_MODES = ('record', 'replay', 'auto')
+
+
+class ReplayMissError(LookupError):
+    """回放模式下请求未录制"""
+
+
+class RecordReplayProvider(AIProvider):
+    """录制 / 回放 Provider 包装器"""
+
+    def __init__(
+        self,
+        inner: Optional[AIProvider],
+        record_dir: str = 'data/recordings',
+        mode: str = 'replay',
+        name: Optional[str] = None,
+        model: Optional[str] = None,
+        replay_timing: bool = False
+    ):
+        """
+        Args:
+            inner: 实际 Provider（replay 模式下可为 None）
+            record_dir: 录制文件目录
+            mode: record / replay / auto
+            name: provider名称（inner 为 None 时必须提供，需与录制时一致）
+            model: 模型名称（inner 为 None 时必须提供，需与录制时一致）
+            replay_timing: 回放时是否按录制的首token延迟和总耗时等待
+        """
+        if mode not in RECORD_MODES:
+            raise ValueError(f"不支持的录制模式: {mode}，请设置为 {' / '.join(RECORD_MODES)}")
+        if inner is None and mode != 'replay':
+            raise ValueError(f"{mode} 模式需要实际的 Provider")
+
+        self.inner = inner
+        self.record_dir = record_dir
+        self.mode = mode
+        self._name = name or inner.name
+        self._model = model or inner.model
+        self.replay_timing = replay_timing
+        os.makedirs(record_dir, exist_ok=True)
+
+        print(f"[Record/Replay] {mode} 模式 - {self._name}:{self._model}，目录: {record_dir}")
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def model(self) -> str:
+        return self._model
+
+    def _path(self, prompt: str, max_tokens: int, temperature: float, prefix: Optional[str], json_mode: bool) -> str:
+        key = LLMCache.make_key(
+            self.name, self.model, prompt, temperature, max_tokens, prefix=prefix, json_mode=json_mode
+        )
+        return os.path.join(self.record_dir, f"{key}.json")
+
+    def _load(self, path: str) -> Optional[Dict]:
+        if self.mode == 'record' or not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save(self, path: str, prompt: str, prefix: Optional[str], max_tokens: int, temperature: float,
+              result: Dict, ttft: Optional[float], latency: float):
+        recording = {
+            'request': {
+                'provider': self.name,
+                'model': self.model,
+                'prefix': prefix,
+                'prompt': prompt,
+                'max_tokens': max_tokens,
+                'temperature': temperature
+            },
+            'response': {
+                'text': result.get('text', ''),
+                'usage': result.get('usage') or empty_usage(),
+                'stop_reason': result.get('stop_reason'),
+                'model': result.get('model') or self.model
+            },
+            'timing': {'ttft': ttft, 'latency': latency},
+            'recorded_at': datetime.now().isoformat(timespec='seconds')
+        }
+        # 先写临时文件再替换，避免并发读取到写了一半的文件
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(recording, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def _miss(self, path: str):
+        raise ReplayMissError(f"回放模式下请求未录制: {os.path.basename(path)}（请先以 record 模式运行）")
+
+    def complete(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        json_mode: bool = False
+    ) -> Dict:
+        path = self._path(prompt, max_tokens, temperature, prefix, json_mode)
+        recording = self._load(path)
+        if recording:
+            if self.replay_timing:
+                time.sleep(recording['timing'].get('latency') or 0)
+            return dict(recording['response'])
+        if self.mode == 'replay':
+            self._miss(path)
+
+        started = time.monotonic()
+        result = self.inner.complete(
+            prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, json_mode=json_mode
+        )
+        self._save(path, prompt, prefix, max_tokens, temperature, result, None, time.monotonic() - started)
+        return result
+
+    def generate_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 8000,
+        temperature: float = 0.3,
+        prefix: Optional[str] = None,
+        on_finish: Optional[Callable[[Dict], None]] = None,
+        json_mode: bool = False
+    ) -> Iterator[str]:
+        path = self._path(prompt, max_tokens, temperature, prefix, json_mode)
+        recording = self._load(path)
+        if recording:
+            yield from self._replay_stream(recording, on_finish)
+            return
+        if self.mode == 'replay':
+            self._miss(path)
+
+        finish_info = {}
+        chunks = []
+        started = time.monotonic()
+        ttft = None
+        for delta in self.inner.generate_stream(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            prefix=prefix,
+            on_finish=finish_info.update,
+            json_mode=json_mode
+        ):
+            if ttft is None:
+                ttft = time.monotonic() - started
+            chunks.append(delta)
+            yield delta
+
+        result = dict(finish_info, text="".join(chunks))
+        self._save(path, prompt, prefix, max_tokens, temperature, result, ttft, time.monotonic() - started)
+        if on_finish:
+            on_finish(finish_info)
+
+    def _replay_stream(self, recording: Dict, on_finish: Optional[Callable[[Dict], None]]) -> Iterator[str]:
+        """按固定大小分段回放，开启 replay_timing 时按录制耗时匀速输出"""
+        response = recording['response']
+        text = response['text']
+        timing = recording.get('timing') or {}
+        chunk_size = 20
+        chunk_count = max(1, (len(text) + chunk_size - 1) // chunk_size)
+
+        if self.replay_timing:
+            time.sleep(timing.get('ttft') or 0)
+        interval = 0.0
+        if self.replay_timing and timing.get('latency'):
+            interval = max(0.0, timing['latency'] - (timing.get('ttft') or 0)) / chunk_count
+
+        for start in range(0, len(text), chunk_size):
+            yield text[start:start + chunk_size]
+            if interval:
+                time.sleep(interval)
+
+        if on_finish:
+            on_finish({k: v for k, v in response.items() if k != 'text'})
@@ -0,0 +1,188 @@
+"""
+结构化解析报告
+解析报告按提示词规定的7大类（## 一级类别 / ### 子类别）切分为带索引的结构，
+随报告一起保存（BiddingRecord.report_sections）；界面按结构渲染，
+目录/章节生成和评审标准提取只取所需的类别，不再按固定长度截取报告开头
+
+- 类别按标题关键词识别，不依赖序号（模型偶尔改动编号时仍能识别）
+- 按报告内容哈希校验，报告更新后自动重新切分
+"""
+
+import re
+import json
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# (键, 名称, 标题匹配规则)，按顺序匹配
+REPORT_CATEGORIES = [
+    ('basic', '基础信息', re.compile(r'基础信息|项目概况|项目信息')),
+    ('qualification', '资格要求', re.compile(r'资格要求|资格条件')),
+    ('evaluation', '评审要求', re.compile(r'评审|评标|评分')),
+    ('submission', '投标文件要求', re.compile(r'投标文件要求|投标要求')),
+    ('invalid', '无效标与废标项', re.compile(r'无效|废标|否决')),
+    ('documents', '应标需提交文件', re.compile(r'需提交|提交文件|证明材料')),
+    ('review', '招标文件审查', re.compile(r'招标文件审查|风险')),
+]
+CATEGORY_LABELS = {key: label for key, label, _ in REPORT_CATEGORIES}
+
+# 目录/章节生成使用的项目信息类别
+PROJECT_INFO_CATEGORIES = ('basic',)
+# 评审标准提取使用的类别（项目需求 + 评审要求）
+CRITERIA_CATEGORIES = ('basic', 'evaluation')
+
+
+def report_hash(text: str) -> str:
+    """报告内容哈希（判断结构是否需要重新切分）"""
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()[:16]
+
+
+def split_report_sections(report: str, marker: str = '## ') -> List[Tuple[Optional[str], str]]:
+    """
+    按标题切分报告
+
+    Args:
+        report: Markdown 报告
+        marker: 标题标记（默认按二级标题切分）
+
+    Returns:
+        [(标题行 或 None(第一个标题之前的内容), 章节全文（含标题行）)]
+    """
+    sections: List[Tuple[Optional[str], List[str]]] = [(None, [])]
+    for line in (report or '').split('\n'):
+        if line.startswith(marker):
+            sections.append((line.strip(), [line]))
+        else:
+            sections[-1][1].append(line)
+    return [(title, "\n".join(lines)) for title, lines in sections if title or "".join(lines).strip()]
+
+
+def _category_of(title: str) -> Optional[str]:
+    for key, _, pattern in REPORT_CATEGORIES:
+        if pattern.search(title):
+            return key
+    return None
+
+
+class AnalysisReport:
+    """
+    切分后的解析报告
+
+    数据结构（JSON可序列化）：
+        {'hash': 报告哈希, 'preamble': 第一个类别之前的内容, 'sections': [
+            {'key': 类别键或None, 'title': 标题, 'content': 正文（不含标题行）,
+             'subsections': [{'title', 'content'}]}
+        ]}
+    """
+
+    def __init__(self, data: Dict):
+        self.hash: str = data.get('hash', '')
+        self.preamble: str = data.get('preamble', '')
+        self.sections: List[Dict] = data.get('sections', [])
+        self._by_key = {section['key']: section for section in self.sections if section.get('key')}
+
+    @classmethod
+    def parse(cls, report: str) -> 'AnalysisReport':
+        """切分 Markdown 报告"""
+        preamble = ''
+        sections = []
+        for title, text in split_report_sections(report):
+            if title is None:
+                preamble = text.strip()
+                continue
+            name = title.lstrip('#').strip()
+            body = text.split('\n', 1)[1] if '\n' in text else ''
+            subsections = []
+            for sub_title, sub_text in split_report_sections(body, '### '):
+                if sub_title is None:
+                    continue
+                subsections.append({
+                    'title': sub_title.lstrip('#').strip(),
+                    'content': (sub_text.split('\n', 1)[1] if '\n' in sub_text else '').strip()
+                })
+            key = _category_of(name)
+            if key in {section['key'] for section in sections}:
+                key = None  # 同一类别只索引第一次出现的章节
+            sections.append({'key': key, 'title': name, 'content': body.strip(), 'subsections': subsections})
+        return cls({'hash': report_hash(report), 'preamble': preamble, 'sections': sections})
+
+    @classmethod
+    def from_json(cls, text: Optional[str], report: str) -> Optional['AnalysisReport']:
+        """从记录中保存的JSON恢复，与报告内容不一致时返回 None"""
+        if not text:
+            return None
+        try:
+            data = json.loads(text)
+        except (TypeError, ValueError):
+            return None
+        if data.get('hash') != report_hash(report):
+            return None
+        return cls(data)
+
+    def to_dict(self) -> Dict:
+        return {'hash': self.hash, 'preamble': self.preamble, 'sections': self.sections}
+
+    def matches(self, report: str) -> bool:
+        """结构是否对应该报告"""
+        return self.hash == report_hash(report)
+
+    def section(self, key: str) -> Optional[Dict]:
+        """按类别键获取章节"""
+        return self._by_key.get(key)
+
+    @property
+    def categories(self) -> List[str]:
+        """报告中识别到的类别键"""
+        return list(self._by_key)
+
+    def context(self, keys: Sequence[str], max_chars: Optional[int] = None) -> str:
+        """
+        选取若干类别，格式化为提示词中的报告内容
+
+        Args:
+            keys: 类别键（按报告中的顺序输出）
+            max_chars: 字符上限（超出时按子类别整段舍弃，单个子类别超出时截断）
+
+        Returns:
+            Markdown 文本，报告中没有这些类别时返回空字符串
+        """
+        blocks = []
+        used = 0
+        for section in self.sections:
+            if section['key'] not in keys:
+                continue
+            parts = [f"## {section['title']}"]
+            if section['subsections']:
+                lead = section['content'].split('\n### ', 1)[0].strip()
+                if lead and not lead.startswith('### '):
+                    parts.append(lead)
+                parts.extend(f"### {sub['title']}\n{sub['content']}" for sub in section['subsections'])
+            else:
+                parts.append(section['content'])
+
+            for part in parts:
+                if max_chars and used + len(part) > max_chars:
+                    remaining = max_chars - used
+                    if remaining > 200:
+                        blocks.append(part[:remaining])
+                    return "\n".join(blocks).strip()
+                blocks.append(part)
+                used += len(part) + 1
+        return "\n".join(blocks).strip()
+
+
+def report_context(report: str, keys: Sequence[str], max_chars: Optional[int] = None) -> str:
+    """
+    从报告中选取若干类别（未识别到这些类别时退回到报告开头）
+
+    Args:
+        report: Markdown 报告
+        keys: 类别键
+        max_chars: 字符上限
+
+    Returns:
+        报告内容
+    """
+    context = AnalysisReport.parse(report or '').context(keys, max_chars)
+    if context:
+        return context
+    return (report or '')[:max_chars] if max_chars else (report or '')
@@ -0,0 +1,271 @@
+"""
+招标文件检索模块（BM25）
+将解析后的招标文件切分为片段并建立BM25索引，按章节标题/要求检索最相关的条款，
+替代按固定长度截取文件开头的做法，使提示词更短、内容更相关
+
+- 分词：中文按字二元组（bigram），英文/数字按整词，无需额外分词库
+- 切块：按段落聚合到固定长度，超长段落带重叠切分
+- 缓存：按文件内容哈希缓存索引（内存 + data/retrieval/*.pkl），同一项目只建一次
+"""
+
+import os
+import re
+import math
+import pickle
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from typing import List, Dict, Optional
+
+# 连续的中日韩文字 / 英文数字串
+_CJK_RUN = re.compile(r'[一-鿿㐀-䶿]+')
+_WORD = re.compile(r'[A-Za-z0-9]+(?:\.[0-9]+)?')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文感知分词：中文连续片段切为二元组（单字片段保留单字），英文数字按整词小写
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        词项列表
+    """
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(word.lower() for word in _WORD.findall(text))
+    return tokens
+
+
+def chunk_documents(
+    document_contents: Dict[str, str],
+    chunk_chars: int = 500,
+    overlap: int = 100
+) -> List[Dict]:
+    """
+    将各文件内容切分为检索片段
+
+    Args:
+        document_contents: {文件类别: 文本内容}
+        chunk_chars: 片段最大字符数
+        overlap: 超长段落切分时的重叠字符数
+
+    Returns:
+        [{'source': 文件类别, 'offset': 起始位置, 'text': 片段文本}]
+    """
+    chunks = []
+    step = max(1, chunk_chars - overlap)
+
+    for source, content in document_contents.items():
+        if not content or not content.strip():
+            continue
+
+        buffer = ''
+        buffer_offset = 0
+        position = 0
+        for paragraph in content.split('\n'):
+            start = position
+            position += len(paragraph) + 1
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+
+            # 超长段落（如表格转换的长行）单独按窗口切分
+            if len(paragraph) > chunk_chars:
+                if buffer:
+                    chunks.append({'source': source, 'offset': buffer_offset, 'text': buffer})
+                    buffer = ''
+                for i in range(0, len(paragraph), step):
+                    chunks.append({'source': source, 'offset': start + i, 'text': paragraph[i:i + chunk_chars]})
+                    if i + chunk_chars >= len(paragraph):
+                        break
+                continue
+
+            if buffer and len(buffer) + len(paragraph) + 1 > chunk_chars:
+                chunks.append({'source': source, 'offset': buffer_offset, 'text': buffer})
+                buffer = ''
+            if not buffer:
+                buffer_offset = start
+            buffer = f"{buffer}\n{paragraph}" if buffer else paragraph
+
+        if buffer:
+            chunks.append({'source': source, 'offset': buffer_offset, 'text': buffer})
+
+    return chunks
+
+
+class BM25Index:
+    """BM25 倒排索引"""
+
+    def __init__(self, chunks: List[Dict], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            chunks: chunk_documents 返回的片段列表
+            k1: 词频饱和参数
+            b: 长度归一化参数
+        """
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+
+        # 倒排表：词项 -> [(片段序号, 词频)]
+        self.postings: Dict[str, List] = defaultdict(list)
+        self.lengths: List[int] = []
+        for index, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk['text']))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((index, tf))
+        self.postings = dict(self.postings)
+
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        total = len(chunks)
+        self.idf = {
+            term: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def search(self, query: str, top_k: int = 4) -> List[Dict]:
+        """
+        检索与查询最相关的片段
+
+        Args:
+            query: 查询文本（如章节标题 + 章节要求）
+            top_k: 返回片段数
+
+        Returns:
+            [{'source', 'offset', 'text', 'score'}]，按得分从高到低
+        """
+        if not self.chunks:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term, qtf in Counter(tokenize(query)).items():
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for index, tf in docs:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+                scores[index] += qtf * idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [dict(self.chunks[index], score=score) for index, score in ranked]
+
+    def context_for(self, query: str, top_k: int = 4, max_chars: Optional[int] = None) -> str:
+        """
+        检索并格式化为提示词中的参考条款（按原文顺序排列）
+
+        Args:
+            query: 查询文本
+            top_k: 片段数
+            max_chars: 总字符上限（超出时丢弃得分较低的片段）
+
+        Returns:
+            格式化后的参考条款文本，无结果时返回空字符串
+        """
+        selected = []
+        used = 0
+        for hit in self.search(query, top_k):
+            if max_chars and selected and used + len(hit['text']) > max_chars:
+                break
+            selected.append(hit)
+            used += len(hit['text'])
+
+        # 按文件和位置排序，保持条款原有的先后关系
+        selected.sort(key=lambda hit: (hit['source'], hit['offset']))
+        return "\n\n".join(f"【{hit['source']}】\n{hit['text']}" for hit in selected)
+
+
+class RetrievalIndexCache:
+    """按文件内容哈希缓存BM25索引（内存 + 磁盘）"""
+
+    def __init__(
+        self,
+        cache_dir: str = 'data/retrieval',
+        chunk_chars: int = 500,
+        overlap: int = 100,
+        max_in_memory: int = 16
+    ):
+        """
+        Args:
+            cache_dir: 索引文件目录，为空时只在内存中缓存
+            chunk_chars: 片段最大字符数
+            overlap: 片段重叠字符数
+            max_in_memory: 内存中最多保留的索引数（超出时淘汰最早加入的）
+        """
+        self.cache_dir = cache_dir
+        self.chunk_chars = chunk_chars
+        self.overlap = overlap
+        self.max_in_memory = max_in_memory
+        self._memory: Dict[str, BM25Index] = {}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional['RetrievalIndexCache']:
+        """根据环境变量创建，RETRIEVAL_ENABLED=false 时返回 None"""
+        if os.getenv('RETRIEVAL_ENABLED', 'true').lower() in ('false', '0', 'no'):
+            return None
+        return cls(
+            cache_dir=os.getenv('RETRIEVAL_CACHE_DIR', 'data/retrieval'),
+            chunk_chars=int(os.getenv('RETRIEVAL_CHUNK_CHARS', '500')),
+            overlap=int(os.getenv('RETRIEVAL_CHUNK_OVERLAP', '100'))
+        )
+
+    def _key(self, document_contents: Dict[str, str]) -> str:
+        digest = hashlib.sha256(f"{self.chunk_chars}:{self.overlap}".encode('utf-8'))
+        for source in sorted(document_contents):
+            digest.update(b'\x00' + source.encode('utf-8') + b'\x00')
+            digest.update((document_contents[source] or '').encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, document_contents: Dict[str, str]) -> Optional[BM25Index]:
+        """
+        获取文件内容对应的索引（未缓存时构建）
+
+        Args:
+            document_contents: {文件类别: 文本内容}
+
+        Returns:
+            BM25Index，文件内容为空时返回 None
+        """
+        if not any(content and content.strip() for content in document_contents.values()):
+            return None
+
+        key = self._key(document_contents)
+        with self._lock:
+            index = self._memory.get(key)
+            if index is not None:
+                return index
+
+            path = os.path.join(self.cache_dir, f"{key}.pkl") if self.cache_dir else None
+            if path and os.path.exists(path):
+                try:
+                    with open(path, 'rb') as f:
+                        index = pickle.load(f)
+                except Exception as e:
+                    print(f"[Retrieval] 索引文件读取失败，重新构建: {e}")
+
+            if index is None:
+                index = BM25Index(chunk_documents(document_contents, self.chunk_chars, self.overlap))
+                print(f"[Retrieval] 建立索引: {len(index)} 个片段，{len(index.postings)} 个词项")
+                if path:
+                    tmp_path = f"{path}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmp_path, path)
+
+            self._memory[key] = index
+            while len(self._memory) > self.max_in_memory:
+                self._memory.pop(next(iter(self._memory)))
+            return index
@@ -0,0 +1,278 @@
+"""
+LLM 请求调度器
+所有模型调用在发出前按优先级排队获取并发名额，避免后台批量任务占满并发、交互用户长时间等待
+
+- 优先级：interactive（页面上的单次操作）> pipeline（并发生成章节、流水线）> bulk（批量重新解析）
+- 全局并发预算按provider共享（限额按API账号计算），默认与每分钟请求数上限挂钩
+- 同一优先级内按用户公平调度：进行中调用较少的用户优先，其次轮到最久未被调度的用户，最后先到先得
+- 老化：排队超过 LLM_SCHEDULER_AGING_SECONDS 的请求每次提升一个优先级，低优先级不会被无限期饿死
+- 记录各优先级的排队数、进行中调用数和等待时间
+"""
+
+import os
+import time
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+from .metrics import percentile
+
+# 优先级从高到低
+PRIORITIES = ('interactive', 'pipeline', 'bulk')
+PRIORITY_LABELS = {
+    'interactive': '交互',
+    'pipeline': '流水线',
+    'bulk': '批量',
+}
+
+# 当前调用的优先级和所属用户（线程池中需通过 contextvars.copy_context() 传递）
+_current_priority: contextvars.ContextVar = contextvars.ContextVar('current_priority', default='interactive')
+_current_user: contextvars.ContextVar = contextvars.ContextVar('current_user', default=None)
+
+
+def set_request_user(user: Optional[str]):
+    """设置当前上下文的用户标识（同一用户的调用参与公平调度）"""
+    _current_user.set(user)
+
+
+def get_request_priority() -> str:
+    """获取当前上下文的调用优先级"""
+    return _current_priority.get()
+
+
+@contextmanager
+def request_priority(priority: str):
+    """在 with 块内以指定优先级发起调用"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的优先级: {priority}，可选: {', '.join(PRIORITIES)}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def context_with_priority(priority: str) -> contextvars.Context:
+    """复制当前上下文并设置优先级（用于提交到线程池的任务，每个任务使用独立的副本）"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的优先级: {priority}，可选: {', '.join(PRIORITIES)}")
+    context = contextvars.copy_context()
+    context.run(_current_priority.set, priority)
+    return context
+
+
+class _Waiter:
+    """排队中的请求"""
+
+    __slots__ = ('priority', 'user', 'enqueued', 'granted')
+
+    def __init__(self, priority: str, user: Optional[str]):
+        self.priority = priority
+        self.user = user
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class LLMScheduler:
+    """按优先级和用户公平分配并发名额"""
+
+    def __init__(self, max_concurrency: int = 8, aging_seconds: float = 60.0, history: int = 500):
+        """
+        Args:
+            max_concurrency: 同时进行的调用数上限
+            aging_seconds: 排队每满多少秒提升一个优先级（0 表示不提升）
+            history: 每个优先级保留的最近等待时间样本数
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.aging_seconds = aging_seconds
+
+        self._condition = threading.Condition()
+        # 优先级 -> {用户: 排队请求}
+        self._queues: Dict[str, 'OrderedDict[Optional[str], deque]'] = {p: OrderedDict() for p in PRIORITIES}
+        self._running = 0
+        self._running_by_user: Dict[Optional[str], int] = {}
+        self._last_served: Dict[Optional[str], float] = {}  # 各用户最近一次获得名额的时间
+        self._running_by_priority = {p: 0 for p in PRIORITIES}
+        self._served = {p: 0 for p in PRIORITIES}
+        self._waits = {p: deque(maxlen=history) for p in PRIORITIES}
+
+    @classmethod
+    def from_env(cls, provider_name: str) -> 'LLMScheduler':
+        """
+        根据环境变量创建（以openai为例，claude使用 ANTHROPIC_ 前缀）
+
+            OPENAI_MAX_CONCURRENCY: 该provider的并发上限
+            LLM_MAX_CONCURRENCY: 未单独设置时的并发上限（默认8）；
+                                 设置了 OPENAI_RPM 时不超过 RPM/10（按单次调用约6秒以上估算，避免并发超出限额）
+            LLM_SCHEDULER_AGING_SECONDS: 排队老化时间
+        """
+        prefix = 'ANTHROPIC' if provider_name == 'claude' else provider_name.upper()
+        concurrency = os.getenv(f'{prefix}_MAX_CONCURRENCY')
+        if concurrency:
+            max_concurrency = int(concurrency)
+        else:
+            max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+            rpm = float(os.getenv(f'{prefix}_RPM', '0'))
+            if rpm > 0:
+                max_concurrency = min(max_concurrency, max(1, int(rpm // 10)))
+        return cls(
+            max_concurrency=max_concurrency,
+            aging_seconds=float(os.getenv('LLM_SCHEDULER_AGING_SECONDS', '60'))
+        )
+
+    def _level(self, waiter: _Waiter, now: float) -> int:
+        """考虑老化后的有效优先级（数值越小越优先）"""
+        level = PRIORITIES.index(waiter.priority)
+        if self.aging_seconds > 0:
+            level -= int((now - waiter.enqueued) / self.aging_seconds)
+        return max(0, level)
+
+    def _dispatch(self):
+        """有空闲名额时按 (有效优先级, 用户进行中调用数, 用户上次获得名额时间, 排队时间) 选出下一个请求（需持有锁）"""
+        granted = False
+        while self._running < self.max_concurrency:
+            now = time.monotonic()
+            best = None
+            best_key = None
+            for priority in PRIORITIES:
+                for user, queue in self._queues[priority].items():
+                    waiter = queue[0]
+                    key = (
+                        self._level(waiter, now),
+                        self._running_by_user.get(user, 0),
+                        self._last_served.get(user, 0.0),
+                        waiter.enqueued
+                    )
+                    if best_key is None or key < best_key:
+                        best, best_key = waiter, key
+            if best is None:
+                break
+
+            queues = self._queues[best.priority]
+            queues[best.user].popleft()
+            if not queues[best.user]:
+                del queues[best.user]
+            best.granted = True
+            self._running += 1
+            self._running_by_user[best.user] = self._running_by_user.get(best.user, 0) + 1
+            self._last_served[best.user] = now
+            self._running_by_priority[best.priority] += 1
+            self._served[best.priority] += 1
+            self._waits[best.priority].append(now - best.enqueued)
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def acquire(self, priority: Optional[str] = None, user: Optional[str] = None) -> _Waiter:
+        """
+        排队获取一个并发名额（阻塞），用完后需调用 release 归还
+
+        Args:
+            priority: 优先级，默认使用当前上下文的优先级
+            user: 用户标识，默认使用当前上下文的用户
+
+        Returns:
+            名额凭据
+        """
+        waiter = _Waiter(priority or get_request_priority(), user if user is not None else _current_user.get())
+        with self._condition:
+            self._queues[waiter.priority].setdefault(waiter.user, deque()).append(waiter)
+            self._dispatch()
+            try:
+                while not waiter.granted:
+                    self._condition.wait()
+            except BaseException:
+                # 排队期间被中断（如页面重跑）：移出队列，已分配的名额归还
+                if waiter.granted:
+                    self._release_locked(waiter)
+                else:
+                    queue = self._queues[waiter.priority].get(waiter.user)
+                    if queue is not None:
+                        queue.remove(waiter)
+                        if not queue:
+                            del self._queues[waiter.priority][waiter.user]
+                raise
+        return waiter
+
+    def release(self, waiter: _Waiter):
+        """归还 acquire 获取的名额"""
+        with self._condition:
+            self._release_locked(waiter)
+
+    def _release_locked(self, waiter: _Waiter):
+        self._running -= 1
+        self._running_by_priority[waiter.priority] -= 1
+        remaining = self._running_by_user.get(waiter.user, 1) - 1
+        if remaining:
+            self._running_by_user[waiter.user] = remaining
+        else:
+            self._running_by_user.pop(waiter.user, None)
+            if not any(waiter.user in queues for queues in self._queues.values()):
+                self._last_served.pop(waiter.user, None)
+        self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, user: Optional[str] = None, label: str = ''):
+        """
+        在 with 块内占用一个并发名额
+
+        Args:
+            priority: 优先级，默认使用当前上下文的优先级
+            user: 用户标识，默认使用当前上下文的用户
+            label: 日志中显示的调用说明（如任务类型）
+        """
+        waiter = self.acquire(priority, user)
+        waited = time.monotonic() - waiter.enqueued
+        if waited > 1:
+            print(f"[Scheduler] {label or waiter.priority} 排队 {waited:.1f}s（{PRIORITY_LABELS[waiter.priority]}）")
+        try:
+            yield waited
+        finally:
+            self.release(waiter)
+
+    def stats(self) -> Dict:
+        """各优先级的排队数、进行中调用数、已调度数和等待时间（毫秒）"""
+        with self._condition:
+            classes = {}
+            for priority in PRIORITIES:
+                waits = [w * 1000 for w in self._waits[priority]]
+                classes[priority] = {
+                    'label': PRIORITY_LABELS[priority],
+                    'queued': sum(len(queue) for queue in self._queues[priority].values()),
+                    'running': self._running_by_priority[priority],
+                    'served': self._served[priority],
+                    'wait_p50_ms': percentile(waits, 50) if waits else 0.0,
+                    'wait_p95_ms': percentile(waits, 95) if waits else 0.0,
+                    'wait_max_ms': max(waits) if waits else 0.0,
+                }
+            return {
+                'max_concurrency': self.max_concurrency,
+                'running': self._running,
+                'classes': classes
+            }
+
+
+# 同一provider的所有 ClaudeService / 批量任务共享调度器
+_schedulers: Dict[str, LLMScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(provider_name: str) -> LLMScheduler:
+    """获取provider共享的调度器"""
+    with _schedulers_lock:
+        if provider_name not in _schedulers:
+            _schedulers[provider_name] = LLMScheduler.from_env(provider_name)
+        return _schedulers[provider_name]
+
+
+def scheduler_statistics() -> Dict[str, Dict]:
+    """所有provider调度器的统计 {provider: stats}"""
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {name: scheduler.stats() for name, scheduler in schedulers.items()}
+
+
+def scheduling_enabled() -> bool:
+    """是否启用调度（LLM_SCHEDULER_ENABLED=false 时调用直接发出，不排队）"""
+    return os.getenv('LLM_SCHEDULER_ENABLED', 'true').lower() not in ('false', '0', 'no')
@@ -0,0 +1,212 @@
+"""
+历史章节库（跨项目复用）
+相似项目的"施工组织设计""质量保证措施"等章节每周都要重新生成。
+将历史项目已生成的技术标章节建立本地向量索引，生成章节前先检索最相似的历史章节：
+相似度较高的作为参考稿附在提示词中，相似度很高时可直接采用，减少模型调用和输出token
+
+- 向量：中文字二元组/英文整词（与检索模块分词一致）哈希到固定维度的稀疏向量，TF-IDF加权后归一化，NumPy计算余弦相似度
+- 章节相似度 = 标题相似度与内容相似度加权；再与项目评审标准的相似度加权（同类项目的章节更可用）
+- 按记录更新时间增量刷新，只对新增/变化的章节重新计算向量
+"""
+
+import os
+import json
+import zlib
+import hashlib
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .retrieval import tokenize
+
+
+class _SparseRows:
+    """按行拼接的稀疏词频矩阵（对数词频），相似度计算时再乘以IDF"""
+
+    def __init__(self, rows: List[Tuple[np.ndarray, np.ndarray]], dim: int):
+        lengths = np.asarray([len(indices) for indices, _ in rows], dtype=np.int64)
+        self.count = len(rows)
+        self.indices = np.concatenate([indices for indices, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+        self.values = np.log1p(np.concatenate([counts for _, counts in rows])) if rows else np.zeros(0)
+        self.row_ids = np.repeat(np.arange(self.count), lengths)
+        # 每个桶在多少行中出现（行内桶号唯一）
+        frequency = np.bincount(self.indices, minlength=dim)
+        self.idf = np.log((1 + self.count) / (1 + frequency)) + 1
+        weighted = self.values * self.idf[self.indices]
+        self.norms = np.sqrt(np.bincount(self.row_ids, weights=weighted * weighted, minlength=self.count))
+        self.weighted = weighted / np.maximum(self.norms, 1e-12)[self.row_ids]
+
+    def query(self, indices: np.ndarray, counts: np.ndarray, dim: int) -> np.ndarray:
+        """查询向量与每一行的余弦相似度"""
+        vector = np.zeros(dim)
+        if len(indices):
+            weights = np.log1p(counts) * self.idf[indices]
+            vector[indices] = weights / max(float(np.linalg.norm(weights)), 1e-12)
+        return np.bincount(self.row_ids, weights=self.weighted * vector[self.indices], minlength=self.count)
+
+
+class SectionLibrary:
+    """历史章节向量索引"""
+
+    def __init__(
+        self,
+        dim: int = 1 << 18,
+        title_weight: float = 0.6,
+        project_weight: float = 0.2,
+        content_chars: int = 2000
+    ):
+        """
+        Args:
+            dim: 哈希向量维度
+            title_weight: 章节相似度中标题所占权重（其余为内容）
+            project_weight: 总相似度中项目评审标准相似度所占权重
+            content_chars: 每个章节参与向量计算的内容长度
+        """
+        self.dim = dim
+        self.title_weight = title_weight
+        self.project_weight = project_weight
+        self.content_chars = content_chars
+
+        self._lock = threading.Lock()
+        self._rows: Dict[Tuple, Tuple] = {}  # 章节键 -> (标题词频, 内容词频)
+        self._projects: Dict[Tuple, Tuple] = {}  # (记录ID, 评审标准哈希) -> 词频
+        self._entries: List[Dict] = []
+        self._titles = self._contents = self._project_rows = None
+        self._entry_project = np.zeros(0, dtype=np.int64)
+        self.signature: Optional[Tuple] = None
+
+    @classmethod
+    def from_env(cls) -> Optional['SectionLibrary']:
+        """根据环境变量创建，SECTION_LIBRARY_ENABLED=false 时返回 None"""
+        if os.getenv('SECTION_LIBRARY_ENABLED', 'true').lower() in ('false', '0', 'no'):
+            return None
+        return cls(dim=int(os.getenv('SECTION_LIBRARY_DIM', str(1 << 18))))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _counts(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """文本的稀疏哈希词频 (桶号, 次数)"""
+        indices = [zlib.crc32(token.encode('utf-8')) % self.dim for token in tokenize(text)]
+        indices, counts = np.unique(np.asarray(indices, dtype=np.int64), return_counts=True)
+        return indices, counts.astype(np.float64)
+
+    def refresh(self, records: Sequence, signature: Optional[Tuple] = None) -> int:
+        """
+        由项目记录重建索引（未变化的章节沿用已计算的词频）
+
+        Args:
+            records: BiddingRecord 列表（使用 generated_sections / bidding_response / project_name）
+            signature: 记录的版本标识（如 [(ID, 更新时间)]），与上次相同时不重建
+
+        Returns:
+            索引中的章节数
+        """
+        if signature is not None and signature == self.signature:
+            return len(self._entries)
+
+        entries = []
+        rows = {}
+        projects = {}
+        project_index = {}
+        entry_project = []
+        for record in records:
+            sections = json.loads(record.generated_sections) if record.generated_sections else {}
+            if not sections:
+                continue
+            criteria = record.bidding_response or ''
+            project_key = (record.id, hashlib.md5(criteria.encode('utf-8')).hexdigest())
+            if project_key not in projects:
+                projects[project_key] = self._projects.get(project_key) or self._counts(criteria)
+                project_index[project_key] = len(project_index)
+            for title, content in sections.items():
+                if not content or not content.strip():
+                    continue
+                key = (record.id, title, hashlib.md5(content.encode('utf-8')).hexdigest())
+                rows[key] = self._rows.get(key) or (
+                    self._counts(title), self._counts(content[:self.content_chars])
+                )
+                entries.append({
+                    'record_id': record.id,
+                    'project': record.project_name or f"项目{record.id}",
+                    'title': title,
+                    'content': content,
+                    'key': key,
+                })
+                entry_project.append(project_index[project_key])
+
+        titles = _SparseRows([rows[entry['key']][0] for entry in entries], self.dim)
+        contents = _SparseRows([rows[entry['key']][1] for entry in entries], self.dim)
+        project_rows = _SparseRows(list(projects.values()), self.dim)
+
+        with self._lock:
+            self._rows = rows
+            self._projects = projects
+            self._entries = entries
+            self._titles, self._contents, self._project_rows = titles, contents, project_rows
+            self._entry_project = np.asarray(entry_project, dtype=np.int64)
+            self.signature = signature
+        print(f"[Section Library] 索引 {len(entries)} 个历史章节（{len(projects)} 个项目）")
+        return len(entries)
+
+    def search(
+        self,
+        query: str,
+        project: Optional[str] = None,
+        top_k: int = 3,
+        min_score: float = 0.0,
+        exclude_record: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        检索最相似的历史章节
+
+        Args:
+            query: 章节标题 + 章节要求
+            project: 当前项目的评审标准（提供时同类项目的章节排序靠前）
+            top_k: 返回数量
+            min_score: 最低相似度
+            exclude_record: 排除的记录ID（当前项目）
+
+        Returns:
+            [{'record_id', 'project', 'title', 'content', 'score', 'title_score', 'section_score', 'project_score'}]
+            （按总相似度降序）
+        """
+        with self._lock:
+            entries = self._entries
+            titles, contents, project_rows = self._titles, self._contents, self._project_rows
+            entry_project = self._entry_project
+        if not entries or not query.strip():
+            return []
+
+        # 查询同时与标题和内容比较
+        indices, counts = self._counts(query)
+        title_scores = titles.query(indices, counts, self.dim)
+        section_scores = (
+            self.title_weight * title_scores + (1 - self.title_weight) * contents.query(indices, counts, self.dim)
+        )
+        if project and project.strip():
+            project_scores = project_rows.query(*self._counts(project), self.dim)[entry_project]
+            scores = (1 - self.project_weight) * section_scores + self.project_weight * project_scores
+        else:
+            project_scores = np.zeros_like(section_scores)
+            scores = section_scores
+
+        results = []
+        for index in np.argsort(-scores, kind='stable'):
+            entry = entries[index]
+            if scores[index] < min_score or len(results) >= top_k:
+                break
+            if exclude_record is not None and entry['record_id'] == exclude_record:
+                continue
+            results.append({
+                'record_id': entry['record_id'],
+                'project': entry['project'],
+                'title': entry['title'],
+                'content': entry['content'],
+                'score': float(scores[index]),
+                'title_score': float(title_scores[index]),
+                'section_score': float(section_scores[index]),
+                'project_score': float(project_scores[index]),
+            })
+        return results
@@ -0,0 +1,125 @@
+"""
+小章节合并生成
+目录中常有大量300~800字的末级章节，逐个生成时每次都要重复发送评审标准等上下文。
+将相邻的小章节合并为一次调用，要求模型按分隔标记依次输出各章节，再拆分回单独的章节；
+某个章节解析失败（缺失、过短）时只对该章节单独重新生成
+
+- 只合并相邻章节，保持目录顺序
+- 大章节（超过 small_words）单独生成
+"""
+
+import os
+import re
+from typing import Dict, List
+
+# 分隔标记：@@@SECTION 序号@@@（序号从1开始）
+SECTION_MARKER = '@@@SECTION {index}@@@'
+_MARKER_PATTERN = re.compile(r'^\s*@@@\s*SECTION\s*(\d+)\s*@@@\s*$', re.MULTILINE)
+
+
+def _word_count(section: Dict) -> int:
+    try:
+        return int(section.get('word_count', 1000))
+    except (TypeError, ValueError):
+        return 1000
+
+
+def pack_sections(
+    sections: List[Dict],
+    small_words: int = 800,
+    max_words: int = 2400,
+    max_sections: int = 4
+) -> List[List[Dict]]:
+    """
+    将相邻的小章节分组（每组一次调用）
+
+    Args:
+        sections: 章节列表（按目录顺序）
+        small_words: 建议字数不超过该值的章节才参与合并
+        max_words: 每组建议字数合计上限
+        max_sections: 每组最多章节数
+
+    Returns:
+        分组列表，每组为章节列表（不参与合并的章节单独成组）
+    """
+    groups = []
+    current: List[Dict] = []
+    current_words = 0
+
+    for section in sections:
+        words = _word_count(section)
+        if words > small_words:
+            if current:
+                groups.append(current)
+                current, current_words = [], 0
+            groups.append([section])
+            continue
+
+        if current and (current_words + words > max_words or len(current) >= max_sections):
+            groups.append(current)
+            current, current_words = [], 0
+        current.append(section)
+        current_words += words
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+def parse_packed_output(text: str, titles: List[str], min_chars: int = 50) -> Dict[int, str]:
+    """
+    按分隔标记拆分合并输出
+
+    某个分隔标记缺失时，后一章节的内容会并入前一章节；因此内容中出现其他章节标题行的章节也视为解析失败
+
+    Args:
+        text: 模型输出
+        titles: 本组各章节标题（按顺序）
+        min_chars: 单个章节的最少字符数（过短视为解析失败）
+
+    Returns:
+        {章节序号(从0开始): 内容}，只包含成功解析的章节
+    """
+    markers = list(_MARKER_PATTERN.finditer(text))
+    parsed = {}
+    for position, marker in enumerate(markers):
+        index = int(marker.group(1)) - 1
+        if not 0 <= index < len(titles) or index in parsed:
+            continue
+        end = markers[position + 1].start() if position + 1 < len(markers) else len(text)
+        content = text[marker.end():end].strip()
+        if len(content) < min_chars:
+            continue
+        headings = {line.lstrip('#').strip() for line in content.split('\n') if line.startswith('#')}
+        if any(title in headings for other, title in enumerate(titles) if other != index):
+            continue
+        parsed[index] = content
+    return parsed
+
+
+class SectionPacker:
+    """章节合并配置"""
+
+    def __init__(self, small_words: int = 800, max_words: int = 2400, max_sections: int = 4):
+        """
+        Args:
+            small_words: 参与合并的章节建议字数上限
+            max_words: 每组建议字数合计上限
+            max_sections: 每组最多章节数
+        """
+        self.small_words = small_words
+        self.max_words = max_words
+        self.max_sections = max_sections
+
+    @classmethod
+    def from_env(cls) -> 'SectionPacker':
+        """根据环境变量创建（SECTION_PACK_SMALL_WORDS / SECTION_PACK_MAX_WORDS / SECTION_PACK_MAX_SECTIONS）"""
+        return cls(
+            small_words=int(os.getenv('SECTION_PACK_SMALL_WORDS', '800')),
+            max_words=int(os.getenv('SECTION_PACK_MAX_WORDS', '2400')),
+            max_sections=int(os.getenv('SECTION_PACK_MAX_SECTIONS', '4'))
+        )
+
+    def pack(self, sections: List[Dict]) -> List[List[Dict]]:
+        """将相邻的小章节分组"""
+        return pack_sections(sections, self.small_words, self.max_words, self.max_sections)
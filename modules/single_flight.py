@@ -0,0 +1,196 @@
+"""
+相同请求合并（single-flight）
+同一进程内多个线程（多个用户、或双击按钮触发的两次 Streamlit 重跑）同时发起完全相同的调用时，
+只有第一个调用（leader）真正请求模型，其余调用等待并共享同一结果
+
+- 非流式：等待 leader 完成后返回相同结果；leader 出错时所有等待者收到同一个异常
+- 流式：上游在后台线程中生成，输出片段写入共享缓冲区，每个调用方从头回放并继续接收新片段；
+  所有调用方都停止读取时取消上游调用
+- 只合并正在进行的调用，完成后立即移除（已完成结果的复用由响应缓存负责）
+"""
+
+import os
+import threading
+import contextvars
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class _Call:
+    """一次进行中的非流式调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class _SharedStream:
+    """一次进行中的流式调用（所有调用方共享的输出缓冲区）"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.consumers = 0  # 仍在读取的调用方数量
+        self.abandoned = False  # 所有调用方都已停止读取
+
+
+class SingleFlight:
+    """按请求键合并进行中的相同调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self._stats = {'leaders': 0, 'coalesced': 0}
+
+    @classmethod
+    def from_env(cls) -> Optional['SingleFlight']:
+        """根据环境变量创建，SINGLE_FLIGHT_ENABLED=false 时返回 None"""
+        if os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() in ('false', '0', 'no'):
+            return None
+        return cls()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行调用；已有相同键的调用在进行时等待其结果
+
+        Args:
+            key: 请求键（提示词哈希 + 模型 + 参数）
+            fn: 实际调用（只在 leader 线程中执行）
+
+        Returns:
+            (结果, 是否为合并的调用)
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    self._stats['leaders'] += 1
+                    break
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+
+            print(f"[Single Flight] 合并进行中的调用 ({key[:8]})")
+            call.done.wait()
+            if call.error is None:
+                return call.result, True
+            if isinstance(call.error, Exception):
+                raise call.error
+            # leader 被中断（如页面重跑），不是调用本身失败：重新发起
+            with self._lock:
+                self._stats['coalesced'] -= 1
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def stream(self, key: str, factory: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        流式调用；已有相同键的流式调用在进行时从头回放其输出并继续接收
+
+        上游生成器在后台线程中运行（复制调用方的 contextvars，调用记录归属不变），
+        调用方提前停止读取不影响其他调用方；全部停止读取时关闭上游生成器
+
+        Args:
+            key: 请求键
+            factory: 创建上游生成器的函数（只调用一次）
+
+        Yields:
+            输出片段
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is not None and not shared.abandoned:
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                shared = self._streams[key] = _SharedStream()
+                self._stats['leaders'] += 1
+                leader = True
+            with shared.condition:
+                shared.consumers += 1
+
+        if leader:
+            context = contextvars.copy_context()
+            threading.Thread(
+                target=context.run, args=(self._produce, key, shared, factory), daemon=True
+            ).start()
+        else:
+            print(f"[Single Flight] 合并进行中的流式调用 ({key[:8]})")
+
+        position = 0
+        try:
+            while True:
+                with shared.condition:
+                    while position >= len(shared.chunks) and not shared.done:
+                        shared.condition.wait()
+                    pending = shared.chunks[position:]
+                    position = len(shared.chunks)
+                    finished = shared.done
+                for chunk in pending:
+                    yield chunk
+                if finished:
+                    break
+            if shared.error is not None:
+                raise shared.error
+        finally:
+            with shared.condition:
+                shared.consumers -= 1
+                if shared.consumers <= 0 and not shared.done:
+                    shared.abandoned = True
+
+    def _produce(self, key: str, shared: _SharedStream, factory: Callable[[], Iterator[str]]):
+        """后台运行上游生成器，把输出写入共享缓冲区"""
+        generator = None
+        try:
+            generator = factory()
+            for chunk in generator:
+                with shared.condition:
+                    if shared.abandoned:
+                        break
+                    shared.chunks.append(chunk)
+                    shared.condition.notify_all()
+        except BaseException as e:
+            shared.error = e
+        finally:
+            if generator is not None and shared.abandoned:
+                # 所有调用方都已停止读取：关闭上游（按取消记录）
+                generator.close()
+            with self._lock:
+                if self._streams.get(key) is shared:
+                    self._streams.pop(key)
+            with shared.condition:
+                shared.done = True
+                shared.condition.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """合并统计：leaders 实际发出的调用数，coalesced 被合并的调用数，in_flight 进行中的调用数"""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls) + len(self._streams))
+
+
+_single_flight: Optional[SingleFlight] = None
+_single_flight_loaded = False
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """进程内共享的合并器（按环境变量创建，关闭时返回 None）"""
+    global _single_flight, _single_flight_loaded
+    if not _single_flight_loaded:
+        with _single_flight_lock:
+            if not _single_flight_loaded:
+                _single_flight = SingleFlight.from_env()
+                _single_flight_loaded = True
+    return _single_flight
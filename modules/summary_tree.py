@@ -0,0 +1,196 @@
+"""
+招标文件分层摘要树
+每个文件按 片段 → 章 → 全文 三级生成摘要（片段摘要并发生成），随项目记录保存，
+后续的评审标准提取、投标文件生成等步骤按需取用不同粒度的摘要，无需重新发送原文
+
+- 分章：识别"第X章/第X部分"等章标题，识别不到时按长度切分
+- 按文件内容哈希判断是否需要重建，未变化的文件直接沿用已保存的摘要
+- 查询：按粒度（document / chapter / chunk）返回摘要，可按查询语句用BM25选出最相关的节点
+"""
+
+import re
+import json
+import hashlib
+from typing import Dict, List, Optional
+from .retrieval import BM25Index
+
+SUMMARY_TREE_VERSION = 1
+
+# 摘要粒度
+LEVELS = ('document', 'chapter', 'chunk')
+
+# 章标题：第X章 / 第X部分 / 第X篇 / 第X卷
+_CHAPTER_HEADING = re.compile(r'^\s*第\s*[一二三四五六七八九十百零〇\d]+\s*(章|部分|篇|卷)[^。；;]{0,40}$')
+# 无"第X章"时退回到一级编号标题：一、XXX
+_NUMBERED_HEADING = re.compile(r'^\s*[一二三四五六七八九十]+\s*[、.．]\s*[^。；;\s]{1,30}\s*$')
+# 目录页中的条目（带引导点或以页码结尾），不作为章标题
+_TOC_ENTRY = re.compile(r'\.{3,}|…{2,}|·{3,}|\s\d+\s*$')
+
+
+def content_hash(text: str) -> str:
+    """文件内容哈希（判断摘要是否需要重建）"""
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()[:16]
+
+
+def split_chapters(text: str, max_chapter_chars: int = 30000) -> List[Dict]:
+    """
+    按章标题切分文件
+
+    Args:
+        text: 文件内容
+        max_chapter_chars: 识别不到章标题时按该长度切分
+
+    Returns:
+        [{'title': 章标题, 'offset': 起始位置, 'text': 章内容}]
+    """
+    lines = text.split('\n')
+    for pattern in (_CHAPTER_HEADING, _NUMBERED_HEADING):
+        headings = []
+        position = 0
+        for line in lines:
+            if len(line) <= 60 and pattern.match(line) and not _TOC_ENTRY.search(line):
+                headings.append((position, line.strip()))
+            position += len(line) + 1
+        if len(headings) >= 2:
+            break
+    else:
+        headings = []
+
+    chapters = []
+    if headings:
+        if headings[0][0] > 0 and text[:headings[0][0]].strip():
+            chapters.append({'title': '（文件开头）', 'offset': 0, 'text': text[:headings[0][0]]})
+        for index, (offset, title) in enumerate(headings):
+            end = headings[index + 1][0] if index + 1 < len(headings) else len(text)
+            chapters.append({'title': title, 'offset': offset, 'text': text[offset:end]})
+    else:
+        for index, offset in enumerate(range(0, len(text), max_chapter_chars), 1):
+            chapters.append({'title': f'第{index}部分', 'offset': offset, 'text': text[offset:offset + max_chapter_chars]})
+
+    return [chapter for chapter in chapters if chapter['text'].strip()]
+
+
+class SummaryTree:
+    """
+    分层摘要树
+
+    数据结构（JSON可序列化，保存在 BiddingRecord.document_summary）：
+        {'version': 1, 'files': {文件类别: {'hash', 'summary', 'chapters': [
+            {'title', 'offset', 'summary', 'chunks': [{'offset', 'summary'}]}
+        ]}}}
+    """
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        if data.get('version') != SUMMARY_TREE_VERSION:
+            data = {}
+        self.files: Dict[str, Dict] = data.get('files', {})
+
+    @classmethod
+    def from_json(cls, text: Optional[str]) -> Optional['SummaryTree']:
+        """从记录中保存的JSON恢复，为空或格式不符时返回 None"""
+        if not text:
+            return None
+        try:
+            tree = cls(json.loads(text))
+        except (TypeError, ValueError):
+            return None
+        return tree if tree.files else None
+
+    def to_dict(self) -> Dict:
+        return {'version': SUMMARY_TREE_VERSION, 'files': self.files}
+
+    def stale_sources(self, document_contents: Dict[str, str]) -> List[str]:
+        """内容有变化（或尚未生成摘要）的文件"""
+        return [
+            source for source, content in document_contents.items()
+            if content and content.strip()
+            and self.files.get(source, {}).get('hash') != content_hash(content)
+        ]
+
+    def is_current(self, document_contents: Dict[str, str]) -> bool:
+        """摘要是否与当前文件内容一致"""
+        sources = {source for source, content in document_contents.items() if content and content.strip()}
+        return not self.stale_sources(document_contents) and sources == set(self.files)
+
+    def nodes(self, level: str, source: Optional[str] = None) -> List[Dict]:
+        """
+        指定粒度的所有摘要节点
+
+        Args:
+            level: document / chapter / chunk
+            source: 只返回该文件的节点
+
+        Returns:
+            [{'source', 'chapter', 'offset', 'text'}]（按文件和原文顺序）
+        """
+        if level not in LEVELS:
+            raise ValueError(f"未知的摘要粒度: {level}，可选: {', '.join(LEVELS)}")
+
+        nodes = []
+        for name, node in self.files.items():
+            if source and name != source:
+                continue
+            if level == 'document':
+                nodes.append({'source': name, 'chapter': None, 'offset': 0, 'text': node['summary']})
+                continue
+            for chapter in node['chapters']:
+                if level == 'chapter':
+                    nodes.append({
+                        'source': name, 'chapter': chapter['title'], 'offset': chapter['offset'],
+                        'text': chapter['summary']
+                    })
+                else:
+                    nodes.extend(
+                        {'source': name, 'chapter': chapter['title'], 'offset': chunk['offset'], 'text': chunk['summary']}
+                        for chunk in chapter['chunks']
+                    )
+        return nodes
+
+    def context(
+        self,
+        level: str = 'document',
+        query: Optional[str] = None,
+        max_chars: Optional[int] = None,
+        source: Optional[str] = None
+    ) -> str:
+        """
+        格式化为提示词中的摘要
+
+        Args:
+            level: 摘要粒度
+            query: 查询语句，提供时按相关度选取节点（再按原文顺序排列）
+            max_chars: 总字符上限（超出时丢弃相关度较低 / 靠后的节点）
+            source: 只使用该文件的摘要
+
+        Returns:
+            格式化后的摘要文本
+        """
+        nodes = self.nodes(level, source)
+        if query and len(nodes) > 1:
+            index = BM25Index(nodes)
+            ranked = index.search(query, top_k=len(nodes))
+            # 与查询完全无关的节点排在最后
+            matched = {(hit['source'], hit['offset'], hit['chapter']) for hit in ranked}
+            ranked += [node for node in nodes if (node['source'], node['offset'], node['chapter']) not in matched]
+            nodes = ranked
+
+        selected = []
+        used = 0
+        for node in nodes:
+            if max_chars and selected and used + len(node['text']) > max_chars:
+                break
+            selected.append(node)
+            used += len(node['text'])
+
+        # 按文件顺序和原文位置排列
+        file_order = {name: position for position, name in enumerate(self.files)}
+        selected.sort(key=lambda node: (file_order[node['source']], node['offset']))
+        return "\n\n".join(
+            f"【{node['source']}{' / ' + node['chapter'] if node['chapter'] else ''}】\n{node['text']}"
+            for node in selected
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """各粒度的节点数"""
+        return {level: len(self.nodes(level)) for level in LEVELS}
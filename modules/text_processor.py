@@ -4,34 +4,53 @@
 """
 
 import re
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+
+# 默认token系数（中文字符 / 英文单词 / 其他字符），模型未校准时使用
+DEFAULT_TOKEN_COEFFICIENTS = (1.5, 1.3, 0.5)
 
 
 class TextProcessor:
     """文本处理器"""
 
     @staticmethod
-    def estimate_tokens(text: str) -> int:
+    def char_class_counts(text: str) -> Tuple[int, int, int]:
+        """统计 (中文字符数, 英文单词数, 其他字符数)"""
+        if not text:
+            return 0, 0, 0
+        # 统计中文字符数
+        chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
+        # 统计英文单词数
+        english_words = len(re.findall(r'[a-zA-Z]+', text))
+        # 其他字符（数字、符号等）
+        other_chars = len(text) - chinese_chars - english_words
+        return chinese_chars, english_words, other_chars
+
+    @staticmethod
+    def estimate_tokens(text: str, model: Optional[str] = None) -> int:
         """
         估算文本的token数量
 
-        简化算法：
+        指定模型且该模型已有校准系数时（见 token_calibration），按实际计费数据拟合的系数估算；
+        否则使用简化算法：
         - 中文：1字符 ≈ 1.5 tokens
         - 英文：1单词 ≈ 1.3 tokens
+        - 其他：1字符 ≈ 0.5 tokens
         """
         if not text:
             return 0
 
-        # 统计中文字符数
-        chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-        # 统计英文单词数
-        english_words = len(re.findall(r'[a-zA-Z]+', text))
-        # 其他字符（数字、符号等）
-        other_chars = len(text) - chinese_chars - english_words
+        if model:
+            from .token_calibration import get_calibrator
+            calibrator = get_calibrator()
+            if calibrator:
+                calibrated = calibrator.estimate(text, model)
+                if calibrated is not None:
+                    return calibrated
 
         # 估算token数
-        tokens = int(chinese_chars * 1.5 + english_words * 1.3 + other_chars * 0.5)
-        return tokens
+        counts = TextProcessor.char_class_counts(text)
+        return int(sum(c * x for c, x in zip(DEFAULT_TOKEN_COEFFICIENTS, counts)))
 
     @staticmethod
     def smart_truncate(text: str, max_tokens: int, keep_structure: bool = True) -> str:
@@ -120,7 +139,8 @@ class TextProcessor:
     @staticmethod
     def split_into_batches(
         document_contents: Dict[str, str],
-        max_tokens_per_batch: int = 60000
+        max_tokens_per_batch: int = 60000,
+        model: Optional[str] = None
     ) -> List[Dict[str, str]]:
         """
         将文档内容分批，每批不超过max_tokens
@@ -128,6 +148,7 @@ class TextProcessor:
         Args:
             document_contents: {文件类型: 内容} 字典
             max_tokens_per_batch: 每批最大token数
+            model: 模型名称（已校准时按该模型的系数估算）
 
         Returns:
             批次列表 [{文件类型: 内容}, ...]
@@ -137,7 +158,7 @@ class TextProcessor:
         current_tokens = 0
 
         for file_type, content in document_contents.items():
-            file_tokens = TextProcessor.estimate_tokens(content)
+            file_tokens = TextProcessor.estimate_tokens(content, model)
 
             # 单个文件超过限制，需要截断
             if file_tokens > max_tokens_per_batch * 0.8:
@@ -147,7 +168,7 @@ class TextProcessor:
                     int(max_tokens_per_batch * 0.8),
                     keep_structure=True
                 )
-                file_tokens = TextProcessor.estimate_tokens(truncated)
+                file_tokens = TextProcessor.estimate_tokens(truncated, model)
                 content = truncated
 
             # 检查是否需要新批次
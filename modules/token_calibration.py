@@ -0,0 +1,319 @@
+"""
+token估算校准
+记录每次调用的（提示词字符分类计数，实际计费 prompt_tokens）样本，按模型用最小二乘拟合
+中文字符 / 英文单词 / 其他字符三类的token系数，持久化后供 TextProcessor.estimate_tokens 使用
+
+- 样本和系数保存在 SQLite（data/token_calibration.db），进程重启后仍然有效
+- 每个模型累计 TOKEN_CALIBRATION_REFIT_EVERY 个新样本后用最近的样本重新拟合
+- 样本不足或拟合结果异常（系数为负、误差反而更大）时继续使用默认系数
+"""
+
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from .text_processor import TextProcessor, DEFAULT_TOKEN_COEFFICIENTS
+
+Base = declarative_base()
+
+
+class TokenSample(Base):
+    """校准样本表"""
+    __tablename__ = 'token_samples'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    create_time = Column(DateTime, default=datetime.now)
+    model = Column(String(200), index=True)
+    chinese_chars = Column(Integer, default=0)
+    english_words = Column(Integer, default=0)
+    other_chars = Column(Integer, default=0)
+    actual_tokens = Column(Integer, default=0)  # 服务端计费的 prompt_tokens
+
+
+class TokenCoefficients(Base):
+    """各模型拟合出的系数"""
+    __tablename__ = 'token_coefficients'
+
+    model = Column(String(200), primary_key=True)
+    chinese = Column(Float)  # 每个中文字符的token数
+    english = Column(Float)  # 每个英文单词的token数
+    other = Column(Float)  # 每个其他字符的token数
+    samples = Column(Integer, default=0)  # 拟合使用的样本数
+    default_error = Column(Float)  # 默认系数的平均相对误差
+    fitted_error = Column(Float)  # 拟合系数的平均相对误差
+    update_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def to_dict(self):
+        return {
+            'model': self.model,
+            'chinese': self.chinese,
+            'english': self.english,
+            'other': self.other,
+            'samples': self.samples,
+            'default_error': self.default_error,
+            'fitted_error': self.fitted_error,
+            'update_time': self.update_time.strftime('%Y-%m-%d %H:%M:%S') if self.update_time else None
+        }
+
+
+def _solve(matrix: List[List[float]], vector: List[float]) -> Optional[List[float]]:
+    """高斯消元（部分主元）求解线性方程组，奇异时返回 None"""
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-9:
+            return None
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(n):
+            if r != col:
+                factor = rows[r][col] / rows[col][col]
+                rows[r] = [a - factor * b for a, b in zip(rows[r], rows[col])]
+    return [rows[i][n] / rows[i][i] for i in range(n)]
+
+
+def fit_coefficients(samples: List[Tuple[int, int, int, int]]) -> Optional[Tuple[float, float, float]]:
+    """
+    最小二乘拟合 token数 ≈ a×中文字符 + b×英文单词 + c×其他字符
+
+    样本中某一类始终为0时该类不参与拟合（沿用默认系数）；拟合出负系数时固定为默认值后重新拟合
+
+    Args:
+        samples: [(中文字符数, 英文单词数, 其他字符数, 实际token数)]
+
+    Returns:
+        (a, b, c)，无法拟合时返回 None
+    """
+    coefficients = list(DEFAULT_TOKEN_COEFFICIENTS)
+    active = [k for k in range(3) if any(sample[k] for sample in samples)]
+
+    for _ in range(3):
+        if not active:
+            return None
+        fixed = [k for k in range(3) if k not in active]
+        # 正规方程 AᵀA x = Aᵀy（固定系数的部分先从 y 中减去）
+        matrix = [[0.0] * len(active) for _ in active]
+        vector = [0.0] * len(active)
+        for sample in samples:
+            target = sample[3] - sum(coefficients[k] * sample[k] for k in fixed)
+            for i, ki in enumerate(active):
+                vector[i] += sample[ki] * target
+                for j, kj in enumerate(active):
+                    matrix[i][j] += sample[ki] * sample[kj]
+        solution = _solve(matrix, vector)
+        if solution is None:
+            return None
+
+        negative = [k for k, value in zip(active, solution) if value <= 0]
+        if not negative:
+            for k, value in zip(active, solution):
+                coefficients[k] = value
+            return tuple(coefficients)
+        active = [k for k in active if k not in negative]
+    return None
+
+
+def _mean_relative_error(samples: List[Tuple[int, int, int, int]], coefficients) -> float:
+    errors = [
+        abs(sum(c * x for c, x in zip(coefficients, sample[:3])) - sample[3]) / sample[3]
+        for sample in samples if sample[3]
+    ]
+    return sum(errors) / len(errors) if errors else 0.0
+
+
+class TokenCalibrator:
+    """按模型校准token估算系数"""
+
+    def __init__(
+        self,
+        db_path: str = 'data/token_calibration.db',
+        min_samples: int = 10,
+        refit_every: int = 10,
+        window: int = 500
+    ):
+        """
+        Args:
+            db_path: 校准数据库路径
+            min_samples: 开始拟合所需的最少样本数
+            refit_every: 每累计多少个新样本重新拟合一次
+            window: 拟合使用的最近样本数
+        """
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+
+        self.min_samples = min_samples
+        self.refit_every = refit_every
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}  # 各模型自上次拟合后新增的样本数
+        self._coefficients: Dict[str, Tuple[float, float, float]] = {}
+
+        session = self.Session()
+        try:
+            for row in session.query(TokenCoefficients).all():
+                self._coefficients[row.model] = (row.chinese, row.english, row.other)
+        finally:
+            session.close()
+
+    @classmethod
+    def from_env(cls) -> Optional['TokenCalibrator']:
+        """根据环境变量创建，TOKEN_CALIBRATION_ENABLED=false 时返回 None"""
+        if os.getenv('TOKEN_CALIBRATION_ENABLED', 'true').lower() in ('false', '0', 'no'):
+            return None
+        return cls(
+            db_path=os.getenv('TOKEN_CALIBRATION_PATH', 'data/token_calibration.db'),
+            min_samples=int(os.getenv('TOKEN_CALIBRATION_MIN_SAMPLES', '10')),
+            refit_every=int(os.getenv('TOKEN_CALIBRATION_REFIT_EVERY', '10'))
+        )
+
+    def coefficients_for(self, model: Optional[str]) -> Optional[Tuple[float, float, float]]:
+        """获取模型的校准系数（未校准返回 None）"""
+        if not model:
+            return None
+        with self._lock:
+            return self._coefficients.get(model)
+
+    def estimate(self, text: str, model: Optional[str]) -> Optional[int]:
+        """用模型的校准系数估算token数，未校准时返回 None"""
+        coefficients = self.coefficients_for(model)
+        if coefficients is None:
+            return None
+        counts = TextProcessor.char_class_counts(text)
+        return int(sum(c * x for c, x in zip(coefficients, counts)))
+
+    def record(self, model: str, text: str, actual_tokens: int):
+        """
+        记录一个样本（写入失败只打印日志，不影响业务流程）
+
+        Args:
+            model: 模型名称
+            text: 实际发送的提示词全文（前缀 + 指令）
+            actual_tokens: 服务端返回的 prompt_tokens
+        """
+        if not model or not text or not actual_tokens:
+            return
+
+        chinese, english, other = TextProcessor.char_class_counts(text)
+        session = self.Session()
+        try:
+            session.add(TokenSample(
+                model=model,
+                chinese_chars=chinese,
+                english_words=english,
+                other_chars=other,
+                actual_tokens=actual_tokens
+            ))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"[Token Calibration] 样本写入失败: {e}")
+            return
+        finally:
+            session.close()
+
+        with self._lock:
+            self._pending[model] = self._pending.get(model, 0) + 1
+            due = self._pending[model] >= self.refit_every
+        if due:
+            self.refit(model)
+
+    def refit(self, model: str) -> Optional[Dict]:
+        """
+        用最近的样本重新拟合模型系数
+
+        Returns:
+            拟合结果（系数、样本数、误差），样本不足或拟合结果不优于默认系数时返回 None
+        """
+        session = self.Session()
+        try:
+            rows = (
+                session.query(TokenSample)
+                .filter_by(model=model)
+                .order_by(TokenSample.id.desc())
+                .limit(self.window)
+                .all()
+            )
+            samples = [(r.chinese_chars, r.english_words, r.other_chars, r.actual_tokens) for r in rows]
+            if len(samples) < self.min_samples:
+                return None
+
+            with self._lock:
+                self._pending[model] = 0
+
+            coefficients = fit_coefficients(samples)
+            if coefficients is None:
+                return None
+            default_error = _mean_relative_error(samples, DEFAULT_TOKEN_COEFFICIENTS)
+            fitted_error = _mean_relative_error(samples, coefficients)
+            if fitted_error > default_error:
+                return None
+
+            row = session.get(TokenCoefficients, model) or TokenCoefficients(model=model)
+            row.chinese, row.english, row.other = coefficients
+            row.samples = len(samples)
+            row.default_error = default_error
+            row.fitted_error = fitted_error
+            session.merge(row)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"[Token Calibration] 拟合失败: {e}")
+            return None
+        finally:
+            session.close()
+
+        with self._lock:
+            self._coefficients[model] = coefficients
+        print(f"[Token Calibration] {model}: 中文 {coefficients[0]:.3f} / 英文单词 {coefficients[1]:.3f} / "
+              f"其他 {coefficients[2]:.3f}（{len(samples)} 个样本，误差 {default_error:.1%} → {fitted_error:.1%}）")
+        return {
+            'model': model,
+            'coefficients': coefficients,
+            'samples': len(samples),
+            'default_error': default_error,
+            'fitted_error': fitted_error
+        }
+
+    def get_all(self) -> List[Dict]:
+        """所有模型的校准系数"""
+        session = self.Session()
+        try:
+            return [row.to_dict() for row in session.query(TokenCoefficients).order_by(TokenCoefficients.model).all()]
+        finally:
+            session.close()
+
+    def clear(self):
+        """清空样本和系数"""
+        session = self.Session()
+        try:
+            session.query(TokenSample).delete()
+            session.query(TokenCoefficients).delete()
+            session.commit()
+        finally:
+            session.close()
+        with self._lock:
+            self._coefficients.clear()
+            self._pending.clear()
+
+
+_calibrator: Optional[TokenCalibrator] = None
+_calibrator_loaded = False
+_calibrator_lock = threading.Lock()
+
+
+def get_calibrator() -> Optional[TokenCalibrator]:
+    """进程内共享的校准器（按环境变量创建，关闭时返回 None）"""
+    global _calibrator, _calibrator_loaded
+    if not _calibrator_loaded:
+        with _calibrator_lock:
+            if not _calibrator_loaded:
+                _calibrator = TokenCalibrator.from_env()
+                _calibrator_loaded = True
+    return _calibrator
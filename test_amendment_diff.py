@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+补遗/澄清增量解析测试：段落比较、按章定位变更和报告章节替换
+运行: python test_amendment_diff.py（也可用 pytest 运行）
+"""
+import sys
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.amendment_diff import split_paragraphs, diff_documents, render_diff, patch_report
+
+OLD = """第一章 招标公告
+项目名称：智慧园区建设项目
+投标截止时间：2025年11月12日9时30分
+
+第二章 投标人须知
+投标保证金：人民币20万元
+投标有效期：90天
+
+第三章 技术要求
+系统应支持1000路视频接入
+存储时间不少于30天
+"""
+
+NEW = OLD.replace("投标保证金：人民币20万元", "投标保证金：人民币10万元") \
+         .replace("存储时间不少于30天", "存储时间不少于90天\n支持国产化操作系统")
+
+REPORT = """# 招标文件解析报告
+
+## 一、项目概况
+项目名称：智慧园区建设项目
+
+## 二、投标要求
+- 投标保证金：20万元
+- 投标有效期：90天
+
+## 三、技术要求
+- 视频接入：1000路
+- 存储时间：30天
+"""
+
+
+def test_split_paragraphs():
+    text = "第一段  内容\n\n\t第二段\n"
+    assert split_paragraphs(text) == [(0, '第一段 内容'), (9, '第二段')]
+    assert text[9:].strip() == '第二段'
+    assert split_paragraphs('') == [] and split_paragraphs(None) == []
+
+
+def test_diff_locates_chapters():
+    diff = diff_documents({'招标文件': OLD}, {'招标文件': NEW}, context=1)
+    chapters = [(item['source'], item['chapter']) for item in diff['chapters']]
+    assert chapters == [('招标文件', '第二章 投标人须知'), ('招标文件', '第三章 技术要求')]
+
+    bond = diff['chapters'][0]['hunks'][0]
+    assert ('-', '投标保证金：人民币20万元') in bond and ('+', '投标保证金：人民币10万元') in bond
+    assert (' ', '投标有效期：90天') in bond
+    tech = [entry for hunk in diff['chapters'][1]['hunks'] for entry in hunk]
+    assert ('+', '支持国产化操作系统') in tech and ('-', '存储时间不少于30天') in tech
+
+    assert diff['changed_chars'] == sum(item['changed_chars'] for item in diff['chapters'])
+    assert diff['total_chars'] == len(NEW)
+    assert 0 < diff['ratio'] < 0.5
+
+
+def test_diff_whitespace_and_files():
+    # 只有缩进、行尾空白和空行变化时没有变更
+    reformatted = OLD.replace("投标有效期：90天", "  投标有效期：90天\t").replace("\n\n", "\n\n\n")
+    assert diff_documents({'招标文件': OLD}, {'招标文件': reformatted})['chapters'] == []
+    assert diff_documents({'招标文件': OLD}, {'招标文件': OLD})['changed_chars'] == 0
+
+    # 新增的文件类别整体为新增内容，删除的类别整体为删除内容（排在现有文件之后）
+    diff = diff_documents(
+        {'招标文件': OLD, '评分标准': '技术分60分\n商务分40分'},
+        {'招标文件': OLD, '补遗文件': '补遗一：开标时间推迟一周'}
+    )
+    assert [item['source'] for item in diff['chapters']] == ['补遗文件', '评分标准']
+    assert diff['chapters'][0]['hunks'] == [[('+', '补遗一：开标时间推迟一周')]]
+    assert diff['chapters'][1]['hunks'] == [[('-', '技术分60分'), ('-', '商务分40分')]]
+
+
+def test_render_diff():
+    diff = diff_documents({'招标文件': OLD}, {'招标文件': NEW})
+    text = render_diff(diff)
+    assert '【招标文件 / 第二章 投标人须知】' in text
+    assert '- 投标保证金：人民币20万元' in text and '+ 投标保证金：人民币10万元' in text
+    limited = render_diff(diff, max_chars=20)
+    assert '第三章' not in limited and '（另有 1 章的变更因篇幅省略）' in limited
+
+
+def test_patch_report():
+    updates = "## 二、投标要求\n- 投标保证金：10万元\n- 投标有效期：90天\n\n## 五、补遗事项\n- 存储时间调整为90天\n"
+    patched, replaced, added = patch_report(REPORT, updates)
+    assert replaced == ['## 二、投标要求'] and added == ['## 五、补遗事项']
+    assert '投标保证金：10万元' in patched and '20万元' not in patched
+    # 未变更的章节保持原样、顺序不变，新增章节追加在末尾
+    assert '## 一、项目概况\n项目名称：智慧园区建设项目' in patched
+    assert patched.index('## 一、') < patched.index('## 二、') < patched.index('## 三、') < patched.index('## 五、')
+    assert patched.startswith('# 招标文件解析报告')
+
+    # 标题序号或空白不同也按同一章节替换
+    patched, replaced, added = patch_report(REPORT, "## 3. 技术要求\n- 存储时间：90天\n")
+    assert replaced == ['## 3. 技术要求'] and added == []
+    assert '存储时间：90天' in patched and '视频接入' not in patched
+    patched, replaced, added = patch_report(REPORT, '')
+    assert replaced == [] and added == []
+    assert patched.strip() == REPORT.strip()
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_split_paragraphs, test_diff_locates_chapters, test_diff_whitespace_and_files, test_render_diff,
+                 test_patch_report):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
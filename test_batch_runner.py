@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+批量模式端到端测试：BatchRunner 通过本地替身服务器走 OpenAI Batch / Anthropic Message Batches 接口，
+依次执行 解析 → 评审标准 → 目录 → 章节 四个阶段并写回项目记录
+运行: python test_batch_runner.py（也可用 pytest 运行）
+"""
+import os
+import sys
+import json
+import tempfile
+sys.stdout.reconfigure(encoding='utf-8')
+
+# 测试不写入仓库下的 data/ 目录
+for name, value in {
+    'LLM_CACHE_ENABLED': 'false', 'METRICS_ENABLED': 'false', 'RETRIEVAL_ENABLED': 'false',
+    'TOKEN_CALIBRATION_ENABLED': 'false', 'SECTION_LIBRARY_ENABLED': 'false',
+    'MOCK_TTFT_MS': '0', 'MOCK_TOKENS_PER_SEC': '0', 'LLM_SCHEDULER_ENABLED': 'false',
+}.items():
+    os.environ[name] = value
+
+from modules.ai_provider import OpenAIProvider, ClaudeProvider
+from modules.provider_middleware import ResilientProvider
+from modules.record_replay import RecordReplayProvider
+from modules.mock_provider import MockProvider
+from modules.llm_cache import LLMCache
+from modules.database import DatabaseManager
+from modules.ai_service import ClaudeService, extract_sections_from_outline
+from modules.batch_runner import (
+    BatchRunner, get_batch_backend, OpenAIBatchBackend, AnthropicBatchBackend, LocalBatchBackend, STAGES
+)
+from modules.batch_stub_server import start_stub_server
+
+DOCUMENTS = {
+    '招标文件': "第一章 招标公告\n项目名称：智慧园区建设项目\n投标截止时间：2025年11月12日9时30分\n"
+                "第二章 技术要求\n系统应支持1000路视频接入，存储时间不少于30天。\n",
+}
+
+
+def _provider(provider_class, base_url):
+    """创建指向替身服务器的真实 Provider（外层包装重试中间件）"""
+    variable = 'OPENAI_BASE_URL' if provider_class is OpenAIProvider else 'ANTHROPIC_BASE_URL'
+    previous = os.environ.get(variable)
+    os.environ[variable] = base_url + ('/v1' if provider_class is OpenAIProvider else '')
+    try:
+        return ResilientProvider(provider_class(api_key='test-key', model='stub-model'))
+    finally:
+        if previous is None:
+            os.environ.pop(variable)
+        else:
+            os.environ[variable] = previous
+
+
+def _run_all_stages(provider_class):
+    server, base_url = start_stub_server()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            provider = _provider(provider_class, base_url)
+            cache = LLMCache(db_path=os.path.join(tmp, 'cache.db'))
+            ai_service = ClaudeService(provider=provider, cache=cache)
+            db_manager = DatabaseManager(db_path=os.path.join(tmp, 'records.db'))
+            ids = [db_manager.create_record(f"项目{i}", {'招标文件': f"tender{i}.pdf"}).id for i in range(2)]
+
+            runner = BatchRunner(ai_service, db_manager, poll_interval=0.05, upload_dir=tmp)
+            # 文件解析依赖 PyMuPDF，这里直接提供解析后的文件内容
+            runner._load_documents = lambda record: dict(DOCUMENTS)
+            report = runner.run(record_ids=ids)
+
+            assert list(report) == list(STAGES)
+            for stage in ('analysis', 'criteria', 'outline'):
+                assert report[stage]['succeeded'] == 2 and report[stage]['failed'] == 0, (stage, report[stage])
+            assert report['sections']['failed'] == 0 and report['sections']['succeeded'] >= 2
+
+            backend_class = OpenAIBatchBackend if provider_class is OpenAIProvider else AnthropicBatchBackend
+            assert all(isinstance(backend, backend_class) for backend in runner._backends.values())
+
+            for record_id in ids:
+                record = db_manager.get_record(record_id).to_dict()
+                assert record['status'] == 'analyzed' and record['analysis_report']
+                assert record['analyzed_contents'] == DOCUMENTS
+                assert record['bidding_response']
+                sections = extract_sections_from_outline(record['technical_outline'])
+                assert sections, record['technical_outline']
+                assert set(record['generated_sections']) == {section['title'] for section in sections}
+                assert all(content.strip() for content in record['generated_sections'].values())
+
+            # 结果已写入响应缓存：重新运行只读缓存，不再提交批次
+            for record_id in ids:
+                db_manager.update_record(record_id, technical_outline=None, generated_sections={})
+            rerun = runner.run(record_ids=ids, stages=['outline'])
+            assert rerun['outline'] == {'submitted': 0, 'cached': 2, 'succeeded': 0, 'failed': 0}
+
+            db_manager.close()
+            db_manager.engine.dispose()
+            cache.engine.dispose()
+    finally:
+        server.shutdown()
+
+
+def test_openai_batch():
+    _run_all_stages(OpenAIProvider)
+
+
+def test_anthropic_batch():
+    _run_all_stages(ClaudeProvider)
+
+
+def test_backend_selection():
+    mock = MockProvider(model='mock-model')
+    assert isinstance(get_batch_backend(ResilientProvider(mock)), LocalBatchBackend)
+    with tempfile.TemporaryDirectory() as tmp:
+        # 录制/回放包装不能被绕过：即使内层是 OpenAI 也使用本地执行（经过录制/回放）
+        openai = OpenAIProvider(api_key='test-key', model='stub-model')
+        recorded = ResilientProvider(RecordReplayProvider(openai, record_dir=tmp, mode='auto'))
+        backend = get_batch_backend(recorded)
+        assert isinstance(backend, LocalBatchBackend) and backend.provider is recorded
+        assert isinstance(get_batch_backend(ResilientProvider(openai)), OpenAIBatchBackend)
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_openai_batch, test_anthropic_batch, test_backend_selection):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+标书问答测试：对话历史超出上限时较早的轮次压缩进摘要、摘要滚动合并、问答前缀在各轮之间保持不变
+运行: python test_chat.py（也可用 pytest 运行）
+"""
+import os
+import sys
+import threading
+sys.stdout.reconfigure(encoding='utf-8')
+
+# 测试不写入仓库下的 data/ 目录
+for name, value in {
+    'LLM_CACHE_ENABLED': 'false', 'METRICS_ENABLED': 'false', 'RETRIEVAL_ENABLED': 'false',
+    'TOKEN_CALIBRATION_ENABLED': 'false', 'SECTION_LIBRARY_ENABLED': 'false',
+    'MOCK_TTFT_MS': '0', 'MOCK_TOKENS_PER_SEC': '0', 'LLM_SCHEDULER_ENABLED': 'false',
+}.items():
+    os.environ[name] = value
+
+from modules.mock_provider import MockProvider
+from modules.ai_service import ClaudeService
+from modules.retrieval import BM25Index, chunk_documents
+
+DOCUMENTS = {
+    '招标文件': "第一章 投标须知\n投标保证金：人民币伍拾万元整（500000元）。\n"
+                "第二章 合同条款\n逾期竣工违约金：每日按合同价款的万分之五计取。\n",
+}
+
+
+class CallLog(MockProvider):
+    """记录每次调用的 (前缀, 提示词)"""
+
+    def __init__(self):
+        super().__init__(ttft_ms=0, tokens_per_sec=0, jitter=0)
+        self.calls = []
+        self._log_lock = threading.Lock()
+
+    def complete(self, prompt, max_tokens=8000, temperature=0.3, prefix=None, json_mode=False):
+        with self._log_lock:
+            self.calls.append((prefix, prompt))
+        return super().complete(prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, json_mode=json_mode)
+
+    def generate_stream(self, prompt, max_tokens=8000, temperature=0.3, prefix=None, on_finish=None, json_mode=False):
+        with self._log_lock:
+            self.calls.append((prefix, prompt))
+        yield from super().generate_stream(
+            prompt, max_tokens=max_tokens, temperature=temperature, prefix=prefix, on_finish=on_finish, json_mode=json_mode
+        )
+
+
+def _service(history_tokens=100, keep_messages=2):
+    provider = CallLog()
+    service = ClaudeService(provider=provider)
+    service.chat_history_tokens = history_tokens
+    service.chat_keep_messages = keep_messages
+    service.get_retriever = lambda document_contents: BM25Index(chunk_documents(document_contents))
+    return service, provider
+
+
+def _turns(*questions):
+    history = []
+    for question in questions:
+        history.append({'role': 'user', 'content': question})
+        history.append({'role': 'assistant', 'content': f'关于{question}的回答。' * 5})
+    return history
+
+
+def test_short_history_unchanged():
+    service, provider = _service(history_tokens=10000)
+    history = _turns('投标保证金是多少？')
+    assert service.compact_chat_history(history, '- 已有摘要') == ('- 已有摘要', history)
+    # 消息数不超过保留条数时即使超出上限也不压缩
+    service.chat_history_tokens = 1
+    assert service.compact_chat_history(history) == ('', history)
+    assert provider.calls == []
+
+
+def test_compact_older_turns():
+    service, provider = _service()
+    history = _turns('投标保证金是多少？', '工期多少天？', '违约金怎么计算？')
+    summary, recent = service.compact_chat_history(history)
+
+    # 只保留最近的消息原文，较早的轮次合并为摘要
+    assert recent == history[-2:]
+    assert summary.splitlines() == ['- 用户问过：投标保证金是多少？', '- 用户问过：工期多少天？']
+    assert len(provider.calls) == 1
+    _, prompt = provider.calls[0]
+    assert '违约金怎么计算' not in prompt and '（无）' in prompt
+
+
+def test_summary_rolls_forward():
+    service, provider = _service()
+    summary, recent = service.compact_chat_history(_turns('投标保证金是多少？', '工期多少天？'))
+    history = recent + _turns('违约金怎么计算？', '需要哪些资质？')
+    summary, recent = service.compact_chat_history(history, summary)
+    # 新摘要包含原有摘要和新压缩的轮次，压缩后的历史重新回到上限以内
+    assert summary.splitlines() == [
+        '- 用户问过：投标保证金是多少？', '- 用户问过：工期多少天？', '- 用户问过：违约金怎么计算？'
+    ]
+    assert recent == history[-2:] and len(provider.calls) == 2
+
+
+def test_chat_prompt_layout():
+    service, provider = _service(history_tokens=10000)
+    history = _turns('投标保证金是多少？')
+    answer = service.chat('违约金怎么计算？', history, history_summary='- 用户问过：工期', document_contents=DOCUMENTS)
+    assert '万分之五' in answer
+
+    prefix, prompt = provider.calls[-1]
+    # 摘要、最近对话、检索片段依次放在当前问题之前
+    markers = ['=== 之前对话的摘要 ===', '=== 最近的对话 ===', '=== 招标文件相关原文 ===', '=== 当前问题 ===']
+    positions = [prompt.index(marker) for marker in markers]
+    assert positions == sorted(positions)
+    assert prompt.rstrip().endswith('违约金怎么计算？')
+
+    # 同一项目的问答前缀不随问题和历史变化（可命中前缀缓存）
+    service.chat('投标保证金是多少？', document_contents=DOCUMENTS)
+    assert provider.calls[-1][0] == prefix and '=== 关键信息 ===' in prefix
+
+
+def test_chat_without_project():
+    service, provider = _service(history_tokens=10000)
+    service.chat('你好', _turns('在吗？'))
+    prefix, prompt = provider.calls[-1]
+    assert prefix is None
+    assert prompt.startswith('=== 最近的对话 ===') and prompt.endswith('你好')
+
+
+def test_chat_compacts_long_history():
+    service, provider = _service()
+    history = _turns('投标保证金是多少？', '工期多少天？', '需要哪些资质？')
+    service.chat('违约金怎么计算？', history, document_contents=DOCUMENTS)
+    # 一次压缩调用 + 一次问答调用，问答提示词中较早的轮次只以摘要出现
+    assert len(provider.calls) == 2
+    _, prompt = provider.calls[-1]
+    assert '- 用户问过：投标保证金是多少？' in prompt and '关于投标保证金是多少？的回答' not in prompt
+    assert '关于需要哪些资质？的回答' in prompt
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_short_history_unchanged, test_compact_older_turns, test_summary_rolls_forward, test_chat_prompt_layout,
+        test_chat_without_project, test_chat_compacts_long_history
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
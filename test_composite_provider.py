@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+组合Provider测试：故障转移顺序、对冲请求与延迟分位数
+运行: python test_composite_provider.py（也可用 pytest 运行）
+"""
+import sys
+import time
+import threading
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.ai_provider import AIProvider, empty_usage
+from modules.composite_provider import CompositeProvider, LatencyHistogram
+
+
+class DelayedProvider(AIProvider):
+    """延迟指定秒数后返回文本或抛出异常，记录调用顺序"""
+
+    def __init__(self, name, delay=0.0, error=None, calls=None):
+        self.name = name
+        self.model = f'{name}-model'
+        self.delay = delay
+        self.error = error
+        self.calls = calls if calls is not None else []
+        self._lock = threading.Lock()
+
+    def _run(self):
+        with self._lock:
+            self.calls.append(self.name)
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return f'来自{self.name}'
+
+    def complete(self, prompt, max_tokens=8000, temperature=0.3, prefix=None, json_mode=False):
+        return {'text': self._run(), 'usage': empty_usage(), 'stop_reason': 'stop', 'model': self.model}
+
+    def generate_stream(self, prompt, max_tokens=8000, temperature=0.3, prefix=None, on_finish=None, json_mode=False):
+        text = self._run()
+        for char in text:
+            yield char
+        if on_finish:
+            on_finish({'usage': empty_usage(), 'stop_reason': 'stop', 'model': self.model})
+
+
+def _composite(*backends, hedge_delay=60.0):
+    return CompositeProvider(
+        list(backends), min_samples=5, default_hedge_delay=hedge_delay, default_ttft_hedge_delay=hedge_delay
+    )
+
+
+def test_failover_order():
+    calls = []
+    composite = _composite(
+        DelayedProvider('a', error=RuntimeError('a down'), calls=calls),
+        DelayedProvider('b', error=RuntimeError('b down'), calls=calls),
+        DelayedProvider('c', calls=calls),
+    )
+    assert composite.complete('问题')['text'] == '来自c'
+    assert calls == ['a', 'b', 'c']
+    assert [s['errors'] for s in composite.get_statistics()] == [1, 1, 0]
+    assert composite.get_statistics()[2]['wins'] == 1
+
+
+def test_all_backends_fail():
+    composite = _composite(
+        DelayedProvider('a', error=RuntimeError('a down')),
+        DelayedProvider('b', error=ValueError('b down')),
+    )
+    try:
+        composite.complete('问题')
+        assert False, '全部后端失败时应抛出异常'
+    except ValueError as e:
+        assert 'b down' in str(e)
+
+
+def test_no_hedge_when_primary_fast():
+    calls = []
+    composite = _composite(DelayedProvider('a', calls=calls), DelayedProvider('b', calls=calls), hedge_delay=5)
+    assert composite.complete('问题')['text'] == '来自a'
+    assert calls == ['a']
+    assert composite.stats[1] == {'calls': 0, 'wins': 0, 'errors': 0, 'hedges': 0}
+
+
+def test_hedge_slow_primary():
+    composite = _composite(DelayedProvider('a', delay=1.0), DelayedProvider('b'), hedge_delay=0.05)
+    started = time.monotonic()
+    result = composite.complete('问题')
+    elapsed = time.monotonic() - started
+    assert result['text'] == '来自b'
+    assert elapsed < 0.8, elapsed
+    assert composite.stats[1]['hedges'] == 1 and composite.stats[1]['wins'] == 1
+    assert composite.stats[0]['wins'] == 0
+
+
+def test_hedge_delay_from_histogram():
+    composite = _composite(DelayedProvider('a'), DelayedProvider('b'), hedge_delay=99)
+    # 样本不足时使用默认阈值
+    assert composite._hedge_delay(0, 'total', 1000) == 99
+    for seconds in (0.1, 0.2, 0.3, 0.4, 2.0):
+        composite._histogram(0, 'total', 1000).add(seconds)
+    assert composite._hedge_delay(0, 'total', 1000) == 2.0
+    # 不同输出规模分开统计
+    assert composite._hedge_delay(0, 'total', 8000) == 99
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(max_samples=3)
+    assert histogram.percentile(50) is None
+    for seconds in (5, 1, 2, 3):
+        histogram.add(seconds)
+    assert histogram.count == 3
+    assert histogram.percentile(0) == 1 and histogram.percentile(100) == 3
+
+
+def test_stream_failover():
+    calls = []
+    composite = _composite(
+        DelayedProvider('a', error=RuntimeError('a down'), calls=calls),
+        DelayedProvider('b', calls=calls),
+    )
+    finished = []
+    text = ''.join(composite.generate_stream('问题', on_finish=finished.append))
+    assert text == '来自b'
+    assert calls == ['a', 'b']
+    assert finished and finished[0]['model'] == 'b-model'
+
+
+def test_stream_hedge_slow_first_token():
+    composite = _composite(DelayedProvider('a', delay=1.0), DelayedProvider('b'), hedge_delay=0.05)
+    started = time.monotonic()
+    text = ''.join(composite.generate_stream('问题'))
+    assert text == '来自b'
+    assert time.monotonic() - started < 0.8
+    assert composite.stats[1]['hedges'] == 1 and composite.stats[1]['wins'] == 1
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_failover_order, test_all_backends_fail, test_no_hedge_when_primary_fast, test_hedge_slow_primary,
+        test_hedge_delay_from_histogram, test_latency_histogram, test_stream_failover, test_stream_hedge_slow_first_token
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+上下文窗口规划测试：按上下文窗口依次选择 直接发送 / 去重 / 压缩 / 分块摘录，分块不超过单次调用的窗口
+运行: python test_context_planner.py（也可用 pytest 运行）
+"""
+import os
+import sys
+sys.stdout.reconfigure(encoding='utf-8')
+
+os.environ['TOKEN_CALIBRATION_ENABLED'] = 'false'
+
+from modules.context_planner import ContextPlanner, context_window, dedupe_text, split_by_tokens
+from modules.text_processor import TextProcessor
+
+MODEL = 'mock-model'
+HEADER = '某市道路改造工程施工招标文件 第 页 共 页'
+CLAUSE = '第{index}条 投标人应具备市政公用工程施工总承包二级及以上资质，项目经理应具备一级注册建造师执业资格，工期{days}日历天。'
+
+
+def _document(clauses=40, repeated_header=True):
+    lines = []
+    for index in range(clauses):
+        if repeated_header:
+            lines.append(HEADER)
+        lines.append(CLAUSE.format(index=index, days=100 + index))
+    return '\n'.join(lines)
+
+
+def _plan(text, window, instruction_tokens=200, max_output_tokens=500, forced_ratio=None, **kwargs):
+    """在指定上下文窗口下规划（不使用安全余量，便于按token数构造场景）"""
+    os.environ['MODEL_CONTEXT_WINDOW'] = str(window)
+    try:
+        planner = ContextPlanner(safety_margin=0, map_output_tokens=300, **kwargs)
+        return planner.plan(text, MODEL, instruction_tokens, max_output_tokens, forced_ratio=forced_ratio)
+    finally:
+        os.environ.pop('MODEL_CONTEXT_WINDOW', None)
+
+
+def _tokens(text):
+    return TextProcessor.estimate_tokens(text, MODEL)
+
+
+def test_context_window():
+    assert context_window('openai/gpt-4o-mini') == 128000
+    assert context_window('claude-sonnet-4-20250514') == 200000
+    assert context_window('unknown-model') == context_window(None) == 128000
+    os.environ['MODEL_CONTEXT_WINDOW'] = '32000'
+    try:
+        assert context_window('claude-sonnet-4-20250514') == 32000
+    finally:
+        os.environ.pop('MODEL_CONTEXT_WINDOW', None)
+
+
+def test_dedupe_text():
+    text = f"{HEADER}\n正文一\n\n\n\n{HEADER}\n是\n是\n正文二"
+    # 重复的长行（页眉）去除，短行保留，连续空行合并
+    assert dedupe_text(text) == f"{HEADER}\n正文一\n\n是\n是\n正文二"
+
+
+def test_split_by_tokens():
+    text = _document(clauses=30, repeated_header=False)
+    parts = split_by_tokens(text, 400, MODEL)
+    assert len(parts) > 1
+    assert all(_tokens(part) <= 400 for part in parts)
+    assert '\n'.join(parts) == text
+    # 单行超长时按字符切分
+    long_line = '招' * 1000
+    pieces = split_by_tokens(long_line, 300, MODEL)
+    assert ''.join(pieces) == long_line and all(_tokens(piece) <= 300 for piece in pieces)
+
+
+def test_as_is_when_fits():
+    text = _document()
+    plan = _plan(text, _tokens(text) + 200 + 500)
+    assert plan['strategy'] == 'as_is' and plan['document_text'] == text and plan['parts'] == []
+    assert plan['budget_tokens'] == _tokens(text)
+
+
+def test_dedupe_when_duplicates_fill_window():
+    text = _document()
+    deduped_tokens = _tokens(dedupe_text(text))
+    assert deduped_tokens < _tokens(text)
+    plan = _plan(text, deduped_tokens + 700)
+    assert plan['strategy'] == 'dedupe'
+    assert plan['document_text'].count(HEADER) == 1
+    assert plan['final_tokens'] <= plan['budget_tokens']
+
+
+def test_compress_within_ratio():
+    text = _document()
+    deduped_tokens = _tokens(dedupe_text(text))
+    plan = _plan(text, int(deduped_tokens * 0.7) + 700)
+    assert plan['strategy'] == 'compress'
+    assert plan['final_tokens'] <= plan['budget_tokens']
+
+
+def test_map_reduce_when_window_too_small():
+    text = _document(clauses=80)
+    deduped = dedupe_text(text)
+    plan = _plan(text, 1500, min_compression_ratio=0.4)
+    assert plan['strategy'] == 'map_reduce' and plan['document_text'] == ''
+    # 每块加上指令和摘录输出仍能放入窗口，分块合起来就是去重后的全文
+    part_budget = 1500 - 200 - 300
+    assert len(plan['parts']) > 1
+    assert all(_tokens(part) <= part_budget for part in plan['parts'])
+    assert '\n'.join(plan['parts']) == deduped
+    # 汇总阶段的输入为各块摘录，不超过预算
+    assert plan['final_tokens'] == min(plan['budget_tokens'], len(plan['parts']) * 300)
+    # map 阶段的额外调用计入预计耗时
+    reduce_seconds = ContextPlanner().predict_seconds(MODEL, 'analysis', 200 + plan['final_tokens'], 500)
+    assert plan['predicted_seconds'] > reduce_seconds
+
+
+def test_forced_ratio():
+    text = _document()
+    plan = _plan(text, 10 ** 6, forced_ratio=0.5)
+    assert plan['strategy'] == 'compress' and 'COMPRESSION_RATIO' in plan['reason']
+
+
+def test_window_too_small_for_instructions():
+    try:
+        _plan(_document(), 600, instruction_tokens=200, max_output_tokens=500)
+        assert False, '指令和输出预留超过窗口时应报错'
+    except ValueError:
+        pass
+
+
+def test_plan_cached():
+    planner = ContextPlanner()
+    text = _document()
+    first = planner.plan(text, MODEL, 200, 500)
+    assert planner.plan(text, MODEL, 200, 500) is first
+    assert planner.plan(text, MODEL, 200, 600) is not first
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_context_window, test_dedupe_text, test_split_by_tokens, test_as_is_when_fits,
+        test_dedupe_when_duplicates_fill_window, test_compress_within_ratio, test_map_reduce_when_window_too_small,
+        test_forced_ratio, test_window_too_small_for_instructions, test_plan_cached
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+招标文件关键信息提取测试：日期、金额、期限、编号、资质的解析与多值取舍
+运行: python test_fact_extractor.py（也可用 pytest 运行）
+"""
+import sys
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.fact_extractor import (
+    FactExtractor, chinese_to_number, parse_datetime, parse_amount, parse_duration, parse_code, render_fact_sheet
+)
+
+TENDER = """
+第一章 招标公告
+项目编号：ZB-2025-0312（一标段）
+投标文件递交的截止时间：2025年11月12日（星期三）下午2时30分，逾期送达的投标文件不予受理。
+开标时间：同投标截止时间。
+投标保证金：人民币贰拾万元整（¥200,000.00元）。
+计划工期：一百八十日历天。
+投标人须具备建筑工程施工总承包一级及以上资质，并具有建筑装修装饰工程专业承包二级资质。
+"""
+
+NOTICE = """
+补充说明：递交投标文件截止时间 2025-11-12 14:30。
+开标日期：2025年11月12日14:30
+工期：180日历天
+"""
+
+
+def test_chinese_to_number():
+    assert chinese_to_number('贰拾万') == 200000
+    assert chinese_to_number('一百八十') == 180
+    assert chinese_to_number('十五') == 15
+    assert chinese_to_number('一千零五') == 1005
+    assert chinese_to_number('三亿五千万') == 350000000
+    assert chinese_to_number('二十A') is None
+
+
+def test_parse_datetime():
+    assert parse_datetime('：2025年11月12日（星期三）下午2时30分')[0] == '2025-11-12 14:30'
+    assert parse_datetime('为 2025-11-12 09:30 整')[0] == '2025-11-12 09:30'
+    assert parse_datetime('2025/3/5')[0] == '2025-03-05'
+    assert parse_datetime('2025年13月40日') is None
+    assert parse_datetime('另行通知') is None
+
+
+def test_parse_amount():
+    assert parse_amount('：人民币贰拾万元整')[0] == '200,000元'
+    assert parse_amount('为20万元')[0] == '200,000元'
+    assert parse_amount('：¥200,000.00元')[0] == '200,000元'
+    assert parse_amount('1,234.5元')[0] == '1,234.5元'
+    assert parse_amount('按招标文件规定') is None
+
+
+def test_parse_duration():
+    assert parse_duration('：一百八十日历天')[0] == '180日历天'
+    assert parse_duration('为6个月')[0] == '6个月'
+    assert parse_duration('90日')[0] == '90天'
+    # 日期中的年/月/日不是期限
+    assert parse_duration('自2025年3月1日起365天')[0] == '365天'
+
+
+def test_parse_code():
+    code, start, end = parse_code('：ZB-2025-0312（一标段）')
+    assert code == 'ZB-2025-0312'
+    assert '：ZB-2025-0312（一标段）'[start:end] == code
+    assert parse_code('为GC2025-01号')[0] == 'GC2025-01号'
+    assert parse_code('：见附件') is None
+
+
+def test_extract():
+    facts = FactExtractor().extract({'招标文件': TENDER, '补充说明': NOTICE})
+    assert list(facts) == ['bid_deadline', 'bid_opening', 'bid_bond', 'project_code', 'duration', 'qualification']
+    assert facts['bid_deadline']['value'] == '2025-11-12 14:30'
+    assert facts['bid_deadline']['alternatives'] == []
+    assert facts['bid_deadline']['source'] == '招标文件'
+    assert '截止时间' in facts['bid_deadline']['evidence']
+    assert facts['bid_bond']['value'] == '200,000元'
+    assert facts['project_code']['value'] == 'ZB-2025-0312'
+    assert facts['duration']['value'] == '180日历天'
+    assert facts['qualification']['value'] == '建筑工程施工总承包一级及以上；建筑装修装饰工程专业承包二级'
+    # 开标时间在招标文件中没有具体值（"同投标截止时间"），取补充说明中的值
+    assert facts['bid_opening']['source'] == '补充说明'
+
+
+def test_extract_conflicting_values():
+    contents = {
+        '招标文件': "投标保证金：20万元。\n投标保证金金额为人民币贰拾万元。",
+        '澄清': "投标保证金调整为10万元。",
+    }
+    fact = FactExtractor().extract(contents)['bid_bond']
+    assert fact['value'] == '200,000元'
+    assert fact['alternatives'] == ['100,000元']
+    sheet = render_fact_sheet({'bid_bond': fact}, with_evidence=True)
+    assert sheet.startswith('- 投标保证金：200,000元（另见：100,000元）')
+    assert '原文：' in sheet and '（招标文件）' in sheet
+
+
+def test_extract_empty():
+    assert FactExtractor().extract({'招标文件': '', '评分标准': '本项目无特殊要求。'}) == {}
+    assert render_fact_sheet({}) == ''
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_chinese_to_number, test_parse_datetime, test_parse_amount, test_parse_duration, test_parse_code,
+                 test_extract, test_extract_conflicting_values, test_extract_empty):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+LLM响应缓存测试：请求键、TTL过期和LRU淘汰
+运行: python test_llm_cache.py（也可用 pytest 运行）
+"""
+import sys
+import os
+import time
+import tempfile
+from datetime import datetime, timedelta
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.llm_cache import LLMCache, CacheEntry
+
+
+def _open(tmp, **kwargs):
+    return LLMCache(db_path=os.path.join(tmp, 'cache.db'), **kwargs)
+
+
+def test_make_key():
+    key = LLMCache.make_key('openai', 'gpt-4o', '提示词', 0.3, 1000)
+    assert len(key) == 64
+    assert key == LLMCache.make_key('openai', 'gpt-4o', '提示词', 0.3, 1000, prefix=None, json_mode=False)
+    # 空前缀与不带前缀相同；json_mode 关闭时不参与计算（开启JSON模式之前写入的键仍然有效）
+    assert key == LLMCache.make_key('openai', 'gpt-4o', '提示词', 0.3, 1000, prefix='')
+    assert key != LLMCache.make_key('openai', 'gpt-4o', '提示词', 0.3, 1000, json_mode=True)
+    # 任一字段不同键都不同
+    variants = [
+        ('claude', 'gpt-4o', '提示词', 0.3, 1000, None),
+        ('openai', 'gpt-4o-mini', '提示词', 0.3, 1000, None),
+        ('openai', 'gpt-4o', '提示词。', 0.3, 1000, None),
+        ('openai', 'gpt-4o', '提示词', 0.7, 1000, None),
+        ('openai', 'gpt-4o', '提示词', 0.3, 2000, None),
+        ('openai', 'gpt-4o', '提示词', 0.3, 1000, '前缀'),
+    ]
+    keys = {LLMCache.make_key(*fields[:5], prefix=fields[5]) for fields in variants}
+    assert len(keys) == len(variants) and key not in keys
+    # 前缀与指令的分界不同也不会冲突
+    assert LLMCache.make_key('openai', 'm', 'BC', 0.3, 10, prefix='A') != \
+        LLMCache.make_key('openai', 'm', 'C', 0.3, 10, prefix='AB')
+
+
+def test_get_set():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = _open(tmp)
+        assert cache.get('missing') is None
+        cache.set('key', '')  # 空输出不缓存
+        assert cache.get('key') is None
+        cache.set('key', '结果', 'openai', 'gpt-4o')
+        cache.set('key', '新结果', 'openai', 'gpt-4o')
+        assert cache.get('key') == '新结果'
+        assert (cache.hits, cache.misses) == (1, 2)
+        cache.clear()
+        assert cache.get('key') is None
+        cache.engine.dispose()
+
+
+def test_ttl_expiry():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = _open(tmp, ttl_hours=1)
+        cache.set('fresh', '新')
+        cache.set('stale', '旧')
+        session = cache.Session()
+        session.query(CacheEntry).filter_by(key='stale').update(
+            {'create_time': datetime.now() - timedelta(hours=2)}
+        )
+        session.commit()
+        session.close()
+
+        assert cache.get('stale') is None
+        assert cache.get('fresh') == '新'
+        session = cache.Session()
+        assert [row.key for row in session.query(CacheEntry).all()] == ['fresh']  # 过期条目读取时删除
+        session.close()
+        cache.engine.dispose()
+
+        # ttl_hours <= 0 永不过期
+        cache = LLMCache(db_path=os.path.join(tmp, 'forever.db'), ttl_hours=0)
+        cache.set('old', '旧')
+        session = cache.Session()
+        session.query(CacheEntry).update({'create_time': datetime.now() - timedelta(days=365)})
+        session.commit()
+        session.close()
+        assert cache.get('old') == '旧'
+        cache.engine.dispose()
+
+
+def test_lru_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = _open(tmp, max_entries=3)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key.upper())
+            time.sleep(0.01)
+        assert cache.get('a') == 'A'  # 访问后 a 成为最近使用
+        time.sleep(0.01)
+        cache.set('d', 'D')
+        assert cache.get('b') is None
+        assert [cache.get(key) for key in ('a', 'c', 'd')] == ['A', 'C', 'D']
+
+        # 写入时同时清理过期条目
+        session = cache.Session()
+        session.query(CacheEntry).filter_by(key='c').update({'create_time': datetime.now() - timedelta(days=30)})
+        session.commit()
+        session.close()
+        cache.set('e', 'E')
+        assert cache.get_statistics()['entries'] == 3
+        assert cache.get('c') is None
+        cache.engine.dispose()
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_make_key, test_get_set, test_ttl_expiry, test_lru_eviction):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+调用指标测试：分组汇总与CSV导出
+运行: python test_metrics.py（也可用 pytest 运行）
+"""
+import sys
+import io
+import csv
+import tempfile
+import os
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.metrics import MetricsStore, percentile, record_context, get_record_context
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([10, 20, 30, 40], 50) in (20, 25, 30)
+    assert percentile([5], 95) == 5
+
+
+def test_record_context():
+    assert get_record_context() is None
+    with record_context(7):
+        assert get_record_context() == 7
+    assert get_record_context() is None
+
+
+def test_to_csv_mixed_rows():
+    # 与调用统计页一致：按任务汇总的行 + 按项目汇总的行（多出 record_id/project_name）一起导出
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MetricsStore(db_path=os.path.join(tmp, 'metrics.db'))
+        usage = {'prompt_tokens': 100, 'completion_tokens': 20}
+        store.record('analysis', 'mock', 'mock-model', usage=usage, latency_ms=120, record_id=1)
+        store.record('chat', 'mock', 'mock-model', usage=usage, latency_ms=80, record_id=2)
+        store.record('chat', 'mock', 'mock-model', cache_hit=True, record_id=2)
+
+        calls = store.get_calls()
+        by_task = MetricsStore.summarize(calls, 'task')
+        by_record = [dict(row, project_name=f"项目{row['record_id']}") for row in MetricsStore.summarize(calls, 'record_id')]
+        text = MetricsStore.to_csv(by_task + by_record)
+        store.engine.dispose()
+
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert len(rows) == len(by_task) + len(by_record)
+    assert {'task', 'record_id', 'project_name', 'calls'} <= set(rows[0])
+    chat = next(row for row in rows if row['task'] == 'chat')
+    assert chat['calls'] == '2' and chat['cache_hits'] == '1' and chat['project_name'] == ''
+    assert any(row['project_name'] == '项目2' for row in rows)
+
+
+def test_to_csv_empty():
+    assert MetricsStore.to_csv([]) == ''
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_percentile, test_record_context, test_to_csv_mixed_rows, test_to_csv_empty):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+模拟Provider测试：按真实提示词模板输出对应结构、截断与续写、前缀缓存用量和错误注入
+运行: python test_mock_provider.py（也可用 pytest 运行）
+"""
+import sys
+import json
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.mock_provider import MockProvider, MockAPIError
+from modules.provider_middleware import is_retryable
+from modules.section_packer import parse_packed_output
+from modules.prompts import (
+    TECHNICAL_PROPOSAL_CONTEXT_PREFIX, TECHNICAL_PROPOSAL_OUTLINE_SUFFIX, TECHNICAL_PROPOSAL_SECTION_SUFFIX,
+    TECHNICAL_PROPOSAL_PACKED_SECTIONS_SUFFIX, TECHNICAL_PROPOSAL_PACKED_SECTION_ITEM,
+    CHAT_HISTORY_SUMMARY_SUFFIX, OUTPUT_CONTINUATION_SUFFIX
+)
+
+PREFIX = TECHNICAL_PROPOSAL_CONTEXT_PREFIX.format(project_info='某道路改造工程', evaluation_criteria='施工组织设计 20分')
+
+
+def _mock(**kwargs):
+    options = dict(ttft_ms=0, tokens_per_sec=0, jitter=0)
+    options.update(kwargs)
+    return MockProvider(**options)
+
+
+def _section_prompt(title, word_count=300):
+    return TECHNICAL_PROPOSAL_SECTION_SUFFIX.format(
+        section_title=title, word_count=word_count, section_requirements='按评审标准撰写'
+    )
+
+
+def test_outline_json():
+    mock = _mock()
+    text = mock.complete(TECHNICAL_PROPOSAL_OUTLINE_SUFFIX, prefix=PREFIX, json_mode=True)['text']
+    outline = json.loads(text)['outline']
+    assert outline and all(chapter['level'] == 1 and chapter['children'] for chapter in outline)
+    assert all('word_count' in child for chapter in outline for child in chapter['children'])
+    # 非 json_mode 时以代码块包裹
+    fenced = mock.complete(TECHNICAL_PROPOSAL_OUTLINE_SUFFIX, prefix=PREFIX)['text']
+    assert fenced.startswith('```json\n') and json.loads(fenced[8:-4]) == json.loads(text)
+
+
+def test_section_title_and_length():
+    text = _mock().complete(_section_prompt('主要施工方法', 500), prefix=PREFIX)['text']
+    assert text.startswith('# 主要施工方法\n')
+    assert len(text) >= 500
+
+
+def test_packed_sections_parse_back():
+    titles = ['工程概况', '重点、难点', '质量保证措施']
+    items = "\n".join(
+        TECHNICAL_PROPOSAL_PACKED_SECTION_ITEM.format(
+            index=index, section_title=title, word_count=300, section_requirements='按评审标准撰写'
+        )
+        for index, title in enumerate(titles, 1)
+    )
+    prompt = TECHNICAL_PROPOSAL_PACKED_SECTIONS_SUFFIX.format(count=len(titles), sections_list=items)
+    parsed = parse_packed_output(_mock().complete(prompt, prefix=PREFIX)['text'], titles)
+    assert sorted(parsed) == [0, 1, 2]
+    assert all(parsed[index].startswith(f'# {title}') for index, title in enumerate(titles))
+
+
+def test_deterministic_output():
+    first, second = _mock(seed=1), _mock(seed=2)
+    prompt = _section_prompt('工程概况')
+    assert first.complete(prompt, prefix=PREFIX)['text'] == second.complete(prompt, prefix=PREFIX)['text']
+    assert first.complete(prompt, prefix=PREFIX)['text'] != first.complete(prompt, prefix=PREFIX + '补充')['text']
+
+
+def test_stream_matches_complete():
+    mock = _mock()
+    prompt = _section_prompt('工程概况')
+    finished = []
+    streamed = ''.join(mock.generate_stream(prompt, prefix=PREFIX, on_finish=finished.append))
+    assert streamed == mock.complete(prompt, prefix=PREFIX)['text']
+    assert finished[0]['stop_reason'] == 'stop' and finished[0]['usage']['completion_tokens'] > 0
+
+
+def test_prefix_cache_usage():
+    mock = _mock()
+    first = mock.complete(_section_prompt('工程概况'), prefix=PREFIX)['usage']
+    second = mock.complete(_section_prompt('重点、难点'), prefix=PREFIX)['usage']
+    assert first['cache_write_tokens'] > 0 and first['cache_read_tokens'] == 0
+    assert second['cache_read_tokens'] == first['cache_write_tokens'] and second['cache_write_tokens'] == 0
+
+
+def test_truncation_and_continuation():
+    mock = _mock()
+    prompt = _section_prompt('主要施工方法', 1000)
+    full = mock.complete(prompt, prefix=PREFIX)['text']
+    truncated = mock.complete(prompt, prefix=PREFIX, max_tokens=100)
+    assert truncated['stop_reason'] == 'length' and full.startswith(truncated['text'])
+
+    partial = truncated['text']
+    continuation = mock.complete(OUTPUT_CONTINUATION_SUFFIX.format(prompt=prompt, partial=partial), prefix=PREFIX)['text']
+    # 续写会重复中断处的最后几个字，拼接时由调用方去重
+    overlap = len(partial) - (len(full) - len(continuation))
+    assert 0 < overlap <= 10 and partial + continuation[overlap:] == full
+
+
+def test_chat_summary():
+    prompt = CHAT_HISTORY_SUMMARY_SUFFIX.format(
+        summary='- 用户问过：工期多少天',
+        messages='用户：投标保证金是多少？\n助手：50万元。'
+    )
+    text = _mock().complete(prompt)['text']
+    assert text.splitlines() == ['- 用户问过：工期多少天', '- 用户问过：投标保证金是多少？']
+
+
+def test_error_injection():
+    mock = _mock(error_rate=1.0)
+    try:
+        mock.complete(_section_prompt('工程概况'))
+        assert False, '错误率为1时应抛出模拟错误'
+    except MockAPIError as e:
+        assert e.status_code == 429 and is_retryable(e)
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_outline_json, test_section_title_and_length, test_packed_sections_parse_back, test_deterministic_output,
+        test_stream_matches_complete, test_prefix_cache_usage, test_truncation_and_continuation, test_chat_summary,
+        test_error_injection
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+任务级模型路由测试：路由配置解析、环境变量/配置文件加载与Provider创建
+运行: python test_model_router.py（也可用 pytest 运行）
+"""
+import os
+import sys
+import json
+import tempfile
+sys.stdout.reconfigure(encoding='utf-8')
+
+os.environ['MOCK_TTFT_MS'] = '0'
+os.environ['MOCK_TOKENS_PER_SEC'] = '0'
+
+from modules.ai_provider import AIProvider
+from modules.composite_provider import CompositeProvider
+from modules.model_router import ModelRouter, parse_route, TASKS
+
+
+class DefaultProvider(AIProvider):
+    name = 'default'
+    model = 'default-model'
+
+
+def _clear_route_env():
+    for task in TASKS:
+        os.environ.pop(f'MODEL_ROUTE_{task.upper()}', None)
+    os.environ.pop('MODEL_ROUTES_FILE', None)
+
+
+def test_parse_route():
+    assert parse_route('openai:openai/gpt-4o-mini') == [('openai', 'openai/gpt-4o-mini')]
+    # 模型名中的冒号保留；provider类型统一小写；模型名可省略
+    assert parse_route(' Claude:claude-3-5-haiku-latest , mock , openai:') == [
+        ('claude', 'claude-3-5-haiku-latest'), ('mock', None), ('openai', None)
+    ]
+    assert parse_route('openai:qwen2.5:7b') == [('openai', 'qwen2.5:7b')]
+    assert parse_route('') == [] and parse_route(' , ,') == []
+
+
+def test_unrouted_task_uses_default():
+    default = DefaultProvider()
+    router = ModelRouter(default, {'criteria': [('mock', 'mock-mini')]})
+    assert router.provider_for('section') is default
+    assert router.provider_for('unknown-task') is default
+
+
+def test_single_candidate_route():
+    router = ModelRouter(DefaultProvider(), {'criteria': [('mock', 'mock-mini')]})
+    provider = router.provider_for('criteria')
+    assert (provider.name, provider.model) == ('mock', 'mock-mini')
+    # 按需创建后复用
+    assert router.provider_for('criteria') is provider
+    assert provider.complete('评审标准')['text']
+
+
+def test_multiple_candidates_compose():
+    router = ModelRouter(DefaultProvider(), {'outline': [('mock', 'first'), ('mock', 'second')]})
+    provider = router.provider_for('outline')
+    assert isinstance(provider, CompositeProvider)
+    assert provider.model == 'mock:first+mock:second'
+
+
+def test_from_env_file_and_overrides():
+    _clear_route_env()
+    with tempfile.TemporaryDirectory() as tmp:
+        routes_file = os.path.join(tmp, 'model_routes.json')
+        with open(routes_file, 'w', encoding='utf-8') as f:
+            json.dump({'criteria': 'mock:from-file', 'section': ['mock:a', 'openai:gpt-4o']}, f)
+        os.environ['MODEL_ROUTES_FILE'] = routes_file
+        # 环境变量优先于配置文件
+        os.environ['MODEL_ROUTE_CRITERIA'] = 'mock:from-env'
+        try:
+            router = ModelRouter.from_env(DefaultProvider())
+        finally:
+            _clear_route_env()
+
+    assert router.routes == {
+        'criteria': [('mock', 'from-env')],
+        'section': [('mock', 'a'), ('openai', 'gpt-4o')],
+    }
+
+
+def test_from_env_missing_file():
+    _clear_route_env()
+    os.environ['MODEL_ROUTES_FILE'] = os.path.join(tempfile.gettempdir(), 'no_such_routes.json')
+    try:
+        router = ModelRouter.from_env(DefaultProvider())
+    finally:
+        _clear_route_env()
+    assert router.routes == {}
+
+
+def test_describe():
+    router = ModelRouter(DefaultProvider(), {'chat': [('mock', 'mock-chat')]})
+    rows = {row['task']: row for row in router.describe()}
+    assert set(rows) == set(TASKS)
+    assert rows['chat']['routed'] and rows['chat']['model'] == 'mock-chat'
+    assert not rows['analysis']['routed'] and rows['analysis']['provider'] == 'default'
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_parse_route, test_unrouted_task_uses_default, test_single_candidate_route, test_multiple_candidates_compose,
+        test_from_env_file_and_overrides, test_from_env_missing_file, test_describe
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+流式目录解析测试：逐块输入时返回的章节应与完整解析结果一致（与JSON键顺序无关）
+运行: python test_outline_stream.py（也可用 pytest 运行）
+"""
+import sys
+import json
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.outline_stream import IncrementalOutlineParser
+from modules.ai_service import extract_sections_from_outline
+
+OUTLINE = {
+    'outline': [
+        {'title': '第一章 项目概述', 'children': [
+            {'title': '1.1 项目背景', 'word_count': 800, 'description': '背景与目标'},
+            {'title': '1.2 建设内容', 'word_count': 1200, 'description': ''},
+        ]},
+        {'title': '第二章 技术方案', 'word_count': 500, 'description': '总体说明', 'children': [
+            {'title': '2.1 总体架构', 'children': [
+                {'title': '2.1.1 逻辑架构', 'word_count': 1500, 'description': '分层设计'},
+                {'title': '2.1.2 部署架构', 'word_count': 1000, 'description': '含"双活"部署'},
+            ]},
+            {'title': '2.2 关键技术', 'word_count': 2000, 'description': ''},
+        ]},
+        {'title': '第三章 服务承诺', 'word_count': 600, 'description': ''},
+    ]
+}
+
+KEY_ORDERS = {
+    'title_first': ['title', 'word_count', 'description', 'children'],
+    'children_first': ['children', 'word_count', 'description', 'title'],
+    'word_count_first': ['word_count', 'children', 'title', 'description'],
+}
+
+
+def _reorder(node, order):
+    """按指定顺序重排对象的键"""
+    if isinstance(node, list):
+        return [_reorder(item, order) for item in node]
+    if isinstance(node, dict):
+        keys = sorted(node, key=lambda k: order.index(k) if k in order else -1)
+        return {key: _reorder(node[key], order) for key in keys}
+    return node
+
+
+def _stream(text, chunk_size):
+    parser = IncrementalOutlineParser()
+    sections = []
+    for start in range(0, len(text), chunk_size):
+        sections.extend(parser.feed(text[start:start + chunk_size]))
+    return parser, sections
+
+
+def test_key_orders():
+    expected = extract_sections_from_outline(OUTLINE)
+    for name, order in KEY_ORDERS.items():
+        text = json.dumps(_reorder(OUTLINE, order), ensure_ascii=False, indent=2)
+        for chunk_size in (1, 7, len(text)):
+            parser, sections = _stream(text, chunk_size)
+            assert sections == expected, f"{name} / chunk {chunk_size}: {[s['title'] for s in sections]}"
+            assert parser.result() == OUTLINE
+
+
+def test_surrounding_text():
+    # 模型在JSON前后附带说明文字、代码块标记
+    text = "以下是目录：\n```json\n" + json.dumps(OUTLINE, ensure_ascii=False) + "\n```\n请确认。"
+    parser, sections = _stream(text, 5)
+    assert sections == extract_sections_from_outline(OUTLINE)
+    assert parser.result() == OUTLINE
+
+
+def test_incomplete():
+    text = json.dumps(OUTLINE, ensure_ascii=False)
+    parser, sections = _stream(text[:len(text) // 2], 3)
+    assert parser.result() is None
+    expected = extract_sections_from_outline(OUTLINE)
+    assert sections == expected[:len(sections)]
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_key_orders, test_surrounding_text, test_incomplete):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
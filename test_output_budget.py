@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+输出预算与续写拼接测试
+运行: python test_output_budget.py（也可用 pytest 运行）
+"""
+import sys
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.output_budget import is_truncated, section_output_tokens, continuation_delta, ContinuationStitcher
+
+PREVIOUS = "## 2.1 总体架构\n\n系统采用分层架构，包括数据采集层、数据处理层和应用服务层。\n数据处理层负责对采集到的"
+
+
+def test_is_truncated():
+    assert is_truncated('length') and is_truncated('max_tokens')
+    assert not is_truncated('stop') and not is_truncated('end_turn') and not is_truncated(None)
+
+
+def test_section_output_tokens():
+    small = section_output_tokens(300)
+    large = section_output_tokens(3000)
+    assert small == 1024  # 不低于最小预算
+    assert small < large <= 8000
+    assert large % 256 == 0
+    assert section_output_tokens(100000) == 8000
+    assert section_output_tokens(100000, maximum=4000) == 4000
+    assert section_output_tokens('约一千字') == section_output_tokens(1000)
+
+
+def test_continuation_delta_overlap():
+    # 续写重复了中断处的结尾
+    continuation = "数据处理层负责对采集到的原始数据进行清洗和转换。"
+    assert continuation_delta(PREVIOUS, continuation) == "原始数据进行清洗和转换。"
+    # 没有重复时原样追加
+    assert continuation_delta(PREVIOUS, "原始数据进行清洗。") == "原始数据进行清洗。"
+    # 短重叠（少于 min_overlap）不删除
+    assert continuation_delta("结果如下：表", "表格一") == "表格一"
+
+
+def test_continuation_delta_restarted_line():
+    # 续写从中断的那一行行首重新开始（前面带空白）
+    previous = "第一行内容\n  数据处理层负责对采集到的原始"
+    continuation = "\n数据处理层负责对采集到的原始数据进行清洗。"
+    assert continuation_delta(previous, continuation, min_overlap=50) == continuation
+    assert continuation_delta(previous, continuation) == "数据进行清洗。"
+
+
+def test_stitcher_streaming():
+    continuation = "数据处理层负责对采集到的原始数据进行清洗和转换。" + "后续内容。" * 100
+    expected = continuation_delta(PREVIOUS, continuation)
+    for size in (1, 4, 50):
+        stitcher = ContinuationStitcher(PREVIOUS, max_overlap=30)
+        output = ''
+        for start in range(0, len(continuation), size):
+            output += stitcher.feed(continuation[start:start + size])
+        output += stitcher.flush()
+        assert output == expected, size
+        assert PREVIOUS + output == PREVIOUS + "原始数据进行清洗和转换。" + "后续内容。" * 100
+
+
+def test_stitcher_short_continuation():
+    # 续写很短、缓冲未满就结束
+    stitcher = ContinuationStitcher(PREVIOUS)
+    assert stitcher.feed("数据处理层负责对采集到的") == ''
+    assert stitcher.flush() == ''
+    assert stitcher.flush() == ''
+    stitcher = ContinuationStitcher(PREVIOUS)
+    assert stitcher.feed("数据。") == ''
+    assert stitcher.flush() == "数据。"
+    assert stitcher.feed("之后的片段") == "之后的片段"
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_is_truncated, test_section_output_tokens, test_continuation_delta_overlap,
+                 test_continuation_delta_restarted_line, test_stitcher_streaming, test_stitcher_short_continuation):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
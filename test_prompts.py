@@ -7,7 +7,7 @@ from modules.prompts import TECHNICAL_PROPOSAL_OUTLINE_PROMPT
 # Test formatting
 try:
     result = TECHNICAL_PROPOSAL_OUTLINE_PROMPT.format(
-        project_requirements="test",
+        project_info="test",
         evaluation_criteria="test"
     )
     print("SUCCESS: TECHNICAL_PROPOSAL_OUTLINE_PROMPT can be formatted")
@@ -16,3 +16,14 @@ except KeyError as e:
     print(f"ERROR: Missing placeholder - {e}")
 except Exception as e:
     print(f"ERROR: {e}")
+
+# 目录后缀不经 .format() 直接发送，JSON示例不能带转义花括号
+from modules.prompts import TECHNICAL_PROPOSAL_OUTLINE_SUFFIX
+import json
+try:
+    assert '{{' not in TECHNICAL_PROPOSAL_OUTLINE_SUFFIX and '}}' not in TECHNICAL_PROPOSAL_OUTLINE_SUFFIX
+    json.loads(TECHNICAL_PROPOSAL_OUTLINE_SUFFIX.split('```json')[1].split('```')[0])
+    assert result.endswith(TECHNICAL_PROPOSAL_OUTLINE_SUFFIX)
+    print("SUCCESS: TECHNICAL_PROPOSAL_OUTLINE_SUFFIX contains a valid JSON example")
+except Exception as e:
+    print(f"ERROR: TECHNICAL_PROPOSAL_OUTLINE_SUFFIX - {e!r}")
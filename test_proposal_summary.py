@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+一致性模式测试：滚动摘要的提取与token上限，分批生成时各批提示词附带前文摘要，同名章节互不覆盖
+运行: python test_proposal_summary.py（也可用 pytest 运行）
+"""
+import os
+import sys
+import time
+import threading
+sys.stdout.reconfigure(encoding='utf-8')
+
+# 测试不写入仓库下的 data/ 目录
+for name, value in {
+    'LLM_CACHE_ENABLED': 'false', 'METRICS_ENABLED': 'false', 'RETRIEVAL_ENABLED': 'false',
+    'TOKEN_CALIBRATION_ENABLED': 'false', 'SECTION_LIBRARY_ENABLED': 'false',
+    'MOCK_TTFT_MS': '0', 'MOCK_TOKENS_PER_SEC': '0', 'LLM_SCHEDULER_ENABLED': 'false',
+}.items():
+    os.environ[name] = value
+
+from modules.mock_provider import MockProvider
+from modules.ai_service import ClaudeService
+from modules.proposal_summary import ProposalSummary
+from modules.text_processor import TextProcessor
+
+CONSISTENCY_MARKER = '=== 前文已确定的关键信息 ==='
+
+
+class PromptLog(MockProvider):
+    """记录每次调用提示词的模拟Provider"""
+
+    def __init__(self):
+        super().__init__(ttft_ms=0, tokens_per_sec=0, jitter=0)
+        self.prompts = []
+        self._log_lock = threading.Lock()
+
+    def complete(self, prompt, *args, **kwargs):
+        with self._log_lock:
+            self.prompts.append(prompt)
+        return super().complete(prompt, *args, **kwargs)
+
+    def generate_stream(self, prompt, *args, **kwargs):
+        with self._log_lock:
+            self.prompts.append(prompt)
+        yield from super().generate_stream(prompt, *args, **kwargs)
+
+
+def _sections(*titles):
+    return [{'title': title, 'word_count': 300, 'description': f'{title}要求'} for title in titles]
+
+
+def test_every_call_after_first_has_summary():
+    provider = PromptLog()
+    service = ClaudeService(provider=provider)
+    sections = _sections('工程概况', '施工部署', '主要施工方法', '质量保证措施', '安全文明施工')
+    results = list(service.generate_sections_consistently(sections, '项目信息', '评审标准', max_workers=3, use_cache=False))
+
+    assert len(results) == len(sections) and all(result['content'] for result in results)
+    assert len(provider.prompts) == len(sections)
+    # 第一个调用单独成批，没有前文；其后所有调用都带摘要
+    assert CONSISTENCY_MARKER not in provider.prompts[0]
+    assert all(CONSISTENCY_MARKER in prompt for prompt in provider.prompts[1:])
+
+
+def test_existing_summary_used_from_first_batch():
+    provider = PromptLog()
+    service = ClaudeService(provider=provider)
+    summary = ProposalSummary.from_sections({'工期计划': '本工程总工期180日历天，确保按期竣工。'})
+    list(service.generate_sections_consistently(
+        _sections('工程概况', '施工部署'), '项目信息', '评审标准', max_workers=2, use_cache=False, summary=summary
+    ))
+    assert all(CONSISTENCY_MARKER in prompt and '180日历天' in prompt for prompt in provider.prompts)
+
+
+class SlowFailure(PromptLog):
+    """建议字数为600的章节延迟后失败（晚于同批其他章节完成）"""
+
+    def complete(self, prompt, *args, **kwargs):
+        if '**建议字数**：600字' in prompt:
+            time.sleep(0.2)
+            raise ValueError('模拟生成失败')
+        return super().complete(prompt, *args, **kwargs)
+
+
+def test_duplicate_titles_kept_apart():
+    service = ClaudeService(provider=SlowFailure())
+    summary = ProposalSummary.from_sections({'工期计划': '本工程总工期180日历天。'})
+    # 不同章下的同名小节在同一批：后完成的失败结果不能覆盖先完成的成功结果
+    sections = _sections('工程概况', '工程概况')
+    sections[1]['word_count'] = 600
+    results = list(service.generate_sections_consistently(
+        sections, '项目信息', '评审标准', max_workers=2, use_cache=False, summary=summary
+    ))
+
+    assert [bool(result['content']) for result in results] == [True, False]
+    assert '工程概况' in summary.sections
+
+
+def test_summary_stays_within_budget():
+    summary = ProposalSummary(max_tokens=200)
+    for index in range(40):
+        summary.update(f'第{index}节', f'项目经理张{index}全程驻场。投入挖掘机{index + 2}台。第{index}阶段工期{index + 10}天。确保合格率{index}%。')
+    assert TextProcessor.estimate_tokens(summary.render(), summary.model) <= 200
+    # 超出预算时保留最先确定的信息
+    assert '张0' in summary.render() and '张39' not in summary.render()
+    assert '第39节' in summary.render()
+
+
+def test_summary_lists_recent_titles():
+    summary = ProposalSummary(max_tokens=5000)
+    for index in range(ProposalSummary.MAX_TITLES + 5):
+        summary.update(f'小节{index:02d}', f'工期{index + 1}天。')
+    first_line = summary.render().splitlines()[0]
+    assert first_line.startswith(f'已完成章节：（共{ProposalSummary.MAX_TITLES + 5}个，列出最近{ProposalSummary.MAX_TITLES}个）小节05')
+    assert '小节04' not in first_line
+
+
+def test_summary_extraction():
+    summary = ProposalSummary()
+    assert summary.render() == '' and len(summary) == 0
+    summary.update('施工部署', '## 人员\n- **项目经理**：李工，一级建造师。\n本工程工期180日历天。这是一段没有关键信息的普通论述。')
+    # 同一章节只计入一次；相同信息只保留最先出现的表述
+    summary.update('施工部署', '项目经理：王工。')
+    summary.update('进度计划', '本工程工期180日历天。')
+    rendered = summary.render()
+    assert rendered.startswith('已完成章节：施工部署')
+    assert '项目经理**' not in rendered and '- 项目经理：李工，一级建造师' in rendered
+    assert '王工' not in rendered and rendered.count('180日历天') == 1
+    assert '普通论述' not in rendered
+    assert summary.sections == ['施工部署', '进度计划'] and len(summary) == 2
+
+
+def test_from_sections_order():
+    summary = ProposalSummary.from_sections({'第一章': '工期120天。', '第二章': '工期150天。'})
+    assert summary.sections == ['第一章', '第二章']
+    assert summary.render().index('120天') < summary.render().index('150天')
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_every_call_after_first_has_summary, test_existing_summary_used_from_first_batch, test_duplicate_titles_kept_apart,
+        test_summary_stays_within_budget, test_summary_lists_recent_titles, test_summary_extraction, test_from_sections_order
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
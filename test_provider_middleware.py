@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Provider中间件测试：令牌桶、退避、重试与熔断
+运行: python test_provider_middleware.py（也可用 pytest 运行）
+"""
+import sys
+import time
+import threading
+from types import SimpleNamespace
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.ai_provider import AIProvider, empty_usage
+from modules.provider_middleware import (
+    TokenBucket, CircuitBreaker, CircuitOpenError, ResilientProvider, is_retryable, get_retry_after
+)
+
+
+class StatusError(Exception):
+    """带HTTP状态码的模拟接口错误"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class ScriptedProvider(AIProvider):
+    """按脚本依次抛出异常或返回结果"""
+
+    def __init__(self, script, name='scripted'):
+        self.script = list(script)
+        self.name = name
+        self.model = 'scripted-model'
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        step = self.script.pop(0) if self.script else 'ok'
+        if isinstance(step, BaseException):
+            raise step
+        return step
+
+    def complete(self, prompt, max_tokens=8000, temperature=0.3, prefix=None, json_mode=False):
+        return {'text': self._next(), 'usage': empty_usage(), 'stop_reason': 'stop', 'model': self.model}
+
+    def generate_stream(self, prompt, max_tokens=8000, temperature=0.3, prefix=None, on_finish=None, json_mode=False):
+        text = self._next()
+        for char in text:
+            yield char
+
+
+def _resilient(script, max_retries=3, breaker=None):
+    provider = ResilientProvider(ScriptedProvider(script), max_retries=max_retries, base_delay=0.001, max_delay=0.01)
+    provider.request_bucket = provider.token_bucket = None
+    provider.breaker = breaker or CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    return provider
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate_per_minute=600, capacity=2)  # 每秒补充10个
+    assert bucket.acquire(1) == 0 and bucket.acquire(1) == 0
+    started = time.monotonic()
+    waited = bucket.acquire(1)
+    elapsed = time.monotonic() - started
+    assert 0.05 <= waited <= 0.2 and elapsed >= 0.05, (waited, elapsed)
+    # 超过容量的请求按容量计，不会永久阻塞
+    assert TokenBucket(rate_per_minute=60000, capacity=5).acquire(100) == 0
+
+
+def test_retry_classification():
+    assert is_retryable(StatusError(429)) and is_retryable(StatusError(529)) and is_retryable(StatusError(503))
+    assert not is_retryable(StatusError(400)) and not is_retryable(StatusError(401))
+    assert is_retryable(APIConnectionError()) and is_retryable(TimeoutError())
+    assert not is_retryable(ValueError())
+    assert get_retry_after(StatusError(429, {'retry-after': '3'})) == 3
+    assert get_retry_after(StatusError(429, {'retry-after-ms': '1500'})) == 1.5
+    assert get_retry_after(StatusError(429)) is None
+
+
+def test_backoff():
+    provider = ResilientProvider(ScriptedProvider([]), base_delay=1.0, max_delay=8.0)
+    for attempt in range(6):
+        delay = provider._backoff(attempt, StatusError(503))
+        assert 0 <= delay <= min(8.0, 2 ** attempt)
+    assert provider._backoff(0, StatusError(429, {'retry-after': '5'})) == 5
+    assert provider._backoff(0, StatusError(429, {'retry-after': '120'})) == 8.0
+
+
+def test_retries_then_succeeds():
+    provider = _resilient([StatusError(503), APIConnectionError(), 'done'])
+    assert provider.complete('提示词')['text'] == 'done'
+    assert provider.inner.calls == 3
+    assert provider.breaker.state == 'closed' and provider.breaker.failures == 0
+
+    # 不可重试的错误直接抛出
+    provider = _resilient([StatusError(400), 'done'])
+    try:
+        provider.complete('提示词')
+        raise AssertionError("应抛出异常")
+    except StatusError as e:
+        assert e.status_code == 400
+    assert provider.inner.calls == 1
+
+    # 重试次数用尽
+    provider = _resilient([StatusError(503)] * 5, max_retries=2, breaker=CircuitBreaker(failure_threshold=10))
+    try:
+        provider.complete('提示词')
+        raise AssertionError("应抛出异常")
+    except StatusError:
+        pass
+    assert provider.inner.calls == 3
+
+
+def test_stream_retry():
+    # 收到第一个片段之前的失败重试，之后的失败直接抛出
+    provider = _resilient([StatusError(429), 'abc'])
+    assert "".join(provider.generate_stream('提示词')) == 'abc'
+    assert provider.inner.calls == 2
+
+    class BrokenStream(ScriptedProvider):
+        def generate_stream(self, *args, **kwargs):
+            self.calls += 1
+            yield '部分'
+            raise StatusError(503)
+
+    provider = ResilientProvider(BrokenStream([], name='broken'), max_retries=3, base_delay=0.001)
+    provider.request_bucket = provider.token_bucket = None
+    provider.breaker = CircuitBreaker(failure_threshold=3)
+    received = []
+    try:
+        for delta in provider.generate_stream('提示词'):
+            received.append(delta)
+        raise AssertionError("应抛出异常")
+    except StatusError:
+        pass
+    assert received == ['部分'] and provider.inner.calls == 1
+    assert provider.breaker.failures == 1
+
+
+def test_circuit_opens_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    provider = _resilient([StatusError(503), StatusError(503)], max_retries=1, breaker=breaker)
+    try:
+        provider.complete('提示词')
+    except StatusError:
+        pass
+    assert breaker.state == 'open'
+    try:
+        provider.complete('提示词')
+        raise AssertionError("熔断时应快速失败")
+    except CircuitOpenError:
+        pass
+    assert provider.inner.calls == 2
+
+    time.sleep(0.06)
+    assert provider.complete('提示词')['text'] == 'ok'  # 冷却后的试探请求成功，恢复
+    assert breaker.state == 'closed'
+
+
+def test_half_open_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    results = []
+    barrier = threading.Barrier(5)
+
+    def caller():
+        barrier.wait()
+        results.append(breaker.allow())
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert sorted(results) == [False] * 4 + [True], results
+    assert breaker.state == 'half_open'
+
+    # 试探失败重新打开；成功则关闭
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow() and breaker.allow()
+
+
+def test_half_open_resolved_for_every_exception():
+    def half_open_provider(script):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        return _resilient(script, max_retries=0, breaker=breaker)
+
+    # 上游返回不可重试的错误响应：服务可用，关闭熔断
+    provider = half_open_provider([StatusError(400)])
+    try:
+        provider.complete('提示词')
+    except StatusError:
+        pass
+    assert provider.breaker.state == 'closed'
+
+    # 本地异常 / 调用被中断：归还试探名额，下一个请求可以继续试探
+    for error in (ValueError('本地错误'), KeyboardInterrupt()):
+        provider = half_open_provider([error])
+        try:
+            provider.complete('提示词')
+        except (ValueError, KeyboardInterrupt):
+            pass
+        assert provider.breaker.state == 'half_open'
+        assert provider.complete('提示词')['text'] == 'ok'
+        assert provider.breaker.state == 'closed'
+
+    # 流式调用方提前停止读取
+    provider = half_open_provider(['abc'])
+    stream = provider.generate_stream('提示词')
+    assert next(stream) == 'a'
+    stream.close()
+    assert provider.breaker.allow()
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_token_bucket, test_retry_classification, test_backoff, test_retries_then_succeeds,
+                 test_stream_retry, test_circuit_opens_and_recovers, test_half_open_single_probe,
+                 test_half_open_resolved_for_every_exception):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+录制/回放测试：录制后离线回放（非流式与流式）、未录制请求报错、auto 模式只调用一次
+运行: python test_record_replay.py（也可用 pytest 运行）
+"""
+import os
+import sys
+import json
+import tempfile
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.mock_provider import MockProvider
+from modules.record_replay import RecordReplayProvider, ReplayMissError
+
+
+class CountingMock(MockProvider):
+    """记录实际调用次数的模拟Provider"""
+
+    def __init__(self):
+        super().__init__(model='mock-model', ttft_ms=0, tokens_per_sec=0, jitter=0)
+        self.calls = 0
+
+    def complete(self, *args, **kwargs):
+        self.calls += 1
+        return super().complete(*args, **kwargs)
+
+    def generate_stream(self, *args, **kwargs):
+        self.calls += 1
+        yield from super().generate_stream(*args, **kwargs)
+
+
+def _replayer(record_dir):
+    # 回放不需要实际Provider，名称和模型需与录制时一致
+    return RecordReplayProvider(None, record_dir=record_dir, mode='replay', name='mock', model='mock-model')
+
+
+def test_record_then_replay():
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder = RecordReplayProvider(CountingMock(), record_dir=tmp, mode='record')
+        recorded = recorder.complete('模拟问题', max_tokens=500, prefix='背景资料', json_mode=True)
+        files = os.listdir(tmp)
+        assert len(files) == 1 and files[0].endswith('.json')
+        with open(os.path.join(tmp, files[0]), 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        assert saved['request']['prompt'] == '模拟问题' and saved['request']['prefix'] == '背景资料'
+
+        replayed = _replayer(tmp).complete('模拟问题', max_tokens=500, prefix='背景资料', json_mode=True)
+        assert replayed == recorded
+
+
+def test_stream_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder = RecordReplayProvider(CountingMock(), record_dir=tmp, mode='record')
+        recorded_finish = []
+        recorded = ''.join(recorder.generate_stream('流式问题', on_finish=recorded_finish.append))
+
+        replayed_finish = []
+        replayed = ''.join(_replayer(tmp).generate_stream('流式问题', on_finish=replayed_finish.append))
+        assert replayed == recorded
+        assert replayed_finish[0]['usage'] == recorded_finish[0]['usage']
+        assert replayed_finish[0]['stop_reason'] == recorded_finish[0]['stop_reason']
+
+
+def test_replay_miss():
+    with tempfile.TemporaryDirectory() as tmp:
+        RecordReplayProvider(CountingMock(), record_dir=tmp, mode='record').complete('已录制', max_tokens=500)
+        replayer = _replayer(tmp)
+        # 请求参数任一不同都视为未录制
+        for kwargs in ({'max_tokens': 600}, {'max_tokens': 500, 'json_mode': True}, {'max_tokens': 500, 'prefix': 'x'}):
+            try:
+                replayer.complete('已录制', **kwargs)
+                assert False, f'未录制的请求应报错: {kwargs}'
+            except ReplayMissError:
+                pass
+        try:
+            list(replayer.generate_stream('未录制'))
+            assert False, '未录制的流式请求应报错'
+        except ReplayMissError:
+            pass
+
+
+def test_auto_mode_records_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        inner = CountingMock()
+        auto = RecordReplayProvider(inner, record_dir=tmp, mode='auto')
+        first = auto.complete('问题')
+        second = auto.complete('问题')
+        assert inner.calls == 1 and first == second
+
+        # record 模式总是重新调用并覆盖录制
+        RecordReplayProvider(inner, record_dir=tmp, mode='record').complete('问题')
+        assert inner.calls == 2 and len(os.listdir(tmp)) == 1
+
+
+def test_invalid_configuration():
+    with tempfile.TemporaryDirectory() as tmp:
+        for kwargs in ({'inner': CountingMock(), 'mode': 'playback'}, {'inner': None, 'mode': 'auto'}):
+            try:
+                RecordReplayProvider(record_dir=tmp, name='mock', model='mock-model', **kwargs)
+                assert False, f'应拒绝无效配置: {kwargs}'
+            except ValueError:
+                pass
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_record_then_replay, test_stream_round_trip, test_replay_miss, test_auto_mode_records_once,
+        test_invalid_configuration
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+结构化解析报告测试：按类别切分、按类别选取提示词内容（含字数上限）、随记录保存并按报告哈希校验
+运行: python test_report_store.py（也可用 pytest 运行）
+"""
+import os
+import sys
+import tempfile
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.mock_provider import MockProvider
+from modules.database import DatabaseManager
+from modules.prompts import BIDDING_DOCUMENT_ANALYSIS_SUFFIX
+from modules.report_store import (
+    AnalysisReport, REPORT_CATEGORIES, CATEGORY_LABELS, CRITERIA_CATEGORIES, report_context, report_hash
+)
+
+REPORT = """# 招标文件解析报告
+（报告生成说明）
+
+## 一、项目概况
+工程位于某市。
+### 1.1 项目名称
+某道路改造工程
+### 1.2 工期
+180日历天
+
+## 二、评标办法
+### 评分标准
+技术标40分，施工组织设计20分。
+
+## 三、资格条件
+具备市政二级资质。
+
+## 四、评分细则（补充）
+重复出现的评审类别。
+"""
+
+
+def test_parse_categories():
+    report = AnalysisReport.parse(REPORT)
+    assert report.preamble == '# 招标文件解析报告\n（报告生成说明）'
+    # 按标题关键词识别类别，不依赖序号；同一类别只索引第一次出现的章节
+    assert [section['key'] for section in report.sections] == ['basic', 'evaluation', 'qualification', None]
+    assert report.categories == ['basic', 'evaluation', 'qualification']
+    basic = report.section('basic')
+    assert basic['title'] == '一、项目概况'
+    assert [sub['title'] for sub in basic['subsections']] == ['1.1 项目名称', '1.2 工期']
+    assert basic['subsections'][1]['content'] == '180日历天'
+    assert report.section('invalid') is None
+
+
+def test_prompt_categories_recognized():
+    # 按解析提示词输出的报告能识别全部7大类
+    text = MockProvider(ttft_ms=0, tokens_per_sec=0, jitter=0).complete(BIDDING_DOCUMENT_ANALYSIS_SUFFIX)['text']
+    report = AnalysisReport.parse(text)
+    assert report.categories == [key for key, _, _ in REPORT_CATEGORIES]
+    assert set(CATEGORY_LABELS) == set(report.categories)
+
+
+def test_context_selects_categories():
+    report = AnalysisReport.parse(REPORT)
+    context = report.context(CRITERIA_CATEGORIES)
+    # 按报告中的顺序输出，不含其他类别
+    assert context.startswith('## 一、项目概况\n工程位于某市。\n### 1.1 项目名称')
+    assert '## 二、评标办法' in context and '资格条件' not in context and '评分细则' not in context
+    assert report.context(('invalid',)) == ''
+
+
+def test_context_max_chars():
+    long_report = "## 基础信息\n" + "".join(f"### 子类{i}\n{'内容' * 300}\n" for i in range(3))
+    report = AnalysisReport.parse(long_report)
+    # 剩余空间不足200字时舍弃整个子类别
+    context = report.context(('basic',), max_chars=700)
+    assert '### 子类0' in context and '### 子类1' not in context
+    # 剩余空间足够时截断该子类别
+    truncated = report.context(('basic',), max_chars=1000)
+    assert '### 子类1' in truncated and '### 子类2' not in truncated and len(truncated) <= 1000
+    assert len(truncated) > 900
+
+
+def test_report_context_fallback():
+    assert report_context('无标题的报告内容' * 10, ('basic',), max_chars=20) == ('无标题的报告内容' * 10)[:20]
+    assert report_context(REPORT, ('qualification',)) == '## 三、资格条件\n具备市政二级资质。'
+    assert report_context(None, ('basic',)) == ''
+
+
+def test_saved_with_record():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager = DatabaseManager(db_path=os.path.join(tmp, 'records.db'))
+        record = db_manager.create_record('某道路改造工程')
+        # 保存报告时自动切分并保存结构
+        db_manager.update_record(record.id, analysis_report=REPORT)
+        saved = db_manager.get_record(record.id)
+        restored = AnalysisReport.from_json(saved.report_sections, saved.analysis_report)
+        assert restored.to_dict() == AnalysisReport.parse(REPORT).to_dict()
+        assert restored.matches(REPORT) and restored.hash == report_hash(REPORT)
+
+        # 报告更新后旧结构不再匹配，重新保存时随之更新
+        updated = REPORT.replace('180日历天', '150日历天')
+        assert AnalysisReport.from_json(saved.report_sections, updated) is None
+        db_manager.update_record(record.id, analysis_report=updated)
+        saved = db_manager.get_record(record.id)
+        restored = AnalysisReport.from_json(saved.report_sections, saved.analysis_report)
+        assert restored.section('basic')['subsections'][1]['content'] == '150日历天'
+        db_manager.engine.dispose()
+
+    assert AnalysisReport.from_json(None, REPORT) is None
+    assert AnalysisReport.from_json('不是JSON', REPORT) is None
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_parse_categories, test_prompt_categories_recognized, test_context_selects_categories, test_context_max_chars,
+        test_report_context_fallback, test_saved_with_record
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+招标文件检索测试：分词、切块、BM25排序和索引缓存
+运行: python test_retrieval.py（也可用 pytest 运行）
+"""
+import sys
+import os
+import tempfile
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.retrieval import tokenize, chunk_documents, BM25Index, RetrievalIndexCache
+
+DOCUMENTS = {
+    '招标文件': "\n".join([
+        "第一章 投标须知",
+        "投标截止时间为2024年5月20日上午9时30分，逾期送达的投标文件不予受理。",
+        "投标保证金为人民币伍万元整，须在投标截止前以银行转账方式缴纳。",
+        "",
+        "第二章 技术要求",
+        "系统应采用分布式架构，支持横向扩展，数据库需支持主备切换。",
+        "网络安全须符合等保2.0三级要求，部署防火墙和入侵检测设备。",
+        "第三章 售后服务",
+        "质保期不少于3年，故障响应时间不超过2小时。",
+    ]),
+    '评分标准': "技术方案30分：架构合理、满足等保要求得满分。\n售后服务10分：质保期每增加1年加2分。",
+}
+
+
+def test_tokenize():
+    assert tokenize('网络安全') == ['网络', '络安', '安全']
+    assert tokenize('等保2.0三级') == ['等保', '三级', '2.0']
+    assert tokenize('单') == ['单']
+    assert tokenize('Web Server') == ['web', 'server']
+    assert tokenize('') == []
+
+
+def test_chunk_documents():
+    chunks = chunk_documents(DOCUMENTS, chunk_chars=60, overlap=10)
+    assert {chunk['source'] for chunk in chunks} == set(DOCUMENTS)
+    for chunk in chunks:
+        assert len(chunk['text']) <= 60
+        # offset 指向片段首段落在原文中的位置
+        first_line = chunk['text'].split('\n')[0]
+        assert DOCUMENTS[chunk['source']][chunk['offset']:].startswith(first_line)
+    # 片段覆盖所有非空段落
+    joined = "\n".join(chunk['text'] for chunk in chunks)
+    for line in DOCUMENTS['招标文件'].split('\n'):
+        assert line.strip() in joined
+
+
+def test_chunk_long_paragraph():
+    paragraph = "".join(f"第{i}条技术参数要求。" for i in range(100))
+    chunks = chunk_documents({'技术规范': paragraph}, chunk_chars=100, overlap=20)
+    assert len(chunks) > 1
+    assert all(len(chunk['text']) <= 100 for chunk in chunks)
+    # 相邻窗口重叠 overlap 个字符，末尾完整覆盖
+    assert chunks[1]['offset'] == 80
+    assert chunks[0]['text'][80:] == chunks[1]['text'][:20]
+    assert paragraph.endswith(chunks[-1]['text'])
+    assert chunk_documents({'空文件': '  \n '}) == []
+
+
+def test_bm25_search():
+    index = BM25Index(chunk_documents(DOCUMENTS, chunk_chars=60, overlap=10))
+    hits = index.search('网络安全 等保三级 防火墙', top_k=2)
+    assert hits and '防火墙' in hits[0]['text']
+    assert hits[0]['score'] >= hits[-1]['score']
+    hits = index.search('投标保证金', top_k=1)
+    assert len(hits) == 1 and '保证金' in hits[0]['text']
+    assert index.search('完全无关的查询词xyz') == []
+    assert BM25Index([]).search('任意') == []
+
+
+def test_context_for():
+    index = BM25Index(chunk_documents(DOCUMENTS, chunk_chars=60, overlap=10))
+    context = index.context_for('质保期 售后服务', top_k=3)
+    assert '【招标文件】' in context and '【评分标准】' in context
+    # 按文件名和原文位置排序
+    sources = [block.split('\n')[0] for block in context.split('\n\n')]
+    assert sources == sorted(sources)
+    limited = index.context_for('质保期 售后服务', top_k=3, max_chars=30)
+    assert limited.count('【') == 1
+    assert index.context_for('xyz') == ''
+
+
+def test_index_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = RetrievalIndexCache(cache_dir=tmp, chunk_chars=60, overlap=10, max_in_memory=1)
+        assert cache.get({'招标文件': ''}) is None
+        first = cache.get(DOCUMENTS)
+        assert cache.get(DOCUMENTS) is first
+        assert len(os.listdir(tmp)) == 1
+
+        # 内存中被淘汰后从磁盘读取
+        cache.get({'其他项目': '另一个项目的招标文件内容'})
+        reloaded = cache.get(DOCUMENTS)
+        assert reloaded is not first
+        assert [hit['text'] for hit in reloaded.search('防火墙')] == [hit['text'] for hit in first.search('防火墙')]
+
+        # 新实例共享磁盘缓存；切块参数不同时重新建索引
+        assert len(RetrievalIndexCache(cache_dir=tmp, chunk_chars=60, overlap=10).get(DOCUMENTS)) == len(first)
+        RetrievalIndexCache(cache_dir=tmp, chunk_chars=200, overlap=10).get(DOCUMENTS)
+        assert len(os.listdir(tmp)) == 3
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_tokenize, test_chunk_documents, test_chunk_long_paragraph, test_bm25_search,
+                 test_context_for, test_index_cache):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
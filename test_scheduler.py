@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+LLM请求调度器测试：优先级、用户公平、老化和中断
+运行: python test_scheduler.py（也可用 pytest 运行）
+"""
+import sys
+import time
+import threading
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.scheduler import LLMScheduler, request_priority, get_request_priority, context_with_priority
+
+
+def _wait_queued(scheduler, count, timeout=5.0):
+    """等待排队数达到 count"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if sum(c['queued'] for c in scheduler.stats()['classes'].values()) >= count:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"排队数未达到 {count}")
+
+
+def _run_queued(scheduler, requests):
+    """占住唯一名额，依次排入 requests [(名称, 优先级, 用户)]，释放后返回获得名额的顺序"""
+    order = []
+    holder = scheduler.acquire('interactive', 'holder')
+
+    def worker(name, priority, user):
+        with scheduler.slot(priority, user):
+            order.append(name)
+
+    threads = []
+    for index, (name, priority, user) in enumerate(requests):
+        thread = threading.Thread(target=worker, args=(name, priority, user))
+        thread.start()
+        threads.append(thread)
+        _wait_queued(scheduler, index + 1)
+    scheduler.release(holder)
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_priority_order():
+    scheduler = LLMScheduler(max_concurrency=1, aging_seconds=0)
+    order = _run_queued(scheduler, [
+        ('bulk', 'bulk', 'u1'),
+        ('pipeline', 'pipeline', 'u1'),
+        ('interactive', 'interactive', 'u1'),
+    ])
+    assert order == ['interactive', 'pipeline', 'bulk'], order
+    stats = scheduler.stats()
+    assert stats['running'] == 0
+    assert stats['classes']['bulk']['served'] == 1
+    assert stats['classes']['interactive']['served'] == 2
+
+
+def test_user_fairness():
+    # 同一优先级内，最久未被调度的用户先获得名额
+    scheduler = LLMScheduler(max_concurrency=1, aging_seconds=0)
+    order = _run_queued(scheduler, [
+        ('a1', 'pipeline', 'a'),
+        ('a2', 'pipeline', 'a'),
+        ('b1', 'pipeline', 'b'),
+    ])
+    assert order[0] == 'a1' and order[1] == 'b1', order
+
+
+def test_aging():
+    # 排队足够久的批量请求提升到交互优先级，按排队时间先到先得
+    scheduler = LLMScheduler(max_concurrency=1, aging_seconds=0.05)
+    holder = scheduler.acquire('interactive', 'holder')
+    order = []
+
+    def worker(name, priority):
+        with scheduler.slot(priority, name):
+            order.append(name)
+
+    bulk = threading.Thread(target=worker, args=('bulk', 'bulk'))
+    bulk.start()
+    _wait_queued(scheduler, 1)
+    time.sleep(0.15)
+    interactive = threading.Thread(target=worker, args=('interactive', 'interactive'))
+    interactive.start()
+    _wait_queued(scheduler, 2)
+    scheduler.release(holder)
+    bulk.join(5)
+    interactive.join(5)
+    assert order == ['bulk', 'interactive'], order
+
+
+def test_concurrency_limit():
+    scheduler = LLMScheduler(max_concurrency=3, aging_seconds=0)
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+
+    def worker(index):
+        with scheduler.slot('pipeline', f"u{index % 4}"):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert state['peak'] <= 3, state
+    stats = scheduler.stats()
+    assert stats['running'] == 0 and stats['classes']['pipeline']['served'] == 12
+
+
+def test_interrupted_waiter():
+    # 排队期间被中断的请求移出队列，不占用名额
+    scheduler = LLMScheduler(max_concurrency=1, aging_seconds=0)
+    holder = scheduler.acquire('interactive', 'holder')
+    original_wait = scheduler._condition.wait
+
+    def interrupted_wait(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    scheduler._condition.wait = interrupted_wait
+    try:
+        scheduler.acquire('bulk', 'u1')
+        raise AssertionError("应抛出中断")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler._condition.wait = original_wait
+    assert scheduler.stats()['classes']['bulk']['queued'] == 0
+    scheduler.release(holder)
+    with scheduler.slot('bulk', 'u1'):
+        assert scheduler.stats()['running'] == 1
+    assert scheduler.stats()['running'] == 0
+
+
+def test_priority_context():
+    assert get_request_priority() == 'interactive'
+    with request_priority('bulk'):
+        assert get_request_priority() == 'bulk'
+        context = context_with_priority('pipeline')
+        assert context.run(get_request_priority) == 'pipeline'
+        assert get_request_priority() == 'bulk'
+    assert get_request_priority() == 'interactive'
+    try:
+        with request_priority('urgent'):
+            pass
+        raise AssertionError("未知优先级应报错")
+    except ValueError:
+        pass
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_priority_order, test_user_fairness, test_aging, test_concurrency_limit,
+                 test_interrupted_waiter, test_priority_context):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+历史章节库测试：按标题/内容/项目评审标准的相似度排序、排除当前项目、增量刷新
+运行: python test_section_library.py（也可用 pytest 运行）
+"""
+import os
+import sys
+import tempfile
+sys.stdout.reconfigure(encoding='utf-8')
+
+# 测试不写入仓库下的 data/ 目录
+for name, value in {
+    'LLM_CACHE_ENABLED': 'false', 'METRICS_ENABLED': 'false', 'RETRIEVAL_ENABLED': 'false',
+    'TOKEN_CALIBRATION_ENABLED': 'false', 'SECTION_LIBRARY_ENABLED': 'false',
+    'MOCK_TTFT_MS': '0', 'MOCK_TOKENS_PER_SEC': '0', 'LLM_SCHEDULER_ENABLED': 'false',
+}.items():
+    os.environ[name] = value
+
+from modules.database import DatabaseManager
+from modules.metrics import record_context
+from modules.mock_provider import MockProvider
+from modules.ai_service import ClaudeService
+from modules.section_library import SectionLibrary
+
+ROAD_CRITERIA = '市政道路工程 施工组织设计 沥青路面 交通疏导 评分标准'
+BUILDING_CRITERIA = '房屋建筑工程 主体结构 装饰装修 幕墙 评分标准'
+QUALITY = '建立质量保证体系，落实三检制度，沥青摊铺温度全过程监测，压实度检测合格后方可进入下道工序。'
+SAFETY = '设置专职安全员，落实安全技术交底，高处作业必须系挂安全带，临边洞口设置防护栏杆。'
+SCHEDULE = '总工期180日历天，按路基、基层、面层三个阶段组织流水施工，关键线路节点按周考核。'
+
+
+def _records(tmp):
+    db_manager = DatabaseManager(db_path=os.path.join(tmp, 'records.db'))
+    road = db_manager.create_record('某道路改造工程')
+    db_manager.update_record(road.id, bidding_response=ROAD_CRITERIA, generated_sections={
+        '质量保证措施': QUALITY, '安全文明施工措施': SAFETY, '施工进度计划': SCHEDULE, '空章节': '  ',
+    })
+    building = db_manager.create_record('某办公楼工程')
+    db_manager.update_record(building.id, bidding_response=BUILDING_CRITERIA, generated_sections={
+        '质量保证措施': '主体结构混凝土浇筑实行旁站监理，装饰装修样板先行，幕墙材料进场复检。',
+    })
+    db_manager.create_record('未生成章节的项目')
+    return db_manager, road.id, building.id
+
+
+def test_refresh_skips_empty_sections():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager, _, _ = _records(tmp)
+        library = SectionLibrary(dim=1 << 12)
+        assert library.refresh(db_manager.get_all_records()) == 4
+        assert {result['title'] for result in library.search('措施 计划', top_k=10)} == {
+            '质量保证措施', '安全文明施工措施', '施工进度计划'
+        }
+        assert library.search('   ') == [] and SectionLibrary().search('质量保证措施') == []
+        db_manager.engine.dispose()
+
+
+def test_title_and_content_similarity():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager, road_id, _ = _records(tmp)
+        library = SectionLibrary(dim=1 << 12)
+        library.refresh(db_manager.get_all_records())
+        db_manager.engine.dispose()
+
+    # 标题相同的章节排在最前，相似度在 0~1 之间且按降序排列
+    results = library.search('安全文明施工措施 安全技术交底', top_k=4)
+    assert results[0]['title'] == '安全文明施工措施' and results[0]['record_id'] == road_id
+    scores = [result['score'] for result in results]
+    assert scores == sorted(scores, reverse=True) and 0 < scores[-1] <= scores[0] <= 1 + 1e-9
+    # 标题不同但内容相近的章节也能检索到
+    assert library.search('关键线路 流水施工 工期', top_k=1)[0]['title'] == '施工进度计划'
+    # top_k 与最低相似度
+    assert len(library.search('质量保证措施', top_k=1)) == 1
+    assert all(result['score'] >= 0.5 for result in library.search('质量保证措施', top_k=4, min_score=0.5))
+
+
+def test_project_similarity_and_exclusion():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager, road_id, building_id = _records(tmp)
+        library = SectionLibrary(dim=1 << 12)
+        library.refresh(db_manager.get_all_records())
+        db_manager.engine.dispose()
+
+    # 同名章节：评审标准相近的项目排在前面
+    road_first = library.search('质量保证措施', project='市政道路 沥青路面 交通疏导', top_k=2)
+    assert [result['record_id'] for result in road_first] == [road_id, building_id]
+    assert road_first[0]['project_score'] > road_first[1]['project_score']
+    building_first = library.search('质量保证措施', project='房屋建筑 主体结构 幕墙', top_k=2)
+    assert [result['record_id'] for result in building_first] == [building_id, road_id]
+
+    # 排除当前项目
+    results = library.search('质量保证措施', top_k=4, exclude_record=road_id)
+    assert results and all(result['record_id'] != road_id for result in results)
+
+
+def test_incremental_refresh():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager, road_id, _ = _records(tmp)
+        library = SectionLibrary(dim=1 << 12)
+        signature = tuple(db_manager.get_update_times())
+        library.refresh(db_manager.get_all_records(), signature)
+        rows = dict(library._rows)
+
+        # 记录未变化时不重建
+        assert library.refresh([], signature) == 4
+
+        db_manager.update_record(road_id, generated_sections={
+            '质量保证措施': QUALITY, '安全文明施工措施': SAFETY + '夜间施工设置警示灯。', '施工进度计划': SCHEDULE,
+        })
+        assert library.refresh(db_manager.get_all_records(), tuple(db_manager.get_update_times())) == 4
+        db_manager.engine.dispose()
+
+    # 未变化的章节沿用已计算的词频，变化的章节重新计算
+    unchanged = [key for key in library._rows if key in rows]
+    assert len(unchanged) == 3 and all(library._rows[key] is rows[key] for key in unchanged)
+    assert '夜间施工' in library.search('安全文明施工措施', top_k=1)[0]['content']
+
+
+def test_service_excludes_current_record():
+    service = ClaudeService(
+        provider=MockProvider(ttft_ms=0, tokens_per_sec=0, jitter=0), section_library=SectionLibrary(dim=1 << 12)
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager, road_id, building_id = _records(tmp)
+        assert service.refresh_section_library(db_manager) == 4
+        # 记录未变化时不重建
+        assert service.refresh_section_library(db_manager) == 4
+        db_manager.engine.dispose()
+
+    with record_context(road_id):
+        drafts = service.similar_sections('质量保证措施', top_k=3)
+    assert [draft['record_id'] for draft in drafts] == [building_id]
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_refresh_skips_empty_sections, test_title_and_content_similarity, test_project_similarity_and_exclusion,
+        test_incremental_refresh, test_service_excludes_current_record
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
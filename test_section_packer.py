@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+小章节合并生成测试：相邻小章节分组、按分隔标记拆分输出（缺失标记、标题串入、过短），
+合并生成与单章节生成的提示词上下文一致
+运行: python test_section_packer.py（也可用 pytest 运行）
+"""
+import os
+import sys
+sys.stdout.reconfigure(encoding='utf-8')
+
+# 测试不写入仓库下的 data/ 目录
+for name, value in {
+    'LLM_CACHE_ENABLED': 'false', 'METRICS_ENABLED': 'false', 'RETRIEVAL_ENABLED': 'false',
+    'TOKEN_CALIBRATION_ENABLED': 'false', 'SECTION_LIBRARY_ENABLED': 'false',
+    'MOCK_TTFT_MS': '0', 'MOCK_TOKENS_PER_SEC': '0', 'LLM_SCHEDULER_ENABLED': 'false',
+}.items():
+    os.environ[name] = value
+
+from modules.mock_provider import MockProvider
+from modules.ai_service import ClaudeService
+from modules.retrieval import BM25Index, chunk_documents
+from modules.section_packer import pack_sections, parse_packed_output, SectionPacker, SECTION_MARKER
+
+GROUP = [
+    {'title': '工程概况', 'word_count': 300, 'description': '介绍工程规模'},
+    {'title': '质量保证措施', 'word_count': 500, 'description': '质量管理体系'},
+]
+
+
+def _service():
+    service = ClaudeService(provider=MockProvider(ttft_ms=0, tokens_per_sec=0, jitter=0))
+
+    # 章节库替身：每个章节标题对应一篇参考稿
+    def similar_sections(section_title, section_requirements='', evaluation_criteria='', top_k=3, min_score=0.0):
+        return [{
+            'record_id': 1, 'project': '历史项目', 'title': section_title,
+            'content': f'参考稿：{section_title}', 'score': 1.0
+        }][:top_k]
+    service.similar_sections = similar_sections
+    return service
+
+
+BODY = '本节内容按招标文件要求组织实施，明确管理目标、组织机构和各项保证措施，确保满足评审标准。'
+
+
+def _packed(*parts):
+    """parts 为 (序号, 章节内容)，序号为 None 时不输出分隔标记"""
+    return "\n".join(
+        (SECTION_MARKER.format(index=index) + "\n" if index is not None else "") + content
+        for index, content in parts
+    )
+
+
+def _words(*counts):
+    return [{'title': f'章节{i}', 'word_count': count} for i, count in enumerate(counts)]
+
+
+def test_pack_adjacent_small_sections():
+    groups = pack_sections(_words(300, 500, 1500, 300, 300, 300, 300, 300), small_words=800, max_words=2400, max_sections=4)
+    # 大章节单独成组并打断相邻关系；每组不超过 max_sections
+    assert [[s['title'] for s in group] for group in groups] == [
+        ['章节0', '章节1'], ['章节2'], ['章节3', '章节4', '章节5', '章节6'], ['章节7']
+    ]
+
+
+def test_pack_word_limit_and_order():
+    sections = _words(800, 800, 800, 100)
+    groups = pack_sections(sections, small_words=800, max_words=2000, max_sections=4)
+    assert [len(group) for group in groups] == [2, 2]
+    assert [s for group in groups for s in group] == sections
+    # 缺失或无法解析的字数按1000计（超过 small_words 时单独生成）
+    assert len(pack_sections([{'title': 'a'}, {'title': 'b', 'word_count': 'x'}], small_words=800)) == 2
+    assert SectionPacker(small_words=0).pack(_words(300, 300)) == [[s] for s in _words(300, 300)]
+    assert pack_sections([]) == []
+
+
+def test_parse_all_sections():
+    titles = ['工程概况', '施工部署']
+    text = _packed((1, f'# 工程概况\n{BODY}'), (2, f'# 施工部署\n{BODY}'))
+    parsed = parse_packed_output(text, titles)
+    assert sorted(parsed) == [0, 1]
+    assert parsed[0].startswith('# 工程概况') and parsed[1].startswith('# 施工部署')
+    # 分隔标记前后和内部多出的空格也能识别
+    assert sorted(parse_packed_output(text.replace('@@@SECTION 2@@@', '  @@@ SECTION 2 @@@ '), titles)) == [0, 1]
+
+
+def test_parse_missing_marker():
+    titles = ['工程概况', '施工部署', '质量保证措施']
+    # 第2个标记缺失：第2章内容串入第1章，两者都需要单独重新生成
+    text = _packed((1, f'# 工程概况\n{BODY}'), (None, f'# 施工部署\n{BODY}'), (3, f'# 质量保证措施\n{BODY}'))
+    assert sorted(parse_packed_output(text, titles)) == [2]
+    # 没有任何标记
+    assert parse_packed_output(f'# 工程概况\n{BODY}', titles) == {}
+
+
+def test_parse_heading_spill():
+    titles = ['工程概况', '施工部署']
+    # 其他章节的标题（任意层级）出现在内容中视为解析失败；本章标题和其他小标题不受影响
+    text = _packed((1, f'# 工程概况\n{BODY}\n## 施工部署\n{BODY}'), (2, f'# 施工部署\n## 1. 施工部署原则\n{BODY}'))
+    assert sorted(parse_packed_output(text, titles)) == [1]
+
+
+def test_parse_short_and_invalid_markers():
+    titles = ['工程概况', '施工部署']
+    text = _packed((1, '# 工程概况\n略'), (2, f'# 施工部署\n{BODY}'), (3, f'# 多余章节\n{BODY}'), (2, f'# 施工部署\n重复{BODY}'))
+    parsed = parse_packed_output(text, titles)
+    # 过短的章节、超出范围的序号被忽略，重复序号只取第一次
+    assert sorted(parsed) == [1] and not parsed[1].count('重复')
+    assert sorted(parse_packed_output(text, titles, min_chars=2)) == [0, 1]
+
+
+def test_packed_prompt_shares_section_context():
+    service = _service()
+    retriever = BM25Index(chunk_documents({'招标文件': '工程概况：道路全长3公里。质量保证措施：执行三检制度。'}))
+
+    _, single = service._build_section_prompt(
+        '工程概况', 300, '介绍工程规模', '项目信息', '评审标准', retriever, summary='- 工期180天'
+    )
+    _, packed, _ = service._build_packed_section_prompt(GROUP, '项目信息', '评审标准', retriever, summary='- 工期180天')
+
+    for prompt in (single, packed):
+        assert '=== 前文已确定的关键信息 ===' in prompt and '- 工期180天' in prompt
+        assert '=== 历史项目同类章节（参考稿） ===' in prompt
+        assert '=== 招标文件相关条款 ===' in prompt
+        # 上下文的顺序一致：摘要、参考稿、原文条款，之后才是章节指令
+        positions = [prompt.index(marker) for marker in ('前文已确定', '历史项目同类章节', '招标文件相关条款', '当前任务')]
+        assert positions == sorted(positions), positions
+
+    # 合并生成时每个章节都有参考稿
+    assert '参考稿：工程概况' in packed and '参考稿：质量保证措施' in packed
+    assert '参考稿：质量保证措施' not in single
+
+
+def test_packed_prompt_without_context():
+    service = ClaudeService(provider=MockProvider(ttft_ms=0, tokens_per_sec=0, jitter=0))
+    _, packed, _ = service._build_packed_section_prompt(GROUP, '项目信息', '评审标准')
+    assert packed.lstrip().startswith('=== 当前任务 ===')
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (
+        test_pack_adjacent_small_sections, test_pack_word_limit_and_order, test_parse_all_sections, test_parse_missing_marker,
+        test_parse_heading_spill, test_parse_short_and_invalid_markers, test_packed_prompt_shares_section_context,
+        test_packed_prompt_without_context
+    ):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -5,6 +5,7 @@
 
 import sys
 import os
+import tempfile
 
 def test_python_version():
     """测试 Python 版本"""
@@ -81,6 +82,13 @@ def test_api_connection():
     try:
         from modules.ai_service import ClaudeService
 
+        # 测试调用不读写响应缓存；调用指标、检索索引、token校准写入临时目录，不在仓库 data/ 下留下文件
+        tmp_dir = tempfile.mkdtemp(prefix='bidding_setup_')
+        os.environ['LLM_CACHE_ENABLED'] = 'false'
+        os.environ['METRICS_PATH'] = os.path.join(tmp_dir, 'metrics.db')
+        os.environ['RETRIEVAL_CACHE_DIR'] = os.path.join(tmp_dir, 'retrieval')
+        os.environ['TOKEN_CALIBRATION_PATH'] = os.path.join(tmp_dir, 'token_calibration.db')
+
         # 尝试创建服务实例
         service = ClaudeService()
         print("   ✅ API 服务初始化成功")
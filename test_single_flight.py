@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+相同请求合并测试：非流式/流式调用的合并、异常共享和取消
+运行: python test_single_flight.py（也可用 pytest 运行）
+"""
+import sys
+import time
+import threading
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.single_flight import SingleFlight
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.005)
+    raise AssertionError("等待超时")
+
+
+def test_do_coalesces():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return '结果'
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', fn))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    _wait_until(lambda: flight.stats()['coalesced'] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [('结果', False)] + [('结果', True)] * 3
+    assert flight.stats() == {'leaders': 1, 'coalesced': 3, 'in_flight': 0}
+
+    # 完成后不再合并
+    assert flight.do('key', lambda: '新结果') == ('新结果', False)
+
+
+def test_do_shares_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def fn():
+        release.wait(5)
+        raise RuntimeError('调用失败')
+
+    def worker():
+        try:
+            flight.do('key', fn)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    _wait_until(lambda: flight.stats()['coalesced'] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert errors == ['调用失败'] * 3
+
+
+def test_do_retries_after_leader_interrupted():
+    # leader 被中断（非 Exception）时，等待者重新发起调用
+    flight = SingleFlight()
+    release = threading.Event()
+    results = []
+
+    def interrupted():
+        release.wait(5)
+        raise KeyboardInterrupt
+
+    def leader():
+        try:
+            flight.do('key', interrupted)
+        except KeyboardInterrupt:
+            pass
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    _wait_until(lambda: flight.stats()['in_flight'] == 1)
+    follower = threading.Thread(target=lambda: results.append(flight.do('key', lambda: '重新调用')))
+    follower.start()
+    _wait_until(lambda: flight.stats()['coalesced'] == 1)
+    release.set()
+    leader_thread.join(5)
+    follower.join(5)
+    assert results == [('重新调用', False)]
+    assert flight.stats()['coalesced'] == 0
+
+
+def test_stream_replays_for_late_consumer():
+    flight = SingleFlight()
+    gate = threading.Event()
+    created = []
+
+    def factory():
+        created.append(1)
+        yield '第一段'
+        gate.wait(5)
+        yield '第二段'
+        yield '第三段'
+
+    first = flight.stream('key', factory)
+    assert next(first) == '第一段'
+    late = []
+    late_thread = threading.Thread(target=lambda: late.extend(flight.stream('key', factory)))
+    late_thread.start()
+    _wait_until(lambda: flight.stats()['coalesced'] == 1)
+    gate.set()
+    rest = list(first)
+    late_thread.join(5)
+
+    assert len(created) == 1
+    assert rest == ['第二段', '第三段']
+    assert late == ['第一段', '第二段', '第三段']
+    _wait_until(lambda: flight.stats()['in_flight'] == 0)
+
+
+def test_stream_error():
+    flight = SingleFlight()
+
+    def factory():
+        yield '部分'
+        raise RuntimeError('流式失败')
+
+    received = []
+    try:
+        for chunk in flight.stream('key', factory):
+            received.append(chunk)
+        raise AssertionError("应抛出异常")
+    except RuntimeError as e:
+        assert str(e) == '流式失败'
+    assert received == ['部分']
+
+
+def test_stream_cancelled_when_abandoned():
+    flight = SingleFlight()
+    closed = threading.Event()
+    gate = threading.Event()
+
+    def factory():
+        try:
+            yield '第一段'
+            gate.wait(5)
+            yield '第二段'
+            yield '第三段'
+        finally:
+            closed.set()
+
+    stream = flight.stream('key', factory)
+    assert next(stream) == '第一段'
+    stream.close()  # 唯一的调用方停止读取
+    gate.set()
+    assert closed.wait(5)
+    _wait_until(lambda: flight.stats()['in_flight'] == 0)
+
+    # 放弃后相同键重新发起调用
+    assert list(flight.stream('key', lambda: iter(['新的']))) == ['新的']
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_do_coalesces, test_do_shares_error, test_do_retries_after_leader_interrupted,
+                 test_stream_replays_for_late_consumer, test_stream_error, test_stream_cancelled_when_abandoned):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+分层摘要树测试：分章、随项目记录保存并恢复、只重建内容有变化的文件、按粒度和查询取用摘要
+运行: python test_summary_tree.py（也可用 pytest 运行）
+"""
+import os
+import sys
+import json
+import tempfile
+sys.stdout.reconfigure(encoding='utf-8')
+
+# 测试不写入仓库下的 data/ 目录
+for name, value in {
+    'LLM_CACHE_ENABLED': 'false', 'METRICS_ENABLED': 'false', 'RETRIEVAL_ENABLED': 'false',
+    'TOKEN_CALIBRATION_ENABLED': 'false', 'SECTION_LIBRARY_ENABLED': 'false',
+    'MOCK_TTFT_MS': '0', 'MOCK_TOKENS_PER_SEC': '0', 'LLM_SCHEDULER_ENABLED': 'false',
+}.items():
+    os.environ[name] = value
+
+from modules.mock_provider import MockProvider
+from modules.ai_service import ClaudeService
+from modules.database import DatabaseManager
+from modules.summary_tree import SummaryTree, split_chapters, SUMMARY_TREE_VERSION
+
+TENDER = (
+    "目录\n第一章 招标公告……1\n第二章 评标办法……5\n\n"
+    "第一章 招标公告\n项目名称：某道路改造工程。投标截止时间：2025年11月12日。\n"
+    "第二章 评标办法\n技术标40分，商务标60分。施工组织设计20分。\n"
+)
+CONTRACT = "一、合同条款\n工期180日历天。\n二、付款方式\n按月支付进度款的80%。\n"
+
+
+class CountingMock(MockProvider):
+    """记录调用次数的模拟Provider"""
+
+    def __init__(self):
+        super().__init__(ttft_ms=0, tokens_per_sec=0, jitter=0)
+        self.calls = 0
+
+    def complete(self, *args, **kwargs):
+        self.calls += 1
+        return super().complete(*args, **kwargs)
+
+    def generate_stream(self, *args, **kwargs):
+        self.calls += 1
+        yield from super().generate_stream(*args, **kwargs)
+
+
+def test_split_chapters():
+    chapters = split_chapters(TENDER)
+    # 目录页条目不作为章标题，章前内容单独成节
+    assert [chapter['title'] for chapter in chapters] == ['（文件开头）', '第一章 招标公告', '第二章 评标办法']
+    assert all(TENDER[c['offset']:c['offset'] + len(c['text'])] == c['text'] for c in chapters)
+    # 无"第X章"时按一级编号标题切分，都没有时按长度切分
+    assert [chapter['title'] for chapter in split_chapters(CONTRACT)] == ['一、合同条款', '二、付款方式']
+    assert [chapter['title'] for chapter in split_chapters('正文' * 50, max_chapter_chars=40)] == ['第1部分', '第2部分', '第3部分']
+
+
+def test_persist_and_restore():
+    provider = CountingMock()
+    service = ClaudeService(provider=provider)
+    documents = {'招标文件': TENDER, '合同文件': CONTRACT}
+    tree = service.build_summary_tree(documents, use_cache=False)
+    assert tree.is_current(documents)
+    assert tree.stats() == {'document': 2, 'chapter': 5, 'chunk': 5}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager = DatabaseManager(db_path=os.path.join(tmp, 'records.db'))
+        record = db_manager.create_record('某道路改造工程')
+        db_manager.update_record(record.id, document_summary=tree.to_dict())
+        saved = db_manager.get_record(record.id).document_summary
+        db_manager.engine.dispose()
+
+    restored = SummaryTree.from_json(saved)
+    assert restored.to_dict() == tree.to_dict()
+    assert list(restored.files) == ['招标文件', '合同文件']
+    assert restored.is_current(documents)
+    assert restored.context('chapter') == tree.context('chapter')
+
+
+def test_rebuild_only_changed_files():
+    provider = CountingMock()
+    service = ClaudeService(provider=provider)
+    documents = {'招标文件': TENDER, '合同文件': CONTRACT}
+    tree = SummaryTree.from_json(json.dumps(service.build_summary_tree(documents, use_cache=False).to_dict()))
+
+    changed = {'招标文件': TENDER, '合同文件': CONTRACT.replace('180', '150')}
+    assert tree.stale_sources(changed) == ['合同文件'] and not tree.is_current(changed)
+
+    provider.calls = 0
+    rebuilt = service.build_summary_tree(changed, existing=tree, use_cache=False)
+    # 合同文件：2个片段摘要 + 1个全文摘要（每章只有一个片段，不需要合并章摘要）
+    assert provider.calls == 3
+    assert rebuilt.files['招标文件'] == tree.files['招标文件']
+    assert rebuilt.is_current(changed)
+
+    # 删除的文件不再保留
+    assert list(service.build_summary_tree({'招标文件': TENDER}, existing=rebuilt).files) == ['招标文件']
+
+
+def test_from_json_rejects_invalid():
+    assert SummaryTree.from_json(None) is None
+    assert SummaryTree.from_json('不是JSON') is None
+    assert SummaryTree.from_json(json.dumps({'version': SUMMARY_TREE_VERSION + 1, 'files': {'a': {}}})) is None
+    assert SummaryTree.from_json(json.dumps({'version': SUMMARY_TREE_VERSION, 'files': {}})) is None
+
+
+def test_context_by_query():
+    tree = SummaryTree({'version': SUMMARY_TREE_VERSION, 'files': {
+        '招标文件': {'hash': '', 'summary': '全文概要', 'chapters': [
+            {'title': '招标公告', 'offset': 0, 'summary': '投标截止时间2025年11月12日', 'chunks': []},
+            {'title': '评标办法', 'offset': 100, 'summary': '技术标评分40分，施工组织设计20分', 'chunks': []},
+        ]},
+    }})
+    assert tree.context('document') == '【招标文件】\n全文概要'
+    # 按查询选出最相关的章，超出字数上限的节点被丢弃
+    assert tree.context('chapter', query='评分 施工组织设计', max_chars=20) == '【招标文件 / 评标办法】\n技术标评分40分，施工组织设计20分'
+    # 选中多个节点时按原文顺序排列
+    both = tree.context('chapter', query='评分')
+    assert both.index('招标公告') < both.index('评标办法')
+    try:
+        tree.nodes('section')
+        assert False, '未知粒度应报错'
+    except ValueError:
+        pass
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_split_chapters, test_persist_and_restore, test_rebuild_only_changed_files, test_from_json_rejects_invalid,
+                 test_context_by_query):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+token估算校准测试：最小二乘拟合与按模型持久化的系数
+运行: python test_token_calibration.py（也可用 pytest 运行）
+"""
+import sys
+import os
+import tempfile
+sys.stdout.reconfigure(encoding='utf-8')
+
+from modules.token_calibration import TokenCalibrator, fit_coefficients
+from modules.text_processor import TextProcessor, DEFAULT_TOKEN_COEFFICIENTS
+
+TRUE_COEFFICIENTS = (0.8, 1.1, 0.3)
+
+
+def _tokens(counts, coefficients=TRUE_COEFFICIENTS):
+    return round(sum(c * x for c, x in zip(coefficients, counts)))
+
+
+def _close(actual, expected, tolerance=0.02):
+    return all(abs(a - e) <= tolerance for a, e in zip(actual, expected))
+
+
+def test_fit_recovers_coefficients():
+    samples = []
+    for i in range(1, 21):
+        counts = (i * 137, i * 11 + (i % 3) * 40, i * 53 + (i % 5) * 70)
+        samples.append(counts + (_tokens(counts),))
+    assert _close(fit_coefficients(samples), TRUE_COEFFICIENTS)
+
+
+def test_fit_unused_class_keeps_default():
+    # 样本中从未出现英文单词：英文系数沿用默认值
+    samples = [(i * 100, 0, i * 7 + (i % 4) * 30) for i in range(1, 15)]
+    samples = [counts + (_tokens(counts),) for counts in samples]
+    fitted = fit_coefficients(samples)
+    assert fitted[1] == DEFAULT_TOKEN_COEFFICIENTS[1]
+    assert _close((fitted[0], fitted[2]), (TRUE_COEFFICIENTS[0], TRUE_COEFFICIENTS[2]))
+
+
+def test_fit_never_negative():
+    # 其他字符对token数“负贡献”的异常样本：该系数固定为默认值，其余仍为正
+    samples = []
+    for i in range(1, 21):
+        counts = (i * 100 + (i % 3) * 50, i * 5 + (i % 4) * 20, (i % 5) * 40)
+        samples.append(counts + (max(1, round(0.9 * counts[0] + 1.2 * counts[1] - 0.2 * counts[2])),))
+    fitted = fit_coefficients(samples)
+    assert fitted is not None and all(value > 0 for value in fitted), fitted
+    assert fit_coefficients([]) is None
+    assert fit_coefficients([(0, 0, 0, 10)]) is None
+
+
+def test_calibrator_record_and_estimate():
+    texts = [("招标文件技术要求" * (i + 1)) + (" network server" * (i % 4 * 10 + 5)) + ("0123456789" * ((i * 7) % 11 + 1))
+             for i in range(12)]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'calibration.db')
+        calibrator = TokenCalibrator(db_path=db_path, min_samples=10, refit_every=10)
+        assert calibrator.estimate('测试文本', 'model-a') is None
+        for text in texts:
+            calibrator.record('model-a', text, _tokens(TextProcessor.char_class_counts(text)))
+        coefficients = calibrator.coefficients_for('model-a')
+        assert coefficients is not None and _close(coefficients, TRUE_COEFFICIENTS, 0.05), coefficients
+        assert calibrator.coefficients_for('model-b') is None
+
+        sample = "技术方案 architecture 说明：" * 20
+        expected = _tokens(TextProcessor.char_class_counts(sample))
+        assert abs(calibrator.estimate(sample, 'model-a') - expected) <= expected * 0.05
+        calibrator.engine.dispose()
+
+        # 系数持久化，重新打开后仍然有效
+        reopened = TokenCalibrator(db_path=db_path)
+        assert reopened.coefficients_for('model-a') == coefficients
+        assert [row['model'] for row in reopened.get_all()] == ['model-a']
+        reopened.clear()
+        assert reopened.coefficients_for('model-a') is None and reopened.get_all() == []
+        reopened.engine.dispose()
+
+
+def test_calibrator_ignores_invalid_samples():
+    with tempfile.TemporaryDirectory() as tmp:
+        calibrator = TokenCalibrator(db_path=os.path.join(tmp, 'calibration.db'), min_samples=2, refit_every=1)
+        calibrator.record('', '文本', 10)
+        calibrator.record('model-a', '', 10)
+        calibrator.record('model-a', '文本', 0)
+        assert calibrator.refit('model-a') is None
+        calibrator.engine.dispose()
+
+
+if __name__ == '__main__':
+    failed = False
+    for test in (test_fit_recovers_coefficients, test_fit_unused_class_keeps_default, test_fit_never_negative,
+                 test_calibrator_record_and_estimate, test_calibrator_ignores_invalid_samples):
+        try:
+            test()
+            print(f"SUCCESS: {test.__name__}")
+        except AssertionError as e:
+            failed = True
+            print(f"ERROR: {test.__name__} - {e!r}")
+    sys.exit(1 if failed else 0)